@@ -0,0 +1,181 @@
+"""
+Archivo de Casos Cerrados (tablas calientes / frías)
+IncaNeurobaeza - 2024
+
+cases, case_events y case_notes solo crecían: la bandeja, las estadísticas y
+los recordatorios recorrían también los casos COMPLETA de años anteriores, que
+nadie vuelve a editar. El job diario 'archivar_casos' mueve los casos cerrados
+sin cambios en ARCHIVO_DIAS días, con sus documentos, eventos, notas, reenvíos
+y huellas, a las tablas *_archivo (ver app.database):
+
+- Por lotes de ARCHIVO_LOTE casos, cada lote en una transacción:
+  INSERT ... SELECT al archivo y DELETE de las tablas calientes
+- En PostgreSQL los casos del lote se toman con FOR UPDATE SKIP LOCKED: un
+  caso que alguien está editando queda para la próxima corrida
+- Las comparaciones de versiones (se recalculan) se borran; drive_files y
+  drive_drift conservan el serial y quedan sin case_id
+
+Lectura: detalle_caso busca primero en cases y luego aquí (sello_archivado,
+leer_archivado); las estadísticas suman los archivados por estado y
+generar_serial_unico consulta ambas tablas (serial_existe) para no repetir
+seriales.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, insert, delete, update, exists, literal, func, union_all
+
+from app.database import (
+    engine, Case, Company, Employee, DriveFile, DriveDrift, VersionComparison, EstadoCaso,
+    cases_archivo, ARCHIVO_HIJAS
+)
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+ARCHIVO_DIAS = int(os.environ.get("ARCHIVO_DIAS", "365"))
+ARCHIVO_LOTE = int(os.environ.get("ARCHIVO_LOTE", "500"))
+ARCHIVO_ESTADOS = [
+    EstadoCaso(e.strip()) for e in os.environ.get("ARCHIVO_ESTADOS", "COMPLETA").split(",") if e.strip()
+]
+
+
+# ==================== JOB ====================
+
+def _mover_lote(conn, ids: List[int], ahora: datetime) -> Dict[str, int]:
+    """Copia los casos y sus hijas al archivo y los borra de las tablas calientes"""
+    movidas = {}
+    for origen, destino in [(Case.__table__, cases_archivo)] + [
+        (Case.metadata.tables[nombre], copia) for nombre, copia in ARCHIVO_HIJAS.items()
+    ]:
+        columnas = [c.name for c in origen.columns]
+        filtro = origen.c.id.in_(ids) if origen is Case.__table__ else origen.c.case_id.in_(ids)
+        resultado = conn.execute(insert(destino).from_select(
+            columnas + ['archivado_at'],
+            select(*origen.columns, literal(ahora, destino.c.archivado_at.type)).where(filtro)
+        ))
+        movidas[destino.name] = resultado.rowcount
+
+    # Hijas primero: en SQLite las llaves foráneas no borran en cascada
+    for nombre in ARCHIVO_HIJAS:
+        tabla = Case.metadata.tables[nombre]
+        conn.execute(delete(tabla).where(tabla.c.case_id.in_(ids)))
+    conn.execute(delete(VersionComparison).where(VersionComparison.case_id.in_(ids)))
+    conn.execute(update(DriveFile).where(DriveFile.case_id.in_(ids)).values(case_id=None))
+    conn.execute(update(DriveDrift).where(DriveDrift.case_id.in_(ids)).values(case_id=None))
+    conn.execute(delete(Case).where(Case.id.in_(ids)))
+    return movidas
+
+
+def archivar_casos(dias: int = None, lote: int = None, max_lotes: Optional[int] = None) -> Dict:
+    """
+    Mueve al archivo los casos en ARCHIVO_ESTADOS sin cambios en `dias` días.
+    Se puede correr varias veces: cada corrida sigue donde quedó la anterior
+    """
+    dias = ARCHIVO_DIAS if dias is None else dias
+    lote = lote or ARCHIVO_LOTE
+    limite = datetime.utcnow() - timedelta(days=dias)
+    stats = {'casos': 0, 'lotes': 0, 'filas': {}, 'limite': limite.isoformat()}
+    inicio = time.perf_counter()
+
+    while max_lotes is None or stats['lotes'] < max_lotes:
+        ahora = datetime.utcnow()
+        with engine.begin() as conn:
+            ids = conn.execute(
+                select(Case.id)
+                .where(Case.estado.in_(ARCHIVO_ESTADOS), Case.updated_at < limite)
+                .order_by(Case.id).limit(lote)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            if not ids:
+                break
+            for tabla, filas in _mover_lote(conn, ids, ahora).items():
+                stats['filas'][tabla] = stats['filas'].get(tabla, 0) + filas
+        stats['casos'] += len(ids)
+        stats['lotes'] += 1
+
+    stats['duracion_s'] = round(time.perf_counter() - inicio, 2)
+    if stats['casos']:
+        log.info("🗄️ %s caso(s) archivados en %s lote(s) (%.1fs, sin cambios desde %s)",
+                 stats['casos'], stats['lotes'], stats['duracion_s'], limite.date())
+    else:
+        log.debug("🗄️ Sin casos para archivar (sin cambios desde %s)", limite.date())
+    return stats
+
+
+# ==================== LECTURA ====================
+
+def serial_existe(db, serial: str) -> bool:
+    """¿El serial ya se usó? Casos vivos o archivados, solo con los índices únicos de serial"""
+    return bool(db.scalar(select(
+        exists().where(Case.serial == serial) | exists().where(cases_archivo.c.serial == serial)
+    )))
+
+
+def seriales_con_prefijo(db, prefijo: str) -> List[str]:
+    """Seriales vivos y archivados que empiezan por prefijo, de mayor a menor"""
+    patron = f"{prefijo}%"
+    seriales = union_all(
+        select(Case.serial.label('serial')).where(Case.serial.like(patron)),
+        select(cases_archivo.c.serial).where(cases_archivo.c.serial.like(patron)),
+    ).subquery()
+    return list(db.execute(select(seriales.c.serial).order_by(seriales.c.serial.desc())).scalars())
+
+
+def _conteo_hija(nombre: str):
+    tabla = ARCHIVO_HIJAS[nombre]
+    return (select(func.count()).select_from(tabla)
+            .where(tabla.c.case_id == cases_archivo.c.id).scalar_subquery())
+
+
+async def sello_archivado(db, serial: str):
+    """
+    (id, archivado_at, eventos, notas) del caso archivado o None. Un caso
+    archivado no cambia: basta para el ETag de detalle_caso sin leer el resto
+    """
+    return (await db.execute(
+        select(cases_archivo.c.id, cases_archivo.c.archivado_at,
+               _conteo_hija('case_events').label('eventos'), _conteo_hija('case_notes').label('notas'))
+        .where(cases_archivo.c.serial == serial)
+    )).first()
+
+
+async def leer_archivado(db, case_id: int, eventos: slice, notas: slice) -> Dict:
+    """
+    Caso archivado con lo que necesita detalle_caso (filas con los mismos
+    atributos que los modelos); eventos y notas, la página pedida
+    """
+    fila = (await db.execute(
+        select(cases_archivo, Employee.nombre.label('nombre_empleado'), Company.nombre.label('nombre_empresa'))
+        .outerjoin(Employee, Employee.id == cases_archivo.c.employee_id)
+        .outerjoin(Company, Company.id == cases_archivo.c.company_id)
+        .where(cases_archivo.c.id == case_id)
+    )).first()
+
+    async def hijas(nombre: str, pagina: slice = None):
+        tabla = ARCHIVO_HIJAS[nombre]
+        query = select(tabla).where(tabla.c.case_id == case_id)
+        if pagina is not None:
+            query = (query.order_by(tabla.c.created_at.desc(), tabla.c.id.desc())
+                     .offset(pagina.start).limit(pagina.stop - pagina.start))
+        return (await db.execute(query)).all()
+
+    return {
+        'caso': fila,
+        'nombre_empleado': fila.nombre_empleado,
+        'nombre_empresa': fila.nombre_empresa,
+        'documentos': await hijas('case_documents'),
+        'eventos': await hijas('case_events', eventos),
+        'notas': await hijas('case_notes', notas),
+    }
+
+
+def conteo_archivados(company_id: Optional[int] = None):
+    """SELECT estado, count(*) del archivo (para sumar a las estadísticas de cases)"""
+    query = select(cases_archivo.c.estado, func.count()).group_by(cases_archivo.c.estado)
+    if company_id:
+        query = query.where(cases_archivo.c.company_id == company_id)
+    return query
@@ -0,0 +1,203 @@
+"""
+Arranque del Servidor: Fases, Calentamiento y Perfil de Importación
+IncaNeurobaeza - 2024
+
+En Render cada cold start esperaba a la sync completa del Excel y a la
+verificación del token de Drive antes de aceptar tráfico. Ahora:
+- startup_event solo hace init_db y arranca los schedulers
+- Con ARRANQUE_DIFERIDO=true (por defecto) la sync inicial, el token de Drive
+  y la precarga de pandas/PyMuPDF/Anthropic/httpx corren en un hilo
+  ARRANQUE_DEMORA_CALENTAMIENTO segundos después de que el servidor está listo
+- Las fases (importación, init_db, listo) y cada tarea de calentamiento quedan
+  medidas en obtener_estado() (/status → "arranque")
+- PERFIL_ARRANQUE=true registra el desglose de tiempos de importación
+  (python -X importtime en un subproceso) al terminar el calentamiento
+
+Perfil desde la terminal:
+    python -m app.arranque               # desglose de "import app.main"
+    python -m app.arranque --top 30 app.validador
+"""
+
+import os
+import sys
+import time
+import threading
+import importlib
+import subprocess
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+ARRANQUE_DIFERIDO = os.environ.get("ARRANQUE_DIFERIDO", "true").lower() == "true"
+DEMORA_CALENTAMIENTO = float(os.environ.get("ARRANQUE_DEMORA_CALENTAMIENTO", "1"))
+PERFIL_ARRANQUE = os.environ.get("PERFIL_ARRANQUE", "false").lower() == "true"
+
+# Librerías que ya no se importan al cargar app.main (se usan en el primer
+# upload, la primera llamada a IA, o la sync del Excel)
+MODULOS_PESADOS = [
+    'pandas',
+    'fitz',
+    'PIL.Image',
+    'anthropic',
+    'httpx',
+    'google.oauth2.service_account',
+]
+
+# Referencia: el primer módulo de la app que importa este archivo
+_inicio = time.perf_counter()
+
+_fases: Dict[str, float] = {}
+_calentamiento: Dict[str, dict] = {}
+_estado = {'calentando': False, 'calentado': False, 'inicio_calentamiento': None}
+_perfil: Optional[dict] = None
+
+
+# ==================== FASES ====================
+
+def marcar_fase(nombre: str):
+    """Milisegundos desde que se empezó a importar la app"""
+    _fases[nombre] = round((time.perf_counter() - _inicio) * 1000, 1)
+
+
+def obtener_estado() -> dict:
+    return {
+        'diferido': ARRANQUE_DIFERIDO,
+        'fases_ms': dict(_fases),
+        'calentando': _estado['calentando'],
+        'calentado': _estado['calentado'],
+        'inicio_calentamiento': _estado['inicio_calentamiento'],
+        'calentamiento': {k: dict(v) for k, v in _calentamiento.items()},
+        'perfil_importacion': _perfil,
+    }
+
+
+# ==================== CALENTAMIENTO ====================
+
+def precargar_modulos(modulos: List[str] = None) -> Dict[str, float]:
+    """Importa las librerías pesadas para que el primer request no las pague"""
+    tiempos = {}
+    for modulo in modulos or MODULOS_PESADOS:
+        inicio = time.perf_counter()
+        try:
+            importlib.import_module(modulo)
+            tiempos[modulo] = round((time.perf_counter() - inicio) * 1000, 1)
+        except ImportError as e:
+            log.warning("⚠️ No se pudo precargar %s: %s", modulo, e)
+    return tiempos
+
+
+def _ejecutar_tareas(tareas: List[Tuple[str, Callable]], demora: float):
+    if demora:
+        time.sleep(demora)
+    _estado['inicio_calentamiento'] = datetime.now().isoformat()
+    for nombre, funcion in tareas:
+        inicio = time.perf_counter()
+        registro = {'ok': False, 'ms': None, 'error': None}
+        try:
+            funcion()
+            registro['ok'] = True
+        except Exception as e:
+            registro['error'] = str(e)
+            log.warning("⚠️ Calentamiento '%s' falló: %s", nombre, e)
+        registro['ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+        _calentamiento[nombre] = registro
+        log.info("🔥 Calentamiento '%s': %.0f ms", nombre, registro['ms'])
+
+    if PERFIL_ARRANQUE:
+        global _perfil
+        try:
+            _perfil = resumen_importaciones(perfil_importaciones('app.main'))
+            for fila in _perfil['top']:
+                log.info("⏱️ import %-40s %8.1f ms", fila['modulo'], fila['acumulado_ms'])
+        except Exception as e:
+            log.warning("⚠️ No se pudo perfilar la importación: %s", e)
+
+    _estado['calentando'] = False
+    _estado['calentado'] = True
+    marcar_fase('calentado')
+
+
+def calentar_en_segundo_plano(tareas: List[Tuple[str, Callable]], demora: float = None) -> threading.Thread:
+    """Corre las tareas en orden en un hilo daemon, después del arranque"""
+    _estado['calentando'] = True
+    hilo = threading.Thread(
+        target=_ejecutar_tareas,
+        args=(tareas, DEMORA_CALENTAMIENTO if demora is None else demora),
+        name="calentamiento",
+        daemon=True
+    )
+    hilo.start()
+    return hilo
+
+
+# ==================== PERFIL DE IMPORTACIÓN ====================
+
+def perfil_importaciones(modulo: str = 'app.main') -> List[dict]:
+    """
+    Corre "python -X importtime -c 'import <modulo>'" en un subproceso (el
+    intérprete actual ya tiene todo importado) y devuelve una fila por módulo:
+    {modulo, nivel, propio_ms, acumulado_ms}
+    """
+    resultado = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        capture_output=True, text=True, timeout=120,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    filas = []
+    for linea in resultado.stderr.splitlines():
+        if not linea.startswith('import time:') or 'self [us]' in linea:
+            continue
+        try:
+            _, propio, acumulado, nombre = [p for p in linea.replace('import time:', '|', 1).split('|')]
+        except ValueError:
+            continue
+        sangria = len(nombre) - len(nombre.lstrip(' '))
+        filas.append({
+            'modulo': nombre.strip(),
+            'nivel': max(0, (sangria - 1) // 2),
+            'propio_ms': int(propio) / 1000,
+            'acumulado_ms': int(acumulado) / 1000,
+        })
+    if resultado.returncode != 0 and not filas:
+        raise RuntimeError(resultado.stderr.strip().splitlines()[-1] if resultado.stderr else 'importtime falló')
+    return filas
+
+
+def resumen_importaciones(filas: List[dict], top: int = 15) -> dict:
+    """Total, los imports directos más caros y el tiempo propio por paquete raíz"""
+    total = max((f['acumulado_ms'] for f in filas), default=0)
+    por_paquete: Dict[str, float] = {}
+    for fila in filas:
+        raiz = fila['modulo'].split('.')[0]
+        por_paquete[raiz] = por_paquete.get(raiz, 0) + fila['propio_ms']
+
+    # Imports hechos directamente por el módulo perfilado (nivel 1)
+    directos = sorted((f for f in filas if f['nivel'] == 1), key=lambda f: f['acumulado_ms'], reverse=True)
+    return {
+        'total_ms': round(total, 1),
+        'top': [{'modulo': f['modulo'], 'acumulado_ms': round(f['acumulado_ms'], 1)} for f in directos[:top]],
+        'por_paquete_ms': {
+            k: round(v, 1) for k, v in sorted(por_paquete.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        },
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Desglose del tiempo de importación")
+    parser.add_argument("modulo", nargs="?", default="app.main")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    resumen = resumen_importaciones(perfil_importaciones(args.modulo), top=args.top)
+    print(f"\n⏱️ import {args.modulo}: {resumen['total_ms']:.0f} ms\n")
+    print("Imports directos más caros (acumulado):")
+    for fila in resumen['top']:
+        print(f"   {fila['modulo']:<45} {fila['acumulado_ms']:8.1f} ms")
+    print("\nTiempo propio por paquete:")
+    for paquete, ms in resumen['por_paquete_ms'].items():
+        print(f"   {paquete:<45} {ms:8.1f} ms")
@@ -0,0 +1,186 @@
+"""
+Búsqueda de Casos por Texto (parámetro q de la bandeja)
+IncaNeurobaeza - 2024
+
+q era ILIKE '%q%' sobre serial, cédula y nombre del empleado: un recorrido
+completo de cases + employees en cada tecla del buscador. Ahora:
+
+- PostgreSQL: serial y cédula por prefijo (índices varchar_pattern_ops) y
+  nombre con pg_trgm sobre f_unaccent(lower(nombre)) (sin tildes ni
+  mayúsculas). Orden: serial exacto, prefijos y luego similitud del nombre
+- SQLite: tabla FTS5 casos_busqueda (rowid = cases.id) que mantienen
+  triggers sobre cases y employees; cada palabra de q se busca por prefijo.
+  Se toman las LIMITE_RESULTADOS coincidencias más recientes y se ordenan
+  como en PostgreSQL (serial exacto, prefijos, luego lo más reciente); bm25
+  sobre todas tardaba cientos de ms con prefijos cortos como 'INC0'
+
+preparar_indices() corre en init_db. Si algo no se pudo crear (permisos para
+CREATE EXTENSION, SQLite sin FTS5) la bandeja sigue con el ILIKE de antes.
+"""
+
+import os
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text, func, or_, case, select, literal_column, table, column
+
+from app.database import Case, Employee
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+# 'fts5' | 'trgm' | None (ILIKE); lo fija preparar_indices en cada proceso
+_motor: Optional[str] = None
+
+# Coincidencias que se ordenan y cuentan por búsqueda
+LIMITE_RESULTADOS = int(os.environ.get("BUSQUEDA_MAX_RESULTADOS", "1000"))
+
+SQL_POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # unaccent() no es IMMUTABLE: el envoltorio permite usarlo en un índice
+    "CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT "
+    "AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_cases_serial_prefijo ON cases (serial varchar_pattern_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_cases_cedula_prefijo ON cases (cedula varchar_pattern_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_employees_nombre_trgm "
+    "ON employees USING gin (f_unaccent(lower(nombre)) gin_trgm_ops)",
+]
+
+_NOMBRE_DEL_EMPLEADO = "(SELECT nombre FROM employees WHERE id = new.employee_id)"
+
+SQL_SQLITE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS casos_busqueda USING fts5("
+    "serial, cedula, nombre, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')",
+    f"""CREATE TRIGGER IF NOT EXISTS casos_busqueda_ai AFTER INSERT ON cases BEGIN
+        INSERT INTO casos_busqueda(rowid, serial, cedula, nombre)
+        VALUES (new.id, new.serial, new.cedula, {_NOMBRE_DEL_EMPLEADO});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS casos_busqueda_au AFTER UPDATE OF serial, cedula, employee_id ON cases BEGIN
+        DELETE FROM casos_busqueda WHERE rowid = old.id;
+        INSERT INTO casos_busqueda(rowid, serial, cedula, nombre)
+        VALUES (new.id, new.serial, new.cedula, {_NOMBRE_DEL_EMPLEADO});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS casos_busqueda_ad AFTER DELETE ON cases BEGIN
+        DELETE FROM casos_busqueda WHERE rowid = old.id;
+    END""",
+    # La carga masiva (app.carga_empleados) reescribe nombre en cada upsert:
+    # solo se reindexa si cambió, y los casos del empleado salen por índice
+    "CREATE INDEX IF NOT EXISTS ix_cases_employee_id ON cases (employee_id)",
+    "DROP TRIGGER IF EXISTS casos_busqueda_emp_au",
+    """CREATE TRIGGER casos_busqueda_emp_au AFTER UPDATE OF nombre ON employees
+    WHEN old.nombre IS NOT new.nombre BEGIN
+        UPDATE casos_busqueda SET nombre = new.nombre
+        WHERE rowid IN (SELECT id FROM cases WHERE employee_id = new.id);
+    END""",
+]
+
+SQL_SQLITE_RELLENAR = """
+    INSERT INTO casos_busqueda(rowid, serial, cedula, nombre)
+    SELECT c.id, c.serial, c.cedula, e.nombre FROM cases c LEFT JOIN employees e ON e.id = c.employee_id
+"""
+
+_fts = table('casos_busqueda', column('rowid'), column('rank'))
+
+
+# ==================== ÍNDICES ====================
+
+def preparar_indices(engine) -> Optional[str]:
+    """Crea (si faltan) los índices de búsqueda del motor y fija cuál se usa"""
+    global _motor
+    try:
+        if engine.dialect.name == "postgresql":
+            # CONCURRENTLY: no bloquea radicaciones mientras se construye (fuera de transacción)
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                for sql in SQL_POSTGRES:
+                    conn.execute(text(sql))
+            _motor = 'trgm'
+        elif engine.dialect.name == "sqlite":
+            with engine.begin() as conn:
+                existia = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'casos_busqueda'"
+                )).first() is not None
+                for sql in SQL_SQLITE:
+                    conn.execute(text(sql))
+                if not existia:
+                    conn.execute(text(SQL_SQLITE_RELLENAR))
+            _motor = 'fts5'
+    except Exception as e:
+        _motor = None
+        log.warning("⚠️ Índices de búsqueda no disponibles, se usa ILIKE: %s", e)
+    else:
+        log.info("🔎 Búsqueda de casos con %s", _motor)
+    return _motor
+
+
+def motor() -> Optional[str]:
+    return _motor
+
+
+# ==================== CONSULTA ====================
+
+def normalizar(texto: str) -> str:
+    """minúsculas y sin tildes (como f_unaccent(lower(...)) en PostgreSQL)"""
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def _escapar_like(texto: str) -> str:
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def expresion_fts(q: str) -> Optional[str]:
+    """'Juan 1023' → '"juan"* "1023"*' (cada palabra por prefijo, todas requeridas)"""
+    palabras = re.findall(r"\w+", normalizar(q))
+    return " ".join(f'"{p}"*' for p in palabras) or None
+
+
+def filtrar_por_texto(query, q: str) -> Tuple[object, List]:
+    """
+    Aplica q a un select(Case) y devuelve (query, orden) para usar en
+    .order_by(*orden). Con índice se ordenan como mucho LIMITE_RESULTADOS
+    coincidencias (las más recientes en SQLite): con más, hay que precisar q
+    """
+    q = q.strip()
+    exacto = (Case.serial == q.upper()).desc()
+    serial = f"{_escapar_like(q.upper())}%"
+    cedula = f"{_escapar_like(q)}%"
+    # Serial o cédula que empiezan por q antes que coincidencias por nombre
+    relevancia = case((Case.serial.like(serial, escape='\\'), 1),
+                      (Case.cedula.like(cedula, escape='\\'), 1), else_=2)
+
+    if _motor == 'fts5':
+        expresion = expresion_fts(q)
+        if expresion is None:
+            return query, [Case.created_at.desc()]
+        # rowid DESC + LIMIT recorre el índice FTS hacia atrás y para en el límite.
+        # Sin bm25 (rank): con términos frecuentes cuesta ~40 ms por consulta a 1M casos
+        coincidencias = (select(_fts.c.rowid.label('case_id'))
+                         .where(literal_column('casos_busqueda').op('MATCH')(expresion))
+                         .order_by(_fts.c.rowid.desc()).limit(LIMITE_RESULTADOS)
+                         .subquery('coincidencias'))
+        query = query.join(coincidencias, coincidencias.c.case_id == Case.id)
+        return query, [exacto, relevancia, Case.created_at.desc()]
+
+    if _motor == 'trgm':
+        termino = normalizar(q)
+        nombre = func.f_unaccent(func.lower(Employee.nombre))
+        # BitmapOr de los tres índices; el LIMIT corta antes de leer todas las filas
+        coincidencias = (select(Case.id.label('case_id'))
+                         .join(Employee, Case.employee_id == Employee.id, isouter=True)
+                         .where(or_(Case.serial.like(serial, escape='\\'), Case.cedula.like(cedula, escape='\\'),
+                                    nombre.like(f"%{_escapar_like(termino)}%", escape='\\')))
+                         .limit(LIMITE_RESULTADOS)
+                         .subquery('coincidencias'))
+        query = (query.join(coincidencias, coincidencias.c.case_id == Case.id)
+                 .join(Employee, Case.employee_id == Employee.id, isouter=True))
+        return query, [exacto, relevancia, func.similarity(nombre, termino).desc(), Case.created_at.desc()]
+
+    # Sin índices: lo de siempre
+    query = query.join(Employee, Case.employee_id == Employee.id, isouter=True).where(or_(
+        Case.serial.ilike(f"%{q}%"),
+        Case.cedula.ilike(f"%{q}%"),
+        Employee.nombre.ilike(f"%{q}%"),
+    ))
+    return query, [Case.created_at.desc()]
@@ -0,0 +1,160 @@
+"""
+Carga Masiva de Empleados (Excel → employees)
+IncaNeurobaeza - 2024
+
+/admin/migrar-excel recorría df.iterrows() y por cada fila buscaba la
+empresa, hacía commit si era nueva, buscaba la cédula y volvía a hacer
+commit: hasta cuatro idas a la BD y dos fsync por empleado. Ahora:
+
+- El DataFrame se limpia con operaciones de columna (cédulas a texto,
+  filas sin cédula/nombre/empresa a errores, cédulas repetidas: gana la última)
+- Empresas: un SELECT ... IN con todos los nombres y un INSERT de las que faltan
+- Empleados: INSERT ... ON CONFLICT (cedula) DO UPDATE por lotes de
+  CARGA_LOTE filas, un executemany y un commit por lote. Un lote que falla
+  se reporta y no detiene a los demás
+"""
+
+import os
+import time
+from typing import Dict, List, Tuple
+
+from sqlalchemy import select, func
+
+from app.database import engine, Company, Employee
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+CARGA_LOTE = int(os.environ.get("CARGA_EMPLEADOS_LOTE", "5000"))
+
+OBLIGATORIAS = ["cedula", "nombre", "empresa"]
+# Columnas opcionales del Excel que se copian tal cual (si vienen)
+OPCIONALES = ["correo", "telefono", "eps", "jefe_nombre", "jefe_email", "jefe_cargo", "area_trabajo"]
+
+
+def _insert(tabla):
+    """INSERT con ON CONFLICT del dialecto (PostgreSQL y SQLite lo soportan igual)"""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(tabla)
+
+
+# ==================== PREPARACIÓN ====================
+
+def _texto(serie):
+    """Columna a texto sin '.0' de las cédulas/teléfonos que pandas leyó como float"""
+    import pandas as pd
+    numeros = pd.to_numeric(serie, errors='coerce')
+    enteros = numeros.notna() & (numeros % 1 == 0)
+    texto = serie.astype('string').str.strip()
+    texto[enteros] = numeros[enteros].astype('int64').astype('string')
+    return texto.mask(texto == "", pd.NA)
+
+
+def preparar_dataframe(df) -> Tuple[object, List[str]]:
+    """DataFrame listo para insertar (una fila por cédula) y los errores por fila"""
+    import pandas as pd
+
+    faltantes = [c for c in OBLIGATORIAS if c not in df.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en el Excel: {', '.join(faltantes)}")
+
+    columnas = OBLIGATORIAS + [c for c in OPCIONALES if c in df.columns]
+    limpio = pd.DataFrame({c: _texto(df[c]) for c in columnas}, index=df.index)
+
+    invalidas = limpio[OBLIGATORIAS].isna().any(axis=1)
+    errores = [
+        f"Fila {idx + 2}: falta {', '.join(c for c in OBLIGATORIAS if pd.isna(fila[c]))}"
+        for idx, fila in limpio[invalidas].iterrows()
+    ]
+    limpio = limpio[~invalidas]
+
+    repetidas = limpio.duplicated('cedula', keep='last')
+    if repetidas.any():
+        errores.append(f"{int(repetidas.sum())} cédula(s) repetida(s) en el Excel: se usó la última fila")
+        limpio = limpio[~repetidas]
+
+    return limpio.astype(object).where(limpio.notna(), None), errores
+
+
+# ==================== CARGA ====================
+
+def resolver_empresas(conn, nombres) -> Tuple[Dict[str, int], int]:
+    """{nombre: id} de todas las empresas, creando las que faltan en un solo INSERT"""
+    nombres = sorted(set(nombres))
+    ids = dict(conn.execute(select(Company.nombre, Company.id).where(Company.nombre.in_(nombres))).all())
+    nuevas = [n for n in nombres if n not in ids]
+    if nuevas:
+        conn.execute(_insert(Company).on_conflict_do_nothing(index_elements=['nombre']),
+                     [{'nombre': n, 'activa': True} for n in nuevas])
+        ids.update(conn.execute(select(Company.nombre, Company.id).where(Company.nombre.in_(nuevas))).all())
+    return ids, len(nuevas)
+
+
+def cargar_empleados(df, lote: int = None) -> Dict:
+    """
+    Inserta o actualiza (por cédula) los empleados del DataFrame del Excel.
+    Devuelve el resumen con un informe por lote
+    """
+    from datetime import datetime
+
+    inicio = time.perf_counter()
+    lote = lote or CARGA_LOTE
+    limpio, errores = preparar_dataframe(df)
+
+    with engine.begin() as conn:
+        empresas, empresas_nuevas = resolver_empresas(conn, limpio['empresa'])
+
+    filas = limpio.rename(columns={'empresa': 'company_id'})
+    filas['company_id'] = filas['company_id'].map(empresas)
+    columnas = list(filas.columns)
+
+    sentencia = _insert(Employee)
+    # Solo se pisan las columnas que trae el Excel (sin jefe_* no se borran los jefes)
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=['cedula'],
+        set_={
+            **{c: sentencia.excluded[c] for c in columnas if c != 'cedula'},
+            'activo': True,
+            'updated_at': sentencia.excluded.updated_at,
+        }
+    )
+
+    lotes = []
+    for numero, desde in enumerate(range(0, len(filas), lote), start=1):
+        registros = filas.iloc[desde:desde + lote].to_dict('records')
+        ahora = datetime.utcnow()
+        for registro in registros:
+            registro['activo'] = True
+            registro['created_at'] = registro['updated_at'] = ahora
+        informe = {'lote': numero, 'filas': len(registros), 'insertados': 0, 'actualizados': 0, 'error': None}
+        t0 = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                existentes = conn.scalar(select(func.count()).select_from(Employee).where(
+                    Employee.cedula.in_([r['cedula'] for r in registros])
+                ))
+                conn.execute(sentencia, registros)
+            informe['insertados'] = len(registros) - existentes
+            informe['actualizados'] = existentes
+        except Exception as e:
+            informe['error'] = str(e)[:300]
+            errores.append(f"Lote {numero} (filas {desde + 1}-{desde + len(registros)}): {informe['error']}")
+            log.error("❌ Error en lote %s de empleados: %s", numero, e)
+        informe['ms'] = round((time.perf_counter() - t0) * 1000, 1)
+        lotes.append(informe)
+
+    resumen = {
+        'total_procesados': len(df),
+        'insertados': sum(l['insertados'] for l in lotes),
+        'actualizados': sum(l['actualizados'] for l in lotes),
+        'empresas_nuevas': empresas_nuevas,
+        'errores': errores,
+        'lotes': lotes,
+        'duracion_s': round(time.perf_counter() - inicio, 2),
+    }
+    log.info("✅ Carga de empleados: %s nuevos, %s actualizados, %s empresas nuevas, %s errores en %.1fs",
+             resumen['insertados'], resumen['actualizados'], empresas_nuevas, len(errores), resumen['duracion_s'])
+    return resumen
@@ -0,0 +1,392 @@
+"""
+Comparador de Versiones - Diferencias página por página entre reenvíos
+IncaNeurobaeza - 2024
+
+- Cada página se resume en un dHash de 64 bits (hash perceptual)
+- Los hashes se guardan por revisión de archivo (md5Checksum de Drive),
+  así la versión anterior no se vuelve a procesar en cada reenvío
+- Las páginas se alinean con programación dinámica (igual / cambiada /
+  agregada / eliminada) y solo se generan miniaturas de lo que cambió
+- Corre en un worker de fondo: se programa al recibir el reenvío y el
+  validador encuentra el resultado listo al abrir el caso
+- El worker toma la fila con un lease en la BD (tomada_at); una fila
+  PENDIENTE sin lease vigente (reinicio, worker de otro proceso que murió)
+  la retoma el job reanudar_comparaciones en cualquier proceso
+- A lo sumo COMPARADOR_MAX_MINIATURAS miniaturas por comparación: el
+  resultado va en una columna JSON y se devuelve entero al abrir el caso
+"""
+
+import io
+import os
+import base64
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageChops
+
+from sqlalchemy import or_
+
+from app.database import SessionLocal, PageFingerprint, VersionComparison
+from app.metricas import span
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+# Distancia de Hamming (sobre 64 bits) para considerar dos páginas iguales / la misma página modificada
+UMBRAL_IGUAL = int(os.environ.get("COMPARADOR_UMBRAL_IGUAL", "6"))
+UMBRAL_CAMBIO = int(os.environ.get("COMPARADOR_UMBRAL_CAMBIO", "22"))
+
+# Ancho en píxeles de las miniaturas que se devuelven al validador
+ANCHO_MINIATURA = int(os.environ.get("COMPARADOR_ANCHO_MINIATURA", "160"))
+# Páginas con miniatura por comparación (el resto solo trae el tipo de cambio)
+MAX_MINIATURAS = int(os.environ.get("COMPARADOR_MAX_MINIATURAS", "20"))
+
+# Un lease más viejo que esto es de un worker que murió: la fila se retoma
+LEASE_MINUTOS = int(os.environ.get("COMPARADOR_LEASE_MINUTOS", "10"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("COMPARADOR_WORKERS", "2")),
+    thread_name_prefix="comparador"
+)
+
+
+# ==================== HASH PERCEPTUAL ====================
+
+def _render_pagina(page, ancho: int) -> Image.Image:
+    """Renderiza una página a escala de grises con el ancho indicado"""
+    zoom = ancho / max(page.rect.width, 1)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+
+def dhash_pagina(page) -> str:
+    """dHash de 64 bits: compara cada píxel con su vecino en una imagen de 9x8"""
+    img = _render_pagina(page, 72).resize((9, 8), Image.LANCZOS)
+    pixeles = list(img.getdata())
+
+    valor = 0
+    for fila in range(8):
+        for col in range(8):
+            izq = pixeles[fila * 9 + col]
+            der = pixeles[fila * 9 + col + 1]
+            valor = (valor << 1) | (1 if izq > der else 0)
+
+    return f"{valor:016x}"
+
+
+def distancia(hash_a: str, hash_b: str) -> int:
+    """Distancia de Hamming entre dos dHash"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+# ==================== CACHÉ POR REVISIÓN ====================
+
+def _revision(meta: dict) -> str:
+    return meta.get('md5Checksum') or meta.get('modifiedTime') or 'sin-revision'
+
+
+def _revision_drive(service, file_id: str) -> str:
+    return _revision(service.files_get(file_id, fields='md5Checksum, modifiedTime'))
+
+
+def _revisiones_drive(service, file_ids: List[str]) -> Dict[str, str]:
+    """Revisión de varios archivos con las llamadas a Drive en paralelo"""
+    respuestas = service.reunir({
+        fid: service.asincrono.files_get(fid, fields='md5Checksum, modifiedTime')
+        for fid in file_ids
+    })
+    revisiones = {}
+    for fid, (meta, error) in respuestas.items():
+        if error is not None:
+            raise error
+        revisiones[fid] = _revision(meta)
+    return revisiones
+
+
+def _descargar(service, file_id: str) -> fitz.Document:
+    contenido = service.files_get_media(file_id)
+    return fitz.open(stream=contenido, filetype="pdf")
+
+
+def _descargar_varios(service, file_ids: List[str]) -> Dict[str, fitz.Document]:
+    """Descarga varios PDFs de Drive a la vez"""
+    respuestas = service.reunir({fid: service.asincrono.files_get_media(fid) for fid in file_ids})
+    for _, error in respuestas.values():
+        if error is not None:
+            raise error
+    return {fid: fitz.open(stream=contenido, filetype="pdf") for fid, (contenido, _) in respuestas.items()}
+
+
+def obtener_huellas_paginas(db, service, file_id: str,
+                            revision: str = None) -> Tuple[List[str], Optional[fitz.Document]]:
+    """
+    Devuelve los dHash de las páginas de un archivo de Drive
+
+    Args:
+        revision: la del archivo si ya se consultó (si no, se pide a Drive)
+
+    Returns:
+        (hashes, documento) - documento es None si los hashes salieron de caché
+    """
+    revision = revision or _revision_drive(service, file_id)
+
+    filas = db.query(PageFingerprint).filter(
+        PageFingerprint.drive_file_id == file_id,
+        PageFingerprint.revision == revision
+    ).order_by(PageFingerprint.pagina).all()
+
+    if filas:
+        return [f.dhash for f in filas], None
+
+    doc = _descargar(service, file_id)
+    hashes = [dhash_pagina(page) for page in doc]
+
+    # Revisiones viejas del mismo archivo ya no sirven
+    db.query(PageFingerprint).filter(
+        PageFingerprint.drive_file_id == file_id,
+        PageFingerprint.revision != revision
+    ).delete(synchronize_session=False)
+
+    for i, h in enumerate(hashes):
+        db.add(PageFingerprint(drive_file_id=file_id, revision=revision, pagina=i, dhash=h))
+    db.commit()
+
+    log.info("🔎 %s páginas procesadas para %s (rev %s)", len(hashes), file_id, revision[:8])
+    return hashes, doc
+
+
+# ==================== ALINEACIÓN ====================
+
+def alinear_paginas(anteriores: List[str], nuevas: List[str]) -> List[Dict]:
+    """
+    Alinea dos secuencias de páginas (edit distance sobre dHash)
+
+    - Emparejar páginas cuesta 0 si son iguales y 1 si es la misma página modificada
+    - Agregar o eliminar una página cuesta 1
+    - Páginas demasiado distintas nunca se emparejan
+    """
+    n, m = len(anteriores), len(nuevas)
+    INF = float('inf')
+
+    def costo_par(i, j):
+        d = distancia(anteriores[i], nuevas[j])
+        if d <= UMBRAL_IGUAL:
+            return 0, d
+        if d <= UMBRAL_CAMBIO:
+            return 1, d
+        return INF, d
+
+    costo = [[0] * (m + 1) for _ in range(n + 1)]
+    for i in range(1, n + 1):
+        costo[i][0] = i
+    for j in range(1, m + 1):
+        costo[0][j] = j
+
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            c, _ = costo_par(i - 1, j - 1)
+            costo[i][j] = min(
+                costo[i - 1][j - 1] + c,
+                costo[i - 1][j] + 1,
+                costo[i][j - 1] + 1
+            )
+
+    # Reconstruir el camino desde el final
+    pasos = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        if i > 0 and j > 0:
+            c, d = costo_par(i - 1, j - 1)
+            if costo[i][j] == costo[i - 1][j - 1] + c:
+                pasos.append({
+                    'tipo': 'igual' if c == 0 else 'cambiada',
+                    'pagina_anterior': i - 1,
+                    'pagina_nueva': j - 1,
+                    'distancia': d
+                })
+                i, j = i - 1, j - 1
+                continue
+        if i > 0 and costo[i][j] == costo[i - 1][j] + 1:
+            pasos.append({'tipo': 'eliminada', 'pagina_anterior': i - 1, 'pagina_nueva': None})
+            i -= 1
+        else:
+            pasos.append({'tipo': 'agregada', 'pagina_anterior': None, 'pagina_nueva': j - 1})
+            j -= 1
+
+    pasos.reverse()
+    return pasos
+
+
+# ==================== MINIATURAS ====================
+
+def _png_base64(img: Image.Image) -> str:
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG", optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def miniatura_diferencias(page_anterior, page_nueva) -> str:
+    """Miniatura de la página nueva con las zonas que cambiaron en rojo"""
+    nueva = _render_pagina(page_nueva, ANCHO_MINIATURA)
+    anterior = _render_pagina(page_anterior, ANCHO_MINIATURA).resize(nueva.size)
+
+    mascara = ImageChops.difference(anterior, nueva).point(lambda v: 255 if v > 40 else 0)
+    resaltado = nueva.convert("RGB")
+    resaltado.paste((220, 38, 38), mask=mascara)
+    return _png_base64(resaltado)
+
+
+def miniatura_pagina(page) -> str:
+    return _png_base64(_render_pagina(page, ANCHO_MINIATURA))
+
+
+# ==================== COMPARACIÓN ====================
+
+@span('pdf', 'comparar_versiones')
+def comparar_archivos(db, service, file_id_anterior: str, file_id_nuevo: str) -> Dict:
+    """Compara dos PDFs de Drive y devuelve el resumen + miniaturas de lo que cambió"""
+    revisiones = _revisiones_drive(service, [file_id_anterior, file_id_nuevo])
+    hashes_ant, doc_ant = obtener_huellas_paginas(db, service, file_id_anterior, revisiones[file_id_anterior])
+    hashes_nue, doc_nue = obtener_huellas_paginas(db, service, file_id_nuevo, revisiones[file_id_nuevo])
+
+    paginas = alinear_paginas(hashes_ant, hashes_nue)
+    hay_diferencias = any(p['tipo'] != 'igual' for p in paginas)
+
+    # Solo se descarga lo que falte para las miniaturas
+    if hay_diferencias:
+        faltan = []
+        if doc_ant is None and any(p['tipo'] in ('cambiada', 'eliminada') for p in paginas):
+            faltan.append(file_id_anterior)
+        if doc_nue is None and any(p['tipo'] in ('cambiada', 'agregada') for p in paginas):
+            faltan.append(file_id_nuevo)
+        if faltan:
+            descargados = _descargar_varios(service, faltan)
+            doc_ant = doc_ant or descargados.get(file_id_anterior)
+            doc_nue = doc_nue or descargados.get(file_id_nuevo)
+
+    distintas = [p for p in paginas if p['tipo'] != 'igual']
+    try:
+        for p in distintas[:MAX_MINIATURAS]:
+            if p['tipo'] == 'cambiada':
+                p['miniatura'] = miniatura_diferencias(doc_ant[p['pagina_anterior']], doc_nue[p['pagina_nueva']])
+            elif p['tipo'] == 'agregada':
+                p['miniatura'] = miniatura_pagina(doc_nue[p['pagina_nueva']])
+            elif p['tipo'] == 'eliminada':
+                p['miniatura'] = miniatura_pagina(doc_ant[p['pagina_anterior']])
+    finally:
+        if doc_ant is not None:
+            doc_ant.close()
+        if doc_nue is not None:
+            doc_nue.close()
+
+    return {
+        'paginas_anterior': len(hashes_ant),
+        'paginas_nueva': len(hashes_nue),
+        'resumen': {
+            tipo: sum(1 for p in paginas if p['tipo'] == tipo)
+            for tipo in ('igual', 'cambiada', 'agregada', 'eliminada')
+        },
+        'paginas': paginas,
+        'miniaturas_omitidas': max(len(distintas) - MAX_MINIATURAS, 0)
+    }
+
+
+def _tomar(db, comparacion_id: int) -> bool:
+    """
+    Lease atómico (UPDATE condicional): solo un worker, de cualquier proceso,
+    calcula cada comparación; un lease vencido se puede volver a tomar
+    """
+    ahora = datetime.utcnow()
+    tomadas = db.query(VersionComparison).filter(
+        VersionComparison.id == comparacion_id,
+        VersionComparison.estado == 'PENDIENTE',
+        or_(VersionComparison.tomada_at.is_(None),
+            VersionComparison.tomada_at < ahora - timedelta(minutes=LEASE_MINUTOS))
+    ).update({VersionComparison.tomada_at: ahora}, synchronize_session=False)
+    db.commit()
+    return tomadas == 1
+
+
+def _ejecutar_comparacion(comparacion_id: int):
+    """Worker de fondo: toma la comparación, la calcula y guarda el resultado"""
+    from app.drive_uploader import get_authenticated_service
+
+    db = SessionLocal()
+    try:
+        if not _tomar(db, comparacion_id):
+            return
+        comparacion = db.get(VersionComparison, comparacion_id)
+
+        try:
+            service = get_authenticated_service()
+            resultado = comparar_archivos(db, service, comparacion.file_id_anterior, comparacion.file_id_nuevo)
+            comparacion.resultado = resultado
+            comparacion.estado = 'LISTA'
+            comparacion.error = None
+            log.info("✅ Comparación %s lista: %s", comparacion_id, resultado['resumen'])
+        except Exception as e:
+            db.rollback()
+            comparacion.estado = 'ERROR'
+            comparacion.error = str(e)[:1000]
+            log.error("❌ Error comparando versiones (%s): %s", comparacion_id, e)
+
+        comparacion.tomada_at = None
+        comparacion.completed_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+def programar_comparacion(db, case_id: int, file_id_anterior: str, file_id_nuevo: str,
+                          forzar: bool = False) -> VersionComparison:
+    """
+    Registra (si no existe) la comparación de un par de archivos y la
+    manda al worker de fondo. Hace commit.
+    """
+    comparacion = db.query(VersionComparison).filter(
+        VersionComparison.file_id_anterior == file_id_anterior,
+        VersionComparison.file_id_nuevo == file_id_nuevo
+    ).first()
+
+    if comparacion and comparacion.estado == 'LISTA' and not forzar:
+        return comparacion
+
+    if not comparacion:
+        comparacion = VersionComparison(
+            case_id=case_id,
+            file_id_anterior=file_id_anterior,
+            file_id_nuevo=file_id_nuevo
+        )
+        db.add(comparacion)
+
+    comparacion.estado = 'PENDIENTE'
+    db.commit()
+
+    # Si ya la calcula otro worker, _tomar no la repite
+    _executor.submit(_ejecutar_comparacion, comparacion.id)
+    log.info("🕒 Comparación de versiones programada (%s → %s)", file_id_anterior, file_id_nuevo)
+    return comparacion
+
+
+def reanudar_comparaciones(limite: int = 50) -> int:
+    """
+    Job del planificador: vuelve a mandar al worker las comparaciones
+    PENDIENTE que nadie está calculando (sin lease o con el lease vencido)
+    """
+    vencido = datetime.utcnow() - timedelta(minutes=LEASE_MINUTOS)
+    db = SessionLocal()
+    try:
+        ids = [fila.id for fila in db.query(VersionComparison.id).filter(
+            VersionComparison.estado == 'PENDIENTE',
+            or_(VersionComparison.tomada_at.is_(None), VersionComparison.tomada_at < vencido)
+        ).order_by(VersionComparison.created_at).limit(limite)]
+    finally:
+        db.close()
+
+    for comparacion_id in ids:
+        _executor.submit(_ejecutar_comparacion, comparacion_id)
+    if ids:
+        log.info("🔁 %s comparación(es) de versiones pendientes retomadas", len(ids))
+    return len(ids)
@@ -0,0 +1,382 @@
+"""
+Gestor de Credenciales OAuth de Google Drive
+IncaNeurobaeza - 2024
+
+Antes cada llamada a _get_or_refresh_credentials tomaba un lock global y
+leía/escribía el token en disco aunque siguiera vigente, y retry_on_error
+dormía con time.sleep ante cualquier error que dijera "invalid". Ahora:
+
+- El token vive en memoria: la lectura en el camino caliente no toma locks
+  ni toca el estado compartido (una referencia inmutable _Token)
+- Renovación single-flight: si varios hilos lo necesitan a la vez, uno
+  renueva y el resto espera ese mismo resultado (un Future)
+- Renovación proactiva: un temporizador renueva GOOGLE_TOKEN_RENOVAR_ANTES_SEG
+  antes de que venza, así los requests casi nunca pagan el refresh
+- Backoff sin bloquear: tras un fallo, durante la ventana de espera las
+  llamadas fallan de inmediato (o usan el token si aún no venció) en vez de
+  dormir el hilo del request
+- Entre instancias: el token renovado se publica en app.estado_compartido y
+  la renovación se hace bajo un candado; quien llega después adopta el token
+  de la otra instancia
+
+El cliente REST (app.google_rest) pide el token con token_vigente() y,
+ante un 401, llama a renovar(rechazado=...) con el token que usó.
+"""
+
+import os
+import json
+import time
+import random
+import datetime
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, NamedTuple, Optional
+
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID")
+CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET")
+REFRESH_TOKEN = os.environ.get("GOOGLE_REFRESH_TOKEN")
+SCOPES = ["https://www.googleapis.com/auth/drive.file"]
+TOKEN_URI = "https://oauth2.googleapis.com/token"
+
+# Renovación proactiva: cuántos segundos antes del vencimiento
+RENOVAR_ANTES_SEG = int(os.environ.get("GOOGLE_TOKEN_RENOVAR_ANTES_SEG", "600"))
+# Vida mínima para usar el token en un request sin renovarlo antes
+MARGEN_SEG = int(os.environ.get("GOOGLE_TOKEN_MARGEN_SEG", "120"))
+# Tope del backoff tras fallos de renovación
+BACKOFF_MAX_SEG = int(os.environ.get("GOOGLE_TOKEN_BACKOFF_MAX_SEG", "300"))
+# Cuánto espera un hilo a la renovación que lleva otro
+ESPERA_VUELO_SEG = 30
+
+# Clave del token en el estado compartido
+CLAVE_TOKEN = "google:token"
+
+
+class ErrorCredenciales(Exception):
+    """No hay token utilizable (renovación fallida o en backoff)"""
+
+
+class _Token(NamedTuple):
+    creds: object
+    vence: float  # epoch; inf si el token no trae expiry
+
+    def restante(self) -> float:
+        return self.vence - time.time()
+
+
+def _vencimiento(creds) -> float:
+    if not creds.expiry:
+        return float('inf')
+    # google-auth usa datetimes UTC sin zona
+    return creds.expiry.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def _renovar_con_refresh_token():
+    """access_token nuevo a partir de GOOGLE_REFRESH_TOKEN"""
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
+    if not all([CLIENT_ID, CLIENT_SECRET, REFRESH_TOKEN]):
+        raise ValueError(
+            "❌ Faltan credenciales de Google Drive:\n"
+            f"  CLIENT_ID: {'✅' if CLIENT_ID else '❌'}\n"
+            f"  CLIENT_SECRET: {'✅' if CLIENT_SECRET else '❌'}\n"
+            f"  REFRESH_TOKEN: {'✅' if REFRESH_TOKEN else '❌'}\n"
+            "Configura estas variables en Render Dashboard → Environment"
+        )
+
+    creds = Credentials(
+        token=None,
+        refresh_token=REFRESH_TOKEN,
+        token_uri=TOKEN_URI,
+        client_id=CLIENT_ID,
+        client_secret=CLIENT_SECRET,
+        scopes=SCOPES
+    )
+    creds.refresh(Request())
+    return creds
+
+
+# ==================== GESTOR ====================
+
+class GestorCredenciales:
+    def __init__(self, renovador: Callable = None, estado=None):
+        """
+        renovador: función sin argumentos que retorna Credentials ya
+        renovadas (por defecto, con GOOGLE_REFRESH_TOKEN)
+        estado: backend de app.estado_compartido (por defecto el activo)
+        """
+        self._renovador = renovador or _renovar_con_refresh_token
+        self._estado = estado
+        self._actual: Optional[_Token] = None
+        self._lock = threading.Lock()
+        self._vuelo: Optional[Future] = None
+        self._temporizador: Optional[threading.Timer] = None
+        self._fallos = 0
+        self._no_antes_de = 0.0
+        self._ultimo_error: Optional[str] = None
+        self._stats = {
+            'renovaciones': 0, 'adoptados': 0, 'esperas_vuelo': 0,
+            'fallos': 0, 'rechazos_en_backoff': 0, 'proactivas': 0,
+        }
+
+    # ---------- camino caliente ----------
+
+    def obtener(self):
+        """Credentials vigentes. Sin locks si al token le quedan más de MARGEN_SEG"""
+        actual = self._actual
+        if actual is not None and actual.restante() > MARGEN_SEG:
+            return actual.creds
+        return self.renovar()
+
+    def token_actual(self) -> Optional[str]:
+        actual = self._actual
+        return actual.creds.token if actual else None
+
+    def token_vigente(self) -> Optional[str]:
+        """Token si no hace falta renovarlo (sin locks ni esperas), si no None"""
+        actual = self._actual
+        if actual is not None and actual.restante() > MARGEN_SEG:
+            return actual.creds.token
+        return None
+
+    # ---------- renovación ----------
+
+    def renovar(self, rechazado: str = None, forzar: bool = False):
+        """
+        Single-flight: el primero que llega renueva, los demás esperan su
+        resultado. rechazado = token que Google respondió con 401 (se descarta
+        solo si sigue siendo el actual).
+        """
+        with self._lock:
+            actual = self._actual
+            if rechazado and actual is not None and actual.creds.token == rechazado:
+                self._actual = actual = None
+
+            if not forzar and actual is not None and actual.restante() > MARGEN_SEG:
+                return actual.creds
+
+            vuelo = self._vuelo
+            if vuelo is None:
+                espera = self._no_antes_de - time.monotonic()
+                if espera > 0:
+                    self._stats['rechazos_en_backoff'] += 1
+                    # Mejor un token a punto de vencer que ninguno
+                    if actual is not None and actual.restante() > 0:
+                        return actual.creds
+                    raise ErrorCredenciales(
+                        f"Renovación del token en pausa {espera:.0f}s más: {self._ultimo_error}"
+                    )
+                vuelo = self._vuelo = Future()
+                lider = True
+            else:
+                lider = False
+                self._stats['esperas_vuelo'] += 1
+
+        if not lider:
+            try:
+                return vuelo.result(timeout=ESPERA_VUELO_SEG).creds
+            except FutureTimeout:
+                raise ErrorCredenciales("Tiempo agotado esperando la renovación del token")
+
+        try:
+            token = self._renovar_ahora(rechazado)
+            vuelo.set_result(token)
+            return token.creds
+        except Exception as e:
+            vuelo.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._vuelo = None
+
+    def _renovar_ahora(self, rechazado: Optional[str]) -> _Token:
+        estado = self._backend()
+        try:
+            # Otra instancia pudo renovarlo ya
+            token = self._token_compartido_nuevo(rechazado)
+            if token is None:
+                with estado.candado(f"{CLAVE_TOKEN}:renovando", ttl=30, espera=15) as obtenido:
+                    token = self._token_compartido_nuevo(rechazado)
+                    if token is None:
+                        if not obtenido:
+                            log.warning("⚠️ Otra instancia no terminó de renovar el token, renovando aquí")
+                        log.info("🔄 Generando/renovando access_token con refresh_token...")
+                        creds = self._renovador()
+                        token = _Token(creds, _vencimiento(creds))
+                        self._publicar(token)
+                        self._stats['renovaciones'] += 1
+                        log.info("✅ Token generado/renovado exitosamente (vence en %.0f min)",
+                                 token.restante() / 60)
+        except Exception as e:
+            raise self._registrar_fallo(e)
+
+        self._adoptar(token)
+        return token
+
+    def _registrar_fallo(self, error: Exception) -> Exception:
+        """Abre la ventana de backoff (sin dormir) y arma el error para el caller"""
+        texto = str(error)
+        with self._lock:
+            self._fallos += 1
+            self._stats['fallos'] += 1
+            if 'invalid_grant' in texto.lower():
+                espera = BACKOFF_MAX_SEG
+            else:
+                espera = min(BACKOFF_MAX_SEG, 2 ** self._fallos) * random.uniform(0.8, 1.2)
+            self._no_antes_de = time.monotonic() + espera
+            self._ultimo_error = texto
+        log.error("❌ Error renovando token (fallo %s, próximo intento en %.0fs): %s",
+                  self._fallos, espera, texto)
+
+        # El token actual puede seguir sirviendo: reintentar en fondo al abrir la ventana
+        actual = self._actual
+        if actual is not None and actual.restante() > 0:
+            self._programar(espera)
+
+        # ✅ DETECTAR SI EL REFRESH_TOKEN FUE REVOCADO
+        if 'invalid_grant' in texto.lower():
+            return ErrorCredenciales(
+                "❌ ERROR CRÍTICO: El REFRESH_TOKEN ha sido revocado o es inválido.\n\n"
+                "SOLUCIÓN:\n"
+                "1. Ejecuta localmente: python regenerar_token.py\n"
+                "2. Copia el nuevo REFRESH_TOKEN\n"
+                "3. Actualízalo en Render Dashboard → Environment → GOOGLE_REFRESH_TOKEN\n"
+                "4. Guarda cambios y espera 1-2 minutos\n\n"
+                f"Detalles técnicos: {texto}"
+            )
+        if isinstance(error, (ErrorCredenciales, ValueError)):
+            return error
+        return ErrorCredenciales(f"Error renovando token: {texto}")
+
+    def _adoptar(self, token: _Token):
+        with self._lock:
+            self._actual = token
+            self._fallos = 0
+            self._no_antes_de = 0.0
+            self._ultimo_error = None
+        if token.vence != float('inf'):
+            # Jitter: con varias instancias no renuevan todas en el mismo segundo
+            self._programar(token.restante() - RENOVAR_ANTES_SEG * random.uniform(0.8, 1.0))
+
+    # ---------- renovación proactiva ----------
+
+    def _programar(self, segundos: float):
+        with self._lock:
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+            self._temporizador = threading.Timer(max(5.0, segundos), self._renovar_en_fondo)
+            self._temporizador.daemon = True
+            self._temporizador.name = "renovar_token_google"
+            self._temporizador.start()
+
+    def _renovar_en_fondo(self):
+        self._stats['proactivas'] += 1
+        try:
+            self.renovar(forzar=True)
+        except Exception as e:
+            # _registrar_fallo ya reprogramó si el token actual sigue vigente
+            log.warning("⚠️ Renovación proactiva del token falló: %s", e)
+
+    # ---------- estado compartido ----------
+
+    def _backend(self):
+        if self._estado is not None:
+            return self._estado
+        from app.estado_compartido import obtener_backend
+        return obtener_backend()
+
+    def _token_compartido_nuevo(self, rechazado: Optional[str]) -> Optional[_Token]:
+        """Token publicado por otra instancia si es más nuevo que el nuestro"""
+        datos = self.leer_compartido()
+        if not datos or not datos.get('token') or datos.get('token') == rechazado:
+            return None
+        try:
+            from google.oauth2.credentials import Credentials
+            creds = Credentials(
+                token=datos['token'],
+                refresh_token=datos.get('refresh_token'),
+                token_uri=datos.get('token_uri') or TOKEN_URI,
+                client_id=datos.get('client_id'),
+                client_secret=datos.get('client_secret'),
+                scopes=datos.get('scopes') or SCOPES,
+                expiry=datetime.datetime.fromisoformat(datos['expiry']) if datos.get('expiry') else None
+            )
+        except Exception as e:
+            log.warning("⚠️ Error cargando token del cache: %s", e)
+            return None
+        token = _Token(creds, _vencimiento(creds))
+        actual = self._actual
+        if token.restante() <= MARGEN_SEG:
+            return None
+        if actual is not None and (actual.creds.token == token.creds.token or token.vence <= actual.vence):
+            return None
+        self._stats['adoptados'] += 1
+        log.info("✅ Token renovado por otra instancia (vence en %.0f min)", token.restante() / 60)
+        return token
+
+    def _publicar(self, token: _Token):
+        creds = token.creds
+        datos = {
+            'token': creds.token,
+            'refresh_token': getattr(creds, 'refresh_token', None) or REFRESH_TOKEN,
+            'token_uri': getattr(creds, 'token_uri', TOKEN_URI),
+            'client_id': getattr(creds, 'client_id', CLIENT_ID),
+            'client_secret': getattr(creds, 'client_secret', CLIENT_SECRET),
+            'scopes': getattr(creds, 'scopes', SCOPES),
+            'expiry': creds.expiry.isoformat() if creds.expiry else None
+        }
+        ttl = None if token.vence == float('inf') else max(60, token.restante())
+        try:
+            self._backend().guardar(CLAVE_TOKEN, json.dumps(datos), ttl=ttl)
+            log.debug("💾 Token guardado en cache")
+        except Exception as e:
+            # No es crítico: esta instancia ya lo tiene en memoria
+            log.warning("⚠️ No se pudo guardar token en cache: %s", e)
+
+    def leer_compartido(self) -> Optional[dict]:
+        try:
+            valor = self._backend().obtener(CLAVE_TOKEN)
+            return json.loads(valor) if valor else None
+        except ValueError:
+            return None
+
+    def olvidar(self):
+        """Descarta el token en memoria y en el estado compartido"""
+        with self._lock:
+            self._actual = None
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+                self._temporizador = None
+        self._backend().borrar(CLAVE_TOKEN)
+
+    def estado(self) -> dict:
+        actual = self._actual
+        return {
+            'en_memoria': actual is not None,
+            'vence_en_seg': round(actual.restante()) if actual and actual.vence != float('inf') else None,
+            'fallos_consecutivos': self._fallos,
+            'reintento_en_seg': max(0, round(self._no_antes_de - time.monotonic())),
+            'ultimo_error': self._ultimo_error,
+            **self._stats,
+        }
+
+
+gestor = GestorCredenciales()
+
+
+def es_error_de_autenticacion(error: Exception) -> bool:
+    """401 de Google o refresh rechazado (no cualquier mensaje con "invalid")"""
+    status = getattr(error, 'status', None) or getattr(getattr(error, 'resp', None), 'status', None)
+    if status == 401:
+        return True
+    from google.auth.exceptions import RefreshError
+    if isinstance(error, RefreshError):
+        return True
+    texto = str(error).lower()
+    return any(x in texto for x in (
+        'invalid_grant', 'invalid_token', 'unauthorized', 'invalid authentication', 'invalid credentials'
+    ))
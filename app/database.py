@@ -4,16 +4,26 @@ Modelos SQLAlchemy para gestión de casos de incapacidades
 VERSIÓN 3.0 - Con soporte para jefes y recordatorios
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Enum, JSON, text
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Enum, JSON, text, UniqueConstraint, Index, Table
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import sessionmaker, relationship, Session
 from datetime import datetime
 import os
 import enum
+import threading
+from app.logs import obtener_logger
+from app.metricas import instrumentar_engine
+
+log = obtener_logger(__name__)
 
 # Base para modelos
 Base = declarative_base()
 
+# JSON consultable: JSONB en PostgreSQL (operador @> e índices GIN), JSON
+# (texto, funciones JSON1) en SQLite
+JSONConsultable = JSON().with_variant(JSONB(), 'postgresql')
+
 # Enums para estados
 class EstadoCaso(str, enum.Enum):
     NUEVO = "NUEVO"
@@ -90,6 +100,11 @@ class Employee(Base):
 class Case(Base):
     """Casos de incapacidad registrados"""
     __tablename__ = 'cases'
+    __table_args__ = (
+        # metadata_form @> '{"checks_seleccionados": [...]}' / '{"vehiculo_fantasma": "Sí"}'
+        Index('ix_cases_metadata_form_gin', 'metadata_form', postgresql_using='gin',
+              postgresql_ops={'metadata_form': 'jsonb_path_ops'}).ddl_if(dialect='postgresql'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     serial = Column(String(50), nullable=False, unique=True, index=True)
@@ -104,7 +119,7 @@ class Case(Base):
     estado = Column(Enum(EstadoCaso), default=EstadoCaso.NUEVO, index=True)
     
     # Metadata adicional (JSON para flexibilidad)
-    metadata_form = Column(JSON)
+    metadata_form = Column(JSONConsultable)
     
     # Campos adicionales de búsqueda
     eps = Column(String(100), index=True)
@@ -115,6 +130,8 @@ class Case(Base):
     # Control de flujo
     bloquea_nueva = Column(Boolean, default=False)
     drive_link = Column(String(500))
+    drive_file_id = Column(String(100))    # ID del archivo actual en Drive
+    drive_parent_id = Column(String(100))  # Carpeta donde está (evita files().get(parents) al mover)
     email_form = Column(String(200))
     telefono_form = Column(String(50))
     
@@ -132,13 +149,17 @@ class Case(Base):
     documentos = relationship("CaseDocument", back_populates="caso", cascade="all, delete-orphan")
     eventos = relationship("CaseEvent", back_populates="caso", cascade="all, delete-orphan")
     notas = relationship("CaseNote", back_populates="caso", cascade="all, delete-orphan")
+    blobs = relationship("DocumentBlob", back_populates="caso", cascade="all, delete-orphan")
+    comparaciones = relationship("VersionComparison", back_populates="caso", cascade="all, delete-orphan")
+    reenvios = relationship("CaseResubmission", back_populates="caso", cascade="all, delete-orphan",
+                            order_by="CaseResubmission.numero")
 
 class CaseDocument(Base):
     """Documentos asociados a un caso"""
     __tablename__ = 'case_documents'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    case_id = Column(Integer, ForeignKey('cases.id', ondelete='CASCADE'), nullable=False)
+    case_id = Column(Integer, ForeignKey('cases.id', ondelete='CASCADE'), nullable=False, index=True)
     
     doc_tipo = Column(String(100), nullable=False)
     requerido = Column(Boolean, default=True)
@@ -160,16 +181,21 @@ class CaseDocument(Base):
 class CaseEvent(Base):
     """Historial de eventos/cambios de un caso"""
     __tablename__ = 'case_events'
+    __table_args__ = (
+        # metadata_json @> '{"checks": [...]}': casos marcados con un check en un periodo
+        Index('ix_case_events_metadata_json_gin', 'metadata_json', postgresql_using='gin',
+              postgresql_ops={'metadata_json': 'jsonb_path_ops'}).ddl_if(dialect='postgresql'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    case_id = Column(Integer, ForeignKey('cases.id', ondelete='CASCADE'), nullable=False)
+    case_id = Column(Integer, ForeignKey('cases.id', ondelete='CASCADE'), nullable=False, index=True)
     
     actor = Column(String(200))
     accion = Column(String(100), nullable=False)
     estado_anterior = Column(String(50))
     estado_nuevo = Column(String(50))
     motivo = Column(Text)
-    metadata_json = Column(JSON)
+    metadata_json = Column(JSONConsultable)
     
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
@@ -181,7 +207,7 @@ class CaseNote(Base):
     __tablename__ = 'case_notes'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    case_id = Column(Integer, ForeignKey('cases.id', ondelete='CASCADE'), nullable=False)
+    case_id = Column(Integer, ForeignKey('cases.id', ondelete='CASCADE'), nullable=False, index=True)
     
     autor = Column(String(200))
     contenido = Column(Text, nullable=False)
@@ -192,6 +218,149 @@ class CaseNote(Base):
     # Relaciones
     caso = relationship("Case", back_populates="notas")
 
+class DocumentBlob(Base):
+    """Huella (SHA-256) de cada archivo recibido y dónde quedó en Drive"""
+    __tablename__ = 'document_blobs'
+    __table_args__ = (
+        UniqueConstraint('case_id', 'sha256', name='uq_document_blobs_case_sha256'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    sha256 = Column(String(64), nullable=False, index=True)
+    case_id = Column(Integer, ForeignKey('cases.id', ondelete='CASCADE'), nullable=False, index=True)
+    
+    # Ubicación del archivo dentro del PDF combinado en Drive
+    drive_file_id = Column(String(100))
+    pagina_inicio = Column(Integer)
+    pagina_fin = Column(Integer)
+    
+    nombre_original = Column(String(300))
+    tamano_bytes = Column(Integer)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relaciones
+    caso = relationship("Case", back_populates="blobs")
+
+class PageFingerprint(Base):
+    """Hash perceptual (dHash) de cada página de un PDF en Drive, por revisión"""
+    __tablename__ = 'page_fingerprints'
+    __table_args__ = (
+        UniqueConstraint('drive_file_id', 'revision', 'pagina', name='uq_page_fingerprints_revision_pagina'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    drive_file_id = Column(String(100), nullable=False, index=True)
+    revision = Column(String(100), nullable=False)  # md5Checksum de Drive
+    pagina = Column(Integer, nullable=False)
+    dhash = Column(String(16), nullable=False)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class DriveFile(Base):
+    """Índice local de los archivos de casos en Drive (evita búsquedas por nombre en todo Drive)"""
+    __tablename__ = 'drive_files'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    file_id = Column(String(100), nullable=False, unique=True, index=True)
+    serial = Column(String(50), index=True)
+    case_id = Column(Integer, ForeignKey('cases.id', ondelete='SET NULL'), nullable=True, index=True)
+    
+    # por_validar, validada, completa, incompleta, reenvio
+    rol = Column(String(30), index=True)
+    nombre = Column(String(300))
+    carpeta_id = Column(String(100))
+    carpeta_ruta = Column(String(500))  # Ej: Incompletas/EMPRESA/Ilegibles
+    
+    revision = Column(String(100))
+    md5 = Column(String(32))
+    eliminado = Column(Boolean, default=False, index=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SyncState(Base):
+    """Estado persistente de sincronizaciones (ej. page token de la Changes API de Drive)"""
+    __tablename__ = 'sync_state'
+    
+    clave = Column(String(100), primary_key=True)
+    valor = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DriveDrift(Base):
+    """Diferencias detectadas entre Drive y el estado local (cambios hechos a mano en Drive)"""
+    __tablename__ = 'drive_drift'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    file_id = Column(String(100), nullable=False, index=True)
+    serial = Column(String(50), index=True)
+    case_id = Column(Integer, ForeignKey('cases.id', ondelete='SET NULL'), nullable=True, index=True)
+
+    # movido_manual, eliminado_manual, renombrado, contenido_modificado, carpeta_modificada,
+    # operacion_fallida (movimiento/copia/eliminación del backend que Drive no confirmó)
+    tipo = Column(String(30), nullable=False, index=True)
+    detalle = Column(JSON)
+
+    revisado = Column(Boolean, default=False, index=True)
+    detectado_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class VersionComparison(Base):
+    """Resultado precalculado de comparar la versión anterior con un reenvío"""
+    __tablename__ = 'version_comparisons'
+    __table_args__ = (
+        UniqueConstraint('file_id_anterior', 'file_id_nuevo', name='uq_version_comparisons_par'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    case_id = Column(Integer, ForeignKey('cases.id', ondelete='CASCADE'), nullable=False, index=True)
+    file_id_anterior = Column(String(100), nullable=False)
+    file_id_nuevo = Column(String(100), nullable=False)
+    
+    estado = Column(String(20), default='PENDIENTE')  # PENDIENTE, LISTA, ERROR
+    resultado = Column(JSON)
+    error = Column(Text)
+    
+    # Lease del worker que la está calculando (None si nadie): otro proceso la
+    # retoma si vence (app.comparador_versiones.reanudar_comparaciones)
+    tomada_at = Column(DateTime)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+    
+    # Relaciones
+    caso = relationship("Case", back_populates="comparaciones")
+
+class CaseResubmission(Base):
+    """Reenvíos de documentos de un caso (antes en metadata_form['reenvios'])"""
+    __tablename__ = 'case_resubmissions'
+    __table_args__ = (
+        UniqueConstraint('case_id', 'numero', name='uq_case_resubmissions_case_numero'),
+        # Bandeja de reenvíos pendientes de todas las empresas
+        Index('ix_case_resubmissions_estado_created', 'estado', 'created_at'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    case_id = Column(Integer, ForeignKey('cases.id', ondelete='CASCADE'), nullable=False, index=True)
+    numero = Column(Integer, nullable=False)  # 1, 2, 3... dentro del caso
+    
+    link = Column(String(500))
+    drive_file_id = Column(String(100))
+    archivos = Column(JSON)
+    archivos_repetidos = Column(JSON)
+    paginas_nuevas = Column(JSON)
+    
+    # PENDIENTE_REVISION, APROBADO, RECHAZADO
+    estado = Column(String(30), nullable=False, default='PENDIENTE_REVISION')
+    validador_decision = Column(String(20))
+    motivo = Column(Text)
+    checks_faltantes = Column(JSON)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    decidido_at = Column(DateTime)
+    
+    # Relaciones
+    caso = relationship("Case", back_populates="reenvios")
+
 class SearchHistory(Base):
     """Historial de búsquedas relacionales"""
     __tablename__ = 'search_history'
@@ -205,69 +374,213 @@ class SearchHistory(Base):
     
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
+# ==================== ARCHIVO (casos cerrados) ====================
+# Copias de cases y sus tablas hijas a donde app.archivo mueve los casos
+# cerrados antiguos. Las columnas se toman de la tabla original (un cambio
+# de modelo llega solo al archivo); sin llaves foráneas ni autoincremento:
+# las filas llegan con su id original.
+
+def _tabla_archivo(origen, *extra) -> Table:
+    columnas = [
+        Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable, autoincrement=False)
+        for c in origen.columns
+    ]
+    return Table(f"{origen.name}_archivo", Base.metadata, *columnas,
+                 Column('archivado_at', DateTime, default=datetime.utcnow), *extra)
+
+cases_archivo = _tabla_archivo(
+    Case.__table__,
+    # Índice único: generar_serial_unico comprueba el serial sin leer la fila
+    Index('ix_cases_archivo_serial', 'serial', unique=True),
+    Index('ix_cases_archivo_cedula', 'cedula'),
+    Index('ix_cases_archivo_company_estado', 'company_id', 'estado'),
+)
+
+# Tabla original → copia en el archivo, por case_id
+ARCHIVO_HIJAS = {
+    origen.name: _tabla_archivo(origen, Index(f"ix_{origen.name}_archivo_case_id", 'case_id'))
+    for origen in (CaseDocument.__table__, CaseEvent.__table__, CaseNote.__table__,
+                   CaseResubmission.__table__, DocumentBlob.__table__)
+}
+
 # ==================== FUNCIONES DE INICIALIZACIÓN ====================
 
+def normalizar_url(url: str) -> str:
+    # Render usa postgres:// pero SQLAlchemy necesita postgresql://
+    if url and url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
 def get_database_url():
     """Obtiene la URL de la base de datos desde variables de entorno"""
     database_url = os.environ.get("DATABASE_URL")
     
     if not database_url:
         database_url = "sqlite:///./incapacidades.db"
-        print("⚠️ Usando SQLite (desarrollo). Configura DATABASE_URL para producción.")
-    
-    # Render usa postgres:// pero SQLAlchemy necesita postgresql://
-    if database_url and database_url.startswith("postgres://"):
-        database_url = database_url.replace("postgres://", "postgresql://", 1)
+        log.warning("⚠️ Usando SQLite (desarrollo). Configura DATABASE_URL para producción.")
     
-    return database_url
+    return normalizar_url(database_url)
 
 # Configuración del motor
 database_url = get_database_url()
 
-if database_url.startswith("sqlite"):
-    # SQLite para desarrollo
-    engine = create_engine(
-        database_url,
-        echo=False,
-        connect_args={"check_same_thread": False}
-    )
-else:
-    # PostgreSQL para producción
-    engine = create_engine(
-        database_url,
-        echo=False,
-        pool_pre_ping=True,
-        pool_recycle=3600,
-        pool_size=10,
-        max_overflow=20,
-        connect_args={
-            "connect_timeout": 10,
-            "options": "-c timezone=America/Bogota"
-        }
-    )
+# ==================== PERFIL SQLITE ====================
+# Sin DATABASE_URL (un solo servidor) la radicación, la sync de 60 s y el
+# portal escribían por varias conexiones a la vez: esperaban el candado de
+# SQLite a ciegas (busy handler con sleeps) y terminaban en "database is
+# locked". Perfil de SQLite:
+# - Todas las conexiones: WAL, synchronous=NORMAL (en WAL no corrompe; solo
+#   puede perder el último commit si se cae la máquina), cache_size,
+#   mmap_size y busy_timeout
+# - Una sola conexión de escritura (engine, pool de 1): los escritores del
+#   proceso hacen fila en Python en orden de llegada, y BEGIN IMMEDIATE toma
+#   el candado al empezar (entre procesos, con busy_timeout)
+# - Pool de lectores (engine_lectura, query_only) para las consultas de las
+#   sesiones: en WAL leen mientras alguien escribe
+# - Job 'mantenimiento_sqlite': wal_checkpoint(TRUNCATE) y ANALYZE acotado
+
+SQLITE_BUSY_MS = int(os.environ.get("SQLITE_BUSY_MS", "5000"))
+SQLITE_CACHE_MB = int(os.environ.get("SQLITE_CACHE_MB", "32"))
+SQLITE_MMAP_MB = int(os.environ.get("SQLITE_MMAP_MB", "256"))
+SQLITE_LECTORES = int(os.environ.get("SQLITE_LECTORES", "8"))
+# Cuánto espera un request por la conexión de escritura antes de fallar
+SQLITE_ESPERA_ESCRITOR_S = float(os.environ.get("SQLITE_ESPERA_ESCRITOR_S", "30"))
+SQLITE_CHECKPOINT_MIN = int(os.environ.get("SQLITE_CHECKPOINT_MIN", "10"))
+SQLITE_ANALYSIS_LIMIT = int(os.environ.get("SQLITE_ANALYSIS_LIMIT", "1000"))
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """Pragmas de cada conexión nueva (WAL es del archivo; los demás, de la conexión)"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+    cursor.close()
+
+def _sqlite_lector(dbapi_connection, connection_record):
+    _sqlite_pragmas(dbapi_connection, connection_record)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+def _sqlite_escritor(dbapi_connection, connection_record):
+    _sqlite_pragmas(dbapi_connection, connection_record)
+    # El BEGIN lo emite _sqlite_begin_immediate, no pysqlite
+    dbapi_connection.isolation_level = None
+
+def _sqlite_begin_immediate(conn):
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+def crear_engine(url: str, pool_size: int = 10, max_overflow: int = 20,
+                 escritor_unico: bool = False, solo_lectura: bool = False):
+    """
+    Motor síncrono con la configuración de la app (también para las réplicas).
+    En SQLite: escritor_unico = la conexión de escritura, solo_lectura = pool de lectores
+    """
+    if url.startswith("sqlite"):
+        from sqlalchemy import event
+        from sqlalchemy.pool import QueuePool
+        if escritor_unico:
+            pool_size, max_overflow = 1, 0
+        motor = create_engine(
+            url,
+            echo=False,
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=SQLITE_ESPERA_ESCRITOR_S,
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_MS / 1000}
+        )
+        if escritor_unico:
+            event.listen(motor, "connect", _sqlite_escritor)
+            event.listen(motor, "begin", _sqlite_begin_immediate)
+        else:
+            event.listen(motor, "connect", _sqlite_lector if solo_lectura else _sqlite_pragmas)
+    else:
+        # PostgreSQL para producción
+        motor = create_engine(
+            url,
+            echo=False,
+            pool_pre_ping=True,
+            pool_recycle=3600,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            connect_args={
+                "connect_timeout": 10,
+                "options": "-c timezone=America/Bogota"
+            }
+        )
+
+    # Cada sentencia SQL queda medida (span 'db' en /metrics)
+    instrumentar_engine(motor)
+    return motor
+
+es_sqlite = database_url.startswith("sqlite")
+engine = crear_engine(database_url, escritor_unico=True)
+engine_lectura = (
+    crear_engine(database_url, pool_size=SQLITE_LECTORES, max_overflow=SQLITE_LECTORES, solo_lectura=True)
+    if es_sqlite else engine
+)
+
+class SesionEscritorUnico(Session):
+    """
+    Sesión de SQLite: solo los SELECT van a engine_lectura; flush, DML y todo
+    lo demás (text(), session.connection()) a la conexión de escritura, que
+    no sabe si el SQL escribe. Desde la primera escritura hasta el commit
+    todo va a la de escritura (la sesión lee lo que acaba de escribir)
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.info.get('escritor') or self.info.get('en_flush') or not getattr(clause, 'is_select', False):
+            self.info['escritor'] = True
+            return engine
+        return engine_lectura
+
+@event.listens_for(SesionEscritorUnico, "before_flush")
+def _inicio_flush_sqlite(session, flush_context, instances):
+    session.info['en_flush'] = True
+
+@event.listens_for(SesionEscritorUnico, "after_flush_postexec")
+def _fin_flush_sqlite(session, flush_context):
+    session.info.pop('en_flush', None)
+
+@event.listens_for(SesionEscritorUnico, "after_transaction_end")
+def _fin_transaccion_sqlite(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('escritor', None)
+        # Un flush que falla no llega a after_flush_postexec
+        session.info.pop('en_flush', None)
 
 # Sesión
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine,
+    class_=SesionEscritorUnico if es_sqlite else Session
+)
 
 def init_db():
     """Crea todas las tablas en la base de datos"""
     try:
         Base.metadata.create_all(bind=engine)
-        print("✅ Base de datos inicializada correctamente")
+        log.info("✅ Base de datos inicializada correctamente")
+        
+        # Índices del buscador de la bandeja (pg_trgm / FTS5)
+        from app.busqueda import preparar_indices
+        preparar_indices(engine)
         
         # Verificar conexión
         db = SessionLocal()
         try:
             db.execute(text("SELECT 1"))
             if database_url.startswith("postgresql"):
-                print("✅ Conexión a PostgreSQL exitosa")
+                log.info("✅ Conexión a PostgreSQL exitosa")
             else:
-                print("✅ Conexión a SQLite exitosa")
+                log.info("✅ Conexión a SQLite exitosa")
         finally:
             db.close()
             
     except Exception as e:
-        print(f"❌ Error inicializando base de datos: {e}")
+        log.error("❌ Error inicializando base de datos: %s", e)
         raise
 
 def get_db():
@@ -276,4 +589,180 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Escrituras: siempre el primario (nombre explícito junto a get_db_read)
+get_db_write = get_db
+
+def get_db_read():
+    """Dependency para FastAPI - Sesión de solo lectura (réplica si hay y está al día, ver app.replicas)"""
+    from app.replicas import sesion_lectura
+    db = sesion_lectura()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ==================== MANTENIMIENTO SQLITE ====================
+
+_mantenimiento_sqlite = {'checkpoint': None, 'analyze': None}
+
+def _en_conexion_de_escritura(sentencias):
+    """Sentencias fuera de transacción (wal_checkpoint no corre dentro de una), en la conexión de escritura"""
+    conexion = engine.raw_connection()
+    try:
+        cursor = conexion.cursor()
+        filas = [cursor.execute(sql).fetchall() for sql in sentencias]
+        cursor.close()
+        return filas
+    finally:
+        conexion.close()
+
+def checkpoint_sqlite() -> dict:
+    """
+    Pasa el WAL a la base y lo trunca. El autocheckpoint de SQLite no lo
+    logra mientras siempre haya un lector: el -wal crecía sin límite
+    """
+    import time
+    inicio = time.perf_counter()
+    ocupado, paginas_wal, copiadas = _en_conexion_de_escritura(["PRAGMA wal_checkpoint(TRUNCATE)"])[0][0]
+    resultado = {
+        'completo': not ocupado,
+        'paginas_wal': paginas_wal,
+        'paginas_copiadas': copiadas,
+        'ms': round((time.perf_counter() - inicio) * 1000, 1),
+        'at': datetime.utcnow().isoformat(),
+    }
+    _mantenimiento_sqlite['checkpoint'] = resultado
+    if ocupado:
+        log.info("🧹 Checkpoint de SQLite incompleto (lectores activos): %s/%s páginas", copiadas, paginas_wal)
+    else:
+        log.debug("🧹 Checkpoint de SQLite: %s páginas en %.1f ms", paginas_wal, resultado['ms'])
+    return resultado
+
+def analizar_sqlite() -> dict:
+    """ANALYZE con analysis_limit (muestra acotada por índice): estadísticas al día para el planificador de consultas"""
+    import time
+    inicio = time.perf_counter()
+    _en_conexion_de_escritura([f"PRAGMA analysis_limit={SQLITE_ANALYSIS_LIMIT}", "ANALYZE"])
+    resultado = {'ms': round((time.perf_counter() - inicio) * 1000, 1), 'at': datetime.utcnow().isoformat()}
+    _mantenimiento_sqlite['analyze'] = resultado
+    log.info("📊 ANALYZE de SQLite en %.0f ms", resultado['ms'])
+    return resultado
+
+def obtener_estadisticas_sqlite() -> dict:
+    """Perfil y último mantenimiento (para /status); None si la BD no es SQLite"""
+    if not es_sqlite:
+        return None
+    return {
+        'lectores': SQLITE_LECTORES,
+        'cache_mb': SQLITE_CACHE_MB,
+        'mmap_mb': SQLITE_MMAP_MB,
+        'busy_ms': SQLITE_BUSY_MS,
+        'escritor': engine.pool.status(),
+        **_mantenimiento_sqlite,
+    }
+
+
+# ==================== MOTOR ASÍNCRONO ====================
+# Los endpoints async usaban la sesión síncrona: cada consulta bloqueaba el
+# event loop y con un solo worker los demás requests esperaban detrás.
+# get_async_db entrega una AsyncSession (asyncpg en PostgreSQL, aiosqlite en
+# SQLite) sobre la misma base. El motor se crea en el primer uso: el driver
+# no se importa en el arranque.
+
+_engine_async = None
+_AsyncSessionLocal = None
+_engine_async_lock = threading.Lock()
+
+
+def get_async_database_url(url: str = None) -> str:
+    """La URL de get_database_url con el driver async (sqlite+aiosqlite / postgresql+asyncpg)"""
+    from sqlalchemy.engine import make_url
+
+    url = make_url(url or database_url)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+
+    # asyncpg no entiende sslmode (libpq): el equivalente es ssl
+    query = dict(url.query)
+    if "sslmode" in query:
+        query["ssl"] = query.pop("sslmode")
+    return url.set(drivername="postgresql+asyncpg", query=query).render_as_string(hide_password=False)
+
+
+def crear_engine_async(url: str):
+    """Motor async con la configuración de la app (URL síncrona; el driver se cambia aquí)"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url_async = get_async_database_url(url)
+    if url.startswith("sqlite"):
+        # Solo consultas (los endpoints async no escriben): perfil de lector
+        motor = create_async_engine(
+            url_async, echo=False, pool_size=SQLITE_LECTORES, max_overflow=SQLITE_LECTORES
+        )
+        from sqlalchemy import event
+        event.listen(motor.sync_engine, "connect", _sqlite_lector)
+    else:
+        motor = create_async_engine(
+            url_async,
+            echo=False,
+            pool_pre_ping=True,
+            pool_recycle=3600,
+            pool_size=int(os.environ.get("DB_ASYNC_POOL_SIZE", "10")),
+            max_overflow=int(os.environ.get("DB_ASYNC_MAX_OVERFLOW", "20")),
+            connect_args={
+                "timeout": 10,
+                "server_settings": {"timezone": "America/Bogota"}
+            }
+        )
+    instrumentar_engine(motor.sync_engine)
+    return motor
+
+
+def obtener_engine_async():
+    """Motor async del proceso (se crea una vez, en el primer request que lo pide)"""
+    global _engine_async, _AsyncSessionLocal
+    if _engine_async is not None:
+        return _engine_async
+
+    with _engine_async_lock:
+        if _engine_async is None:
+            from sqlalchemy.ext.asyncio import async_sessionmaker
+
+            motor = crear_engine_async(database_url)
+            # expire_on_commit=False: tras el commit los atributos se leen sin
+            # volver a la BD (en async no hay lazy load implícito)
+            _AsyncSessionLocal = async_sessionmaker(motor, expire_on_commit=False, autoflush=False)
+            _engine_async = motor
+            log.info("✅ Motor async de BD listo (%s)", motor.dialect.driver)
+    return _engine_async
+
+
+async def get_async_db():
+    """Dependency para endpoints async - AsyncSession que no bloquea el event loop"""
+    obtener_engine_async()
+    async with _AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_db_read():
+    """get_async_db de solo lectura: réplica si hay y está al día (ver app.replicas)"""
+    from app.replicas import fabrica_lectura_async
+    fabrica = fabrica_lectura_async()
+    if fabrica is None:
+        obtener_engine_async()
+        fabrica = _AsyncSessionLocal
+    async with fabrica() as db:
+        yield db
+
+
+async def cerrar_engine_async():
+    """Cierra las conexiones del motor async (shutdown), réplicas incluidas"""
+    global _engine_async, _AsyncSessionLocal
+    if _engine_async is not None:
+        await _engine_async.dispose()
+        _engine_async = _AsyncSessionLocal = None
+    from app.replicas import cerrar_async as cerrar_replicas_async
+    await cerrar_replicas_async()
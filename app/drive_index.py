@@ -0,0 +1,290 @@
+"""
+Índice Local de Archivos en Drive
+IncaNeurobaeza - 2024
+
+Tabla drive_files: un registro por PDF de caso (file_id, serial, rol,
+carpeta, revisión, md5). Se escribe en cada subida / movimiento / copia /
+eliminación que hace el backend y se mantiene al día con la Changes API
+de Drive (app/drive_watcher.py: cambios hechos a mano en Drive).
+
+Así "¿dónde está la versión incompleta de X?" es una consulta indexada
+en la BD y no una búsqueda por nombre en todo Drive.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from app.database import SessionLocal, DriveFile, SyncState, Case
+from app.serial_generator import validar_serial
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+# Clave en sync_state del page token de la Changes API
+CLAVE_PAGE_TOKEN = 'drive_changes_page_token'
+
+# Operación del backend en curso sobre un archivo (sync_state, una fila por file_id):
+# el valor es la carpeta destino de un movimiento o ELIMINADO
+PREFIJO_OPERACION = 'drive_op:'
+ELIMINADO = '__eliminado__'
+# Un aviso más viejo que esto es de un proceso que murió a mitad del lote
+OPERACION_VIGENCIA = timedelta(hours=1)
+
+CAMPOS_ARCHIVO = 'id, name, parents, md5Checksum, headRevisionId, trashed, mimeType'
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+
+
+# ==================== CLASIFICACIÓN ====================
+
+def serial_desde_nombre(nombre: str) -> Optional[str]:
+    """
+    Los PDFs se nombran {serial}_{cedula}_... o {serial}_REENVIO_...
+    Sin consecutivo el nombre empieza por la cédula ({cedula}_{tipo}_...): None
+    """
+    if not nombre or '_' not in nombre:
+        return None
+    candidato = nombre.split('_')[0]
+    return candidato if validar_serial(candidato) else None
+
+
+def rol_desde_ruta(carpeta_ruta: Optional[str], nombre: Optional[str] = None) -> Optional[str]:
+    """Rol del archivo en el flujo según la carpeta donde está"""
+    ruta = carpeta_ruta or ''
+    if ruta.startswith('Incompletas'):
+        return 'incompleta'
+    if ruta.startswith('Completas'):
+        return 'completa'
+    if 'Incapacidades_validadas' in ruta:
+        return 'validada'
+    if nombre and '_REENVIO_' in nombre:
+        return 'reenvio'
+    if ruta:
+        return 'por_validar'
+    return None
+
+
+# ==================== ESCRITURA ====================
+
+def registrar_archivo(
+    file_id: str,
+    nombre: str = None,
+    serial: str = None,
+    carpeta_id: str = None,
+    carpeta_ruta: str = None,
+    rol: str = None,
+    md5: str = None,
+    revision: str = None,
+    eliminado: bool = False,
+    db=None
+):
+    """
+    Crea o actualiza la fila del índice de un archivo
+    - Solo pisa los campos que vienen con valor
+    - Si no se pasa db, usa (y cierra) su propia sesión
+    """
+    if not file_id:
+        return None
+
+    propia = db is None
+    db = db or SessionLocal()
+    try:
+        fila = db.query(DriveFile).filter(DriveFile.file_id == file_id).first()
+        if not fila:
+            fila = DriveFile(file_id=file_id)
+            db.add(fila)
+
+        serial = serial or serial_desde_nombre(nombre) or fila.serial
+        if serial and serial != fila.serial:
+            fila.serial = serial
+            caso = db.query(Case.id).filter(Case.serial == serial).first()
+            fila.case_id = caso[0] if caso else None
+
+        for campo, valor in (('nombre', nombre), ('carpeta_id', carpeta_id),
+                             ('carpeta_ruta', carpeta_ruta), ('md5', md5), ('revision', revision)):
+            if valor is not None:
+                setattr(fila, campo, valor)
+
+        fila.rol = rol or rol_desde_ruta(fila.carpeta_ruta, fila.nombre) or fila.rol
+        fila.eliminado = eliminado
+        fila.updated_at = datetime.utcnow()
+
+        if propia:
+            db.commit()
+        else:
+            db.flush()  # la sesión es autoflush=False: que la vea la próxima consulta
+        return fila
+    except Exception as e:
+        if propia:
+            db.rollback()
+        log.warning("⚠️ Error actualizando índice de Drive (%s): %s", file_id, e)
+        return None
+    finally:
+        if propia:
+            db.close()
+
+
+def marcar_eliminado(file_id: str, db=None):
+    return registrar_archivo(file_id, eliminado=True, db=db)
+
+
+# ==================== CONSULTAS ====================
+
+def buscar_por_serial(db, serial: str, rol: str = None, incluir_eliminados: bool = False) -> List[DriveFile]:
+    """Archivos indexados de un serial (más recientes primero)"""
+    query = db.query(DriveFile).filter(DriveFile.serial == serial)
+    if rol:
+        query = query.filter(DriveFile.rol == rol)
+    if not incluir_eliminados:
+        query = query.filter(DriveFile.eliminado == False)
+    return query.order_by(DriveFile.updated_at.desc()).all()
+
+
+def indice_completo(db) -> bool:
+    """True si ya se hizo la carga inicial (hay page token de la Changes API)"""
+    return leer_estado(db, CLAVE_PAGE_TOKEN) is not None
+
+
+def buscar_por_rol(db, rol: str, limite: int = 500) -> List[DriveFile]:
+    return db.query(DriveFile).filter(
+        DriveFile.rol == rol,
+        DriveFile.eliminado == False
+    ).order_by(DriveFile.updated_at.desc()).limit(limite).all()
+
+
+# ==================== RECONCILIACIÓN (CHANGES API) ====================
+
+def ruta_carpeta(service, folder_id: str) -> Optional[str]:
+    """Ruta de una carpeta; completa el cache consultando a Drive los tramos que falten"""
+    from app.drive_uploader import get_cached_folder_path, remember_folder_name
+
+    ruta = get_cached_folder_path(folder_id)
+    if ruta is not None:
+        return ruta
+
+    actual = folder_id
+    for _ in range(20):
+        if not actual or actual == 'root':
+            break
+        try:
+            meta = service.files_get(actual, fields='id, name, parents')
+        except Exception:
+            return None
+        padres = meta.get('parents') or ['root']
+        remember_folder_name(actual, meta.get('name', ''), padres[0])
+        actual = padres[0]
+        ruta = get_cached_folder_path(folder_id)
+        if ruta is not None:
+            return ruta
+
+    return get_cached_folder_path(folder_id)
+
+
+def _aplicar_archivo(db, service, archivo: dict):
+    if archivo.get('mimeType') == FOLDER_MIME:
+        from app.drive_uploader import remember_folder_name
+        padres = archivo.get('parents') or ['root']
+        remember_folder_name(archivo['id'], archivo.get('name', ''), padres[0])
+        return False
+
+    if archivo.get('mimeType') != 'application/pdf':
+        return False
+
+    if archivo.get('trashed'):
+        marcar_eliminado(archivo['id'], db=db)
+        return True
+
+    carpeta_id = (archivo.get('parents') or [None])[0]
+    registrar_archivo(
+        archivo['id'],
+        nombre=archivo.get('name'),
+        carpeta_id=carpeta_id,
+        carpeta_ruta=ruta_carpeta(service, carpeta_id) if carpeta_id else None,
+        md5=archivo.get('md5Checksum'),
+        revision=archivo.get('headRevisionId'),
+        db=db
+    )
+    return True
+
+
+def leer_estado(db, clave: str) -> Optional[str]:
+    """Valor guardado en sync_state (page token, operaciones anunciadas)"""
+    fila = db.get(SyncState, clave)
+    return fila.valor if fila else None
+
+
+def guardar_estado(db, clave: str, valor: str):
+    """Crea o actualiza una clave de sync_state; se guarda con el commit del llamador"""
+    fila = db.get(SyncState, clave)
+    if not fila:
+        fila = SyncState(clave=clave)
+        db.add(fila)
+    fila.valor = valor
+    fila.updated_at = datetime.utcnow()
+
+
+# ==================== OPERACIONES DEL BACKEND EN CURSO ====================
+
+def anunciar_operaciones(destinos: Dict[str, str]):
+    """
+    Antes de mandar movimientos/eliminaciones a Drive: {file_id: carpeta
+    destino o ELIMINADO}. El vigilante puede leer el cambio antes de que el
+    batcher actualice el índice; con el aviso no lo toma por drift.
+    """
+    if not destinos:
+        return
+    db = SessionLocal()
+    try:
+        for file_id, destino in destinos.items():
+            guardar_estado(db, PREFIJO_OPERACION + file_id, destino)
+        db.commit()
+    finally:
+        db.close()
+
+
+def operacion_anunciada(db, file_id: str) -> Optional[str]:
+    """Destino anunciado para el archivo (None si no hay operación vigente)"""
+    fila = db.get(SyncState, PREFIJO_OPERACION + file_id)
+    if not fila or not fila.updated_at or datetime.utcnow() - fila.updated_at > OPERACION_VIGENCIA:
+        return None
+    return fila.valor
+
+
+def concluir_operaciones(db, file_ids: Iterable[str]):
+    """Quita los avisos (en la misma transacción que refleja el resultado en el índice)"""
+    claves = [PREFIJO_OPERACION + file_id for file_id in file_ids]
+    if claves:
+        db.query(SyncState).filter(SyncState.clave.in_(claves)).delete(synchronize_session=False)
+
+
+# ==================== CARGA INICIAL ====================
+
+def indexar_todo(service=None) -> int:
+    """Carga inicial: indexa todos los PDFs visibles para la app"""
+    from app.drive_uploader import get_authenticated_service
+    service = service or get_authenticated_service()
+
+    db = SessionLocal()
+    total = 0
+    try:
+        page_token = None
+        while True:
+            respuesta = service.files_list(
+                q="mimeType='application/pdf' and trashed=false",
+                spaces='drive',
+                fields=f'nextPageToken, files({CAMPOS_ARCHIVO})',
+                pageSize=1000,
+                pageToken=page_token
+            )
+            for archivo in respuesta.get('files', []):
+                if _aplicar_archivo(db, service, archivo):
+                    total += 1
+            db.commit()
+            page_token = respuesta.get('nextPageToken')
+            if not page_token:
+                break
+        log.info("✅ Índice de Drive: %s archivos indexados", total)
+        return total
+    finally:
+        db.close()
+
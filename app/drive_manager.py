@@ -5,14 +5,322 @@ IncaNeurobaeza - 2024
 
 import os
 from pathlib import Path
-from googleapiclient.http import MediaFileUpload
-from app.drive_uploader import get_authenticated_service, create_folder_if_not_exists
+from concurrent.futures import ThreadPoolExecutor
+from app.drive_uploader import (
+    get_authenticated_service, create_folder_if_not_exists,
+    clear_folder_cache, get_cached_folder_name, remember_folder_name
+)
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+
+def extraer_file_id(drive_link):
+    """Extrae el file_id de un link de Google Drive"""
+    if not drive_link:
+        return None
+    if '/file/d/' in drive_link:
+        return drive_link.split('/file/d/')[1].split('/')[0]
+    elif 'id=' in drive_link:
+        return drive_link.split('id=')[1].split('&')[0]
+    return None
+
+
+# ==================== BATCH DE OPERACIONES EN DRIVE ====================
+
+# Un solo worker: los lotes se aplican en el orden en que se confirmaron
+_batch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="drive_batch")
+
+# Operaciones en segundo plano: las fallidas quedan en drive_drift (operacion_fallida)
+_stats = {
+    'lotes': 0,
+    'operaciones': 0,
+    'fallidas': 0,
+    'ultimo_error': None,
+}
+
+
+def obtener_estadisticas() -> dict:
+    return dict(_stats)
+
+
+def obtener_id_carpeta(service, ruta):
+    """Resuelve (y crea si hace falta) una ruta de carpetas desde la raíz, usando el cache"""
+    parent_id = 'root'
+    for nombre in ruta:
+        parent_id = create_folder_if_not_exists(service, nombre.encode(), parent_id)
+    return parent_id
+
+
+class DriveOperationsBatcher:
+    """
+    Acumula movimientos, copias y eliminaciones de una sesión de validación
+    y los envía a Drive en paralelo sobre el pool de app.google_rest
+    (GOOGLE_REST_CONCURRENCIA llamadas en vuelo)
+    
+    - Las carpetas destino se indican como ruta de nombres y se resuelven
+      con el cache de carpetas al ejecutar
+    - Si se conoce el padre actual (cases.drive_parent_id) no hace falta
+      el files_get(parents) previo al movimiento
+    - ejecutar_en_segundo_plano() se llama DESPUÉS del commit de la BD
+    - Cada operación que falla queda en drive_drift como operacion_fallida
+      (el request ya respondió: es lo que ve el validador en /drive/drift)
+    """
+    
+    def __init__(self, service=None):
+        self._service = service
+        self.operaciones = []
+    
+    @property
+    def service(self):
+        if self._service is None:
+            self._service = get_authenticated_service()
+        return self._service
+    
+    def mover(self, file_id, ruta_destino, parent_anterior=None, case_id=None):
+        self.operaciones.append({
+            'tipo': 'mover', 'file_id': file_id, 'ruta': tuple(ruta_destino),
+            'parent_anterior': parent_anterior, 'parent_de_bd': bool(parent_anterior),
+            'case_id': case_id
+        })
+    
+    def copiar(self, file_id, ruta_destino):
+        self.operaciones.append({'tipo': 'copiar', 'file_id': file_id, 'ruta': tuple(ruta_destino)})
+    
+    def eliminar(self, file_id):
+        self.operaciones.append({'tipo': 'eliminar', 'file_id': file_id})
+    
+    def pendientes(self) -> int:
+        return len(self.operaciones)
+    
+    def _ejecutar_lotes(self, llamadas):
+        """Envía {request_id: llamada} en paralelo; devuelve {request_id: (respuesta, error)}"""
+        return self.service.reunir(llamadas)
+    
+    def ejecutar(self) -> list:
+        """Ejecuta todas las operaciones acumuladas (bloqueante)"""
+        operaciones, self.operaciones = self.operaciones, []
+        if not operaciones:
+            return []
+        
+        from app.drive_index import anunciar_operaciones, ELIMINADO
+        
+        service = self.service
+        api = service.asincrono
+        
+        # 1. Carpetas destino (una resolución por ruta distinta)
+        carpetas = {}
+        for op in operaciones:
+            if 'ruta' in op and op['ruta'] not in carpetas:
+                carpetas[op['ruta']] = obtener_id_carpeta(service, op['ruta'])
+        
+        # 2. Padres actuales que no están en la BD (todos a la vez)
+        sin_parent = [op for op in operaciones if op['tipo'] == 'mover' and not op['parent_anterior']]
+        if sin_parent:
+            llamadas = {
+                str(i): api.files_get(op['file_id'], fields='parents')
+                for i, op in enumerate(sin_parent)
+            }
+            resultados_get = self._ejecutar_lotes(llamadas)
+            for i, op in enumerate(sin_parent):
+                respuesta, error = resultados_get.get(str(i), (None, None))
+                if respuesta:
+                    op['parent_anterior'] = ",".join(respuesta.get('parents', []))
+        
+        # 3. Movimientos, copias y eliminaciones (anunciados antes: el vigilante
+        #    puede ver el cambio en Drive antes de que _actualizar_bd lo refleje)
+        anunciar_operaciones({
+            op['file_id']: carpetas[op['ruta']] if op['tipo'] == 'mover' else ELIMINADO
+            for op in operaciones
+            if op['tipo'] == 'eliminar' or (op['tipo'] == 'mover' and op['parent_anterior'] != carpetas[op['ruta']])
+        })
+        llamadas = {}
+        for i, op in enumerate(operaciones):
+            if op['tipo'] == 'mover':
+                destino = carpetas[op['ruta']]
+                if op['parent_anterior'] == destino:
+                    op['resultado'] = 'sin_cambios'
+                    op['parent_nuevo'] = destino
+                    continue
+                llamadas[str(i)] = self._llamada_mover(op, destino)
+            elif op['tipo'] == 'copiar':
+                llamadas[str(i)] = api.files_copy(
+                    op['file_id'],
+                    body={'parents': [carpetas[op['ruta']]]},
+                    fields='id, name, md5Checksum, headRevisionId'
+                )
+            elif op['tipo'] == 'eliminar':
+                llamadas[str(i)] = api.files_delete(op['file_id'])
+        
+        resultados = self._ejecutar_lotes(llamadas) if llamadas else {}
+        
+        # 4. Si el padre guardado en BD quedó viejo (movido a mano), se consulta y se reintenta una vez
+        reintentar = [
+            (i, op) for i, op in enumerate(operaciones)
+            if op['tipo'] == 'mover' and op['parent_de_bd']
+            and resultados.get(str(i), (None, None))[1] is not None
+        ]
+        if reintentar:
+            actuales = self._ejecutar_lotes({
+                str(i): api.files_get(op['file_id'], fields='parents')
+                for i, op in reintentar
+            })
+            llamadas_reintento = {}
+            for i, op in reintentar:
+                respuesta, error = actuales.get(str(i), (None, None))
+                if respuesta:
+                    op['parent_anterior'] = ",".join(respuesta.get('parents', []))
+                    llamadas_reintento[str(i)] = self._llamada_mover(op, carpetas[op['ruta']])
+            if llamadas_reintento:
+                resultados.update(self._ejecutar_lotes(llamadas_reintento))
+        
+        errores = 0
+        for i, op in enumerate(operaciones):
+            if str(i) not in resultados:
+                continue
+            respuesta, error = resultados[str(i)]
+            if error is not None:
+                errores += 1
+                op['resultado'] = 'error'
+                op['error'] = str(error)
+                # Una carpeta cacheada pudo haberse borrado a mano
+                if 'notfound' in str(error).lower() or '404' in str(error):
+                    clear_folder_cache()
+            else:
+                op['resultado'] = 'ok'
+                if op['tipo'] == 'mover':
+                    op['parent_nuevo'] = carpetas[op['ruta']]
+                elif op['tipo'] == 'copiar' and respuesta:
+                    op['copia'] = respuesta
+                    op['parent_nuevo'] = carpetas[op['ruta']]
+        
+        log.info("📦 Batch Drive: %s operaciones (%s llamadas en paralelo), %s error(es)", len(operaciones), len(llamadas), errores)
+        _stats['lotes'] += 1
+        _stats['operaciones'] += len(operaciones)
+        
+        self._actualizar_bd(operaciones)
+        return operaciones
+    
+    def _llamada_mover(self, op, destino):
+        return self.service.asincrono.files_update(
+            op['file_id'],
+            addParents=destino,
+            removeParents=op['parent_anterior'] or None,
+            fields='id, parents'
+        )
+    
+    def _actualizar_bd(self, operaciones):
+        """
+        Refleja en la BD lo que se hizo en Drive:
+        - cases.drive_parent_id de cada caso movido (evita el get(parents) la próxima vez)
+        - índice drive_files (carpeta nueva, copias creadas, eliminados)
+        - drive_drift: una fila operacion_fallida por cada operación con error
+        - quita los avisos de operación en curso (misma transacción)
+        """
+        from app.database import SessionLocal, Case
+        from app.drive_index import registrar_archivo, marcar_eliminado, concluir_operaciones
+        
+        db = SessionLocal()
+        try:
+            concluir_operaciones(db, [op['file_id'] for op in operaciones if op['tipo'] in ('mover', 'eliminar')])
+            for op in operaciones:
+                if op.get('resultado') == 'error':
+                    _registrar_fallo(db, op)
+                    continue
+                if op.get('resultado') not in ('ok', 'sin_cambios'):
+                    continue
+                
+                if op['tipo'] == 'mover':
+                    if op.get('case_id'):
+                        db.query(Case).filter(
+                            Case.id == op['case_id'],
+                            Case.drive_file_id == op['file_id']
+                        ).update({Case.drive_parent_id: op['parent_nuevo']}, synchronize_session=False)
+                    registrar_archivo(op['file_id'], carpeta_id=op['parent_nuevo'],
+                                      carpeta_ruta="/".join(op['ruta']), db=db)
+                
+                elif op['tipo'] == 'copiar' and op.get('copia'):
+                    copia = op['copia']
+                    registrar_archivo(copia.get('id'), nombre=copia.get('name'),
+                                      carpeta_id=op['parent_nuevo'], carpeta_ruta="/".join(op['ruta']),
+                                      md5=copia.get('md5Checksum'), revision=copia.get('headRevisionId'), db=db)
+                
+                elif op['tipo'] == 'eliminar':
+                    marcar_eliminado(op['file_id'], db=db)
+            
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            _stats['ultimo_error'] = f"BD: {e}"
+            log.error("❌ No se pudo actualizar la BD después del batch: %s", e)
+        finally:
+            db.close()
+    
+    def ejecutar_en_segundo_plano(self):
+        """Manda las operaciones al worker de fondo (llamar después del commit)"""
+        if not self.operaciones:
+            return None
+        
+        pendiente = DriveOperationsBatcher(self._service)
+        operaciones = pendiente.operaciones = self.operaciones
+        self.operaciones = []
+        
+        def _tarea():
+            try:
+                return pendiente.ejecutar()
+            except Exception as e:
+                # Falló el lote completo (carpetas, credenciales...): todas quedan registradas
+                log.error("❌ Error ejecutando batch de Drive: %s", e)
+                for op in operaciones:
+                    if op.get('resultado') in (None, 'error'):
+                        op['resultado'] = 'error'
+                        op.setdefault('error', str(e))
+                pendiente._actualizar_bd(operaciones)
+                return operaciones
+        
+        return _batch_executor.submit(_tarea)
+
+
+def _registrar_fallo(db, op):
+    """Fila de drift para una operación que Drive no confirmó"""
+    from app.database import DriveDrift, DriveFile
+    
+    fila = db.query(DriveFile.serial, DriveFile.case_id).filter(DriveFile.file_id == op['file_id']).first()
+    db.add(DriveDrift(
+        file_id=op['file_id'],
+        serial=fila.serial if fila else None,
+        case_id=op.get('case_id') or (fila.case_id if fila else None),
+        tipo='operacion_fallida',
+        detalle={
+            'operacion': op['tipo'],
+            'ruta': "/".join(op['ruta']) if op.get('ruta') else None,
+            'error': (op.get('error') or '')[:500]
+        }
+    ))
+    _stats['fallidas'] += 1
+    _stats['ultimo_error'] = op.get('error')
+    log.warning("⚠️ Drive no confirmó %s de %s: %s", op['tipo'], op['file_id'], op.get('error'))
+
+
+def _encolar_movimiento(batcher, caso, file_id, ruta):
+    """Agrega el movimiento del archivo del caso; usa el padre guardado en BD si corresponde"""
+    parent_anterior = caso.drive_parent_id if caso.drive_file_id == file_id else None
+    caso.drive_file_id = file_id
+    batcher.mover(file_id, ruta, parent_anterior=parent_anterior, case_id=caso.id)
+
 
 class DriveFileManager:
     """Gestor de archivos en Google Drive"""
     
     def __init__(self):
-        self.service = get_authenticated_service()
+        self._service = None
+    
+    @property
+    def service(self):
+        # Se obtiene al primer uso: los movimientos en segundo plano no tocan Drive en el request
+        if self._service is None:
+            self._service = get_authenticated_service()
+        return self._service
     
     def get_file_id_by_name(self, filename, parent_folder_id=None):
         """Busca un archivo por nombre en una carpeta específica"""
@@ -20,11 +328,11 @@ class DriveFileManager:
         if parent_folder_id:
             query += f" and '{parent_folder_id}' in parents"
         
-        results = self.service.files().list(
+        results = self.service.files_list(
             q=query,
             spaces='drive',
             fields='files(id, name, parents)'
-        ).execute()
+        )
         
         files = results.get('files', [])
         return files[0]['id'] if files else None
@@ -34,42 +342,40 @@ class DriveFileManager:
         Actualiza el contenido de un archivo existente en Drive
         Mantiene el mismo file_id, solo reemplaza el contenido
         """
-        from googleapiclient.http import MediaFileUpload
+        from app.drive_upload_manager import subir_archivo_reanudable
         
         try:
-            media = MediaFileUpload(
-                str(new_file_path), 
-                mimetype='application/pdf', 
-                resumable=True
+            updated_file = subir_archivo_reanudable(
+                self.service, new_file_path, {},
+                file_id=file_id,
+                fields='id, webViewLink, modifiedTime, md5Checksum, headRevisionId'
             )
             
-            updated_file = self.service.files().update(
-                fileId=file_id,
-                media_body=media,
-                fields='id, webViewLink, modifiedTime'
-            ).execute()
+            log.info("✅ Archivo actualizado en Drive: %s", file_id)
             
-            print(f"✅ Archivo actualizado en Drive: {file_id}")
+            from app.drive_index import registrar_archivo
+            registrar_archivo(file_id, md5=updated_file.get('md5Checksum'),
+                              revision=updated_file.get('headRevisionId'))
             
             return updated_file
             
         except Exception as e:
-            print(f"❌ Error actualizando archivo {file_id} en Drive: {e}")
+            log.error("❌ Error actualizando archivo %s en Drive: %s", file_id, e)
             raise
     
     def move_file(self, file_id, new_parent_folder_id):
         """Mueve un archivo a una nueva carpeta"""
         # Obtener los padres actuales
-        file = self.service.files().get(fileId=file_id, fields='parents').execute()
+        file = self.service.files_get(file_id, fields='parents')
         previous_parents = ",".join(file.get('parents', []))
         
         # Mover archivo
-        file = self.service.files().update(
-            fileId=file_id,
+        file = self.service.files_update(
+            file_id,
             addParents=new_parent_folder_id,
             removeParents=previous_parents,
             fields='id, parents, webViewLink'
-        ).execute()
+        )
         
         return file
     
@@ -118,7 +424,7 @@ class CaseFileOrganizer:
     def __init__(self):
         self.drive_manager = DriveFileManager()
     
-    def mover_caso_segun_estado(self, caso, nuevo_estado, motivo=None):
+    def mover_caso_segun_estado(self, caso, nuevo_estado, motivo=None, batcher=None):
         """
         Mueve el archivo del caso a la carpeta correspondiente según el nuevo estado
         
@@ -126,120 +432,67 @@ class CaseFileOrganizer:
             caso: Objeto Case de la base de datos
             nuevo_estado: EstadoCaso nuevo
             motivo: Motivo del cambio (para carpetas de incompletas)
+            batcher: DriveOperationsBatcher de la sesión; si no se pasa, el
+                     movimiento se manda de inmediato al worker de fondo
+                     (el caller ya debe haber hecho commit)
+        
+        Returns:
+            True si el movimiento quedó en cola; None si no hay qué mover.
+            No devuelve link: el file_id no cambia al moverlo (caso.drive_link
+            sigue valiendo) y el movimiento aún no está confirmado por Drive
         """
         if not caso.drive_link:
-            print(f"⚠️ Caso {caso.serial} no tiene link de Drive")
+            log.warning("⚠️ Caso %s no tiene link de Drive", caso.serial)
             return None
         
         # Extraer file_id del link de Drive
         file_id = self._extract_file_id_from_link(caso.drive_link)
         if not file_id:
-            print(f"❌ No se pudo extraer file_id de {caso.drive_link}")
+            log.error("❌ No se pudo extraer file_id de %s", caso.drive_link)
             return None
         
         # Obtener carpeta destino según el estado
         empresa_nombre = caso.empresa.nombre if caso.empresa else "OTRA_EMPRESA"
         
+        if nuevo_estado == 'COMPLETA':
+            # 1. Mover a Incapacidades/Incapacidades_validadas/{Empresa}/
+            # 2. Crear COPIA en Completas/{Empresa}/
+            ruta = ('Incapacidades', 'Incapacidades_validadas', empresa_nombre)
+            copia = ('Completas', empresa_nombre)
+            destino_log = "Validadas + Completas"
+        elif nuevo_estado in ['INCOMPLETA', 'ILEGIBLE', 'INCOMPLETA_ILEGIBLE']:
+            # Subcarpeta según motivo
+            subfolder_name = 'Ilegibles' if 'ilegible' in nuevo_estado.lower() else 'Faltan_Soportes'
+            ruta = ('Incompletas', empresa_nombre, subfolder_name)
+            copia = None
+            destino_log = f"Incompletas/{subfolder_name}"
+        elif nuevo_estado == 'EPS_TRANSCRIPCION':
+            ruta = ('Incompletas', empresa_nombre, 'EPS_No_Transcritas')
+            copia = None
+            destino_log = "Incompletas/EPS_No_Transcritas"
+        elif nuevo_estado == 'DERIVADO_TTHH':
+            ruta = ('Incompletas', empresa_nombre, 'THH_Falsas')
+            copia = None
+            destino_log = "Incompletas/THH_Falsas"
+        else:
+            return None
+        
         try:
-            if nuevo_estado == 'COMPLETA':
-                # Caso COMPLETA: 
-                # 1. Mover a Incapacidades_validadas/{Empresa}/
-                # 2. Crear COPIA en Completas/{Empresa}/
-                validadas_folder = self.drive_manager.get_or_create_folder_structure(
-                    empresa_nombre, 'COMPLETA'
-                )
-                
-                # Mover a validadas
-                self.drive_manager.move_file(file_id, validadas_folder)
-                
-                # Crear copia en Completas
-                completas_main = create_folder_if_not_exists(
-                    self.drive_manager.service, b'Completas', 'root'
-                )
-                completas_empresa = create_folder_if_not_exists(
-                    self.drive_manager.service, 
-                    empresa_nombre.encode(), 
-                    completas_main
-                )
-                
-                # Copiar archivo
-                copied_file = self.drive_manager.service.files().copy(
-                    fileId=file_id,
-                    body={'parents': [completas_empresa]}
-                ).execute()
-                
-                print(f"✅ Caso {caso.serial} → Validadas + Completas")
-                return self._get_file_link(file_id)
+            ejecutar_ya = batcher is None
+            batcher = batcher or DriveOperationsBatcher()
             
-            elif nuevo_estado in ['INCOMPLETA', 'ILEGIBLE', 'INCOMPLETA_ILEGIBLE']:
-                # Mover a Incompletas/{Empresa}/{Motivo}/
-                incompletas_main = create_folder_if_not_exists(
-                    self.drive_manager.service, b'Incompletas', 'root'
-                )
-                incompletas_empresa = create_folder_if_not_exists(
-                    self.drive_manager.service, 
-                    empresa_nombre.encode(), 
-                    incompletas_main
-                )
-                
-                # Crear subcarpeta según motivo
-                if 'ilegible' in nuevo_estado.lower():
-                    subfolder_name = b'Ilegibles'
-                else:
-                    subfolder_name = b'Faltan_Soportes'
-                
-                subfolder_id = create_folder_if_not_exists(
-                    self.drive_manager.service,
-                    subfolder_name,
-                    incompletas_empresa
-                )
-                
-                self.drive_manager.move_file(file_id, subfolder_id)
-                print(f"✅ Caso {caso.serial} → Incompletas/{subfolder_name.decode()}")
-                return self._get_file_link(file_id)
+            _encolar_movimiento(batcher, caso, file_id, ruta)
+            if copia:
+                batcher.copiar(file_id, copia)
             
-            elif nuevo_estado == 'EPS_TRANSCRIPCION':
-                # Mover a Incompletas/{Empresa}/EPS_No_Transcritas/
-                incompletas_main = create_folder_if_not_exists(
-                    self.drive_manager.service, b'Incompletas', 'root'
-                )
-                incompletas_empresa = create_folder_if_not_exists(
-                    self.drive_manager.service, 
-                    empresa_nombre.encode(), 
-                    incompletas_main
-                )
-                eps_folder = create_folder_if_not_exists(
-                    self.drive_manager.service,
-                    b'EPS_No_Transcritas',
-                    incompletas_empresa
-                )
-                
-                self.drive_manager.move_file(file_id, eps_folder)
-                print(f"✅ Caso {caso.serial} → Incompletas/EPS_No_Transcritas")
-                return self._get_file_link(file_id)
+            if ejecutar_ya:
+                batcher.ejecutar_en_segundo_plano()
             
-            elif nuevo_estado == 'DERIVADO_TTHH':
-                # Mover a Incompletas/{Empresa}/Falsas/ o THH_Falsas/
-                incompletas_main = create_folder_if_not_exists(
-                    self.drive_manager.service, b'Incompletas', 'root'
-                )
-                incompletas_empresa = create_folder_if_not_exists(
-                    self.drive_manager.service, 
-                    empresa_nombre.encode(), 
-                    incompletas_main
-                )
-                falsas_folder = create_folder_if_not_exists(
-                    self.drive_manager.service,
-                    b'THH_Falsas',
-                    incompletas_empresa
-                )
-                
-                self.drive_manager.move_file(file_id, falsas_folder)
-                print(f"✅ Caso {caso.serial} → Incompletas/THH_Falsas")
-                return self._get_file_link(file_id)
+            log.info("📦 Caso %s → %s (en cola)", caso.serial, destino_log)
+            return True
         
         except Exception as e:
-            print(f"❌ Error moviendo caso {caso.serial}: {e}")
+            log.error("❌ Error moviendo caso %s: %s", caso.serial, e)
             return None
     
     def actualizar_pdf_editado(self, caso, edited_pdf_path):
@@ -259,10 +512,10 @@ class CaseFileOrganizer:
         
         try:
             updated_file = self.drive_manager.update_file_content(file_id, edited_pdf_path)
-            print(f"✅ PDF actualizado en Drive: {caso.serial}")
+            log.info("✅ PDF actualizado en Drive: %s", caso.serial)
             return updated_file.get('webViewLink')
         except Exception as e:
-            print(f"❌ Error actualizando PDF {caso.serial}: {e}")
+            log.error("❌ Error actualizando PDF %s: %s", caso.serial, e)
             return None
     
     def _extract_file_id_from_link(self, drive_link):
@@ -272,10 +525,6 @@ class CaseFileOrganizer:
         elif 'id=' in drive_link:
             return drive_link.split('id=')[1].split('&')[0]
         return None
-    
-    def _get_file_link(self, file_id):
-        """Obtiene el link de visualización de un archivo"""
-        return f"https://drive.google.com/file/d/{file_id}/view"
 
 
 # ==================== GESTOR DE ARCHIVOS INCOMPLETOS ====================
@@ -286,16 +535,20 @@ class IncompleteFileManager:
     def __init__(self):
         self.drive_manager = DriveFileManager()
     
-    def mover_a_incompletas(self, caso, motivo_categoria: str):
+    def mover_a_incompletas(self, caso, motivo_categoria: str, batcher=None):
         """
         Mueve archivo a carpeta Incompletas/{Empresa}/{Categoria}/
         
         Args:
             caso: Objeto Case
             motivo_categoria: 'Ilegibles', 'Faltan_Soportes', 'EPS_No_Transcritas', 'Falsas'
+            batcher: DriveOperationsBatcher de la sesión (si no, va directo al worker de fondo)
+        
+        Returns:
+            True si el movimiento quedó en cola (ver mover_caso_segun_estado)
         """
         if not caso.drive_link:
-            print(f"⚠️ Caso {caso.serial} sin link de Drive")
+            log.warning("⚠️ Caso %s sin link de Drive", caso.serial)
             return None
         
         file_id = self._extract_file_id(caso.drive_link)
@@ -303,33 +556,19 @@ class IncompleteFileManager:
             return None
         
         try:
-            # Crear estructura: Incompletas/{Empresa}/{Categoria}/
-            incompletas_main = create_folder_if_not_exists(
-                self.drive_manager.service, b'Incompletas', 'root'
-            )
-            
             empresa_nombre = caso.empresa.nombre if caso.empresa else "OTRA_EMPRESA"
-            incompletas_empresa = create_folder_if_not_exists(
-                self.drive_manager.service,
-                empresa_nombre.encode(),
-                incompletas_main
-            )
             
-            # Crear subcarpeta según categoría
-            categoria_folder = create_folder_if_not_exists(
-                self.drive_manager.service,
-                motivo_categoria.encode(),
-                incompletas_empresa
-            )
-            
-            # Mover archivo
-            self.drive_manager.move_file(file_id, categoria_folder)
+            ejecutar_ya = batcher is None
+            batcher = batcher or DriveOperationsBatcher()
+            _encolar_movimiento(batcher, caso, file_id, ('Incompletas', empresa_nombre, motivo_categoria))
+            if ejecutar_ya:
+                batcher.ejecutar_en_segundo_plano()
             
-            print(f"✅ Caso {caso.serial} → Incompletas/{motivo_categoria}")
-            return self._get_file_link(file_id)
+            log.info("📦 Caso %s → Incompletas/%s (en cola)", caso.serial, motivo_categoria)
+            return True
             
         except Exception as e:
-            print(f"❌ Error moviendo a incompletas: {e}")
+            log.error("❌ Error moviendo a incompletas: %s", e)
             return None
     
     def buscar_version_incompleta(self, serial: str):
@@ -339,55 +578,103 @@ class IncompleteFileManager:
         Returns:
             dict con file_id, filename, link si existe, None si no
         """
+        # 1. Índice local (consulta indexada, sin tocar Drive)
+        try:
+            from app.database import SessionLocal
+            from app.drive_index import buscar_por_serial, indice_completo
+            db = SessionLocal()
+            try:
+                indexados = buscar_por_serial(db, serial, rol='incompleta')
+                if indexados:
+                    archivo = indexados[0]
+                    log.debug("🔍 Versión incompleta de %s encontrada en el índice: %s", serial, archivo.nombre)
+                    return {
+                        'file_id': archivo.file_id,
+                        'filename': archivo.nombre,
+                        'link': self._get_file_link(archivo.file_id),
+                        'parent_id': archivo.carpeta_id
+                    }
+                if indice_completo(db):
+                    # Con la carga inicial hecha, el índice es la fuente de verdad
+                    return None
+            finally:
+                db.close()
+        except Exception as e:
+            log.warning("⚠️ Índice de Drive no disponible, buscando en Drive: %s", e)
+        
+        # 2. Índice aún sin carga inicial: búsqueda por nombre en Drive
         try:
             # Buscar en carpeta Incompletas/
             query = f"name contains '{serial}' and trashed=false"
             
-            results = self.drive_manager.service.files().list(
+            results = self.drive_manager.service.files_list(
                 q=query,
                 spaces='drive',
                 fields='files(id, name, parents, webViewLink)',
                 pageSize=100
-            ).execute()
+            )
             
             files = results.get('files', [])
             
+            # Nombres de las carpetas padre: primero del cache, el resto todos a la vez
+            nombres = {}
+            desconocidos = []
+            for file in files:
+                for parent_id in file.get('parents', []):
+                    if parent_id in nombres or parent_id in desconocidos:
+                        continue
+                    nombre = get_cached_folder_name(parent_id)
+                    if nombre is not None:
+                        nombres[parent_id] = nombre
+                    else:
+                        desconocidos.append(parent_id)
+            
+            if desconocidos:
+                service = self.drive_manager.service
+                respuestas = service.reunir({
+                    parent_id: service.asincrono.files_get(parent_id, fields='name')
+                    for parent_id in desconocidos
+                })
+                for parent_id, (respuesta, error) in respuestas.items():
+                    if error is None and respuesta:
+                        nombres[parent_id] = respuesta.get('name', '')
+                        remember_folder_name(parent_id, nombres[parent_id])
+            
             # Filtrar solo los que están en Incompletas
             for file in files:
-                # Verificar que el archivo esté en una carpeta Incompletas
-                if 'parents' in file:
-                    for parent_id in file['parents']:
-                        try:
-                            folder = self.drive_manager.service.files().get(
-                                fileId=parent_id,
-                                fields='name'
-                            ).execute()
-                            
-                            # Si alguno de los padres contiene "Incompletas"
-                            if 'Incompletas' in folder.get('name', ''):
-                                print(f"🔍 Encontrada versión incompleta de {serial}: {file['name']}")
-                                return {
-                                    'file_id': file['id'],
-                                    'filename': file['name'],
-                                    'link': file['webViewLink']
-                                }
-                        except:
-                            continue
+                for parent_id in file.get('parents', []):
+                    # Si alguno de los padres contiene "Incompletas"
+                    if 'Incompletas' in nombres.get(parent_id, ''):
+                        log.info("🔍 Encontrada versión incompleta de %s: %s", serial, file['name'])
+                        from app.drive_index import registrar_archivo
+                        registrar_archivo(file['id'], nombre=file['name'], serial=serial,
+                                          carpeta_id=parent_id, rol='incompleta')
+                        return {
+                            'file_id': file['id'],
+                            'filename': file['name'],
+                            'link': file['webViewLink'],
+                            'parent_id': parent_id
+                        }
             
             return None
             
         except Exception as e:
-            print(f"❌ Error buscando incompleta: {e}")
+            log.error("❌ Error buscando incompleta: %s", e)
             return None
     
-    def eliminar_version_incompleta(self, file_id: str):
+    def eliminar_version_incompleta(self, file_id: str, batcher=None):
         """Elimina archivo de Incompletas/ cuando se aprueba el reenvío"""
+        if batcher is not None:
+            batcher.eliminar(file_id)
+            log.info("🗑️ Versión incompleta en cola para eliminar: %s", file_id)
+            return True
+        
         try:
-            self.drive_manager.service.files().delete(fileId=file_id).execute()
-            print(f"🗑️ Versión incompleta eliminada: {file_id}")
+            self.drive_manager.service.files_delete(file_id)
+            log.info("🗑️ Versión incompleta eliminada: %s", file_id)
             return True
         except Exception as e:
-            print(f"❌ Error eliminando: {e}")
+            log.error("❌ Error eliminando: %s", e)
             return False
     
     def _extract_file_id(self, drive_link):
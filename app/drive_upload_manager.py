@@ -0,0 +1,245 @@
+"""
+Gestor de Subidas a Drive - Reanudables y por bloques
+IncaNeurobaeza - 2024
+
+- Cada archivo se sube en bloques (DRIVE_CHUNK_MB) sobre una sesión reanudable
+- La URI de la sesión se guarda en disco: si la subida se corta, el
+  reintento pregunta a Drive el último byte recibido y sigue desde ahí
+- Estadísticas de throughput (MB/s) y reintentos para /drive/upload-stats
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+# Tamaño de bloque (múltiplo de 256 KB, exigido por Drive)
+_BLOQUE_MINIMO = 256 * 1024
+CHUNK_SIZE = max(1, int(float(os.environ.get("DRIVE_CHUNK_MB", "8")) * 4)) * _BLOQUE_MINIMO
+
+MAX_REINTENTOS_BLOQUE = int(os.environ.get("DRIVE_UPLOAD_REINTENTOS", "5"))
+
+# Sesiones reanudables en curso (una por archivo)
+SESIONES_DIR = Path(os.environ.get(
+    "DRIVE_UPLOAD_SESSIONS_DIR",
+    os.path.join(tempfile.gettempdir(), "drive_upload_sessions")
+))
+
+# Drive mantiene la sesión ~1 semana; por seguridad se descarta antes
+SESION_TTL_HORAS = 24
+
+# Errores que vale la pena reintentar sin reiniciar la subida
+_ESTADOS_REINTENTABLES = {408, 429, 500, 502, 503, 504}
+
+
+# ==================== ESTADÍSTICAS ====================
+
+_stats_lock = threading.Lock()
+_stats = {
+    'subidas_ok': 0,
+    'subidas_fallidas': 0,
+    'bytes_subidos': 0,
+    'segundos_subiendo': 0.0,
+    'bloques': 0,
+    'reintentos': 0,
+    'reanudadas': 0,
+    'ultima_subida': None
+}
+
+
+def _sumar_stat(clave: str, valor=1):
+    with _stats_lock:
+        _stats[clave] += valor
+
+
+def obtener_estadisticas() -> Dict:
+    """Throughput promedio y contadores de reintentos desde el arranque"""
+    with _stats_lock:
+        stats = dict(_stats)
+
+    segundos = stats['segundos_subiendo']
+    stats['mb_subidos'] = round(stats['bytes_subidos'] / (1024 * 1024), 2)
+    stats['mb_por_segundo'] = round(stats['mb_subidos'] / segundos, 3) if segundos > 0 else None
+    stats['segundos_subiendo'] = round(segundos, 2)
+    stats['chunk_mb'] = CHUNK_SIZE / (1024 * 1024)
+    stats['sesiones_pendientes'] = len(list(SESIONES_DIR.glob("*.json"))) if SESIONES_DIR.exists() else 0
+    return stats
+
+
+# ==================== SESIONES PERSISTIDAS ====================
+
+def _clave_sesion(file_path: Path, metadata: dict, file_id: str = None) -> str:
+    """Misma ruta + tamaño + mtime + destino → misma sesión"""
+    st = file_path.stat()
+    base = json.dumps({
+        'ruta': str(file_path.resolve()),
+        'tamano': st.st_size,
+        'mtime': int(st.st_mtime),
+        'nombre': metadata.get('name'),
+        'parents': metadata.get('parents'),
+        'file_id': file_id
+    }, sort_keys=True)
+    return hashlib.sha256(base.encode()).hexdigest()[:32]
+
+
+def _leer_sesion(clave: str) -> Optional[dict]:
+    path = SESIONES_DIR / f"{clave}.json"
+    if not path.exists():
+        return None
+    try:
+        sesion = json.loads(path.read_text())
+        creada = datetime.fromisoformat(sesion['creada'])
+        if (datetime.utcnow() - creada).total_seconds() > SESION_TTL_HORAS * 3600:
+            path.unlink(missing_ok=True)
+            return None
+        return sesion
+    except Exception:
+        path.unlink(missing_ok=True)
+        return None
+
+
+def _guardar_sesion(clave: str, resumable_uri: str, tamano: int):
+    SESIONES_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = SESIONES_DIR / f"{clave}.json.tmp"
+    tmp.write_text(json.dumps({
+        'resumable_uri': resumable_uri,
+        'tamano': tamano,
+        'creada': datetime.utcnow().isoformat()
+    }))
+    os.replace(tmp, SESIONES_DIR / f"{clave}.json")
+
+
+def _borrar_sesion(clave: str):
+    (SESIONES_DIR / f"{clave}.json").unlink(missing_ok=True)
+
+
+# ==================== SUBIDA REANUDABLE ====================
+
+def _espera_backoff(intento: int) -> float:
+    return min(30, (2 ** intento)) + random.uniform(0, 1)
+
+
+def subir_archivo_reanudable(
+    service,
+    file_path,
+    metadata: dict,
+    mimetype: str = 'application/pdf',
+    fields: str = 'id,webViewLink,webContentLink',
+    file_id: str = None
+) -> dict:
+    """
+    Sube un archivo a Drive por bloques sobre una sesión reanudable
+    (archivo nuevo, o contenido nuevo del mismo file_id si se indica)
+
+    - Si existe una sesión guardada para este mismo archivo, continúa desde
+      el último byte confirmado por Drive
+    - Errores transitorios (429/5xx/red) se reintentan por bloque con backoff
+    """
+    import httpx
+    from app.google_rest import ErrorGoogle
+
+    file_path = Path(file_path)
+    tamano = file_path.stat().st_size
+    clave = _clave_sesion(file_path, metadata, file_id)
+
+    uri = None
+    offset = 0
+    sesion = _leer_sesion(clave)
+    if sesion and sesion.get('tamano') == tamano:
+        try:
+            estado, valor = service.subida_consultar(sesion['resumable_uri'], tamano)
+        except Exception as e:
+            log.warning("⚠️ No se pudo consultar la sesión previa: %s", e)
+            estado, valor = 'vencida', None
+
+        if estado == 'completa':
+            _borrar_sesion(clave)
+            log.info("♻️ %s ya estaba completo en Drive (sesión previa)", file_path.name)
+            return valor
+        if estado == 'parcial':
+            uri, offset = sesion['resumable_uri'], valor
+            _sumar_stat('reanudadas')
+            log.info("⏯️ Reanudando %s desde %.1f MB de %.1f MB", file_path.name, valor / (1024 * 1024), tamano / (1024 * 1024))
+        else:
+            _borrar_sesion(clave)
+
+    inicio = time.monotonic()
+    bytes_inicio = offset
+    respuesta = None
+    fallos_seguidos = 0
+
+    try:
+        with open(file_path, 'rb') as archivo:
+            while respuesta is None:
+                try:
+                    if uri is None:
+                        uri = service.subida_iniciar(metadata, tamano, mimetype, fileId=file_id, fields=fields)
+                        # Persistir la URI en cuanto existe, aunque el primer bloque falle
+                        _guardar_sesion(clave, uri, tamano)
+                    archivo.seek(offset)
+                    estado, valor = service.subida_enviar(uri, archivo.read(CHUNK_SIZE), offset, tamano)
+                    if estado == 'completa':
+                        respuesta = valor
+                    else:
+                        offset = valor
+                    fallos_seguidos = 0
+                    _sumar_stat('bloques')
+                except ErrorGoogle as e:
+                    if e.status in (404, 410):
+                        # La sesión venció en Drive: el próximo intento empieza de cero
+                        _borrar_sesion(clave)
+                        raise
+                    if not e.reintentable or fallos_seguidos >= MAX_REINTENTOS_BLOQUE:
+                        raise
+                    fallos_seguidos += 1
+                    _sumar_stat('reintentos')
+                    espera = e.retry_after if e.retry_after is not None else _espera_backoff(fallos_seguidos)
+                    log.warning("⚠️ Bloque falló (HTTP %s), reintento %s en %.1fs", e.status, fallos_seguidos, espera)
+                    time.sleep(espera)
+                    offset = _confirmado(service, uri, tamano, offset)
+                except httpx.TransportError as e:
+                    if fallos_seguidos >= MAX_REINTENTOS_BLOQUE:
+                        raise
+                    fallos_seguidos += 1
+                    _sumar_stat('reintentos')
+                    espera = _espera_backoff(fallos_seguidos)
+                    log.warning("⚠️ Error de red subiendo bloque (%s), reintento %s en %.1fs", e, fallos_seguidos, espera)
+                    time.sleep(espera)
+                    offset = _confirmado(service, uri, tamano, offset)
+    except Exception:
+        _sumar_stat('subidas_fallidas')
+        raise
+
+    _borrar_sesion(clave)
+
+    segundos = time.monotonic() - inicio
+    with _stats_lock:
+        _stats['subidas_ok'] += 1
+        _stats['bytes_subidos'] += tamano - bytes_inicio
+        _stats['segundos_subiendo'] += segundos
+        _stats['ultima_subida'] = datetime.now().isoformat()
+
+    mb = (tamano - bytes_inicio) / (1024 * 1024)
+    log.info("📤 %s: %.2f MB en %.1fs (%.2f MB/s)", file_path.name, mb, segundos, mb / segundos if segundos else 0)
+    return respuesta
+
+
+def _confirmado(service, uri: Optional[str], tamano: int, offset: int) -> int:
+    """Tras un bloque fallido, desde dónde seguir según Drive (un bloque pudo llegar a medias)"""
+    if uri is None:
+        return offset
+    try:
+        estado, valor = service.subida_consultar(uri, tamano)
+    except Exception:
+        return offset
+    return valor if estado == 'parcial' else offset
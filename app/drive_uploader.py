@@ -3,273 +3,181 @@ Google Drive Upload con Cache, Thread-Safety y Auto-Recuperación
 IncaNeurobaeza - 2024
 """
 
-import os
-import json
-import time
-import datetime
 import threading
 import functools
 from pathlib import Path
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from app.logs import obtener_logger
 
-# Variables de entorno
-CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID")
-CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET")
-REFRESH_TOKEN = os.environ.get("GOOGLE_REFRESH_TOKEN")
-REDIRECT_URI = os.environ.get("GOOGLE_REDIRECT_URI")
-
-# Archivo de cache del token (Render usa /tmp)
-TOKEN_FILE = Path("/tmp/google_token.json")
+log = obtener_logger(__name__)
 
 # ==================== CACHE Y LOCKS ====================
 
-# Cache global del servicio de Drive
-_service_cache = None
-_service_cache_lock = threading.Lock()
+# Cache de IDs de carpetas en el estado compartido (tres hashes):
+#   carpetas:ids     "parent_id/nombre" → folder_id
+#   carpetas:nombre  folder_id → nombre
+#   carpetas:padre   folder_id → parent_id
+# Las carpetas no cambian de ID, así que se evita un files_list por nivel en
+# cada subida; con Redis lo que aprende una instancia lo aprovechan todas
+HASH_IDS = "carpetas:ids"
+HASH_NOMBRES = "carpetas:nombre"
+HASH_PADRES = "carpetas:padre"
+_folder_cache_lock = threading.Lock()
+
+
+def _estado():
+    from app.estado_compartido import obtener_backend
+    return obtener_backend()
 
-# Lock para renovación de credenciales (evita renovaciones simultáneas)
-_creds_lock = threading.Lock()
 
-# Contador de errores para auto-recuperación
-_error_count = 0
-_max_errors_before_clear = 3
+def _clave_carpeta(nombre: str, parent_id: str) -> str:
+    return f"{parent_id}/{nombre}"
 
 # ==================== FUNCIONES DE CACHE ====================
 
 def clear_service_cache():
-    """Limpia el cache del servicio (útil cuando hay errores)"""
-    global _service_cache, _error_count
-    with _service_cache_lock:
-        _service_cache = None
-        _error_count = 0
-    print("🧹 Cache del servicio limpiado")
+    """Descarta las conexiones abiertas con Google (las próximas llamadas abren nuevas)"""
+    from app.google_rest import renovar_pool
+    renovar_pool()
+    log.info("🧹 Pool de conexiones de Google renovado")
+
+def clear_folder_cache():
+    """Olvida los IDs de carpetas (si alguna se borró o movió a mano en Drive)"""
+    estado = _estado()
+    with _folder_cache_lock:
+        for hash_ in (HASH_IDS, HASH_NOMBRES, HASH_PADRES):
+            estado.borrar_hash(hash_)
+    log.info("🧹 Cache de carpetas limpiado")
+
+def get_cached_folder_name(folder_id: str):
+    """Nombre de una carpeta ya vista por create_folder_if_not_exists (o None)"""
+    return _estado().obtener_campo(HASH_NOMBRES, folder_id)
+
+def remember_folder_name(folder_id: str, name: str, parent_id: str = None):
+    estado = _estado()
+    estado.guardar_campos(HASH_NOMBRES, {folder_id: name})
+    if parent_id:
+        estado.guardar_campos(HASH_PADRES, {folder_id: parent_id})
+
+def get_cached_folder_parent(folder_id: str):
+    return _estado().obtener_campo(HASH_PADRES, folder_id)
+
+def _recordar_carpeta(folder_id: str, name: str, parent_id: str):
+    estado = _estado()
+    estado.guardar_campos(HASH_IDS, {_clave_carpeta(name, parent_id): folder_id})
+    remember_folder_name(folder_id, name, parent_id)
+
+def update_cached_folder(folder_id: str, name: str, parent_id: str = None):
+    """
+    Refleja en el cache un renombre / movimiento de carpeta visto en Drive
+    (la clave (nombre, parent) → id se reemplaza, el ID no cambia)
+    Retorna True si la carpeta ya era conocida y cambió
+    """
+    estado = _estado()
+    with _folder_cache_lock:
+        nombre_previo = estado.obtener_campo(HASH_NOMBRES, folder_id)
+        parent_previo = estado.obtener_campo(HASH_PADRES, folder_id)
+        parent_id = parent_id or parent_previo
+        if nombre_previo == name and parent_previo == parent_id:
+            return False
+        if nombre_previo is not None:
+            estado.borrar_campos(HASH_IDS, [_clave_carpeta(nombre_previo, parent_previo)])
+        _recordar_carpeta(folder_id, name, parent_id)
+        return nombre_previo is not None
+
+def forget_folder(folder_id: str):
+    """Olvida una carpeta (borrada o enviada a la papelera en Drive)"""
+    estado = _estado()
+    with _folder_cache_lock:
+        nombre = estado.obtener_campo(HASH_NOMBRES, folder_id)
+        parent = estado.obtener_campo(HASH_PADRES, folder_id)
+        estado.borrar_campos(HASH_NOMBRES, [folder_id])
+        estado.borrar_campos(HASH_PADRES, [folder_id])
+        # Por si quedó registrada bajo otra clave
+        claves = [c for c, v in estado.campos(HASH_IDS).items() if v == folder_id]
+        if nombre is not None:
+            claves.append(_clave_carpeta(nombre, parent))
+        estado.borrar_campos(HASH_IDS, claves)
+        return nombre is not None
+
+def get_cached_folder_path(folder_id: str):
+    """Ruta 'A/B/C' de una carpeta conocida por el cache (None si falta algún tramo)"""
+    estado = _estado()
+    partes = []
+    actual = folder_id
+    while actual and actual != 'root' and len(partes) < 20:
+        nombre = estado.obtener_campo(HASH_NOMBRES, actual)
+        if nombre is None:
+            return None
+        partes.append(nombre)
+        actual = estado.obtener_campo(HASH_PADRES, actual)
+        if actual is None:
+            return None
+    return "/".join(reversed(partes))
 
 def clear_token_cache():
-    """Elimina el archivo de cache del token"""
+    """Descarta el token (en memoria y en el estado compartido): la próxima llamada renueva"""
     try:
-        if TOKEN_FILE.exists():
-            TOKEN_FILE.unlink()
-            print("🧹 Token cache eliminado")
+        from app.credenciales_google import gestor
+        gestor.olvidar()
+        log.info("🧹 Token cache eliminado")
     except Exception as e:
-        print(f"⚠️ Error eliminando token cache: {e}")
+        log.warning("⚠️ Error eliminando token cache: %s", e)
+
+def leer_token_cache():
+    """Datos del token publicado en el estado compartido (token, expiry, ...) o None"""
+    from app.credenciales_google import gestor
+    return gestor.leer_compartido()
 
 # ==================== DECORADOR DE RETRY ====================
 
-def retry_on_error(max_retries=3, delay=2):
-    """Decorator para reintentar automáticamente en caso de error"""
+def retry_on_error(max_retries=2):
+    """
+    Reintenta solo ante errores de autenticación (401 / refresh rechazado):
+    descarta ese token y repite de inmediato. No duerme el hilo: si la
+    renovación falla, el gestor de credenciales abre su ventana de backoff y
+    los reintentos fallan en el acto con ErrorCredenciales.
+    """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            last_exception = None
+            from app.credenciales_google import gestor, es_error_de_autenticacion, ErrorCredenciales
+            
             for attempt in range(max_retries):
+                token_usado = gestor.token_actual()
                 try:
                     return func(*args, **kwargs)
-                except Exception as e:
-                    last_exception = e
-                    error_str = str(e).lower()
-                    
-                    print(f"⚠️ Error en {func.__name__} (intento {attempt+1}/{max_retries}): {e}")
-                    
-                    # Si es error de autenticación, limpiar cache
-                    if any(x in error_str for x in ['unauthorized', 'invalid', 'expired', 'invalid_grant']):
-                        print("🔄 Error de autenticación detectado, limpiando cache...")
-                        clear_service_cache()
-                        clear_token_cache()
-                        
-                        if attempt < max_retries - 1:
-                            wait_time = delay * (2 ** attempt)  # Backoff exponencial
-                            print(f"⏳ Esperando {wait_time}s antes de reintentar...")
-                            time.sleep(wait_time)
-                            continue
-                    
-                    # Si no es error de auth, no reintentar
+                except ErrorCredenciales:
                     raise
-            
-            raise last_exception
+                except Exception as e:
+                    if not es_error_de_autenticacion(e) or attempt == max_retries - 1:
+                        raise
+                    log.warning("🔄 Error de autenticación en %s (intento %s/%s): %s",
+                                func.__name__, attempt + 1, max_retries, e)
+                    gestor.renovar(rechazado=token_usado)
         return wrapper
     return decorator
 
 # ==================== RENOVACIÓN DE CREDENCIALES ====================
+
 def _get_or_refresh_credentials():
     """
-    Obtiene o renueva las credenciales de Google Drive
-    - Thread-safe (usa lock)
-    - Renovación preventiva (5 minutos antes)
-    - Auto-recuperación en caso de error
-    ✅ CORREGIDO: Ahora siempre genera nuevo token si caduca
+    Credentials vigentes del gestor (app.credenciales_google): en memoria,
+    sin locks mientras el token no esté por vencer
     """
-    
-    with _creds_lock:  # ← EVITA RENOVACIONES SIMULTÁNEAS
-        creds = None
-        needs_refresh = False
-        
-        # Validar que tenemos las credenciales necesarias
-        if not all([CLIENT_ID, CLIENT_SECRET, REFRESH_TOKEN]):
-            raise ValueError(
-                "❌ Faltan credenciales de Google Drive:\n"
-                f"  CLIENT_ID: {'✅' if CLIENT_ID else '❌'}\n"
-                f"  CLIENT_SECRET: {'✅' if CLIENT_SECRET else '❌'}\n"
-                f"  REFRESH_TOKEN: {'✅' if REFRESH_TOKEN else '❌'}\n"
-                "Configura estas variables en Render Dashboard → Environment"
-            )
-        
-        # PASO 1: Intentar cargar token existente del cache
-        if TOKEN_FILE.exists():
-            try:
-                with open(TOKEN_FILE, 'r') as token:
-                    token_data = json.load(token)
-                    creds = Credentials.from_authorized_user_info(
-                        token_data, 
-                        scopes=["https://www.googleapis.com/auth/drive.file"]
-                    )
-                    
-                    # ✅ VERIFICAR SI NECESITA RENOVACIÓN
-                    if creds.expiry:
-                        now = datetime.datetime.utcnow()
-                        time_until_expiry = (creds.expiry - now).total_seconds()
-                        minutes_left = time_until_expiry / 60
-                        
-                        # Renovar si expira en menos de 5 minutos o ya expiró
-                        if time_until_expiry < 300:
-                            if minutes_left < 0:
-                                print(f"⚠️ Token EXPIRADO hace {abs(minutes_left):.1f} minutos")
-                            else:
-                                print(f"⏰ Token expira en {minutes_left:.1f} min, renovando preventivamente...")
-                            needs_refresh = True
-                        else:
-                            print(f"✅ Token válido por {minutes_left:.1f} minutos más")
-                            return creds  # ✅ Token válido, retornar
-                    else:
-                        # Si no tiene expiry, asumir que está válido
-                        print("✅ Token sin fecha de expiración (válido)")
-                        return creds
-                        
-            except Exception as e:
-                print(f"⚠️ Error cargando token del cache: {e}")
-                needs_refresh = True
-        else:
-            print("📝 No existe cache de token, generando nuevo...")
-            needs_refresh = True
-        
-        # PASO 2: ✅ RENOVAR O GENERAR NUEVO TOKEN
-        if needs_refresh or not creds:
-            print("🔄 Generando/renovando access_token con refresh_token...")
-            
-            try:
-                # ✅ SIEMPRE crear credenciales desde REFRESH_TOKEN
-                # Esto funciona tanto si creds existe como si no
-                new_creds = Credentials(
-                    token=None,
-                    refresh_token=REFRESH_TOKEN,
-                    token_uri="https://oauth2.googleapis.com/token",
-                    client_id=CLIENT_ID,
-                    client_secret=CLIENT_SECRET,
-                    scopes=["https://www.googleapis.com/auth/drive.file"]
-                )
-                
-                # Renovar para obtener el access_token
-                new_creds.refresh(Request())
-                
-                print("✅ Token generado/renovado exitosamente")
-                creds = new_creds
-                
-            except Exception as e:
-                error_str = str(e)
-                
-                # ✅ DETECTAR SI EL REFRESH_TOKEN FUE REVOCADO
-                if 'invalid_grant' in error_str.lower():
-                    raise Exception(
-                        "❌ ERROR CRÍTICO: El REFRESH_TOKEN ha sido revocado o es inválido.\n\n"
-                        "SOLUCIÓN:\n"
-                        "1. Ejecuta localmente: python regenerar_token.py\n"
-                        "2. Copia el nuevo REFRESH_TOKEN\n"
-                        "3. Actualízalo en Render Dashboard → Environment → GOOGLE_REFRESH_TOKEN\n"
-                        "4. Guarda cambios y espera 1-2 minutos\n\n"
-                        f"Detalles técnicos: {error_str}"
-                    )
-                
-                raise Exception(f"Error renovando token: {error_str}")
-        
-        # PASO 3: Guardar token renovado en cache
-        if creds:
-            try:
-                token_data = {
-                    'token': creds.token,
-                    'refresh_token': creds.refresh_token or REFRESH_TOKEN,  # ✅ Preservar refresh_token
-                    'token_uri': creds.token_uri,
-                    'client_id': creds.client_id,
-                    'client_secret': creds.client_secret,
-                    'scopes': creds.scopes,
-                    'expiry': creds.expiry.isoformat() if creds.expiry else None
-                }
-                
-                TOKEN_FILE.parent.mkdir(parents=True, exist_ok=True)  # ✅ Crear directorio si no existe
-                
-                with open(TOKEN_FILE, 'w') as token:
-                    json.dump(token_data, token)
-                
-                print("💾 Token guardado en cache")
-                
-            except Exception as e:
-                print(f"⚠️ No se pudo guardar token en cache: {e}")
-                # No es crítico, podemos continuar
-        
-        return creds
+    from app.credenciales_google import gestor
+    return gestor.obtener()
 
 # ==================== SERVICIO DE DRIVE ====================
 
-@retry_on_error(max_retries=3, delay=2)
 def get_authenticated_service():
     """
-    Obtiene el servicio autenticado de Google Drive
-    - Con cache para reutilizar servicio
-    - Con retry automático en caso de error
-    - Thread-safe
+    Cliente de Google Drive del proceso (app.google_rest, llamadas bloqueantes)
+    - Compartido por todos los hilos: un solo pool de conexiones
+    - El token se pide al gestor de credenciales en cada llamada, así que el
+      cliente no caduca y no hace falta probarlo con un files_list
     """
-    global _service_cache, _error_count
-    
-    # PASO 1: Si ya tenemos el servicio en cache, verificar si sigue válido
-    with _service_cache_lock:
-        if _service_cache is not None:
-            try:
-                # Test rápido: listar 1 archivo para verificar conexión
-                _service_cache.files().list(pageSize=1, fields="files(id)").execute()
-                _error_count = 0  # Reset contador de errores
-                return _service_cache
-            except Exception as e:
-                print(f"⚠️ Servicio en cache inválido: {e}")
-                _service_cache = None
-                _error_count += 1
-                
-                # Si hay muchos errores consecutivos, limpiar todo
-                if _error_count >= _max_errors_before_clear:
-                    print(f"⚠️ {_error_count} errores consecutivos, limpiando cache completo...")
-                    clear_token_cache()
-                    _error_count = 0
-    
-    # PASO 2: Necesitamos crear/renovar el servicio
-    print("🔧 Creando nuevo servicio de Google Drive...")
-    creds = _get_or_refresh_credentials()
-    
-    try:
-        service = build('drive', 'v3', credentials=creds)
-        
-        # Verificar que el servicio funciona
-        service.files().list(pageSize=1, fields="files(id)").execute()
-        print("✅ Servicio de Drive creado y verificado")
-        
-        # Guardar en cache
-        with _service_cache_lock:
-            _service_cache = service
-            _error_count = 0
-        
-        return service
-    except Exception as e:
-        print(f"❌ Error creando servicio de Drive: {e}")
-        raise
+    from app.google_rest import cliente_sincrono
+    return cliente_sincrono('drive')
 
 # ==================== FUNCIONES DE UTILIDAD ====================
 
@@ -278,13 +186,19 @@ def create_folder_if_not_exists(service, folder_name, parent_folder_id='root'):
     folder_name_bytes = folder_name if isinstance(folder_name, bytes) else folder_name.encode()
     parent_id = parent_folder_id if isinstance(parent_folder_id, str) else parent_folder_id.decode()
     
+    nombre = folder_name_bytes.decode()
+    folder_id = _estado().obtener_campo(HASH_IDS, _clave_carpeta(nombre, parent_id))
+    if folder_id:
+        return folder_id
+    
     # Buscar carpeta existente
     query = f"name='{folder_name_bytes.decode()}' and mimeType='application/vnd.google-apps.folder' and '{parent_id}' in parents and trashed=false"
-    results = service.files().list(q=query, spaces='drive', fields="files(id, name)").execute()
+    results = service.files_list(q=query, spaces='drive', fields="files(id, name)")
     folders = results.get('files', [])
     
     if folders:
-        print(f"📁 Carpeta '{folder_name_bytes.decode()}' ya existe (ID: {folders[0]['id']})")
+        log.debug("📁 Carpeta '%s' ya existe (ID: %s)", folder_name_bytes.decode(), folders[0]['id'])
+        _recordar_carpeta(folders[0]['id'], nombre, parent_id)
         return folders[0]['id']
     
     # Crear carpeta
@@ -294,8 +208,9 @@ def create_folder_if_not_exists(service, folder_name, parent_folder_id='root'):
         'parents': [parent_id]
     }
     
-    folder = service.files().create(body=folder_metadata, fields='id').execute()
-    print(f"✅ Carpeta '{folder_name_bytes.decode()}' creada (ID: {folder.get('id')})")
+    folder = service.files_create(body=folder_metadata, fields='id')
+    log.info("✅ Carpeta '%s' creada (ID: %s)", folder_name_bytes.decode(), folder.get('id'))
+    _recordar_carpeta(folder.get('id'), nombre, parent_id)
     return folder.get('id')
 
 def get_quinzena_folder_name():
@@ -344,7 +259,7 @@ def normalize_tipo_incapacidad(tipo: str, subtipo: str = None) -> str:
 
 # ==================== FUNCIÓN PRINCIPAL DE UPLOAD ====================
 
-@retry_on_error(max_retries=3, delay=2)
+@retry_on_error()
 def upload_to_drive(
     file_path: Path, 
     empresa: str, 
@@ -369,7 +284,7 @@ def upload_to_drive(
         fecha = datetime.now().strftime("%Y%m%d")
         
         # Crear estructura de carpetas
-        print(f"📁 Creando estructura de carpetas en Drive...")
+        log.debug("📁 Creando estructura de carpetas en Drive...")
         main_folder_id = create_folder_if_not_exists(service, b"Incapacidades", 'root')
         empresa_folder_id = create_folder_if_not_exists(service, empresa.encode() if isinstance(empresa, str) else empresa, main_folder_id)
         year_folder_id = create_folder_if_not_exists(service, año_actual.encode(), empresa_folder_id)
@@ -397,7 +312,7 @@ def upload_to_drive(
         else:
             filename = f"{cedula}_{tipo_normalizado}_{fecha}.pdf"
         
-        print(f"📤 Subiendo archivo: {filename}")
+        log.debug("📤 Subiendo archivo: %s", filename)
         
         file_metadata = {
             'name': filename,
@@ -405,31 +320,41 @@ def upload_to_drive(
             'description': f'Incapacidad {tipo} - Cédula: {cedula} - Empresa: {empresa}'
         }
         
-        media = MediaFileUpload(str(file_path), mimetype='application/pdf', resumable=True)
-        
-        file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id,webViewLink,webContentLink'
-        ).execute()
+        # Subida por bloques, reanudable desde el último byte confirmado
+        from app.drive_upload_manager import subir_archivo_reanudable
+        file = subir_archivo_reanudable(
+            service, file_path, file_metadata,
+            fields='id,webViewLink,webContentLink,md5Checksum,headRevisionId'
+        )
         
         # Hacer público
         try:
-            service.permissions().create(
-                fileId=file.get('id'),
-                body={'role': 'reader', 'type': 'anyone'}
-            ).execute()
+            service.permissions_create(file.get('id'), body={'role': 'reader', 'type': 'anyone'}, fields='id')
         except Exception as e:
-            print(f"⚠️ No se pudo hacer público: {e}")
+            log.warning("⚠️ No se pudo hacer público: %s", e)
+        
+        # Registrar en el índice local de archivos
+        from app.drive_index import registrar_archivo
+        registrar_archivo(
+            file.get('id'),
+            nombre=filename,
+            carpeta_id=final_folder_id,
+            carpeta_ruta=get_cached_folder_path(final_folder_id),
+            md5=file.get('md5Checksum'),
+            revision=file.get('headRevisionId')
+        )
         
         link = file.get('webViewLink', f"https://drive.google.com/file/d/{file.get('id')}/view")
-        print(f"✅ Archivo subido exitosamente")
-        print(f"🔗 Link: {link}")
+        log.debug("✅ Archivo subido exitosamente")
+        log.debug("🔗 Link: %s", link)
         return link
         
     except Exception as e:
+        # Si una carpeta cacheada ya no existe, el próximo intento la vuelve a buscar
+        if 'notfound' in str(e).lower() or '404' in str(e):
+            clear_folder_cache()
         error_msg = f"Error subiendo archivo a Drive: {str(e)}"
-        print(f"❌ {error_msg}")
+        log.error("❌ %s", error_msg)
         raise Exception(error_msg)
 
 def get_folder_link(empresa: str) -> str:
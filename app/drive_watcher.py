@@ -0,0 +1,280 @@
+"""
+Vigilante de Cambios en Drive (Changes API)
+IncaNeurobaeza - 2024
+
+Cada DRIVE_WATCHER_SEGUNDOS lee changes.list desde el último page token y:
+- Actualiza el cache de carpetas (renombres, movimientos, papelera)
+- Actualiza el índice drive_files (y la ruta de los archivos de una carpeta renombrada)
+- Detecta lo que el personal hizo a mano en Drive (mover, borrar, renombrar,
+  reemplazar el PDF) y lo registra en drive_drift para revisión
+
+Lo que hace el backend ya queda en el índice en el momento (subidas, batcher),
+así que al llegar el cambio coincide con el índice y no cuenta como drift. Los
+movimientos y eliminaciones del batcher se anuncian en sync_state antes de
+mandarlos a Drive: si el cambio llega antes de que el batcher actualice el
+índice, coincide con el aviso y tampoco cuenta.
+
+Para probar contra el servidor falso: GOOGLE_API_ENDPOINT=http://127.0.0.1:8765/
+(ver fake_google_server.py y test_drive_watcher.py)
+"""
+
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+
+from app.database import SessionLocal, DriveFile, DriveDrift, Case
+from app.drive_index import (
+    CLAVE_PAGE_TOKEN, CAMPOS_ARCHIVO, FOLDER_MIME,
+    registrar_archivo, marcar_eliminado, indexar_todo,
+    ELIMINADO, operacion_anunciada,
+    ruta_carpeta, leer_estado, guardar_estado
+)
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+WATCHER_SEGUNDOS = int(os.environ.get("DRIVE_WATCHER_SEGUNDOS", "60"))
+
+# Una sola pasada a la vez (scheduler + llamadas manuales)
+_lock = threading.Lock()
+
+_stats = {
+    'ejecuciones': 0,
+    'cambios_leidos': 0,
+    'drift_detectado': 0,
+    'ultima_ejecucion': None,
+    'ultimo_error': None,
+}
+
+
+# ==================== DRIFT ====================
+
+def _registrar_drift(db, fila: Optional[DriveFile], file_id: str, tipo: str, detalle: dict):
+    db.add(DriveDrift(
+        file_id=file_id,
+        serial=fila.serial if fila else None,
+        case_id=fila.case_id if fila else None,
+        tipo=tipo,
+        detalle=detalle
+    ))
+    # Se suma a _stats cuando la página hace commit (un rollback no lo cuenta)
+    db.info['drift_pendiente'] = db.info.get('drift_pendiente', 0) + 1
+    log.warning("⚠️ Drift en Drive: %s %s", tipo, fila.serial if fila and fila.serial else file_id)
+
+
+# ==================== CARPETAS ====================
+
+def _aplicar_carpeta(db, service, archivo: dict, eliminada: bool = False) -> bool:
+    """Refleja en el cache (y en las rutas del índice) un cambio de carpeta"""
+    from app.drive_uploader import (
+        update_cached_folder, forget_folder, get_cached_folder_path
+    )
+
+    folder_id = archivo['id']
+    ruta_anterior = get_cached_folder_path(folder_id)
+
+    if eliminada or archivo.get('trashed'):
+        if not forget_folder(folder_id):
+            return False
+        afectados = db.query(DriveFile).filter(
+            DriveFile.carpeta_id == folder_id,
+            DriveFile.eliminado == False
+        ).count()
+        if afectados:
+            _registrar_drift(db, None, folder_id, 'carpeta_modificada', {
+                'accion': 'eliminada',
+                'ruta': ruta_anterior,
+                'archivos_afectados': afectados
+            })
+        return True
+
+    padres = archivo.get('parents') or ['root']
+    if not update_cached_folder(folder_id, archivo.get('name', ''), padres[0]):
+        return False
+
+    ruta_nueva = ruta_carpeta(service, folder_id)
+    if ruta_anterior and ruta_nueva and ruta_anterior != ruta_nueva:
+        # Toda la subcarpeta cambia de ruta: reescribir el prefijo en el índice
+        filas = db.query(DriveFile).filter(
+            (DriveFile.carpeta_ruta == ruta_anterior) |
+            (DriveFile.carpeta_ruta.like(f"{ruta_anterior}/%"))
+        ).all()
+        for fila in filas:
+            registrar_archivo(
+                fila.file_id,
+                carpeta_ruta=ruta_nueva + fila.carpeta_ruta[len(ruta_anterior):],
+                rol=None,
+                eliminado=fila.eliminado,
+                db=db
+            )
+        _registrar_drift(db, None, folder_id, 'carpeta_modificada', {
+            'accion': 'renombrada_o_movida',
+            'desde': ruta_anterior,
+            'hacia': ruta_nueva,
+            'archivos_afectados': len(filas)
+        })
+    return True
+
+
+# ==================== ARCHIVOS ====================
+
+def _aplicar_archivo(db, service, file_id: str, archivo: Optional[dict]) -> bool:
+    """Compara un cambio de Drive con el índice, registra el drift y actualiza el índice"""
+    fila = db.query(DriveFile).filter(DriveFile.file_id == file_id).first()
+
+    # Borrado definitivo o papelera
+    if archivo is None or archivo.get('trashed'):
+        if not fila:
+            return False
+        if not fila.eliminado:
+            if operacion_anunciada(db, file_id) != ELIMINADO:
+                _registrar_drift(db, fila, file_id, 'eliminado_manual', {
+                    'nombre': fila.nombre,
+                    'ruta': fila.carpeta_ruta,
+                    'papelera': bool(archivo and archivo.get('trashed'))
+                })
+            marcar_eliminado(file_id, db=db)
+        return True
+
+    if archivo.get('mimeType') != 'application/pdf':
+        return False
+
+    carpeta_id = (archivo.get('parents') or [None])[0]
+    carpeta_ruta = ruta_carpeta(service, carpeta_id) if carpeta_id else None
+
+    if fila and fila.eliminado:
+        _registrar_drift(db, fila, file_id, 'restaurado', {
+            'nombre': archivo.get('name'),
+            'ruta': carpeta_ruta
+        })
+    elif fila:
+        if fila.carpeta_id and carpeta_id and carpeta_id != fila.carpeta_id:
+            # Movimiento del batcher que todavía no llegó al índice: no es drift
+            if operacion_anunciada(db, file_id) != carpeta_id:
+                _registrar_drift(db, fila, file_id, 'movido_manual', {
+                    'desde': fila.carpeta_ruta or fila.carpeta_id,
+                    'hacia': carpeta_ruta or carpeta_id
+                })
+            # El caso guarda su carpeta actual (la usa el batcher al mover)
+            db.query(Case).filter(Case.drive_file_id == file_id).update(
+                {Case.drive_parent_id: carpeta_id}, synchronize_session=False
+            )
+        if fila.nombre and archivo.get('name') and archivo['name'] != fila.nombre:
+            _registrar_drift(db, fila, file_id, 'renombrado', {
+                'desde': fila.nombre,
+                'hacia': archivo['name']
+            })
+        if fila.md5 and archivo.get('md5Checksum') and archivo['md5Checksum'] != fila.md5:
+            _registrar_drift(db, fila, file_id, 'contenido_modificado', {
+                'md5_anterior': fila.md5,
+                'md5_nuevo': archivo['md5Checksum']
+            })
+
+    registrar_archivo(
+        file_id,
+        nombre=archivo.get('name'),
+        carpeta_id=carpeta_id,
+        carpeta_ruta=carpeta_ruta,
+        md5=archivo.get('md5Checksum'),
+        revision=archivo.get('headRevisionId'),
+        db=db
+    )
+    return True
+
+
+# ==================== PASADA ====================
+
+def procesar_cambios(service=None) -> dict:
+    """
+    Una pasada del vigilante: aplica los cambios de Drive desde el último
+    page token. La primera vez toma el token actual y hace la carga completa.
+    """
+    from app.drive_uploader import get_authenticated_service
+
+    if not _lock.acquire(blocking=False):
+        return {'ok': True, 'omitido': 'pasada en curso'}
+
+    db = None
+    try:
+        service = service or get_authenticated_service()
+        db = SessionLocal()
+        page_token = leer_estado(db, CLAVE_PAGE_TOKEN)
+
+        if not page_token:
+            inicio = service.changes_get_start_page_token().get('startPageToken')
+            db.close()
+            indexados = indexar_todo(service)
+            db = SessionLocal()
+            guardar_estado(db, CLAVE_PAGE_TOKEN, inicio)
+            db.commit()
+            return {'ok': True, 'inicial': True, 'indexados': indexados}
+
+        leidos = aplicados = drift = 0
+
+        while page_token:
+            respuesta = service.changes_list(
+                page_token,
+                spaces='drive',
+                pageSize=1000,
+                fields=f'nextPageToken, newStartPageToken, changes(fileId, removed, file({CAMPOS_ARCHIVO}))'
+            )
+
+            for cambio in respuesta.get('changes', []):
+                leidos += 1
+                archivo = None if cambio.get('removed') else cambio.get('file')
+                file_id = cambio.get('fileId') or (archivo or {}).get('id')
+
+                if archivo and archivo.get('mimeType') == FOLDER_MIME:
+                    aplicado = _aplicar_carpeta(db, service, archivo)
+                elif archivo is None:
+                    # Borrado definitivo: puede ser archivo indexado o carpeta cacheada
+                    aplicado = (_aplicar_archivo(db, service, file_id, None) or
+                                _aplicar_carpeta(db, service, {'id': file_id}, eliminada=True))
+                else:
+                    aplicado = _aplicar_archivo(db, service, file_id, archivo)
+                aplicados += int(bool(aplicado))
+
+            if respuesta.get('newStartPageToken'):
+                guardar_estado(db, CLAVE_PAGE_TOKEN, respuesta['newStartPageToken'])
+                page_token = None
+            else:
+                page_token = respuesta.get('nextPageToken')
+                guardar_estado(db, CLAVE_PAGE_TOKEN, page_token)
+            db.commit()
+            drift_pagina = db.info.pop('drift_pendiente', 0)
+            _stats['drift_detectado'] += drift_pagina
+            drift += drift_pagina
+
+        _stats['cambios_leidos'] += leidos
+        if aplicados:
+            log.info("🔄 Vigilante de Drive: %s cambios aplicados, %s con drift", aplicados, drift)
+        return {'ok': True, 'leidos': leidos, 'aplicados': aplicados, 'drift': drift}
+
+    except Exception as e:
+        if db is not None:
+            db.rollback()
+        _stats['ultimo_error'] = str(e)
+        log.warning("⚠️ Error en vigilante de Drive: %s", e)
+        return {'ok': False, 'error': str(e)}
+    finally:
+        _stats['ejecuciones'] += 1
+        _stats['ultima_ejecucion'] = datetime.utcnow().isoformat()
+        if db is not None:
+            db.close()
+        _lock.release()
+
+
+# ==================== CONSULTAS ====================
+
+def obtener_estadisticas() -> dict:
+    return dict(_stats, intervalo_segundos=WATCHER_SEGUNDOS)
+
+
+def listar_drift(db, solo_pendientes: bool = True, tipo: str = None, limite: int = 100):
+    query = db.query(DriveDrift)
+    if solo_pendientes:
+        query = query.filter(DriveDrift.revisado == False)
+    if tipo:
+        query = query.filter(DriveDrift.tipo == tipo)
+    return query.order_by(DriveDrift.detectado_at.desc()).limit(limite).all()
@@ -1304,4 +1304,18 @@ def get_confirmation_template(nombre, serial, empresa, tipo_incapacidad, telefon
         
     </body>
     </html>
-    """
\ No newline at end of file
+    """
+
+def get_alerta_cedula_desconocida_template(consecutivo, cedula, email, telefono, quinzena, link_drive):
+    """Alerta interna: llegó una incapacidad con una cédula que no está en la base de empleados"""
+    return f"""
+        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
+            <h2 style="color: #dc3545;">⚠️ Cédula no encontrada en la base de empleados</h2>
+            <p><strong>Consecutivo:</strong> {consecutivo}<br>
+            <strong>Cédula:</strong> {cedula}<br>
+            <strong>Email:</strong> {email}<br>
+            <strong>Teléfono:</strong> {telefono}<br>
+            <strong>Quincena:</strong> {quinzena}</p>
+            <p><a href="{link_drive}">Ver documento en Drive</a></p>
+        </div>
+        """
@@ -0,0 +1,189 @@
+"""
+Escritura Diferida (filas no críticas en bloque)
+IncaNeurobaeza - 2024
+
+busqueda_relacional hacía un INSERT y un commit en el primario (un fsync)
+por cada búsqueda solo para guardar el SearchHistory, y la búsqueda desde
+Excel dos más. Esas filas no las lee nadie en el request: ahora se encolan y
+un hilo las escribe en bloque.
+
+- encolar(Modelo, {...}) no toca la BD: deja la fila en una cola acotada
+  (ESCRITURA_DIFERIDA_MAXIMA filas). Con la cola llena la fila se descarta
+  y se cuenta; el request nunca espera
+- El hilo vacía la cola cada ESCRITURA_DIFERIDA_MS ms, o antes si ya hay
+  ESCRITURA_DIFERIDA_FILAS filas: un INSERT executemany por modelo y un
+  solo commit por lote
+- detener() escribe lo pendiente: lo llama shutdown_event (y atexit para
+  scripts)
+
+Lo que sí importa perder (CaseEvent, el historial del caso) no pasa por
+aquí: registrar_evento lo agrega a la sesión del request y se guarda con el
+mismo commit que el cambio que registra.
+
+Uso:
+    from app.escritura_diferida import encolar
+    encolar(SearchHistory, {'usuario': "Validador", 'tipo_busqueda': "relacional", ...})
+"""
+
+import os
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+ESCRITURA_DIFERIDA_MAXIMA = int(os.environ.get("ESCRITURA_DIFERIDA_MAXIMA", "10000"))
+ESCRITURA_DIFERIDA_MS = int(os.environ.get("ESCRITURA_DIFERIDA_MS", "500"))
+ESCRITURA_DIFERIDA_FILAS = int(os.environ.get("ESCRITURA_DIFERIDA_FILAS", "200"))
+
+_cola: "queue.Queue[Tuple[type, dict]]" = queue.Queue(maxsize=ESCRITURA_DIFERIDA_MAXIMA)
+_despertar = threading.Event()
+_detener = threading.Event()
+# Un solo vaciado a la vez (el hilo, detener() o un vaciar() explícito)
+_escribiendo = threading.Lock()
+_hilo: Optional[threading.Thread] = None
+_hilo_lock = threading.Lock()
+_avisado = False
+
+_stats = {
+    'encoladas': 0,
+    'escritas': 0,
+    'descartadas': 0,
+    'lotes': 0,
+    'errores': 0,
+    'ultimo_lote_ms': None,
+    'ultimo_error': None,
+}
+
+
+# ==================== ENCOLAR ====================
+
+def _iniciar():
+    global _hilo
+    if _hilo is not None:
+        return
+    with _hilo_lock:
+        if _hilo is None:
+            _detener.clear()
+            _hilo = threading.Thread(target=_bucle, name="escritura_diferida", daemon=True)
+            _hilo.start()
+
+
+def encolar(modelo, fila: dict) -> bool:
+    """
+    Deja la fila para el próximo lote. False si la cola está llena (la fila
+    se descarta: solo para datos que se pueden perder)
+    """
+    global _avisado
+    if 'created_at' in modelo.__table__.c:
+        # La hora del request, no la del lote
+        fila.setdefault('created_at', datetime.utcnow())
+    _iniciar()
+    try:
+        _cola.put_nowait((modelo, fila))
+    except queue.Full:
+        _stats['descartadas'] += 1
+        if not _avisado:
+            _avisado = True
+            log.warning("⚠️ Cola de escritura diferida llena (%s filas): se descartan filas de %s",
+                        ESCRITURA_DIFERIDA_MAXIMA, modelo.__tablename__)
+        return False
+    _stats['encoladas'] += 1
+    if _cola.qsize() >= ESCRITURA_DIFERIDA_FILAS:
+        _despertar.set()
+    return True
+
+
+# ==================== VACIAR ====================
+
+def _escribir(lote: List[Tuple[type, dict]]):
+    """Un INSERT executemany por modelo (y por juego de columnas), un commit"""
+    from app.database import engine
+
+    grupos: Dict[Tuple[type, frozenset], List[dict]] = {}
+    for modelo, fila in lote:
+        # executemany exige las mismas claves en todas las filas; las que
+        # faltan toman el default de la columna, no NULL
+        grupos.setdefault((modelo, frozenset(fila)), []).append(fila)
+
+    inicio = time.perf_counter()
+    try:
+        with engine.begin() as conn:
+            for (modelo, _), filas in grupos.items():
+                conn.execute(insert(modelo), filas)
+    except Exception as e:
+        _stats['errores'] += 1
+        _stats['descartadas'] += len(lote)
+        _stats['ultimo_error'] = str(e)[:300]
+        log.error("❌ Error escribiendo %s fila(s) diferidas: %s", len(lote), e)
+        return
+    _stats['escritas'] += len(lote)
+    _stats['lotes'] += 1
+    _stats['ultimo_lote_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+    log.debug("💾 %s fila(s) diferidas escritas en %.1f ms", len(lote), _stats['ultimo_lote_ms'])
+
+
+def vaciar() -> int:
+    """Escribe ya lo que haya en la cola. Devuelve cuántas filas tomó"""
+    global _avisado
+    total = 0
+    with _escribiendo:
+        while True:
+            lote = []
+            while len(lote) < ESCRITURA_DIFERIDA_MAXIMA:
+                try:
+                    lote.append(_cola.get_nowait())
+                except queue.Empty:
+                    break
+            if not lote:
+                break
+            _escribir(lote)
+            total += len(lote)
+        _avisado = False
+    return total
+
+
+def _bucle():
+    while not _detener.is_set():
+        _despertar.wait(ESCRITURA_DIFERIDA_MS / 1000)
+        _despertar.clear()
+        try:
+            vaciar()
+        except Exception as e:
+            log.error("❌ Error en el hilo de escritura diferida: %s", e)
+
+
+def detener(timeout: float = 10.0) -> int:
+    """Detiene el hilo y escribe lo pendiente (al apagar)"""
+    global _hilo
+    with _hilo_lock:
+        hilo, _hilo = _hilo, None
+    if hilo is not None:
+        _detener.set()
+        _despertar.set()
+        hilo.join(timeout)
+    pendientes = vaciar()
+    if pendientes:
+        log.info("💾 %s fila(s) diferidas escritas al apagar", pendientes)
+    return pendientes
+
+
+atexit.register(detener)
+
+
+def obtener_estadisticas() -> dict:
+    return {
+        'pendientes': _cola.qsize(),
+        'maxima': ESCRITURA_DIFERIDA_MAXIMA,
+        'intervalo_ms': ESCRITURA_DIFERIDA_MS,
+        'filas_por_lote': ESCRITURA_DIFERIDA_FILAS,
+        'activo': _hilo is not None and _hilo.is_alive(),
+        **_stats,
+    }
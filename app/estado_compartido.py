@@ -0,0 +1,430 @@
+"""
+Estado Compartido entre Instancias
+IncaNeurobaeza - 2024
+
+Lo que antes vivía en globales del proceso o en /tmp (token de Google,
+cache de carpetas de Drive, ritmo de llamadas a las APIs) pasa por un backend
+intercambiable, para poder correr varias instancias del portal sin que cada
+una renueve el token por su cuenta ni pise los archivos de las otras:
+
+- Local (por defecto): claves simples en archivos JSON en ESTADO_LOCAL_DIR
+  (compartidas entre workers de la misma máquina, como el antiguo
+  /tmp/google_token.json); hashes y cubetas de ritmo en memoria del proceso
+- Redis: ESTADO_COMPARTIDO_URL=redis://host:6379/0 (o REDIS_URL). Si Redis
+  no responde se usa el backend local y se cuenta el error
+
+También da directorios de trabajo únicos por request (directorio_de_trabajo)
+para los PDFs e imágenes temporales, en vez de nombres fijos por serial en
+tempfile.gettempdir().
+
+Probar con un Redis local de mentira (fakeredis, en requirements-dev.txt):
+    python -m pytest -q test_estado_compartido.py
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+from app.logs import obtener_logger, contexto_actual
+
+log = obtener_logger(__name__)
+
+ESTADO_COMPARTIDO_URL = os.environ.get("ESTADO_COMPARTIDO_URL") or os.environ.get("REDIS_URL", "")
+ESTADO_PREFIJO = os.environ.get("ESTADO_COMPARTIDO_PREFIJO", "incapacidades:")
+ESTADO_LOCAL_DIR = Path(os.environ.get(
+    "ESTADO_LOCAL_DIR",
+    os.path.join(tempfile.gettempdir(), "incapacidades_estado")
+))
+DIRECTORIO_TRABAJO = Path(os.environ.get(
+    "DIRECTORIO_TRABAJO",
+    os.path.join(tempfile.gettempdir(), "incapacidades_trabajo")
+))
+
+_stats = {'errores_redis': 0, 'respaldo_local': 0, 'esperas_ritmo': 0, 'directorios_creados': 0}
+
+
+def _nombre_archivo(clave: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', clave) + ".json"
+
+
+# ==================== BACKEND LOCAL ====================
+
+class BackendLocal:
+    """Archivos JSON para claves simples; hashes y cubetas en memoria"""
+
+    nombre = "local"
+
+    def __init__(self, directorio: Path = None):
+        self.directorio = Path(directorio or ESTADO_LOCAL_DIR)
+        self._lock = threading.Lock()
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        self._cubetas: Dict[str, list] = {}
+
+    # ---------- claves simples ----------
+
+    def _ruta(self, clave: str) -> Path:
+        return self.directorio / _nombre_archivo(clave)
+
+    def obtener(self, clave: str) -> Optional[str]:
+        ruta = self._ruta(clave)
+        try:
+            datos = json.loads(ruta.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        if datos.get('expira') and datos['expira'] < time.time():
+            ruta.unlink(missing_ok=True)
+            return None
+        return datos.get('valor')
+
+    def guardar(self, clave: str, valor: str, ttl: float = None):
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        ruta = self._ruta(clave)
+        temporal = ruta.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+        temporal.write_text(json.dumps({'valor': valor, 'expira': time.time() + ttl if ttl else None}))
+        # Reemplazo atómico: otro worker nunca lee un archivo a medio escribir
+        os.replace(temporal, ruta)
+
+    def borrar(self, clave: str):
+        self._ruta(clave).unlink(missing_ok=True)
+
+    @contextmanager
+    def candado(self, clave: str, ttl: float = 30, espera: float = 0):
+        """flock sobre un archivo: excluye hilos y workers de esta máquina"""
+        import fcntl
+
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        archivo = open(self.directorio / (_nombre_archivo(clave) + ".lock"), 'a+')
+        limite = time.monotonic() + espera
+        obtenido = False
+        try:
+            while True:
+                try:
+                    fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    obtenido = True
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= limite:
+                        break
+                    time.sleep(0.05)
+            yield obtenido
+        finally:
+            if obtenido:
+                fcntl.flock(archivo.fileno(), fcntl.LOCK_UN)
+            archivo.close()
+
+    # ---------- hashes ----------
+
+    def obtener_campo(self, hash_: str, campo: str) -> Optional[str]:
+        with self._lock:
+            return self._hashes.get(hash_, {}).get(campo)
+
+    def guardar_campos(self, hash_: str, campos: Dict[str, str]):
+        with self._lock:
+            self._hashes.setdefault(hash_, {}).update(campos)
+
+    def borrar_campos(self, hash_: str, campos: Iterable[str]):
+        with self._lock:
+            tabla = self._hashes.get(hash_, {})
+            for campo in campos:
+                tabla.pop(campo, None)
+
+    def campos(self, hash_: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._hashes.get(hash_, {}))
+
+    def borrar_hash(self, hash_: str):
+        with self._lock:
+            self._hashes.pop(hash_, None)
+
+    # ---------- ritmo ----------
+
+    def consumir(self, clave: str, por_segundo: float, rafaga: float) -> float:
+        """Cubeta de tokens: 0 si hay turno, si no los segundos a esperar"""
+        ahora = time.time()
+        with self._lock:
+            tokens, ultimo = self._cubetas.get(clave, (rafaga, ahora))
+            tokens = min(rafaga, tokens + (ahora - ultimo) * por_segundo)
+            if tokens >= 1:
+                self._cubetas[clave] = (tokens - 1, ahora)
+                return 0.0
+            self._cubetas[clave] = (tokens, ahora)
+            return (1 - tokens) / por_segundo
+
+
+# ==================== BACKEND REDIS ====================
+
+class BackendRedis:
+    """
+    Mismo contrato sobre Redis (o cualquier servidor compatible). Las
+    operaciones compuestas usan WATCH/MULTI en vez de scripts Lua, así
+    también funcionan contra fakeredis sin dependencias extra.
+    """
+
+    nombre = "redis"
+
+    def __init__(self, url: str, prefijo: str = None, cliente=None):
+        if cliente is None:
+            import redis
+            cliente = redis.Redis.from_url(url, decode_responses=True,
+                                           socket_timeout=2, socket_connect_timeout=2)
+        self.cliente = cliente
+        self.prefijo = ESTADO_PREFIJO if prefijo is None else prefijo
+        self.respaldo = BackendLocal()
+        self._ultimo_aviso = 0.0
+
+    def _k(self, clave: str) -> str:
+        return self.prefijo + clave
+
+    def _fallo(self, operacion: str, error: Exception):
+        _stats['errores_redis'] += 1
+        _stats['respaldo_local'] += 1
+        # Un aviso por minuto como máximo
+        if time.monotonic() - self._ultimo_aviso > 60:
+            self._ultimo_aviso = time.monotonic()
+            log.warning("⚠️ Redis no disponible en %s (%s): usando estado local", operacion, error)
+
+    # ---------- claves simples ----------
+
+    def obtener(self, clave: str) -> Optional[str]:
+        try:
+            return self.cliente.get(self._k(clave))
+        except Exception as e:
+            self._fallo('obtener', e)
+            return self.respaldo.obtener(clave)
+
+    def guardar(self, clave: str, valor: str, ttl: float = None):
+        try:
+            self.cliente.set(self._k(clave), valor, px=int(ttl * 1000) if ttl else None)
+        except Exception as e:
+            self._fallo('guardar', e)
+            self.respaldo.guardar(clave, valor, ttl)
+
+    def borrar(self, clave: str):
+        try:
+            self.cliente.delete(self._k(clave))
+        except Exception as e:
+            self._fallo('borrar', e)
+            self.respaldo.borrar(clave)
+
+    @contextmanager
+    def candado(self, clave: str, ttl: float = 30, espera: float = 0):
+        """SET NX PX con dueño: expira solo si la instancia muere con él tomado"""
+        import redis
+
+        k = self._k(f"candado:{clave}")
+        dueno = uuid.uuid4().hex
+        limite = time.monotonic() + espera
+        obtenido = False
+        try:
+            while True:
+                obtenido = bool(self.cliente.set(k, dueno, nx=True, px=int(ttl * 1000)))
+                if obtenido or time.monotonic() >= limite:
+                    break
+                time.sleep(0.05)
+        except Exception as e:
+            self._fallo('candado', e)
+            with self.respaldo.candado(clave, ttl, espera) as local:
+                yield local
+            return
+
+        try:
+            yield obtenido
+        finally:
+            if obtenido:
+                try:
+                    with self.cliente.pipeline() as pipe:
+                        pipe.watch(k)
+                        if pipe.get(k) == dueno:
+                            pipe.multi()
+                            pipe.delete(k)
+                            pipe.execute()
+                except (redis.WatchError, redis.RedisError) as e:
+                    log.debug("Candado %s no liberado (expira solo): %s", clave, e)
+
+    # ---------- hashes ----------
+
+    def obtener_campo(self, hash_: str, campo: str) -> Optional[str]:
+        try:
+            return self.cliente.hget(self._k(hash_), campo)
+        except Exception as e:
+            self._fallo('obtener_campo', e)
+            return self.respaldo.obtener_campo(hash_, campo)
+
+    def guardar_campos(self, hash_: str, campos: Dict[str, str]):
+        if not campos:
+            return
+        try:
+            self.cliente.hset(self._k(hash_), mapping=campos)
+        except Exception as e:
+            self._fallo('guardar_campos', e)
+            self.respaldo.guardar_campos(hash_, campos)
+
+    def borrar_campos(self, hash_: str, campos: Iterable[str]):
+        campos = list(campos)
+        if not campos:
+            return
+        try:
+            self.cliente.hdel(self._k(hash_), *campos)
+        except Exception as e:
+            self._fallo('borrar_campos', e)
+            self.respaldo.borrar_campos(hash_, campos)
+
+    def campos(self, hash_: str) -> Dict[str, str]:
+        try:
+            return self.cliente.hgetall(self._k(hash_))
+        except Exception as e:
+            self._fallo('campos', e)
+            return self.respaldo.campos(hash_)
+
+    def borrar_hash(self, hash_: str):
+        try:
+            self.cliente.delete(self._k(hash_))
+        except Exception as e:
+            self._fallo('borrar_hash', e)
+            self.respaldo.borrar_hash(hash_)
+
+    # ---------- ritmo ----------
+
+    def consumir(self, clave: str, por_segundo: float, rafaga: float) -> float:
+        """Cubeta de tokens compartida por todas las instancias"""
+        import redis
+
+        k = self._k(f"ritmo:{clave}")
+        try:
+            with self.cliente.pipeline() as pipe:
+                for _ in range(10):
+                    try:
+                        pipe.watch(k)
+                        datos = pipe.hgetall(k)
+                        ahora = time.time()
+                        tokens = float(datos.get('tokens', rafaga))
+                        ultimo = float(datos.get('ts', ahora))
+                        tokens = min(rafaga, tokens + max(0.0, ahora - ultimo) * por_segundo)
+                        espera = 0.0 if tokens >= 1 else (1 - tokens) / por_segundo
+                        if tokens >= 1:
+                            tokens -= 1
+                        pipe.multi()
+                        pipe.hset(k, mapping={'tokens': tokens, 'ts': ahora})
+                        pipe.expire(k, max(60, int(rafaga / por_segundo) + 1))
+                        pipe.execute()
+                        return espera
+                    except redis.WatchError:
+                        continue
+            # Demasiada contención: pedir un turno corto y reintentar
+            return 1 / por_segundo
+        except redis.RedisError as e:
+            self._fallo('consumir', e)
+            return self.respaldo.consumir(clave, por_segundo, rafaga)
+
+
+# ==================== BACKEND ACTIVO ====================
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def obtener_backend():
+    """Backend del proceso (Redis si hay URL configurada, si no local)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if ESTADO_COMPARTIDO_URL:
+                    _backend = BackendRedis(ESTADO_COMPARTIDO_URL)
+                    log.info("🗄️ Estado compartido en Redis (%s)", ESTADO_COMPARTIDO_URL.split('@')[-1])
+                else:
+                    _backend = BackendLocal()
+    return _backend
+
+
+def configurar_backend(backend):
+    """Reemplaza el backend (pruebas, o un cliente Redis ya construido)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def esperar_turno(clave: str, por_segundo: float, rafaga: float = None, maximo: float = 30.0) -> float:
+    """Bloquea hasta que la cubeta `clave` dé un turno; retorna los segundos esperados"""
+    if por_segundo <= 0:
+        return 0.0
+    rafaga = rafaga or max(1.0, por_segundo)
+    backend = obtener_backend()
+    esperado = 0.0
+    while esperado < maximo:
+        espera = backend.consumir(clave, por_segundo, rafaga)
+        if espera <= 0:
+            break
+        _stats['esperas_ritmo'] += 1
+        espera = min(espera, maximo - esperado)
+        time.sleep(espera)
+        esperado += espera
+    return esperado
+
+
+async def esperar_turno_async(clave: str, por_segundo: float, rafaga: float = None, maximo: float = 30.0) -> float:
+    """Igual que esperar_turno pero sin bloquear el event loop mientras espera"""
+    import asyncio
+
+    if por_segundo <= 0:
+        return 0.0
+    rafaga = rafaga or max(1.0, por_segundo)
+    backend = obtener_backend()
+    esperado = 0.0
+    while esperado < maximo:
+        espera = backend.consumir(clave, por_segundo, rafaga)
+        if espera <= 0:
+            break
+        _stats['esperas_ritmo'] += 1
+        espera = min(espera, maximo - esperado)
+        await asyncio.sleep(espera)
+        esperado += espera
+    return esperado
+
+
+def obtener_estadisticas() -> dict:
+    backend = obtener_backend()
+    return {'backend': backend.nombre, **_stats}
+
+
+# ==================== DIRECTORIOS DE TRABAJO ====================
+
+def crear_directorio_de_trabajo(etiqueta: str = "tmp") -> Path:
+    """
+    Directorio temporal único (etiqueta + request_id + aleatorio): dos
+    requests sobre el mismo serial, o dos instancias con el mismo disco, no
+    comparten archivos
+    """
+    DIRECTORIO_TRABAJO.mkdir(parents=True, exist_ok=True)
+    request_id = contexto_actual().get('request_id', 'fondo')
+    etiqueta = re.sub(r'[^A-Za-z0-9_-]', '_', etiqueta)[:40]
+    _stats['directorios_creados'] += 1
+    return Path(tempfile.mkdtemp(prefix=f"{etiqueta}_{request_id}_", dir=DIRECTORIO_TRABAJO))
+
+
+def borrar_directorio_de_trabajo(ruta: Optional[Path]):
+    if ruta:
+        shutil.rmtree(ruta, ignore_errors=True)
+
+
+@contextmanager
+def directorio_de_trabajo(etiqueta: str = "tmp"):
+    ruta = crear_directorio_de_trabajo(etiqueta)
+    try:
+        yield ruta
+    finally:
+        borrar_directorio_de_trabajo(ruta)
+
+
+def nombre_seguro(nombre: Optional[str], por_defecto: str = "archivo") -> str:
+    """Nombre de archivo subido sin rutas (evita '../' en adjunto.filename)"""
+    nombre = os.path.basename((nombre or "").replace("\\", "/")).strip()
+    return nombre or por_defecto
@@ -0,0 +1,124 @@
+"""
+Filtros sobre metadata_form y case_events.metadata_json
+IncaNeurobaeza - 2024
+
+Los checks del validador y los datos del formulario (vehiculo_fantasma,
+madre_trabaja, dias_incapacidad...) viven en columnas JSON. Estas funciones
+arman condiciones SQL sobre ellas para usar dentro de un select(Case):
+
+- PostgreSQL (JSONB): contención con @>, que usa los índices GIN
+  jsonb_path_ops de cases.metadata_form y case_events.metadata_json
+- SQLite: funciones JSON1 (json_each / json_extract), sin índice, pero el
+  filtro de fechas sigue usando el índice de created_at
+"""
+
+from calendar import monthrange
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, literal, or_, select, true
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.database import Case, CaseEvent, database_url
+
+# Campos del formulario que se pueden filtrar (valores como los guarda /subir-incapacidad)
+CAMPOS_METADATA = {
+    'vehiculo_fantasma', 'tiene_soat', 'madre_trabaja', 'nacidos_vivos', 'dias_incapacidad', 'subtipo'
+}
+
+
+def es_postgres() -> bool:
+    return database_url.startswith("postgresql")
+
+
+def _contiene(columna, valor):
+    return columna.op('@>')(literal(valor, JSONB))
+
+
+def _valores_json1(columna, ruta: str):
+    return func.json_each(columna, ruta).table_valued('value').alias('chk')
+
+
+# ==================== CHECKS ====================
+
+def checks_marcados_en(checks: List[str], modo: str = 'alguno',
+                       desde: Optional[datetime] = None, hasta: Optional[datetime] = None):
+    """
+    Casos a los que el validador marcó esos checks (evento de validación o
+    rechazo de reenvío con metadata {"checks": [...]}) entre desde y hasta.
+    Es un IN (subconsulta) sin correlacionar: se resuelve una vez desde
+    case_events (índice de created_at / GIN), no un EXISTS por cada caso
+    """
+    condiciones = []
+    if desde:
+        condiciones.append(CaseEvent.created_at >= desde)
+    if hasta:
+        condiciones.append(CaseEvent.created_at < hasta)
+
+    if not es_postgres():
+        valores = _valores_json1(CaseEvent.metadata_json, '$.checks')
+        consulta = (select(CaseEvent.case_id).select_from(CaseEvent).join(valores, true())
+                    .where(valores.c.value.in_(checks), *condiciones))
+        if modo == 'todos' and len(checks) > 1:
+            consulta = consulta.group_by(CaseEvent.id).having(
+                func.count(func.distinct(valores.c.value)) == len(checks))
+        return Case.id.in_(consulta)
+
+    if modo == 'todos':
+        contiene = _contiene(CaseEvent.metadata_json, {'checks': checks})
+    else:
+        contiene = or_(*[_contiene(CaseEvent.metadata_json, {'checks': [c]}) for c in checks])
+    return Case.id.in_(select(CaseEvent.case_id).where(contiene, *condiciones))
+
+
+def checks_vigentes(checks: List[str], modo: str = 'alguno'):
+    """Casos cuyo metadata_form['checks_seleccionados'] tiene hoy esos checks"""
+    if not es_postgres():
+        valores = _valores_json1(Case.metadata_form, '$.checks_seleccionados')
+        encontrados = select(func.count(func.distinct(valores.c.value))).where(
+            valores.c.value.in_(checks)).scalar_subquery()
+        return encontrados >= (len(checks) if modo == 'todos' else 1)
+
+    if modo == 'todos':
+        return _contiene(Case.metadata_form, {'checks_seleccionados': checks})
+    return or_(*[_contiene(Case.metadata_form, {'checks_seleccionados': [c]}) for c in checks])
+
+
+# ==================== CAMPOS DEL FORMULARIO ====================
+
+def campo_igual(clave: str, valor):
+    """metadata_form[clave] == valor (clave de CAMPOS_METADATA)"""
+    if clave not in CAMPOS_METADATA:
+        raise ValueError(f"Campo no filtrable: {clave}")
+    if es_postgres():
+        return _contiene(Case.metadata_form, {clave: valor})
+    return func.json_extract(Case.metadata_form, f'$.{clave}') == valor
+
+
+# ==================== PERIODOS ====================
+
+def rango_quincena(quincena: str, hoy: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """
+    'actual', 'anterior' o 'AAAA-MM-1' / 'AAAA-MM-2' → [desde, hasta)
+    (primera quincena del 1 al 15, segunda del 16 a fin de mes)
+    """
+    hoy = hoy or datetime.now()
+    if quincena in ('actual', 'anterior'):
+        anio, mes, mitad = hoy.year, hoy.month, 1 if hoy.day <= 15 else 2
+        if quincena == 'anterior':
+            if mitad == 2:
+                mitad = 1
+            else:
+                anterior = hoy.replace(day=1) - timedelta(days=1)
+                anio, mes, mitad = anterior.year, anterior.month, 2
+    else:
+        try:
+            anio, mes, mitad = (int(p) for p in quincena.split('-'))
+            if mitad not in (1, 2) or not 1 <= mes <= 12:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"Quincena inválida: {quincena} (use 'actual', 'anterior' o AAAA-MM-1/2)")
+
+    if mitad == 1:
+        return datetime(anio, mes, 1), datetime(anio, mes, 16)
+    return datetime(anio, mes, 16), datetime(anio, mes, monthrange(anio, mes)[1]) + timedelta(days=1)
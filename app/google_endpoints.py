@@ -0,0 +1,61 @@
+"""
+Endpoints de APIs de Google configurables
+IncaNeurobaeza - 2024
+
+Con GOOGLE_API_ENDPOINT (ej. http://127.0.0.1:8765/) el cliente de Drive y
+Sheets (app.google_rest) y la descarga del Excel de empleados apuntan a un
+servidor local (fake_google_server.py) en vez de googleapis.com, sin OAuth. Sirve
+para pruebas y benchmarks de carga.
+Sin la variable, todo funciona igual que siempre.
+
+GOOGLE_LIMITE_POR_SEGUNDO (por API, 0 = sin límite) reparte la cuota entre
+todas las instancias con una cubeta de tokens en el estado compartido
+(app.estado_compartido): las llamadas esperan turno en vez de recibir 429.
+"""
+
+import os
+
+GOOGLE_API_ENDPOINT = os.environ.get("GOOGLE_API_ENDPOINT")
+GOOGLE_LIMITE_POR_SEGUNDO = float(os.environ.get("GOOGLE_LIMITE_POR_SEGUNDO", "0"))
+GOOGLE_LIMITE_RAFAGA = float(os.environ.get("GOOGLE_LIMITE_RAFAGA", "0")) or None
+
+_ROOTS_GOOGLE = (
+    "https://www.googleapis.com/",
+    "https://sheets.googleapis.com/",
+    "https://www.mtls.googleapis.com/",
+    "https://sheets.mtls.googleapis.com/",
+)
+
+
+def usando_endpoint_local() -> bool:
+    return bool(GOOGLE_API_ENDPOINT)
+
+
+def _raiz_local() -> str:
+    return GOOGLE_API_ENDPOINT if GOOGLE_API_ENDPOINT.endswith('/') else GOOGLE_API_ENDPOINT + '/'
+
+
+def raiz_api(nombre_api: str) -> str:
+    """Raíz REST de la API ('drive' o 'sheets'), o la del servidor local"""
+    if usando_endpoint_local():
+        return _raiz_local()
+    return "https://sheets.googleapis.com/" if nombre_api == 'sheets' else "https://www.googleapis.com/"
+
+
+def url_externa(url: str) -> str:
+    """URL directa a Google (ej. export del Excel) redirigida al servidor local si aplica"""
+    if not usando_endpoint_local():
+        return url
+    raiz = _raiz_local()
+    for root in _ROOTS_GOOGLE + ("https://docs.google.com/", "https://drive.google.com/"):
+        if url.startswith(root):
+            return raiz + url[len(root):]
+    return url
+
+
+async def esperar_cuota_async(nombre_api: str) -> float:
+    """Turno en la cubeta compartida de la API, sin bloquear el loop (no hace nada si no hay límite)"""
+    if GOOGLE_LIMITE_POR_SEGUNDO <= 0:
+        return 0.0
+    from app.estado_compartido import esperar_turno_async
+    return await esperar_turno_async(f"google:{nombre_api}", GOOGLE_LIMITE_POR_SEGUNDO, GOOGLE_LIMITE_RAFAGA)
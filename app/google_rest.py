@@ -0,0 +1,568 @@
+"""
+Cliente REST Asíncrono de Google (Drive v3 y Sheets v4)
+IncaNeurobaeza - 2024
+
+googleapiclient arma cada servicio desde el documento de discovery y habla
+por httplib2, que no es thread-safe (hacía falta un cliente por hilo) y es
+lento de construir; Sheets además se reconstruía en cada llamada. Aquí están
+solo los endpoints que usa el portal, sobre httpx:
+
+- Un pool de conexiones por event loop, HTTP/2 si está instalado h2
+  (GOOGLE_REST_HTTP2=0 lo apaga): las llamadas concurrentes comparten
+  conexiones en vez de abrir una por hilo
+- Autenticación compartida: Drive usa el token del gestor de
+  app.credenciales_google y Sheets el de la cuenta de servicio
+  (GOOGLE_SHEETS_CREDENTIALS), creada una sola vez
+- Un 401 descarta ese token y repite; 429, 5xx, cuota excedida y errores de
+  red se reintentan respetando Retry-After (o con backoff exponencial)
+- Cada llamada es un span de app.metricas por endpoint (drive.files.list,
+  sheets.values.append, ...) y espera turno en la cuota compartida
+
+Desde código async:
+    archivo = await drive.files_get(file_id, fields='id, name')
+Desde código sync (endpoints def, scheduler, workers):
+    servicio = cliente_sincrono('drive')
+    archivo = servicio.files_get(file_id, fields='id, name')
+    resultados = servicio.reunir({fid: servicio.asincrono.files_get(fid) for fid in ids})
+
+Las llamadas sync corren en un event loop propio en segundo plano (hilo
+"google_rest"), así todos los hilos del proceso comparten el mismo pool y
+reunir() hace en paralelo lo que antes iba en un batch request.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import weakref
+import functools
+import threading
+import contextvars
+import email.utils
+import importlib.util
+from concurrent.futures import Future
+from typing import Any, Awaitable, Dict, Optional, Tuple
+from urllib.parse import quote
+
+from app.metricas import span
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+# Reintentos ante 429 / 5xx / errores de red (el 401 se repite aparte, una vez)
+REINTENTOS = int(os.environ.get("GOOGLE_REST_REINTENTOS", "4"))
+# Si Google pide esperar más que esto (Retry-After), se falla en vez de esperar
+ESPERA_MAX_SEG = float(os.environ.get("GOOGLE_REST_ESPERA_MAX_SEG", "30"))
+TIMEOUT_SEG = float(os.environ.get("GOOGLE_REST_TIMEOUT_SEG", "60"))
+# Conexiones por pool (un pool por event loop)
+CONEXIONES = int(os.environ.get("GOOGLE_REST_CONEXIONES", "20"))
+# Llamadas en vuelo a la vez dentro de un reunir()
+CONCURRENCIA = int(os.environ.get("GOOGLE_REST_CONCURRENCIA", "10"))
+HTTP2 = os.environ.get("GOOGLE_REST_HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+
+SCOPES_SHEETS = ['https://www.googleapis.com/auth/spreadsheets']
+
+_ESTADOS_REINTENTABLES = {408, 429, 500, 502, 503, 504}
+# Drive responde 403 (no 429) cuando se excede la cuota por usuario
+_RAZONES_CUOTA = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+_stats = {
+    'llamadas': 0,
+    'reintentos': 0,
+    'esperas_retry_after': 0,
+    'renovaciones_401': 0,
+    'errores': 0,
+}
+_versiones_http: Dict[str, int] = {}
+
+
+# ==================== ERRORES ====================
+
+class ErrorGoogle(Exception):
+    """Respuesta de error de una API de Google (status HTTP y razón)"""
+
+    def __init__(self, api: str, operacion: str, status: int, datos: Any = None,
+                 retry_after: Optional[float] = None):
+        self.api = api
+        self.operacion = operacion
+        self.status = status
+        self.retry_after = retry_after
+        error = datos.get('error') if isinstance(datos, dict) else None
+        if isinstance(error, dict):
+            self.razon = (error.get('errors') or [{}])[0].get('reason') or error.get('status')
+            self.mensaje = error.get('message', '')
+        else:
+            self.razon = None
+            self.mensaje = str(error or datos or '')[:300]
+        razon = f" ({self.razon})" if self.razon else ""
+        super().__init__(f"HTTP {status} en {api}.{operacion}{razon}: {self.mensaje}")
+
+    @property
+    def reintentable(self) -> bool:
+        return self.status in _ESTADOS_REINTENTABLES or (self.status == 403 and self.razon in _RAZONES_CUOTA)
+
+
+def _retry_after(cabeceras) -> Optional[float]:
+    """Segundos de Retry-After (número o fecha HTTP), o None"""
+    valor = cabeceras.get('retry-after')
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(intento: int) -> float:
+    return min(ESPERA_MAX_SEG, 0.5 * 2 ** intento) + random.uniform(0, 0.5)
+
+
+def _cuerpo(resp):
+    try:
+        return resp.json()
+    except ValueError:
+        return resp.text
+
+
+# ==================== AUTENTICACIÓN ====================
+
+_cuenta_servicio = None
+_cuenta_lock = threading.Lock()
+
+
+def _token_cuenta_servicio(rechazado: str = None) -> str:
+    """Token de la cuenta de servicio de Sheets: se crea una vez y se renueva al vencer"""
+    global _cuenta_servicio
+    with _cuenta_lock:
+        if _cuenta_servicio is None:
+            creds_json = os.environ.get("GOOGLE_SHEETS_CREDENTIALS")
+            if not creds_json:
+                from app.credenciales_google import ErrorCredenciales
+                raise ErrorCredenciales("GOOGLE_SHEETS_CREDENTIALS no configurado")
+            from google.oauth2.service_account import Credentials
+            _cuenta_servicio = Credentials.from_service_account_info(json.loads(creds_json), scopes=SCOPES_SHEETS)
+
+        creds = _cuenta_servicio
+        if not creds.valid or (rechazado and creds.token == rechazado):
+            from google.auth.transport.requests import Request
+            creds.refresh(Request())
+        return creds.token
+
+
+async def _token(api: str) -> Optional[str]:
+    from app.google_endpoints import usando_endpoint_local
+    if usando_endpoint_local():
+        return None
+
+    if api == 'sheets':
+        creds = _cuenta_servicio
+        if creds is not None and creds.valid:
+            return creds.token
+        return await asyncio.to_thread(_token_cuenta_servicio)
+
+    from app.credenciales_google import gestor
+    # Camino caliente sin hilos; renovar sí bloquea (refresh HTTP), va a un hilo
+    return gestor.token_vigente() or (await asyncio.to_thread(gestor.obtener)).token
+
+
+async def _descartar_token(api: str, token: str):
+    if api == 'sheets':
+        await asyncio.to_thread(_token_cuenta_servicio, token)
+    else:
+        from app.credenciales_google import gestor
+        await asyncio.to_thread(gestor.renovar, token)
+
+
+# ==================== POOL HTTP ====================
+
+# httpx.AsyncClient queda atado al loop donde se usa: uno por loop
+_clientes = weakref.WeakKeyDictionary()
+
+
+def _cliente():
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    cliente = _clientes.get(loop)
+    if cliente is None:
+        cliente = _clientes[loop] = httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=httpx.Timeout(TIMEOUT_SEG, connect=10.0),
+            limits=httpx.Limits(max_connections=CONEXIONES, max_keepalive_connections=CONEXIONES),
+        )
+    return cliente
+
+
+async def solicitar(api: str, operacion: str, metodo: str, url: str, *, params: dict = None,
+                    json: Any = None, contenido: bytes = None, cabeceras: dict = None,
+                    reintentos: int = None, aceptar: Tuple[int, ...] = ()):
+    """
+    Una llamada a Google con token, cuota, métrica y reintentos
+
+    Args:
+        operacion: nombre del endpoint para las métricas ('files.list')
+        aceptar: estados >= 400 (o 308) que esta llamada no trata como error
+        reintentos: None = REINTENTOS; 0 para quien maneja sus propios reintentos
+
+    Returns:
+        httpx.Response
+    """
+    import httpx
+    from app.google_endpoints import esperar_cuota_async
+
+    reintentos = REINTENTOS if reintentos is None else reintentos
+    intento = 0
+    renovado = False
+
+    while True:
+        await esperar_cuota_async(api)
+        token = await _token(api)
+        encabezados = dict(cabeceras or {})
+        if token:
+            encabezados['Authorization'] = f"Bearer {token}"
+
+        _stats['llamadas'] += 1
+        try:
+            with span(api, operacion):
+                resp = await _cliente().request(metodo, url, params=params, json=json,
+                                                content=contenido, headers=encabezados)
+                _versiones_http[resp.http_version] = _versiones_http.get(resp.http_version, 0) + 1
+                if resp.status_code >= 400 and resp.status_code not in aceptar:
+                    raise ErrorGoogle(api, operacion, resp.status_code, _cuerpo(resp), _retry_after(resp.headers))
+            return resp
+
+        except ErrorGoogle as e:
+            if e.status == 401 and token and not renovado:
+                # Token rechazado: se descarta solo ese y se repite una vez
+                renovado = True
+                _stats['renovaciones_401'] += 1
+                await _descartar_token(api, token)
+                continue
+            if not e.reintentable or intento >= reintentos:
+                _stats['errores'] += 1
+                raise
+            error, espera = e, e.retry_after
+
+        except httpx.TransportError as e:
+            if intento >= reintentos:
+                _stats['errores'] += 1
+                raise
+            error, espera = e, None
+
+        intento += 1
+        if espera is None:
+            espera = _backoff(intento)
+        elif espera > ESPERA_MAX_SEG:
+            _stats['errores'] += 1
+            raise error
+        else:
+            _stats['esperas_retry_after'] += 1
+        _stats['reintentos'] += 1
+        log.warning("⚠️ %s.%s: %s, reintento %s/%s en %.1fs", api, operacion, error, intento, reintentos, espera)
+        await asyncio.sleep(espera)
+
+
+def _limpios(params: Optional[dict]) -> dict:
+    # httpx mandaría None como "" (ej. pageToken=None en la primera página)
+    return {k: v for k, v in (params or {}).items() if v is not None}
+
+
+def _json(resp) -> dict:
+    return resp.json() if resp.content else {}
+
+
+# ==================== DRIVE ====================
+
+def _estado_subida(resp) -> Tuple[str, Any]:
+    if resp.status_code == 308:
+        rango = resp.headers.get('range')
+        return 'parcial', int(rango.rsplit('-', 1)[1]) + 1 if rango else 0
+    return 'completa', _json(resp)
+
+
+class Drive:
+    """Endpoints de Drive v3 (los parámetros se llaman igual que en la API)"""
+
+    def _url(self, ruta: str) -> str:
+        from app.google_endpoints import raiz_api
+        return f"{raiz_api('drive')}drive/v3/{ruta}"
+
+    def _archivo(self, file_id: str, sufijo: str = '') -> str:
+        return self._url(f"files/{quote(file_id, safe='')}{sufijo}")
+
+    async def files_list(self, **params) -> dict:
+        resp = await solicitar('drive', 'files.list', 'GET', self._url('files'), params=_limpios(params))
+        return _json(resp)
+
+    async def files_get(self, fileId: str, **params) -> dict:
+        resp = await solicitar('drive', 'files.get', 'GET', self._archivo(fileId), params=_limpios(params))
+        return _json(resp)
+
+    async def files_get_media(self, fileId: str) -> bytes:
+        resp = await solicitar('drive', 'files.get_media', 'GET', self._archivo(fileId), params={'alt': 'media'})
+        return resp.content
+
+    async def files_create(self, body: dict, **params) -> dict:
+        resp = await solicitar('drive', 'files.create', 'POST', self._url('files'),
+                               params=_limpios(params), json=body)
+        return _json(resp)
+
+    async def files_update(self, fileId: str, body: dict = None, **params) -> dict:
+        resp = await solicitar('drive', 'files.update', 'PATCH', self._archivo(fileId),
+                               params=_limpios(params), json=body or {})
+        return _json(resp)
+
+    async def files_copy(self, fileId: str, body: dict = None, **params) -> dict:
+        resp = await solicitar('drive', 'files.copy', 'POST', self._archivo(fileId, '/copy'),
+                               params=_limpios(params), json=body or {})
+        return _json(resp)
+
+    async def files_delete(self, fileId: str) -> None:
+        await solicitar('drive', 'files.delete', 'DELETE', self._archivo(fileId))
+
+    async def permissions_create(self, fileId: str, body: dict, **params) -> dict:
+        resp = await solicitar('drive', 'permissions.create', 'POST', self._archivo(fileId, '/permissions'),
+                               params=_limpios(params), json=body)
+        return _json(resp)
+
+    async def changes_get_start_page_token(self, **params) -> dict:
+        resp = await solicitar('drive', 'changes.getStartPageToken', 'GET', self._url('changes/startPageToken'),
+                               params=_limpios(params))
+        return _json(resp)
+
+    async def changes_list(self, pageToken: str, **params) -> dict:
+        resp = await solicitar('drive', 'changes.list', 'GET', self._url('changes'),
+                               params=_limpios({**params, 'pageToken': pageToken}))
+        return _json(resp)
+
+    # ---------- subidas reanudables ----------
+
+    async def subida_iniciar(self, metadata: dict, tamano: int, mimetype: str,
+                             fileId: str = None, **params) -> str:
+        """Abre una sesión reanudable (archivo nuevo, o contenido nuevo de fileId); retorna su URI"""
+        from app.google_endpoints import raiz_api
+        ruta = f"upload/drive/v3/files/{quote(fileId, safe='')}" if fileId else "upload/drive/v3/files"
+        resp = await solicitar(
+            'drive', 'upload_start', 'PATCH' if fileId else 'POST', raiz_api('drive') + ruta,
+            params=_limpios({**params, 'uploadType': 'resumable'}), json=metadata or {},
+            cabeceras={'X-Upload-Content-Type': mimetype, 'X-Upload-Content-Length': str(tamano)}
+        )
+        return resp.headers['location']
+
+    async def subida_enviar(self, uri: str, datos: bytes, inicio: int, total: int) -> Tuple[str, Any]:
+        """
+        Envía un bloque de la sesión (sin reintentos: los maneja quien sube)
+
+        Returns:
+            ('completa', archivo) | ('parcial', bytes confirmados por Drive)
+        """
+        rango = f"bytes {inicio}-{inicio + len(datos) - 1}/{total}" if datos else f"bytes */{total}"
+        resp = await solicitar('drive', 'upload_chunk', 'PUT', uri, contenido=datos,
+                               cabeceras={'Content-Range': rango}, reintentos=0, aceptar=(308,))
+        return _estado_subida(resp)
+
+    async def subida_consultar(self, uri: str, total: int) -> Tuple[str, Any]:
+        """
+        Pregunta a Drive cuántos bytes tiene de una sesión previa
+
+        Returns:
+            ('completa', archivo) | ('parcial', offset) | ('vencida', None)
+        """
+        try:
+            resp = await solicitar('drive', 'upload_status', 'PUT', uri, contenido=b'',
+                                   cabeceras={'Content-Range': f"bytes */{total}"}, reintentos=0, aceptar=(308,))
+        except ErrorGoogle as e:
+            if e.status in (404, 410):
+                return 'vencida', None
+            raise
+        return _estado_subida(resp)
+
+
+# ==================== SHEETS ====================
+
+class Sheets:
+    """Endpoints de valores de Sheets v4 (los parámetros se llaman igual que en la API)"""
+
+    def _url(self, spreadsheet_id: str, rango: str, sufijo: str = '') -> str:
+        from app.google_endpoints import raiz_api
+        return (f"{raiz_api('sheets')}v4/spreadsheets/{quote(spreadsheet_id, safe='')}"
+                f"/values/{quote(rango, safe='')}{sufijo}")
+
+    async def values_get(self, spreadsheetId: str, range: str, **params) -> dict:
+        resp = await solicitar('sheets', 'values.get', 'GET', self._url(spreadsheetId, range),
+                               params=_limpios(params))
+        return _json(resp)
+
+    async def values_update(self, spreadsheetId: str, range: str, body: dict, **params) -> dict:
+        resp = await solicitar('sheets', 'values.update', 'PUT', self._url(spreadsheetId, range),
+                               params=_limpios(params), json=body)
+        return _json(resp)
+
+    async def values_append(self, spreadsheetId: str, range: str, body: dict, **params) -> dict:
+        resp = await solicitar('sheets', 'values.append', 'POST', self._url(spreadsheetId, range, ':append'),
+                               params=_limpios(params), json=body)
+        return _json(resp)
+
+
+drive = Drive()
+sheets = Sheets()
+
+
+# ==================== CONCURRENCIA ====================
+
+async def reunir(llamadas: Dict[Any, Awaitable], limite: int = None) -> Dict[Any, Tuple[Any, Optional[BaseException]]]:
+    """
+    Varias llamadas a la vez, como un batch de googleapiclient:
+    {clave: corrutina} → {clave: (respuesta, error)}, con a lo sumo
+    `limite` (GOOGLE_REST_CONCURRENCIA) en vuelo
+    """
+    semaforo = asyncio.Semaphore(limite or CONCURRENCIA)
+
+    async def _una(corrutina):
+        async with semaforo:
+            return await corrutina
+
+    claves = list(llamadas)
+    salida = await asyncio.gather(*(_una(llamadas[c]) for c in claves), return_exceptions=True)
+    return {
+        clave: (None, r) if isinstance(r, BaseException) else (r, None)
+        for clave, r in zip(claves, salida)
+    }
+
+
+# ==================== FACHADA SINCRÓNICA ====================
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_hilo: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+
+
+def _loop_de_fondo() -> asyncio.AbstractEventLoop:
+    global _loop, _hilo
+    loop = _loop
+    if loop is not None:
+        return loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            _hilo = threading.Thread(target=loop.run_forever, name="google_rest", daemon=True)
+            _hilo.start()
+            _loop = loop
+        return _loop
+
+
+def _reiniciar_tras_fork():
+    # El hilo del loop no sobrevive al fork (workers de gunicorn)
+    global _loop, _hilo, _loop_lock, _cuenta_lock
+    _loop = _hilo = None
+    _loop_lock = threading.Lock()
+    _cuenta_lock = threading.Lock()
+    _clientes.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_tras_fork)
+
+
+def _pasar_resultado(tarea: asyncio.Task, futuro: Future):
+    if tarea.cancelled():
+        futuro.cancel()
+    elif tarea.exception() is not None:
+        futuro.set_exception(tarea.exception())
+    else:
+        futuro.set_result(tarea.result())
+
+
+def ejecutar(corrutina: Awaitable, timeout: float = None):
+    """
+    Corre una corrutina de este módulo desde código sync y espera el resultado
+
+    Va al loop de fondo con el contexto del hilo que llama (request_id de los
+    logs y traza de app.metricas incluidos)
+    """
+    loop = _loop_de_fondo()
+    if threading.current_thread() is _hilo:
+        corrutina.close()
+        raise RuntimeError("ejecutar() desde el loop de google_rest: usar await")
+
+    futuro = Future()
+
+    def _lanzar():
+        tarea = loop.create_task(corrutina)
+        tarea.add_done_callback(lambda t: _pasar_resultado(t, futuro))
+
+    loop.call_soon_threadsafe(_lanzar, context=contextvars.copy_context())
+    return futuro.result(timeout)
+
+
+class ClienteSincrono:
+    """Drive o Sheets con llamadas bloqueantes; `asincrono` es la API original"""
+
+    def __init__(self, asincrono):
+        self.asincrono = asincrono
+
+    def __getattr__(self, nombre):
+        metodo = getattr(self.asincrono, nombre)
+        if not asyncio.iscoroutinefunction(metodo):
+            return metodo
+
+        @functools.wraps(metodo)
+        def llamar(*args, **kwargs):
+            return ejecutar(metodo(*args, **kwargs))
+        return llamar
+
+    def reunir(self, llamadas: Dict[Any, Awaitable], limite: int = None) -> Dict[Any, Tuple[Any, Optional[BaseException]]]:
+        """reunir() bloqueante: {clave: servicio.asincrono.files_get(...)}"""
+        return ejecutar(reunir(llamadas, limite))
+
+
+_sincronos = {'drive': ClienteSincrono(drive), 'sheets': ClienteSincrono(sheets)}
+
+
+def cliente_sincrono(api: str) -> ClienteSincrono:
+    """'drive' o 'sheets' (compartido por todos los hilos: no hace falta uno por hilo)"""
+    return _sincronos[api]
+
+
+def renovar_pool():
+    """
+    Descarta el pool del loop de fondo: las llamadas siguientes abren
+    conexiones nuevas (las que están en vuelo terminan con el anterior)
+    """
+    loop = _loop
+    if loop is not None:
+        loop.call_soon_threadsafe(_clientes.pop, loop, None)
+
+
+def cerrar():
+    """Cierra el pool del loop de fondo y detiene el loop (apagado del proceso)"""
+    global _loop, _hilo
+    loop = _loop
+    if loop is None:
+        return
+
+    async def _cerrar():
+        cliente = _clientes.pop(asyncio.get_running_loop(), None)
+        if cliente is not None:
+            await cliente.aclose()
+
+    try:
+        ejecutar(_cerrar(), timeout=5)
+    except Exception as e:
+        log.warning("⚠️ Error cerrando el cliente de Google: %s", e)
+    loop.call_soon_threadsafe(loop.stop)
+    _loop = _hilo = None
+
+
+def obtener_estadisticas() -> dict:
+    return {
+        'http2_disponible': HTTP2,
+        'pools': len(_clientes),
+        'versiones_http': dict(_versiones_http),
+        **_stats,
+    }
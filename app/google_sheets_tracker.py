@@ -3,33 +3,106 @@ Google Sheets Tracker - Sincronización automática
 """
 
 import os
-import json
 from datetime import datetime
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+from app.logs import obtener_logger
 
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+log = obtener_logger(__name__)
 
 def get_sheets_service():
-    """Obtiene el servicio de Google Sheets"""
-    try:
-        creds_json = os.environ.get("GOOGLE_SHEETS_CREDENTIALS")
-        if not creds_json:
-            print("❌ GOOGLE_SHEETS_CREDENTIALS no configurado")
-            return None
-        
-        creds_dict = json.loads(creds_json)
-        creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-        service = build('sheets', 'v4', credentials=creds)
-        return service
-    except Exception as e:
-        print(f"❌ Error creando servicio Sheets: {e}")
+    """
+    Cliente de Google Sheets del proceso (app.google_rest): se crea una vez,
+    no en cada llamada. None si faltan las credenciales
+    """
+    from app.google_endpoints import usando_endpoint_local
+    # El servidor local (fake_google_server.py) no pide credenciales
+    if not usando_endpoint_local() and not os.environ.get("GOOGLE_SHEETS_CREDENTIALS"):
+        log.error("❌ GOOGLE_SHEETS_CREDENTIALS no configurado")
         return None
+    from app.google_rest import cliente_sincrono
+    return cliente_sincrono('sheets')
+
+def _fila_caso(caso):
+    """Fila de Casos_Activos (se arma en el hilo del request: toca relaciones de la sesión)"""
+    empleado_nombre = caso.empleado.nombre if caso.empleado else "Desconocido"
+    empresa_nombre = caso.empresa.nombre if caso.empresa else "Otra"
+    dias_pendiente = (datetime.now() - caso.created_at).days
+
+    # Obtener última nota como observación
+    ultima_nota = ""
+    if caso.notas:
+        ultima_nota = caso.notas[0].contenido if caso.notas else ""
+
+    return [
+        caso.serial,
+        empleado_nombre,
+        caso.cedula,
+        empresa_nombre,
+        caso.tipo.value if caso.tipo else "N/A",
+        caso.estado.value,
+        caso.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        dias_pendiente,
+        caso.updated_at.strftime("%Y-%m-%d %H:%M:%S"),
+        ultima_nota[:100]  # Primeros 100 caracteres
+    ]
+
+def _fila_cambio(serial, estado_anterior, estado_nuevo, validador, observaciones):
+    return [
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        serial,
+        estado_anterior,
+        estado_nuevo,
+        validador,
+        observaciones[:200],  # Primeros 200 caracteres
+        "cambio_estado"
+    ]
+
+async def _escribir_caso(sheets, spreadsheet_id, fila):
+    """Actualiza la fila del serial en Casos_Activos o la agrega al final"""
+    serial = fila[0]
+
+    # Buscar si ya existe el caso
+    result = await sheets.values_get(spreadsheet_id, "Casos_Activos!A:A")
+
+    fila_existente = None
+    for idx, row in enumerate(result.get('values', [])):
+        if row and row[0] == serial:
+            fila_existente = idx + 1
+            break
+
+    if fila_existente:
+        # Actualizar fila existente
+        await sheets.values_update(
+            spreadsheet_id,
+            f"Casos_Activos!A{fila_existente}:J{fila_existente}",
+            body={"values": [fila]},
+            valueInputOption="RAW"
+        )
+        log.info("✅ Caso %s actualizado en Sheet (fila %s)", serial, fila_existente)
+    else:
+        # Agregar nueva fila
+        await sheets.values_append(
+            spreadsheet_id,
+            "Casos_Activos!A:J",
+            body={"values": [fila]},
+            valueInputOption="RAW",
+            insertDataOption="INSERT_ROWS"
+        )
+        log.info("✅ Caso %s agregado al Sheet", serial)
+
+async def _escribir_cambio(sheets, spreadsheet_id, fila):
+    await sheets.values_append(
+        spreadsheet_id,
+        "Historial_Cambios!A:G",
+        body={"values": [fila]},
+        valueInputOption="RAW",
+        insertDataOption="INSERT_ROWS"
+    )
+    log.info("✅ Cambio de estado registrado en Sheet: %s", fila[1])
 
 def actualizar_caso_en_sheet(caso, accion="actualizar"):
     """
     Sincroniza un caso con Google Sheets
-    
+
     Args:
         caso: Objeto Case de la BD
         accion: "actualizar" o "crear"
@@ -38,77 +111,18 @@ def actualizar_caso_en_sheet(caso, accion="actualizar"):
         service = get_sheets_service()
         if not service:
             return False
-        
+
         spreadsheet_id = os.environ.get("GOOGLE_SHEETS_ID")
         if not spreadsheet_id:
-            print("❌ GOOGLE_SHEETS_ID no configurado")
+            log.error("❌ GOOGLE_SHEETS_ID no configurado")
             return False
-        
-        # Datos del caso
-        empleado_nombre = caso.empleado.nombre if caso.empleado else "Desconocido"
-        empresa_nombre = caso.empresa.nombre if caso.empresa else "Otra"
-        dias_pendiente = (datetime.now() - caso.created_at).days
-        
-        # Obtener última nota como observación
-        ultima_nota = ""
-        if caso.notas:
-            ultima_nota = caso.notas[0].contenido if caso.notas else ""
-        
-        # Fila de datos
-        valores = [[
-            caso.serial,
-            empleado_nombre,
-            caso.cedula,
-            empresa_nombre,
-            caso.tipo.value if caso.tipo else "N/A",
-            caso.estado.value,
-            caso.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            dias_pendiente,
-            caso.updated_at.strftime("%Y-%m-%d %H:%M:%S"),
-            ultima_nota[:100]  # Primeros 100 caracteres
-        ]]
-        
-        # Buscar si ya existe el caso
-        range_name = "Casos_Activos!A:A"
-        result = service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=range_name
-        ).execute()
-        
-        serials = result.get('values', [])
-        fila_existente = None
-        
-        for idx, row in enumerate(serials):
-            if row and row[0] == caso.serial:
-                fila_existente = idx + 1
-                break
-        
-        if fila_existente:
-            # Actualizar fila existente
-            range_update = f"Casos_Activos!A{fila_existente}:J{fila_existente}"
-            service.spreadsheets().values().update(
-                spreadsheetId=spreadsheet_id,
-                range=range_update,
-                valueInputOption="RAW",
-                body={"values": valores}
-            ).execute()
-            print(f"✅ Caso {caso.serial} actualizado en Sheet (fila {fila_existente})")
-        else:
-            # Agregar nueva fila
-            range_append = "Casos_Activos!A:J"
-            service.spreadsheets().values().append(
-                spreadsheetId=spreadsheet_id,
-                range=range_append,
-                valueInputOption="RAW",
-                insertDataOption="INSERT_ROWS",
-                body={"values": valores}
-            ).execute()
-            print(f"✅ Caso {caso.serial} agregado al Sheet")
-        
+
+        from app.google_rest import ejecutar
+        ejecutar(_escribir_caso(service.asincrono, spreadsheet_id, _fila_caso(caso)))
         return True
-        
+
     except Exception as e:
-        print(f"❌ Error sincronizando con Sheets: {e}")
+        log.error("❌ Error sincronizando con Sheets: %s", e)
         return False
 
 def registrar_cambio_estado_sheet(caso, estado_anterior, estado_nuevo, validador="Sistema", observaciones=""):
@@ -117,31 +131,46 @@ def registrar_cambio_estado_sheet(caso, estado_anterior, estado_nuevo, validador
         service = get_sheets_service()
         if not service:
             return False
-        
+
         spreadsheet_id = os.environ.get("GOOGLE_SHEETS_ID")
-        
-        valores = [[
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            caso.serial,
-            estado_anterior,
-            estado_nuevo,
-            validador,
-            observaciones[:200],  # Primeros 200 caracteres
-            "cambio_estado"
-        ]]
-        
-        range_append = "Historial_Cambios!A:G"
-        service.spreadsheets().values().append(
-            spreadsheetId=spreadsheet_id,
-            range=range_append,
-            valueInputOption="RAW",
-            insertDataOption="INSERT_ROWS",
-            body={"values": valores}
-        ).execute()
-        
-        print(f"✅ Cambio de estado registrado en Sheet: {caso.serial}")
+
+        from app.google_rest import ejecutar
+        fila = _fila_cambio(caso.serial, estado_anterior, estado_nuevo, validador, observaciones)
+        ejecutar(_escribir_cambio(service.asincrono, spreadsheet_id, fila))
         return True
-        
+
     except Exception as e:
-        print(f"❌ Error registrando cambio en Sheets: {e}")
-        return False
\ No newline at end of file
+        log.error("❌ Error registrando cambio en Sheets: %s", e)
+        return False
+
+def sincronizar_cambio_estado(caso, estado_anterior, estado_nuevo, validador="Sistema", observaciones=""):
+    """
+    actualizar_caso_en_sheet + registrar_cambio_estado_sheet con las dos
+    escrituras en paralelo (hojas distintas, no dependen una de la otra)
+
+    Returns:
+        True si ambas quedaron registradas
+    """
+    service = get_sheets_service()
+    if not service:
+        return False
+
+    spreadsheet_id = os.environ.get("GOOGLE_SHEETS_ID")
+    if not spreadsheet_id:
+        log.error("❌ GOOGLE_SHEETS_ID no configurado")
+        return False
+
+    sheets = service.asincrono
+    resultados = service.reunir({
+        'caso': _escribir_caso(sheets, spreadsheet_id, _fila_caso(caso)),
+        'historial': _escribir_cambio(sheets, spreadsheet_id, _fila_cambio(
+            caso.serial, estado_anterior, estado_nuevo, validador, observaciones
+        )),
+    })
+
+    ok = True
+    for nombre, (_, error) in resultados.items():
+        if error is not None:
+            ok = False
+            log.error("❌ Error sincronizando con Sheets (%s): %s", nombre, error)
+    return ok
@@ -0,0 +1,114 @@
+"""
+Huellas de documentos - Deduplicación de archivos recibidos por caso
+IncaNeurobaeza - 2024
+
+Cada archivo que entra por el formulario se identifica por su SHA-256
+(calculado en merge_pdfs_con_huellas). La tabla document_blobs guarda
+en qué archivo de Drive y en qué rango de páginas quedó cada huella,
+para reconocer al instante los adjuntos que el empleado vuelve a subir.
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from app.database import DocumentBlob
+
+
+def hashes_del_caso(db: Session, case_id: int) -> Set[str]:
+    """SHA-256 de todos los archivos ya recibidos en el caso (para omitirlos del PDF)"""
+    return {sha for sha, in db.query(DocumentBlob.sha256).filter(DocumentBlob.case_id == case_id)}
+
+
+def huellas_conocidas(db: Session, case_id: int, huellas: List[Dict]) -> Dict[str, DocumentBlob]:
+    """Devuelve {sha256: DocumentBlob} de las huellas que ya existen en el caso"""
+    hashes = {h['sha256'] for h in huellas}
+    if not hashes:
+        return {}
+
+    blobs = db.query(DocumentBlob).filter(
+        DocumentBlob.case_id == case_id,
+        DocumentBlob.sha256.in_(hashes)
+    ).all()
+    return {b.sha256: b for b in blobs}
+
+
+def clasificar_huellas(db: Session, case_id: int, huellas: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Separa las huellas de un envío en (nuevas, repetidas)
+
+    - Los duplicados dentro del mismo envío se ignoran (ya se omitieron del PDF)
+    - Una repetida trae la referencia al archivo/páginas donde ya está en Drive
+    """
+    conocidas = huellas_conocidas(db, case_id, huellas)
+    nuevas, repetidas = [], []
+
+    for h in huellas:
+        if h.get('duplicado'):
+            continue
+        blob = conocidas.get(h['sha256'])
+        if blob:
+            repetidas.append({
+                **h,
+                'drive_file_id': blob.drive_file_id,
+                'pagina_inicio_original': blob.pagina_inicio,
+                'pagina_fin_original': blob.pagina_fin,
+                'recibido': blob.created_at.isoformat() if blob.created_at else None
+            })
+        else:
+            nuevas.append(h)
+
+    return nuevas, repetidas
+
+
+def archivos_omitidos(huellas: List[Dict], repetidas: List[Dict]) -> List[Dict]:
+    """
+    Lo que quedó fuera del PDF combinado, para la respuesta al empleado:
+    repetidos dentro del envío y archivos que el caso ya tenía (con dónde están)
+    """
+    omitidos = [{'nombre': h['nombre'], 'motivo': 'repetido_en_envio'} for h in huellas if h.get('duplicado')]
+    omitidos.extend({
+        'nombre': h['nombre'],
+        'motivo': 'ya_recibido',
+        'drive_file_id': h['drive_file_id'],
+        'pagina_inicio': h['pagina_inicio_original'],
+        'pagina_fin': h['pagina_fin_original'],
+        'recibido': h['recibido']
+    } for h in repetidas)
+    return omitidos
+
+
+def paginas_de(huellas: List[Dict]) -> List[int]:
+    """Lista de páginas (0-indexadas) del PDF combinado que ocupan esas huellas"""
+    paginas = []
+    for h in huellas:
+        if h.get('pagina_inicio') is None:
+            continue
+        paginas.extend(range(h['pagina_inicio'], h['pagina_fin'] + 1))
+    return sorted(paginas)
+
+
+def registrar_huellas(db: Session, case_id: int, huellas: List[Dict], drive_file_id: Optional[str]) -> int:
+    """
+    Agrega a la sesión las huellas nuevas del caso (NO hace commit)
+
+    Returns:
+        Cantidad de huellas registradas
+    """
+    conocidas = huellas_conocidas(db, case_id, huellas)
+    registradas = 0
+
+    for h in huellas:
+        if h.get('duplicado') or h['sha256'] in conocidas:
+            continue
+        db.add(DocumentBlob(
+            sha256=h['sha256'],
+            case_id=case_id,
+            drive_file_id=drive_file_id,
+            pagina_inicio=h.get('pagina_inicio'),
+            pagina_fin=h.get('pagina_fin'),
+            nombre_original=(h.get('nombre') or '')[:300],
+            tamano_bytes=h.get('tamano_bytes')
+        ))
+        conocidas[h['sha256']] = True
+        registradas += 1
+
+    return registradas
@@ -3,13 +3,35 @@ Redactor de Emails con Claude 3 Opus
 IncaBaeza - Sistema de redacción clara para personas mayores
 """
 
-import anthropic
 import os
+import threading
+from app.logs import obtener_logger
 
-# Cliente de Anthropic
-client = anthropic.Anthropic(
-    api_key=os.environ.get("ANTHROPIC_API_KEY")
-)
+log = obtener_logger(__name__)
+
+# Cliente de Anthropic: se crea en el primer uso (el SDK tarda ~0.4 s en
+# importarse y no hace falta para arrancar el servidor)
+_client = None
+_client_lock = threading.Lock()
+
+
+def obtener_cliente():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import anthropic
+                _client = anthropic.Anthropic(
+                    api_key=os.environ.get("ANTHROPIC_API_KEY")
+                )
+    return _client
+
+
+def _crear_mensaje(operacion: str, **kwargs):
+    """client.messages.create medido en app.metricas (span 'anthropic')"""
+    from app.metricas import span
+    with span('anthropic', operacion):
+        return obtener_cliente().messages.create(**kwargs)
 
 # ✅ Documentos requeridos por tipo (para incluir en emails)
 DOCUMENTOS_REQUERIDOS = {
@@ -110,7 +132,7 @@ def redactar_email_incompleta(nombre: str, serial: str, checks_seleccionados: li
 Responde ÚNICAMENTE con el contenido del email."""
 
     try:
-        message = client.messages.create(
+        message = _crear_mensaje('email_incompleta',
             model="claude-3-opus-20240229",  # ✅ Claude 3 Opus
             max_tokens=600,
             temperature=0.7,
@@ -121,11 +143,11 @@ Responde ÚNICAMENTE con el contenido del email."""
         )
         
         contenido = message.content[0].text.strip()
-        print(f"✅ Email redactado con Claude Opus para {serial}")
+        log.info("✅ Email redactado con Claude Opus para %s", serial)
         return contenido
         
     except Exception as e:
-        print(f"❌ Error redactando con IA: {e}")
+        log.error("❌ Error redactando con IA: %s", e)
         # Fallback a plantilla estática MUY CLARA
         return f"""Hola {nombre},
 
@@ -185,7 +207,7 @@ def redactar_email_ilegible(nombre: str, serial: str, checks_seleccionados: list
 Responde ÚNICAMENTE con el contenido."""
 
     try:
-        message = client.messages.create(
+        message = _crear_mensaje('email_ilegible',
             model="claude-3-opus-20240229",
             max_tokens=400,
             temperature=0.7,
@@ -249,7 +271,7 @@ def redactar_alerta_tthh(empleado_nombre: str, serial: str, empresa: str, checks
 Responde ÚNICAMENTE con el contenido."""
 
     try:
-        message = client.messages.create(
+        message = _crear_mensaje('alerta_tthh',
             model="claude-3-opus-20240229",
             max_tokens=500,
             temperature=0.5,
@@ -291,7 +313,7 @@ def redactar_recordatorio_7dias(nombre: str, serial: str, estado: str) -> str:
 Responde ÚNICAMENTE con el contenido."""
 
     try:
-        message = client.messages.create(
+        message = _crear_mensaje('recordatorio_7dias',
             model="claude-3-opus-20240229",
             max_tokens=300,
             temperature=0.7,
@@ -334,7 +356,7 @@ def redactar_alerta_jefe_7dias(jefe_nombre: str, empleado_nombre: str, serial: s
 Responde ÚNICAMENTE con el contenido."""
 
     try:
-        message = client.messages.create(
+        message = _crear_mensaje('alerta_jefe_7dias',
             model="claude-3-opus-20240229",
             max_tokens=400,
             temperature=0.5,
@@ -374,7 +396,7 @@ def redactar_mensaje_personalizado(nombre: str, serial: str, mensaje_libre: str)
 Responde ÚNICAMENTE con el contenido."""
 
     try:
-        message = client.messages.create(
+        message = _crear_mensaje('mensaje_personalizado',
             model="claude-3-opus-20240229",
             max_tokens=400,
             temperature=0.7,
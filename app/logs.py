@@ -0,0 +1,308 @@
+"""
+Logging Estructurado
+IncaNeurobaeza - 2024
+
+Reemplaza los print() del camino caliente:
+- Niveles (LOG_LEVEL) y formato texto o JSON (LOG_FORMATO=texto|json)
+- Escritura en un hilo aparte (QueueHandler + QueueListener): el request solo
+  encola; si la cola se llena se descarta el registro en vez de bloquear
+- Muestreo de DEBUG (LOG_MUESTREO_DEBUG, 0..1) y muestreo por llamada para
+  líneas de alto volumen: log.info(..., muestreo=0.1)
+- Correlación: cada request lleva request_id (header X-Request-ID o generado)
+  y el serial del caso en cuanto se conoce; todos los registros los incluyen
+- DEBUG por caso: LOG_DEBUG_SERIALES=SER1,SER2 o POST /logs/debug, sin bajar
+  el nivel global. Con LOG_DEBUG_POR_HEADER=true también con "X-Debug: 1"
+
+Uso:
+    from app.logs import obtener_logger, asignar_contexto
+    log = obtener_logger(__name__)
+    log.debug("cc_list: %s", cc_list)   # no cuesta nada si DEBUG está apagado
+    asignar_contexto(serial=serial)
+"""
+
+import os
+import sys
+import json
+import uuid
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from starlette.requests import Request
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMATO = os.environ.get("LOG_FORMATO", "texto").lower()
+LOG_MUESTREO_DEBUG = float(os.environ.get("LOG_MUESTREO_DEBUG", "1.0"))
+LOG_DEBUG_POR_HEADER = os.environ.get("LOG_DEBUG_POR_HEADER", "false").lower() == "true"
+LOG_COLA_MAXIMA = int(os.environ.get("LOG_COLA_MAXIMA", "10000"))
+
+RAIZ = "incapacidades"
+
+
+def _a_nivel(nombre: str) -> int:
+    nivel = logging.getLevelName(nombre.upper())
+    return nivel if isinstance(nivel, int) else logging.INFO
+
+
+_nivel = _a_nivel(LOG_LEVEL)
+_seriales_debug = {
+    s.strip() for s in os.environ.get("LOG_DEBUG_SERIALES", "").split(",") if s.strip()
+}
+
+# request_id, serial, debug (forzado para este request)
+_contexto: ContextVar[dict] = ContextVar("contexto_log", default={})
+
+_listener = None
+_stats = {'encolados': 0, 'descartados': 0}
+
+
+# ==================== CONTEXTO ====================
+
+def asignar_contexto(**campos):
+    """Agrega campos (serial, cedula...) al contexto del request/tarea actual"""
+    _contexto.set({**_contexto.get(), **{k: v for k, v in campos.items() if v is not None}})
+
+
+@contextmanager
+def contexto_log(**campos):
+    """Contexto temporal para tareas fuera de un request (jobs, hilos)"""
+    token = _contexto.set({**_contexto.get(), **campos})
+    try:
+        yield
+    finally:
+        _contexto.reset(token)
+
+
+def contexto_actual() -> dict:
+    return dict(_contexto.get())
+
+
+def _debug_activo() -> bool:
+    ctx = _contexto.get()
+    if not ctx:
+        return False
+    return bool(ctx.get('debug')) or (bool(_seriales_debug) and ctx.get('serial') in _seriales_debug)
+
+
+# ==================== DEBUG POR CASO ====================
+
+def activar_debug_serial(serial: str):
+    _seriales_debug.add(serial)
+
+
+def desactivar_debug_serial(serial: str):
+    _seriales_debug.discard(serial)
+
+
+def seriales_en_debug() -> list:
+    return sorted(_seriales_debug)
+
+
+# ==================== LOGGER ====================
+
+class LoggerContextual(logging.LoggerAdapter):
+    """
+    Decide el nivel antes de crear el registro: una llamada por debajo del
+    nivel cuesta una comparación (más una lectura del contexto si hay
+    seriales en debug). Los argumentos se formatean solo si se emite.
+    """
+
+    def __init__(self, logger):
+        super().__init__(logger, {})
+
+    def isEnabledFor(self, level):
+        return level >= _nivel or _debug_activo()
+
+    def log(self, level, msg, *args, muestreo: float = None, **kwargs):
+        if level < _nivel:
+            if not _debug_activo():
+                return
+        elif level == logging.DEBUG and LOG_MUESTREO_DEBUG < 1.0 and random.random() >= LOG_MUESTREO_DEBUG:
+            return
+        if muestreo is not None and level < logging.WARNING and random.random() >= muestreo:
+            return
+        self.logger._log(level, msg, args, **kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+    def exception(self, msg, *args, exc_info=True, **kwargs):
+        self.log(logging.ERROR, msg, *args, exc_info=exc_info, **kwargs)
+
+    def critical(self, msg, *args, **kwargs):
+        self.log(logging.CRITICAL, msg, *args, **kwargs)
+
+
+def obtener_logger(nombre: str) -> LoggerContextual:
+    """Logger del módulo bajo la raíz 'incapacidades' (app.validador → incapacidades.validador)"""
+    if nombre.startswith("app."):
+        nombre = nombre[4:]
+    configurar_logging()
+    return LoggerContextual(logging.getLogger(f"{RAIZ}.{nombre}"))
+
+
+# ==================== HANDLERS ====================
+
+class _FiltroContexto(logging.Filter):
+    """Corre en el hilo que loguea: copia el contexto al registro antes de encolarlo"""
+
+    def filter(self, record):
+        ctx = _contexto.get()
+        record.request_id = ctx.get('request_id', '-')
+        record.serial = ctx.get('serial', '-')
+        record.contexto = ctx
+        return True
+
+
+class _ColaSinBloqueo(logging.handlers.QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            _stats['encolados'] += 1
+        except queue.Full:
+            _stats['descartados'] += 1
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.contexto = dict(getattr(record, 'contexto', {}) or {})
+        return record
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record):
+        datos = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for clave, valor in (getattr(record, 'contexto', None) or {}).items():
+            if clave != 'debug':
+                datos[clave] = valor
+        if record.exc_info:
+            datos['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            datos['exc'] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FormatoTexto(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(request_id)s %(serial)s] %(name)s: %(message)s")
+
+
+def configurar_logging(nivel: str = None, formato: str = None, forzar: bool = False):
+    """Instala la cola y el hilo escritor (una vez por proceso)"""
+    global _listener, _nivel
+
+    if nivel:
+        _nivel = _a_nivel(nivel)
+    if _listener is not None and not forzar:
+        return
+    if _listener is not None:
+        _listener.stop()
+
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(FormatoJSON() if (formato or LOG_FORMATO) == "json" else FormatoTexto())
+
+    cola = queue.Queue(maxsize=LOG_COLA_MAXIMA)
+    manejador = _ColaSinBloqueo(cola)
+    manejador.addFilter(_FiltroContexto())
+
+    raiz = logging.getLogger(RAIZ)
+    raiz.handlers[:] = [manejador]
+    # El nivel lo decide LoggerContextual; aquí no se filtra
+    raiz.setLevel(logging.DEBUG)
+    raiz.propagate = False
+
+    _listener = logging.handlers.QueueListener(cola, salida, respect_handler_level=False)
+    _listener.start()
+
+
+def detener_logging():
+    """Vacía la cola (al apagar)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(detener_logging)
+
+
+def obtener_estadisticas() -> dict:
+    return {
+        'nivel': logging.getLevelName(_nivel),
+        'formato': LOG_FORMATO,
+        'muestreo_debug': LOG_MUESTREO_DEBUG,
+        'seriales_debug': seriales_en_debug(),
+        **_stats,
+    }
+
+
+# ==================== MIDDLEWARE ====================
+
+async def contexto_de_ruta(request: Request):
+    """
+    Dependencia global de FastAPI: agrega el serial de la ruta al contexto.
+    Es async para correr en la misma tarea que el endpoint (los endpoints
+    sync reciben una copia del contexto ya con el serial).
+    """
+    serial = request.path_params.get('serial')
+    if serial:
+        asignar_contexto(serial=serial)
+
+
+class ContextoLogMiddleware:
+    """
+    ASGI puro: asigna request_id (o respeta X-Request-ID) y lo devuelve en la
+    respuesta. Con LOG_DEBUG_POR_HEADER=true, "X-Debug: 1" activa DEBUG solo
+    para ese request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        debug = False
+        for clave, valor in scope.get("headers") or []:
+            if clave == b"x-request-id":
+                request_id = valor.decode("latin-1")[:64]
+            elif clave == b"x-debug" and LOG_DEBUG_POR_HEADER:
+                debug = valor in (b"1", b"true")
+        request_id = request_id or uuid.uuid4().hex[:12]
+
+        ctx = {'request_id': request_id}
+        if debug:
+            ctx['debug'] = True
+        token = _contexto.set(ctx)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                mensaje.setdefault("headers", [])
+                mensaje["headers"] = list(mensaje["headers"]) + [(b"x-request-id", request_id.encode())]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _contexto.reset(token)
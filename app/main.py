@@ -1,19 +1,22 @@
+# Primero: mide el tiempo de importación del resto de la app (app.arranque)
+from app.arranque import marcar_fase
 from typing import List, Optional
 from fastapi import FastAPI, UploadFile, Form, File, Depends
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-import pandas as pd
+from sqlalchemy.ext.asyncio import AsyncSession
 import os, uuid
 from pathlib import Path
 from datetime import datetime, date
 import calendar
 
 from app.drive_uploader import upload_to_drive
-from app.pdf_merger import merge_pdfs_from_uploads
-from app.email_templates import get_confirmation_template, get_alert_template
+from app.pdf_merger import merge_pdfs_con_huellas
+from app.huellas_documentos import clasificar_huellas, registrar_huellas, paginas_de, hashes_del_caso, archivos_omitidos
+from app.email_templates import get_confirmation_template, get_alerta_cedula_desconocida_template
 from app.database import (
-    get_db, init_db, Case, CaseDocument, Employee, Company,
+    get_db, get_async_db, init_db, Case, CaseDocument, Employee,
     EstadoCaso, EstadoDocumento, TipoIncapacidad
 )
 from app.validador import router as validador_router
@@ -21,8 +24,14 @@ from app.sync_excel import sincronizar_empleado_desde_excel  # ✅ NUEVO
 from app.serial_generator import generar_serial_unico  # ✅ NUEVO
 
 from app.n8n_notifier import enviar_a_n8n
-from fastapi import Request, Header
+from app.metricas import MetricasMiddleware, marca
+from app.logs import ContextoLogMiddleware, asignar_contexto, contexto_de_ruta
+from app.replicas import ReplicasMiddleware
+from fastapi import Header, Body
 from app.database import CaseEvent
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
 
 # ==================== FUNCIÓN: DOCUMENTOS REQUERIDOS ====================
 def obtener_documentos_requeridos(tipo: str, dias: int = None, phantom: bool = None, mother_works: bool = None) -> list:
@@ -69,7 +78,11 @@ def obtener_documentos_requeridos(tipo: str, dias: int = None, phantom: bool = N
     
     else:
         return ['Incapacidad médica']  # Default
-app = FastAPI(title="IncaNeurobaeza API", version="2.0.0")
+app = FastAPI(
+    title="IncaNeurobaeza API",
+    version="2.0.0",
+    dependencies=[Depends(contexto_de_ruta)]
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -80,6 +93,16 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Latencia por ruta + desglose por etapas (/metrics, /status, header Server-Timing)
+app.add_middleware(MetricasMiddleware)
+
+# Lee tus escrituras: tras un commit, las lecturas del cliente van al primario
+# hasta que las réplicas lo alcanzan (cookie/header X-BD-Escritura)
+app.add_middleware(ReplicasMiddleware)
+
+# request_id por request (header X-Request-ID) para correlacionar los logs
+app.add_middleware(ContextoLogMiddleware)
+
 app.include_router(validador_router)
 
 # ==================== HEALTH CHECK DE GOOGLE DRIVE ====================
@@ -89,9 +112,8 @@ from app.drive_uploader import (
     get_authenticated_service, 
     clear_service_cache, 
     clear_token_cache,
-    TOKEN_FILE
+    leer_token_cache
 )
-import datetime
 import json
 
 drive_router = APIRouter(prefix="/drive", tags=["Google Drive"])
@@ -103,27 +125,26 @@ async def drive_health_check():
     Útil para monitoreo con Uptime Robot, etc.
     """
     try:
-        service = get_authenticated_service()
+        from app.google_rest import drive
         
-        # Test: listar 1 archivo
-        service.files().list(pageSize=1, fields="files(id)").execute()
+        # Test: listar 1 archivo (async: no ocupa un hilo del pool mientras espera a Drive)
+        await drive.files_list(pageSize=1, fields="files(id)")
         
         # Obtener info del token
         token_info = None
-        if TOKEN_FILE.exists():
+        token_data = leer_token_cache()
+        if token_data:
             try:
-                with open(TOKEN_FILE, 'r') as f:
-                    token_data = json.load(f)
-                    expiry_str = token_data.get('expiry')
-                    if expiry_str:
-                        expiry = datetime.datetime.fromisoformat(expiry_str)
-                        now = datetime.datetime.utcnow()
-                        remaining = (expiry - now).total_seconds()
-                        token_info = {
-                            'expires_in_minutes': round(remaining / 60, 1),
-                            'expires_at': expiry_str,
-                            'status': 'valid' if remaining > 0 else 'expired'
-                        }
+                expiry_str = token_data.get('expiry')
+                if expiry_str:
+                    expiry = datetime.fromisoformat(expiry_str)
+                    now = datetime.utcnow()
+                    remaining = (expiry - now).total_seconds()
+                    token_info = {
+                        'expires_in_minutes': round(remaining / 60, 1),
+                        'expires_at': expiry_str,
+                        'status': 'valid' if remaining > 0 else 'expired'
+                    }
             except Exception as e:
                 token_info = {'error': str(e)}
         
@@ -131,13 +152,13 @@ async def drive_health_check():
             "status": "healthy",
             "service": "connected",
             "token_info": token_info,
-            "timestamp": datetime.datetime.now().isoformat()
+            "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
         return {
             "status": "unhealthy",
             "error": str(e),
-            "timestamp": datetime.datetime.now().isoformat()
+            "timestamp": datetime.now().isoformat()
         }
 
 @drive_router.post("/refresh-cache")
@@ -179,6 +200,77 @@ async def clear_all_drive_cache():
             "error": str(e)
         }
 
+@drive_router.get("/upload-stats")
+async def drive_upload_stats():
+    """
+    Estadísticas de subidas a Drive desde el arranque
+    (MB/s promedio, bloques, reintentos y sesiones reanudadas)
+    """
+    from app.drive_upload_manager import obtener_estadisticas
+    return {
+        "status": "ok",
+        "stats": obtener_estadisticas(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@drive_router.get("/drift")
+def drive_drift(
+    pendientes: bool = True,
+    tipo: Optional[str] = None,
+    limite: int = 100,
+    db: Session = Depends(get_db)
+):
+    """
+    Cambios hechos a mano en Drive detectados por el vigilante
+    (movidos, eliminados, renombrados, PDFs reemplazados) y operaciones
+    en segundo plano que Drive no confirmó (operacion_fallida)
+    """
+    from app.drive_watcher import listar_drift, obtener_estadisticas
+    from app.drive_manager import obtener_estadisticas as estadisticas_batch
+    registros = listar_drift(db, solo_pendientes=pendientes, tipo=tipo, limite=min(limite, 500))
+    return {
+        "status": "ok",
+        "vigilante": obtener_estadisticas(),
+        "operaciones_en_segundo_plano": estadisticas_batch(),
+        "total": len(registros),
+        "drift": [{
+            "id": d.id,
+            "tipo": d.tipo,
+            "file_id": d.file_id,
+            "serial": d.serial,
+            "case_id": d.case_id,
+            "detalle": d.detalle,
+            "revisado": d.revisado,
+            "detectado_at": d.detectado_at.isoformat() if d.detectado_at else None
+        } for d in registros]
+    }
+
+@drive_router.post("/drift/{drift_id}/revisado")
+def marcar_drift_revisado(drift_id: int, db: Session = Depends(get_db)):
+    """Marca un registro de drift como revisado"""
+    from app.database import DriveDrift
+    registro = db.get(DriveDrift, drift_id)
+    if not registro:
+        return JSONResponse(status_code=404, content={"error": "Registro no encontrado"})
+    registro.revisado = True
+    db.commit()
+    return {"status": "ok", "id": drift_id}
+
+@drive_router.post("/sync-cambios")
+async def sincronizar_cambios_drive():
+    """Fuerza una pasada del vigilante de cambios de Drive"""
+    from app.drive_watcher import procesar_cambios
+    from app.planificador import candado_job
+    import asyncio
+    
+    def _pasada():
+        # Mismo candado que el job del líder: nunca dos pasadas entre procesos
+        with candado_job('vigilante_cambios_drive') as obtenido:
+            return procesar_cambios() if obtenido else {'ok': True, 'omitido': 'pasada en curso en otro proceso'}
+    
+    resultado = await asyncio.get_running_loop().run_in_executor(None, _pasada)
+    return {"status": "ok" if resultado.get('ok') else "error", **resultado}
+
 # Agregar el router al app
 app.include_router(drive_router)
 DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "base_empleados.xlsx")
@@ -194,22 +286,41 @@ scheduler_recordatorios = None  # ✅ NUEVO
 @app.on_event("startup")
 def startup_event():
     global scheduler_sync, scheduler_recordatorios
-    init_db()
-    print("🚀 API iniciada")
+    from app.arranque import ARRANQUE_DIFERIDO, calentar_en_segundo_plano, precargar_modulos
+    from app.planificador import planificador, candado_exclusivo
+    
+    marcar_fase('importado')
+    # Con varios workers, create_all a la vez choca ("table already exists")
+    with candado_exclusivo('init_db', esperar=True):
+        init_db()
+    marcar_fase('init_db')
+    log.info("🚀 API iniciada")
     
     try:
-        # Sincronización Excel
-        scheduler_sync = iniciar_sincronizacion_automatica()
-        print("✅ Sincronización automática activada")
+        # Sincronización Excel (la pasada inicial va al calentamiento si es diferido)
+        scheduler_sync = iniciar_sincronizacion_automatica(ejecutar_inicial=not ARRANQUE_DIFERIDO)
+        log.info("✅ Sincronización automática activada")
     except Exception as e:
-        print(f"⚠️ Error iniciando sync: {e}")
+        log.warning("⚠️ Error iniciando sync: %s", e)
     
     try:
         # ✅ NUEVO: Scheduler de recordatorios
         scheduler_recordatorios = iniciar_scheduler_recordatorios()
-        print("✅ Sistema de recordatorios activado")
+        log.info("✅ Sistema de recordatorios activado")
     except Exception as e:
-        print(f"⚠️ Error iniciando recordatorios: {e}")
+        log.warning("⚠️ Error iniciando recordatorios: %s", e)
+    
+    marcar_fase('listo')
+    
+    # Después de aceptar tráfico: librerías pesadas, sync del Excel y token de Drive
+    tareas = [('precarga_modulos', precargar_modulos)]
+    if ARRANQUE_DIFERIDO:
+        # Solo el líder del planificador (los demás workers no repiten la sync)
+        tareas += [
+            ('sync_excel', lambda: planificador.ejecutar_ahora('sync_excel_to_postgresql')),
+            ('token_drive', lambda: planificador.ejecutar_ahora('verificar_drive_token')),
+        ]
+    calentar_en_segundo_plano(tareas)
 
 @app.on_event("shutdown")
 def shutdown_event():
@@ -217,11 +328,22 @@ def shutdown_event():
     
     if scheduler_sync:
         scheduler_sync.shutdown()
-        print("🛑 Sincronización detenida")
+        log.info("🛑 Sincronización detenida")
     
     if scheduler_recordatorios:  # ✅ NUEVO
         scheduler_recordatorios.shutdown()
-        print("🛑 Recordatorios detenidos")
+        log.info("🛑 Recordatorios detenidos")
+    
+    from app.google_rest import cerrar as cerrar_google_rest
+    cerrar_google_rest()
+    
+    from app.escritura_diferida import detener as detener_escritura_diferida
+    detener_escritura_diferida()
+
+@app.on_event("shutdown")
+async def cerrar_bd_async():
+    from app.database import cerrar_engine_async
+    await cerrar_engine_async()
 
 # ==================== UTILIDADES ====================
 
@@ -258,18 +380,18 @@ def send_html_email(to_email: str, subject: str, html_body: str, caso=None):
         if hasattr(caso, 'empresa') and caso.empresa:
             if hasattr(caso.empresa, 'email_copia') and caso.empresa.email_copia:
                 cc_email = caso.empresa.email_copia
-                print(f"📧 CC configurado: {cc_email} ({caso.empresa.nombre})")
+                log.debug("📧 CC configurado: %s (%s)", cc_email, caso.empresa.nombre)
         
         # ✅ OBTENER TELÉFONO DEL FORMULARIO (prioritario)
         if hasattr(caso, 'telefono_form') and caso.telefono_form:
             whatsapp = caso.telefono_form
-            print(f"📱 WhatsApp desde formulario: {whatsapp}")
+            log.debug("📱 WhatsApp desde formulario: %s", whatsapp)
         
         # ✅ OBTENER CORREO DE BD
         if hasattr(caso, 'empleado') and caso.empleado:
             if hasattr(caso.empleado, 'correo') and caso.empleado.correo:
                 correo_bd = caso.empleado.correo
-                print(f"📧 Correo BD: {correo_bd}")
+                log.debug("📧 Correo BD: %s", correo_bd)
     
     resultado = enviar_a_n8n(
         tipo_notificacion=tipo_notificacion,
@@ -288,10 +410,10 @@ def send_html_email(to_email: str, subject: str, html_body: str, caso=None):
         canales = "Email"
         if whatsapp:
             canales += " + WhatsApp"
-        print(f"✅ {canales} enviado: {to_email} (CC: {cc_email or 'ninguno'}, Tel: {whatsapp or 'ninguno'})")
+        log.info("✅ %s enviado: %s (CC: %s, Tel: %s)", canales, to_email, cc_email or 'ninguno', whatsapp or 'ninguno')
         return True, None
     else:
-        print(f"❌ Error enviando via N8N")
+        log.error("❌ Error enviando via N8N")
         return False, "Error N8N"
     
 
@@ -388,40 +510,119 @@ async def ping():
     from datetime import datetime
     return {"status": "alive", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato Prometheus (latencias por ruta, llamadas externas, etapas)"""
+    from fastapi.responses import PlainTextResponse
+    from app.metricas import exportar_prometheus
+    return PlainTextResponse(exportar_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/logs")
+async def estado_logs(token: str = Header(None, alias="X-Admin-Token")):
+    """Nivel, formato, cola de escritura y seriales con DEBUG activo"""
+    from app.validador import verificar_token_admin
+    from app.logs import obtener_estadisticas
+    verificar_token_admin(token)
+    return obtener_estadisticas()
+
+@app.post("/logs/debug/{serial}")
+async def activar_debug_caso(serial: str, activar: bool = True, token: str = Header(None, alias="X-Admin-Token")):
+    """Activa (o desactiva con ?activar=false) los logs DEBUG solo para un caso"""
+    from app.validador import verificar_token_admin
+    from app.logs import activar_debug_serial, desactivar_debug_serial, seriales_en_debug
+    verificar_token_admin(token)
+    if activar:
+        activar_debug_serial(serial)
+    else:
+        desactivar_debug_serial(serial)
+    return {"ok": True, "seriales_debug": seriales_en_debug()}
+
 @app.get("/status")
-async def status_dashboard(db: Session = Depends(get_db)):
-    """Dashboard de estado del sistema"""
+async def status_dashboard(db: AsyncSession = Depends(get_async_db)):
+    """Dashboard de estado del sistema (datos en vivo de app.metricas)"""
     from datetime import datetime
+    from app.metricas import resumen
+    from app.arranque import obtener_estado as obtener_estado_arranque
+    from app.planificador import planificador
+    from app.estado_compartido import obtener_estadisticas as estadisticas_estado_compartido
+    from app.google_rest import obtener_estadisticas as estadisticas_google_rest
+    from app.replicas import obtener_estadisticas as estadisticas_replicas
+    from app.escritura_diferida import obtener_estadisticas as estadisticas_escritura_diferida
+    from app.database import obtener_estadisticas_sqlite
     
     # Verificar BD
     try:
-        total_casos = db.query(Case).count()
+        from sqlalchemy import select, func
+        total_casos = await db.scalar(select(func.count()).select_from(Case))
         db_status = "✅ connected"
     except:
         total_casos = 0
         db_status = "❌ error"
     
     # Verificar Drive
+    credenciales = None
     try:
-        from app.drive_uploader import TOKEN_FILE
-        drive_status = "✅ authenticated" if TOKEN_FILE.exists() else "⚠️ no token"
+        from app.credenciales_google import gestor as gestor_credenciales
+        from app.google_endpoints import usando_endpoint_local
+        credenciales = gestor_credenciales.estado()
+        if usando_endpoint_local():
+            drive_status = "🧪 endpoint local"
+        elif credenciales['en_memoria'] or gestor_credenciales.leer_compartido():
+            drive_status = "✅ authenticated"
+        else:
+            drive_status = "⚠️ no token"
     except:
         drive_status = "❌ error"
     
+    if scheduler_sync and scheduler_sync.running:
+        scheduler_status = "✅ running (líder)" if scheduler_sync.es_lider else "✅ running (en otro worker)"
+    else:
+        scheduler_status = "⚠️ detenido"
+    
+    metricas = resumen()
+    requests_total = metricas['requests']
+    
+    # Estado de cada servicio externo según sus llamadas recientes
+    externos = {}
+    for nombre, datos in metricas['llamadas'].items():
+        servicio = nombre.split('.', 1)[0]
+        agregado = externos.setdefault(servicio, {'llamadas': 0, 'errores': 0, 'p95_ms': 0.0})
+        agregado['llamadas'] += datos['total']
+        agregado['errores'] += datos['errores']
+        agregado['p95_ms'] = max(agregado['p95_ms'], datos['p95_ms'])
+        if datos.get('ultimo_error'):
+            agregado['ultimo_error'] = datos['ultimo_error']
+    
     return {
         "timestamp": datetime.now().isoformat(),
         "services": {
             "api": "✅ online",
             "database": db_status,
             "google_drive": drive_status,
-            "scheduler": "✅ running",
-            "uptime_robot": "✅ monitoring"
+            "scheduler": scheduler_status,
+            "externos": externos
         },
         "stats": {
             "total_casos": total_casos,
-            "render_sleep": "disabled",
-            "response_time": "<2s"
-        }
+            "uptime_s": metricas['uptime_s'],
+            "requests": requests_total.get('total', 0),
+            "response_time_p50_ms": requests_total.get('p50_ms'),
+            "response_time_p95_ms": requests_total.get('p95_ms'),
+            "response_time_p99_ms": requests_total.get('p99_ms'),
+            "error_rate_pct": requests_total.get('tasa_error_pct', 0.0)
+        },
+        "rutas": metricas['rutas'],
+        "llamadas": metricas['llamadas'],
+        "etapas": metricas['etapas'],
+        "requests_mas_lentos": metricas['requests_mas_lentos'],
+        "arranque": obtener_estado_arranque(),
+        "planificador": planificador.estado(),
+        "estado_compartido": estadisticas_estado_compartido(),
+        "credenciales_google": credenciales,
+        "google_rest": estadisticas_google_rest(),
+        "replicas": estadisticas_replicas(),
+        "escritura_diferida": estadisticas_escritura_diferida(),
+        "sqlite": obtener_estadisticas_sqlite()
     }
 
 @app.get("/stats/uptime")
@@ -445,25 +646,24 @@ async def uptime_stats():
     return {"status": "alive", "timestamp": datetime.now().isoformat()}
 
 @app.post("/wake-up")
-async def force_wake_up(db: Session = Depends(get_db)):
+async def force_wake_up(db: AsyncSession = Depends(get_async_db)):
     """Fuerza renovación de todos los servicios"""
     from datetime import datetime
-    from app.drive_uploader import get_authenticated_service
+    from app.google_rest import drive
     from sqlalchemy import text
     
     resultados = {}
     
     # Renovar Drive
     try:
-        service = get_authenticated_service()
-        service.files().list(pageSize=1).execute()
+        await drive.files_list(pageSize=1)
         resultados["drive"] = "✅ renovado"
     except Exception as e:
         resultados["drive"] = f"❌ {str(e)[:50]}"
     
     # Test BD
     try:
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         resultados["database"] = "✅ conectada"
     except Exception as e:
         resultados["database"] = f"❌ {str(e)[:50]}"
@@ -491,8 +691,11 @@ def obtener_empleado(cedula: str, db: Session = Depends(get_db)):
         }
     
     # PASO 2: Sincronizar desde Excel
-    print(f"📄 Sync instantánea para {cedula}...")
-    empleado_sync = sincronizar_empleado_desde_excel(cedula)
+    log.info("📄 Sync instantánea para %s...", cedula)
+    empleado_sync = None
+    if sincronizar_empleado_desde_excel(cedula):
+        # El sync usa su propia sesión: releer aquí para poder cargar la empresa
+        empleado_sync = db.query(Employee).filter(Employee.cedula == cedula).first()
     
     if empleado_sync:
         return {
@@ -551,7 +754,7 @@ def verificar_bloqueo_empleado(
     }
 
 @app.post("/casos/{serial}/reenviar")
-async def reenviar_caso_incompleto(
+def reenviar_caso_incompleto(
     serial: str,
     archivos: List[UploadFile] = File(...),
     db: Session = Depends(get_db)
@@ -580,16 +783,33 @@ async def reenviar_caso_incompleto(
         )
     
     try:
-        # 2. Procesar nuevos archivos
-        pdf_final_path, original_filenames = await merge_pdfs_from_uploads(
+        # 2. Procesar nuevos archivos (sin los que el caso ya tiene)
+        pdf_final_path, original_filenames, huellas = merge_pdfs_con_huellas(
             archivos,
             caso.cedula,
-            caso.tipo.value if caso.tipo else "general"
+            caso.tipo.value if caso.tipo else "general",
+            ya_recibidos=hashes_del_caso(db, caso.id)
         )
         
-        # 3. Subir NUEVO archivo a Drive (NO reemplazar el viejo aún)
-        from app.serial_generator import extraer_iniciales
+        # 2.1 Reconocer adjuntos que ya se habían recibido en este caso
+        huellas_nuevas, huellas_repetidas = clasificar_huellas(db, caso.id, huellas)
+        archivos_repetidos = [h['nombre'] for h in huellas_repetidas]
+        omitidos = archivos_omitidos(huellas, huellas_repetidas)
         
+        if not huellas_nuevas:
+            pdf_final_path.unlink()
+            log.info("♻️ Reenvío %s sin archivos nuevos, no se sube a Drive", serial)
+            return JSONResponse(
+                status_code=409,
+                content={
+                    "error": "Los archivos enviados ya habían sido recibidos en este caso",
+                    "serial": serial,
+                    "archivos_repetidos": archivos_repetidos,
+                    "archivos_omitidos": omitidos
+                }
+            )
+        
+        # 3. Subir NUEVO archivo a Drive (NO reemplazar el viejo aún)
         empresa_destino = caso.empresa.nombre if caso.empresa else "OTRA_EMPRESA"
         
         # Generar nombre único para versión nueva
@@ -605,19 +825,19 @@ async def reenviar_caso_incompleto(
         
         pdf_final_path.unlink()
         
-        # 4. Guardar metadata del reenvío en el caso
-        if not caso.metadata_form:
-            caso.metadata_form = {}
-        
-        if 'reenvios' not in caso.metadata_form:
-            caso.metadata_form['reenvios'] = []
+        # 4. Guardar el reenvío (tabla case_resubmissions)
+        from app.drive_manager import extraer_file_id
+        from app.reenvios import registrar_reenvio
+        reenvio = registrar_reenvio(
+            db, caso,
+            link=nuevo_link,
+            archivos=original_filenames,
+            archivos_repetidos=archivos_repetidos,
+            paginas_nuevas=paginas_de(huellas_nuevas),
+            drive_file_id=extraer_file_id(nuevo_link)
+        )
         
-        caso.metadata_form['reenvios'].append({
-            'fecha': datetime.now().isoformat(),
-            'link': nuevo_link,
-            'archivos': original_filenames,
-            'estado': 'PENDIENTE_REVISION'
-        })
+        registrar_huellas(db, caso.id, huellas, extraer_file_id(nuevo_link))
         
         # 5. Cambiar estado a "NUEVO" para que validador lo vea
         estado_anterior = caso.estado.value
@@ -631,19 +851,29 @@ async def reenviar_caso_incompleto(
             estado_anterior=estado_anterior,
             estado_nuevo="NUEVO",
             actor="Empleado",
-            motivo=f"Reenvío #{len(caso.metadata_form['reenvios'])}",
+            motivo=f"Reenvío #{reenvio.numero}",
             metadata_json={
                 'nuevo_link': nuevo_link,
-                'total_reenvios': len(caso.metadata_form['reenvios'])
+                'total_reenvios': reenvio.numero
             }
         )
         db.add(evento)
         
         db.commit()
         
-        print(f"✅ Reenvío detectado para {serial}")
-        print(f"   📁 Versión anterior: {caso.drive_link}")
-        print(f"   📁 Versión nueva: {nuevo_link}")
+        log.info("✅ Reenvío detectado para %s", serial)
+        log.debug("📁 Versión anterior: %s", caso.drive_link)
+        log.debug("📁 Versión nueva: %s", nuevo_link)
+        
+        # Precalcular la comparación página por página para el validador
+        try:
+            from app.comparador_versiones import programar_comparacion
+            file_id_anterior = extraer_file_id(caso.drive_link)
+            file_id_nuevo = extraer_file_id(nuevo_link)
+            if file_id_anterior and file_id_nuevo:
+                programar_comparacion(db, caso.id, file_id_anterior, file_id_nuevo)
+        except Exception as e:
+            log.warning("⚠️ Error programando comparación de versiones: %s", e)
         
         # 7. Notificar al validador (email interno)
         try:
@@ -671,18 +901,20 @@ async def reenviar_caso_incompleto(
                 adjuntos_base64=[]
             )
         except Exception as e:
-            print(f"⚠️ Error enviando alerta: {e}")
+            log.warning("⚠️ Error enviando alerta: %s", e)
         
         return {
             "success": True,
             "serial": serial,
             "mensaje": "Documentos reenviados exitosamente. El validador revisará tu caso.",
-            "total_reenvios": len(caso.metadata_form['reenvios']),
-            "nuevo_link": nuevo_link
+            "total_reenvios": reenvio.numero,
+            "nuevo_link": nuevo_link,
+            "archivos_repetidos": archivos_repetidos,
+            "archivos_omitidos": omitidos
         }
         
     except Exception as e:
-        print(f"❌ Error procesando reenvío {serial}: {e}")
+        log.error("❌ Error procesando reenvío %s: %s", serial, e)
         import traceback
         traceback.print_exc()
         return JSONResponse(
@@ -693,7 +925,7 @@ async def reenviar_caso_incompleto(
 # ==================== CONTINUACIÓN DE main.py ====================
 
 @app.post("/casos/{serial}/completar")
-async def completar_caso_incompleto(
+def completar_caso_incompleto(
     serial: str,
     archivos: List[UploadFile] = File(...),
     db: Session = Depends(get_db)
@@ -720,41 +952,57 @@ async def completar_caso_incompleto(
         )
     
     try:
-        # 2. Procesar nuevos archivos
-        pdf_final_path, original_filenames = await merge_pdfs_from_uploads(
-            archivos, 
-            caso.cedula, 
-            caso.tipo.value if caso.tipo else "general"
-        )
-        
-        # 3. Actualizar archivo en Drive (MISMO file_id)
-        from app.drive_manager import DriveFileManager, CaseFileOrganizer
-        
-        # Extraer file_id del link actual
-        file_id = None
-        if '/file/d/' in caso.drive_link:
-            file_id = caso.drive_link.split('/file/d/')[1].split('/')[0]
-        elif 'id=' in caso.drive_link:
-            file_id = caso.drive_link.split('id=')[1].split('&')[0]
+        from app.drive_manager import DriveFileManager, CaseFileOrganizer, extraer_file_id
         
+        # 2. Archivo actual del caso en Drive: los documentos nuevos se le agregan
+        #    al final (las páginas y huellas que ya tenía no se mueven)
+        file_id = extraer_file_id(caso.drive_link)
         if not file_id:
             raise Exception("No se pudo extraer file_id del link de Drive")
         
-        # Actualizar contenido del archivo existente
         drive_manager = DriveFileManager()
         
-        # Subir nuevo contenido al mismo file_id
-        from googleapiclient.http import MediaFileUpload
-        media = MediaFileUpload(str(pdf_final_path), mimetype='application/pdf', resumable=True)
+        # 2.1 Procesar nuevos archivos (sin los que el caso ya tiene)
+        pdf_final_path, original_filenames, huellas = merge_pdfs_con_huellas(
+            archivos, 
+            caso.cedula, 
+            caso.tipo.value if caso.tipo else "general",
+            ya_recibidos=hashes_del_caso(db, caso.id),
+            pdf_base=drive_manager.service.files_get_media(file_id)
+        )
+        
+        # 2.2 Si todo lo enviado ya estaba en el caso, no hay nada que completar
+        huellas_nuevas, huellas_repetidas = clasificar_huellas(db, caso.id, huellas)
+        archivos_repetidos = [h['nombre'] for h in huellas_repetidas]
+        omitidos = archivos_omitidos(huellas, huellas_repetidas)
         
-        updated_file = drive_manager.service.files().update(
-            fileId=file_id,
-            media_body=media,
-            fields='id, webViewLink, modifiedTime'
-        ).execute()
+        if not huellas_nuevas:
+            pdf_final_path.unlink()
+            log.info("♻️ Completar %s sin archivos nuevos, no se sube a Drive", serial)
+            return JSONResponse(
+                status_code=409,
+                content={
+                    "error": "Los archivos enviados ya habían sido recibidos en este caso",
+                    "serial": serial,
+                    "archivos_repetidos": archivos_repetidos,
+                    "archivos_omitidos": omitidos
+                }
+            )
+        
+        # 3. Actualizar archivo en Drive (MISMO file_id)
+        from app.drive_upload_manager import subir_archivo_reanudable
+        updated_file = subir_archivo_reanudable(
+            drive_manager.service, pdf_final_path, {},
+            file_id=file_id,
+            fields='id, webViewLink, modifiedTime, md5Checksum, headRevisionId'
+        )
         
         nuevo_link = updated_file.get('webViewLink', caso.drive_link)
         
+        from app.drive_index import registrar_archivo
+        registrar_archivo(file_id, serial=serial, md5=updated_file.get('md5Checksum'),
+                          revision=updated_file.get('headRevisionId'), db=db)
+        
         # Limpiar archivo temporal
         pdf_final_path.unlink()
         
@@ -773,35 +1021,46 @@ async def completar_caso_incompleto(
             estado_anterior=estado_anterior,
             estado_nuevo="NUEVO",
             actor="Empleado",
-            motivo="Documentos completados por el empleado"
+            motivo="Documentos completados por el empleado",
+            metadata_json={
+                'paginas_nuevas': paginas_de(huellas_nuevas),
+                'archivos_repetidos': archivos_repetidos
+            }
         )
         db.add(evento)
         
-        # 6. Mover en Drive de vuelta a "por validar"
-        organizer = CaseFileOrganizer()
-        organizer.mover_caso_segun_estado(caso, "NUEVO")
+        # Las huellas anteriores siguen en sus páginas; se agregan las nuevas
+        registrar_huellas(db, caso.id, huellas, file_id)
+        
+        caso.drive_file_id = file_id
         
         db.commit()
         
-        print(f"✅ Caso {serial} completado por empleado y desbloqueado")
+        # 6. Mover en Drive de vuelta a "por validar" (en segundo plano, después del commit)
+        organizer = CaseFileOrganizer()
+        organizer.mover_caso_segun_estado(caso, "NUEVO")
+        
+        log.info("✅ Caso %s completado por empleado y desbloqueado", serial)
         
         # 7. Sincronizar con Google Sheets
         try:
             from app.google_sheets_tracker import actualizar_caso_en_sheet
             actualizar_caso_en_sheet(caso, accion="actualizar")
         except Exception as e:
-            print(f"⚠️ Error sincronizando con Sheets: {e}")
+            log.warning("⚠️ Error sincronizando con Sheets: %s", e)
         
         return {
             "success": True,
             "serial": serial,
             "mensaje": "Documentos completados exitosamente. El caso será revisado nuevamente.",
             "nuevo_estado": "NUEVO",
-            "nuevo_link": nuevo_link
+            "nuevo_link": nuevo_link,
+            "archivos_repetidos": archivos_repetidos,
+            "archivos_omitidos": omitidos
         }
         
     except Exception as e:
-        print(f"❌ Error completando caso {serial}: {e}")
+        log.error("❌ Error completando caso %s: %s", serial, e)
         import traceback
         traceback.print_exc()
         return JSONResponse(
@@ -810,7 +1069,7 @@ async def completar_caso_incompleto(
         )
 
 @app.post("/subir-incapacidad/")
-async def subir_incapacidad(
+def subir_incapacidad(
     cedula: str = Form(...),
     tipo: str = Form(...),
     email: str = Form(...),
@@ -830,8 +1089,10 @@ async def subir_incapacidad(
     
     # ✅ PASO 2: Si NO está en BD, sincronizar desde Excel
     if not empleado_bd:
-        print(f"📄 Sincronización instantánea para {cedula}...")
-        empleado_bd = sincronizar_empleado_desde_excel(cedula)
+        log.info("📄 Sincronización instantánea para %s...", cedula)
+        if sincronizar_empleado_desde_excel(cedula):
+            # El sync usa su propia sesión: releer en la del request
+            empleado_bd = db.query(Employee).filter(Employee.cedula == cedula).first()
     
     # ✅ PASO 3: Determinar si el empleado fue encontrado (en BD o Excel)
     if empleado_bd:
@@ -839,6 +1100,7 @@ async def subir_incapacidad(
     else:
         try:
             if os.path.exists(DATA_PATH):
+                import pandas as pd
                 df = pd.read_excel(DATA_PATH)
                 empleado_encontrado = not df[df["cedula"] == int(cedula)].empty
             else:
@@ -846,12 +1108,15 @@ async def subir_incapacidad(
         except:
             empleado_encontrado = False
     
+    marca('buscar_empleado')
+    
     # ✅ Generar serial único basado en nombre y cédula
     if empleado_bd:
         consecutivo = generar_serial_unico(db, empleado_bd.nombre, cedula)
     else:
         # Si no hay empleado, usar iniciales genéricas
         consecutivo = generar_serial_unico(db, "DESCONOCIDO", cedula)
+    asignar_contexto(serial=consecutivo, cedula=cedula)
     
     # Verificar si hay casos bloqueantes
     if empleado_bd:
@@ -868,6 +1133,8 @@ async def subir_incapacidad(
                 "mensaje": f"Caso pendiente ({caso_bloqueante.serial}) debe completarse primero."
             })
     
+    marca('serial_y_bloqueos')
+    
     metadata_form = {}
     tiene_soat = None
     tiene_licencia = None
@@ -893,7 +1160,8 @@ async def subir_incapacidad(
     try:
         empresa_destino = empleado_bd.empresa.nombre if empleado_bd else "OTRA_EMPRESA"
         
-        pdf_final_path, original_filenames = await merge_pdfs_from_uploads(archivos, cedula, tipo)
+        pdf_final_path, original_filenames, huellas = merge_pdfs_con_huellas(archivos, cedula, tipo)
+        marca('merge_pdf')
         
         link_pdf = upload_to_drive(
             pdf_final_path, 
@@ -904,6 +1172,7 @@ async def subir_incapacidad(
             tiene_soat=tiene_soat,
             tiene_licencia=tiene_licencia
         )
+        marca('subir_drive')
         
         pdf_final_path.unlink()
         
@@ -912,6 +1181,7 @@ async def subir_incapacidad(
     
     tipo_bd = mapear_tipo_incapacidad(subType if subType else tipo)
     
+    from app.drive_manager import extraer_file_id
     nuevo_caso = Case(
         serial=consecutivo,
         cedula=cedula,
@@ -924,24 +1194,31 @@ async def subir_incapacidad(
         metadata_form=metadata_form,
         eps=empleado_bd.eps if empleado_bd else None,
         drive_link=link_pdf,
+        drive_file_id=extraer_file_id(link_pdf),
         email_form=email,
         telefono_form=telefono,
         bloquea_nueva=False
     )
     
     db.add(nuevo_caso)
+    db.flush()
+    
+    registrar_huellas(db, nuevo_caso.id, huellas, extraer_file_id(link_pdf))
+    
     db.commit()
     db.refresh(nuevo_caso)
+    marca('guardar_bd')
     
-    print(f"✅ Caso {consecutivo} guardado (ID {nuevo_caso.id}) - Empresa: {empleado_bd.empresa.nombre if empleado_bd and empleado_bd.empresa else 'N/A'}")
+    log.info("✅ Caso %s guardado (ID %s) - Empresa: %s", consecutivo, nuevo_caso.id, empleado_bd.empresa.nombre if empleado_bd and empleado_bd.empresa else 'N/A')
     
     # ✅ SINCRONIZAR CON GOOGLE SHEETS
     try:
         from app.google_sheets_tracker import actualizar_caso_en_sheet
         actualizar_caso_en_sheet(nuevo_caso, accion="crear")
-        print(f"✅ Caso {consecutivo} sincronizado con Google Sheets")
+        log.info("✅ Caso %s sincronizado con Google Sheets", consecutivo)
     except Exception as e:
-        print(f"⚠️ Error sincronizando con Sheets: {e}")
+        log.warning("⚠️ Error sincronizando con Sheets: %s", e)
+    marca('sheets')
     
     quinzena_actual = get_current_quinzena()
     
@@ -970,8 +1247,6 @@ async def subir_incapacidad(
         asunto = f"Incapacidad {consecutivo} - {nombre} - {empresa_reg}"
         
         # ✅ ENVIAR VIA N8N con COPIAS
-        from app.n8n_notifier import enviar_a_n8n
-        
         emails_enviados = []
         if email:  # Email del formulario como TO principal
             resultado = enviar_a_n8n(
@@ -990,17 +1265,8 @@ async def subir_incapacidad(
         
         
         # ✅ EMAIL DE SUPERVISIÓN (SIN CC, directo)
-        html_supervision = get_alert_template(
-            tipo="copia",
-            cedula=cedula,
-            nombre=nombre,
-            consecutivo=consecutivo,
-            empresa=empresa_reg,
-            link_pdf=link_pdf,
-            archivos_nombres=original_filenames,
-            email_contacto=email,
-            telefono=telefono
-        )
+        # (misma confirmación que recibe el empleado)
+        html_supervision = html_empleado
         
         enviar_a_n8n(
             tipo_notificacion='extra',
@@ -1012,6 +1278,7 @@ async def subir_incapacidad(
             correo_bd=None,
             adjuntos_base64=[]
         )
+        marca('notificar')
         
         return {
             "status": "ok",
@@ -1020,17 +1287,13 @@ async def subir_incapacidad(
             "case_id": nuevo_caso.id,
             "link_pdf": link_pdf,
             "archivos_combinados": len(original_filenames),
+            "archivos_omitidos": archivos_omitidos(huellas, []),
             "correos_enviados": emails_enviados
         }
     
     else:
-        html_alerta = get_alert_template(
-            tipo="alerta",
-            cedula=cedula,
-            consecutivo=consecutivo,
-            email_contacto=email,
-            telefono=telefono,
-            quinzena=quinzena_actual
+        html_alerta = get_alerta_cedula_desconocida_template(
+            consecutivo, cedula, email, telefono, quinzena_actual, link_pdf
         )
         
         html_confirmacion = f"""
@@ -1072,6 +1335,7 @@ async def subir_incapacidad(
             correo_bd=None,
             adjuntos_base64=[]
         )
+        marca('notificar')
         
         return {
             "status": "warning",
@@ -1079,86 +1343,56 @@ async def subir_incapacidad(
             "consecutivo": consecutivo,
             "case_id": nuevo_caso.id,
             "link_pdf": link_pdf,
+            "archivos_omitidos": archivos_omitidos(huellas, []),
             "correos_enviados": [email]
         }
 
 @app.post("/admin/migrar-excel")
-async def migrar_excel_a_bd(db: Session = Depends(get_db)):
-    """Migra empleados desde Excel a BD"""
+def migrar_excel_a_bd():
+    """Migra empleados desde Excel a BD (upsert por cédula en lotes, ver app.carga_empleados)"""
     
     if not os.path.exists(DATA_PATH):
         return JSONResponse(status_code=404, content={"error": f"Excel no encontrado en {DATA_PATH}"})
     
     try:
+        import pandas as pd
+        from app.carga_empleados import cargar_empleados
         df = pd.read_excel(DATA_PATH)
-        migraciones = 0
-        errores = []
-        
-        for _, row in df.iterrows():
-            try:
-                empresa_nombre = row["empresa"]
-                company = db.query(Company).filter(Company.nombre == empresa_nombre).first()
-                
-                if not company:
-                    company = Company(nombre=empresa_nombre, activa=True)
-                    db.add(company)
-                    db.commit()
-                    db.refresh(company)
-                
-                cedula = str(row["cedula"])
-                empleado_existente = db.query(Employee).filter(Employee.cedula == cedula).first()
-                
-                if not empleado_existente:
-                    nuevo_empleado = Employee(
-                        cedula=cedula,
-                        nombre=row["nombre"],
-                        correo=row["correo"],
-                        telefono=row.get("telefono", None),
-                        company_id=company.id,
-                        eps=row.get("eps", None),
-                        activo=True
-                    )
-                    db.add(nuevo_empleado)
-                    db.commit()
-                    migraciones += 1
-                
-            except Exception as e:
-                errores.append(f"Error en {row.get('cedula', 'N/A')}: {str(e)}")
+        resumen = cargar_empleados(df)
         
         return {
             "status": "ok",
-            "migraciones_exitosas": migraciones,
-            "errores": errores,
-            "total_procesados": len(df)
+            "migraciones_exitosas": resumen['insertados'],
+            **resumen
         }
         
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": f"Error: {str(e)}"})
 
 @app.get("/health/drive-token")
 async def check_drive_token_health():
     """Verifica el estado del token de Drive"""
-    from app.drive_uploader import TOKEN_FILE
-    import json
+    from app.drive_uploader import leer_token_cache
     from datetime import datetime
     
     try:
-        if TOKEN_FILE.exists():
-            with open(TOKEN_FILE, 'r') as f:
-                token_data = json.load(f)
-                expiry_str = token_data.get('expiry')
+        token_data = leer_token_cache()
+        if token_data:
+            expiry_str = token_data.get('expiry')
+            
+            if expiry_str:
+                expiry = datetime.fromisoformat(expiry_str)
+                now = datetime.utcnow()
+                remaining = (expiry - now).total_seconds()
                 
-                if expiry_str:
-                    expiry = datetime.fromisoformat(expiry_str)
-                    now = datetime.utcnow()
-                    remaining = (expiry - now).total_seconds()
-                    
-                    return {
-                        "status": "healthy" if remaining > 0 else "expired",
-                        "expires_in_minutes": round(remaining / 60, 2),
-                        "expires_at": expiry_str,
-                        "last_checked": now.isoformat()
-                    }
+                return {
+                    "status": "healthy" if remaining > 0 else "expired",
+                    "expires_in_minutes": round(remaining / 60, 2),
+                    "expires_at": expiry_str,
+                    "last_checked": now.isoformat()
+                }
         
         return {"status": "no_cache", "message": "Token se generará en primera petición"}
         
@@ -1166,9 +1400,9 @@ async def check_drive_token_health():
         return {"status": "error", "error": str(e)}
 
 @app.post("/validador/casos/{serial}/cambiar-tipo")
-async def cambiar_tipo_incapacidad(
+def cambiar_tipo_incapacidad(
     serial: str,
-    request: Request,
+    datos: dict = Body(...),
     token: str = Header(None, alias="X-Admin-Token"),
     db: Session = Depends(get_db)
 ):
@@ -1180,12 +1414,8 @@ async def cambiar_tipo_incapacidad(
     from app.validador import verificar_token_admin
     verificar_token_admin(token)
     
-    # 2. Leer datos del body
-    try:
-        datos = await request.json()
-        nuevo_tipo = datos.get('nuevo_tipo')
-    except:
-        raise HTTPException(status_code=400, detail="Datos inválidos")
+    # 2. Datos del body (FastAPI responde 422 si no es un objeto JSON)
+    nuevo_tipo = datos.get('nuevo_tipo')
     
     # 3. Validar tipo
     tipos_validos = ['maternity', 'paternity', 'general', 'traffic', 'labor']
@@ -1226,12 +1456,24 @@ async def cambiar_tipo_incapacidad(
     caso.bloquea_nueva = True
     caso.updated_at = datetime.utcnow()
     
-    db.commit()
-    
     # 7. Obtener nuevos documentos requeridos
     docs_requeridos = obtener_documentos_requeridos(nuevo_tipo)
     
-    # 8. Enviar email al empleado
+    # 8. Registrar evento (mismo commit que el cambio de tipo)
+    from app.validador import registrar_evento
+    registrar_evento(
+        db, caso.id,
+        "cambio_tipo",
+        actor="Validador",
+        estado_anterior=tipo_anterior,
+        estado_nuevo=nuevo_tipo,
+        motivo=f"Tipo cambiado de {tipo_anterior} a {nuevo_tipo}",
+        metadata={'docs_requeridos': docs_requeridos}
+    )
+    
+    db.commit()
+    
+    # 9. Enviar email al empleado
     empleado_email = caso.email_form
     empleado_nombre = caso.empleado.nombre if caso.empleado else 'Empleado'
     
@@ -1246,19 +1488,7 @@ async def cambiar_tipo_incapacidad(
                 docs_requeridos=docs_requeridos
             )
         except Exception as e:
-            print(f"Error enviando email: {e}")
-    
-    # 9. Registrar evento
-    from app.validador import registrar_evento
-    registrar_evento(
-        db, caso.id,
-        "cambio_tipo",
-        actor="Validador",
-        estado_anterior=tipo_anterior,
-        estado_nuevo=nuevo_tipo,
-        motivo=f"Tipo cambiado de {tipo_anterior} a {nuevo_tipo}",
-        metadata={'docs_requeridos': docs_requeridos}
-    )
+            log.warning("⚠️ Error enviando email: %s", e)
     
     return {
         "mensaje": f"Tipo cambiado exitosamente de {tipo_anterior} a {nuevo_tipo}",
@@ -0,0 +1,339 @@
+"""
+Métricas de Rendimiento (latencias por ruta, llamadas externas y etapas)
+IncaNeurobaeza - 2024
+
+- MetricasMiddleware: histograma de latencia por método + ruta + status
+- span(tipo, nombre): mide una llamada externa (drive, sheets, n8n,
+  anthropic, db) o una operación de PDF; sirve como `with` y como decorador
+- marca(nombre): cronómetro por etapas dentro de un request ("¿qué parte
+  de subir_incapacidad se come el tiempo?"); lo medido sale en el header
+  Server-Timing y en /status (requests más lentos con su desglose)
+
+Sin dependencias: /metrics se genera en formato de texto de Prometheus.
+"""
+
+import time
+import asyncio
+import functools
+import threading
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+# Buckets en segundos (de consultas de BD a subidas grandes a Drive)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Muestras recientes por serie para p50/p95/p99 en /status
+MUESTRAS_RECIENTES = 1024
+
+# Requests lentos que se guardan con su desglose por etapas
+MAX_TRAZAS_LENTAS = 20
+
+_inicio_proceso = time.time()
+
+
+# ==================== HISTOGRAMAS ====================
+
+class Histograma:
+    __slots__ = ('buckets', 'suma', 'total', 'errores', 'recientes', 'ultimo_error')
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.suma = 0.0
+        self.total = 0
+        self.errores = 0
+        self.recientes = deque(maxlen=MUESTRAS_RECIENTES)
+        self.ultimo_error = None
+
+    def observar(self, segundos: float, error: Optional[str] = None):
+        for i, limite in enumerate(BUCKETS):
+            if segundos <= limite:
+                self.buckets[i] += 1
+                break
+        self.suma += segundos
+        self.total += 1
+        self.recientes.append(segundos)
+        if error:
+            self.errores += 1
+            self.ultimo_error = error[:200]
+
+    def percentiles(self) -> dict:
+        datos = sorted(self.recientes)
+        if not datos:
+            return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0}
+
+        def _p(p):
+            return round(datos[min(len(datos) - 1, int(len(datos) * p))] * 1000, 1)
+        return {'p50_ms': _p(0.50), 'p95_ms': _p(0.95), 'p99_ms': _p(0.99)}
+
+
+_lock = threading.Lock()
+_requests = {}   # (metodo, ruta, status) → Histograma
+_spans = {}      # (tipo, nombre, resultado) → Histograma
+_etapas = {}     # (ruta, etapa) → Histograma
+_trazas_lentas = []  # [(duracion, dict)] ordenado de mayor a menor
+
+
+def _observar(tabla: dict, clave: tuple, segundos: float, error: str = None):
+    with _lock:
+        hist = tabla.get(clave)
+        if hist is None:
+            hist = tabla[clave] = Histograma()
+        hist.observar(segundos, error)
+
+
+# ==================== TRAZA DEL REQUEST ====================
+
+_traza: ContextVar[Optional[dict]] = ContextVar('traza_metricas', default=None)
+
+
+def marca(nombre: str):
+    """
+    Cierra la etapa actual del request: el tiempo desde la marca anterior
+    (o desde el inicio) se registra con este nombre
+    """
+    traza = _traza.get()
+    if traza is None:
+        return
+    ahora = time.perf_counter()
+    traza['etapas'].append((nombre, ahora - traza['ultima']))
+    traza['ultima'] = ahora
+
+
+class span:
+    """
+    Mide una operación: with span('drive', 'files.update'): ...
+    También como decorador (funciones normales y async)
+    """
+
+    def __init__(self, tipo: str, nombre: str):
+        self.tipo = tipo
+        self.nombre = nombre
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duracion = time.perf_counter() - self._inicio
+        error = f"{exc_type.__name__}: {exc}" if exc_type else None
+        _observar(_spans, (self.tipo, self.nombre, 'error' if exc_type else 'ok'), duracion, error)
+
+        traza = _traza.get()
+        if traza is not None:
+            traza['spans'].append((f"{self.tipo}.{self.nombre}", duracion))
+        return False
+
+    def __call__(self, funcion):
+        if asyncio.iscoroutinefunction(funcion):
+            @functools.wraps(funcion)
+            async def envoltura_async(*args, **kwargs):
+                with span(self.tipo, self.nombre):
+                    return await funcion(*args, **kwargs)
+            return envoltura_async
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with span(self.tipo, self.nombre):
+                return funcion(*args, **kwargs)
+        return envoltura
+
+
+# ==================== MIDDLEWARE ASGI ====================
+
+class MetricasMiddleware:
+    """Middleware ASGI puro (no bufferiza respuestas como BaseHTTPMiddleware)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        inicio = time.perf_counter()
+        traza = {'ultima': inicio, 'etapas': [], 'spans': []}
+        token = _traza.set(traza)
+        estado = {'status': 500}
+
+        async def send_con_timing(mensaje):
+            if mensaje['type'] == 'http.response.start':
+                estado['status'] = mensaje['status']
+                # Server-Timing: el navegador / portal muestra el desglose
+                detalle = _server_timing(traza, time.perf_counter() - inicio)
+                if detalle:
+                    mensaje.setdefault('headers', []).append((b'server-timing', detalle.encode('latin-1', 'ignore')))
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, send_con_timing)
+        finally:
+            _traza.reset(token)
+            duracion = time.perf_counter() - inicio
+            ruta_obj = scope.get('route')
+            ruta = getattr(ruta_obj, 'path', None) or 'sin_ruta'
+            metodo = scope.get('method', 'GET')
+            status = estado['status']
+
+            _observar(_requests, (metodo, ruta, str(status)), duracion,
+                      f"HTTP {status}" if status >= 500 else None)
+            for etapa, segundos in traza['etapas']:
+                _observar(_etapas, (ruta, etapa), segundos)
+            _guardar_si_lenta(metodo, ruta, status, duracion, traza)
+
+
+def _server_timing(traza: dict, total: float) -> str:
+    partes = [f"{n.replace(' ', '_')};dur={s * 1000:.1f}" for n, s in traza['etapas'][:20]]
+    partes.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(partes)
+
+
+def _guardar_si_lenta(metodo, ruta, status, duracion, traza):
+    if ruta in ('/metrics', '/status', '/ping'):
+        return
+    with _lock:
+        if len(_trazas_lentas) >= MAX_TRAZAS_LENTAS and duracion <= _trazas_lentas[-1][0]:
+            return
+        _trazas_lentas.append((duracion, {
+            'ruta': f"{metodo} {ruta}",
+            'status': status,
+            'duracion_ms': round(duracion * 1000, 1),
+            'etapas': [{'etapa': n, 'ms': round(s * 1000, 1)} for n, s in traza['etapas']],
+            'llamadas': [{'span': n, 'ms': round(s * 1000, 1)} for n, s in traza['spans'][-50:]],
+            'cuando': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }))
+        _trazas_lentas.sort(key=lambda t: -t[0])
+        del _trazas_lentas[MAX_TRAZAS_LENTAS:]
+
+
+# ==================== BASE DE DATOS ====================
+
+def instrumentar_engine(engine):
+    """Cada sentencia SQL cuenta como span 'db' (SELECT, INSERT, UPDATE...)"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metricas_inicio', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        pila = conn.info.get('_metricas_inicio')
+        if not pila:
+            return
+        duracion = time.perf_counter() - pila.pop()
+        operacion = (statement.lstrip().split(None, 1) or ['?'])[0].upper()
+        _observar(_spans, ('db', operacion, 'ok'), duracion)
+        traza = _traza.get()
+        if traza is not None:
+            traza['spans'].append((f"db.{operacion}", duracion))
+
+    @event.listens_for(engine, "handle_error")
+    def _error(contexto):
+        pila = contexto.connection.info.get('_metricas_inicio') if contexto.connection is not None else None
+        if pila:
+            duracion = time.perf_counter() - pila.pop()
+            operacion = ((contexto.statement or '?').lstrip().split(None, 1) or ['?'])[0].upper()
+            _observar(_spans, ('db', operacion, 'error'), duracion, str(contexto.original_exception))
+
+
+# ==================== EXPORTACIÓN ====================
+
+def _etiquetas(**valores) -> str:
+    partes = []
+    for clave, valor in valores.items():
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _exportar_histograma(lineas, nombre, etiquetas: dict, hist: Histograma):
+    acumulado = 0
+    for limite, cantidad in zip(BUCKETS, hist.buckets):
+        acumulado += cantidad
+        lineas.append(f"{nombre}_bucket{_etiquetas(**etiquetas, le=limite)} {acumulado}")
+    lineas.append(f"{nombre}_bucket{_etiquetas(**etiquetas, le='+Inf')} {hist.total}")
+    lineas.append(f"{nombre}_sum{_etiquetas(**etiquetas)} {hist.suma:.6f}")
+    lineas.append(f"{nombre}_count{_etiquetas(**etiquetas)} {hist.total}")
+
+
+def exportar_prometheus() -> str:
+    """Texto para GET /metrics (formato de exposición de Prometheus 0.0.4)"""
+    lineas = []
+    with _lock:
+        lineas.append("# HELP incapacidades_http_request_duration_seconds Latencia de requests HTTP por ruta")
+        lineas.append("# TYPE incapacidades_http_request_duration_seconds histogram")
+        for (metodo, ruta, status), hist in sorted(_requests.items()):
+            _exportar_histograma(lineas, "incapacidades_http_request_duration_seconds",
+                                 {'method': metodo, 'route': ruta, 'status': status}, hist)
+
+        lineas.append("# HELP incapacidades_span_duration_seconds Llamadas externas (drive, sheets, n8n, anthropic, db) y operaciones de PDF")
+        lineas.append("# TYPE incapacidades_span_duration_seconds histogram")
+        for (tipo, nombre, resultado), hist in sorted(_spans.items()):
+            _exportar_histograma(lineas, "incapacidades_span_duration_seconds",
+                                 {'tipo': tipo, 'nombre': nombre, 'resultado': resultado}, hist)
+
+        lineas.append("# HELP incapacidades_etapa_duration_seconds Etapas dentro de un request")
+        lineas.append("# TYPE incapacidades_etapa_duration_seconds histogram")
+        for (ruta, etapa), hist in sorted(_etapas.items()):
+            _exportar_histograma(lineas, "incapacidades_etapa_duration_seconds",
+                                 {'route': ruta, 'etapa': etapa}, hist)
+
+    lineas.append("# HELP incapacidades_uptime_seconds Segundos desde el arranque del proceso")
+    lineas.append("# TYPE incapacidades_uptime_seconds gauge")
+    lineas.append(f"incapacidades_uptime_seconds {time.time() - _inicio_proceso:.0f}")
+    return "\n".join(lineas) + "\n"
+
+
+def _agrupar(tabla: dict, n_claves: int) -> dict:
+    """Une series que solo difieren en la última etiqueta (status / resultado)"""
+    grupos = {}
+    for clave, hist in tabla.items():
+        grupos.setdefault(clave[:n_claves], []).append(hist)
+    return grupos
+
+
+def _resumen_grupo(hists) -> dict:
+    total = sum(h.total for h in hists)
+    errores = sum(h.errores for h in hists)
+    combinado = Histograma()
+    for h in hists:
+        combinado.recientes.extend(h.recientes)
+    ultimo_error = next((h.ultimo_error for h in hists if h.ultimo_error), None)
+    return {
+        'total': total,
+        'errores': errores,
+        'tasa_error_pct': round(100 * errores / total, 2) if total else 0.0,
+        'promedio_ms': round(1000 * sum(h.suma for h in hists) / total, 1) if total else 0.0,
+        **combinado.percentiles(),
+        **({'ultimo_error': ultimo_error} if ultimo_error else {})
+    }
+
+
+def resumen() -> dict:
+    """Datos en vivo para GET /status"""
+    with _lock:
+        rutas = {f"{m} {r}": _resumen_grupo(h) for (m, r), h in _agrupar(_requests, 2).items()}
+        externos = {f"{t}.{n}": _resumen_grupo(h) for (t, n), h in _agrupar(_spans, 2).items()}
+        etapas = {}
+        for (ruta, etapa), hist in _etapas.items():
+            etapas.setdefault(ruta, {})[etapa] = _resumen_grupo([hist])
+        lentas = [t for _, t in _trazas_lentas[:10]]
+        todas = [h for h in _requests.values()]
+
+    return {
+        'uptime_s': round(time.time() - _inicio_proceso),
+        'requests': _resumen_grupo(todas) if todas else {'total': 0},
+        'rutas': dict(sorted(rutas.items(), key=lambda x: -x[1]['total'])),
+        'llamadas': dict(sorted(externos.items(), key=lambda x: -x[1]['total'])),
+        'etapas': etapas,
+        'requests_mas_lentos': lentas
+    }
+
+
+def reiniciar():
+    with _lock:
+        _requests.clear()
+        _spans.clear()
+        _etapas.clear()
+        _trazas_lentas.clear()
@@ -7,6 +7,10 @@ import os
 import requests
 from typing import List, Optional
 
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
 N8N_WEBHOOK_URL = os.environ.get(
     "N8N_WEBHOOK_URL", 
     "https://n8n-incaneurobaeza.onrender.com/webhook/incapacidades"
@@ -45,43 +49,15 @@ def enviar_a_n8n(
     # ✅ CONSTRUIR LISTA DE CCs
     cc_list = []
     
-    print(f"🔍 DEBUG n8n_notifier:")
-    print(f"   email (TO): {email}")
-    print(f"   correo_bd: {correo_bd}")
-    print(f"   cc_email: {cc_email}")
-    
     # Agregar correo del empleado en BD (si existe y es diferente al principal)
-    if correo_bd:
-        print(f"   ✓ correo_bd existe: {correo_bd}")
-        if correo_bd.strip():
-            print(f"   ✓ correo_bd no está vacío")
-            if correo_bd.lower() != email.lower():
-                cc_list.append(correo_bd.strip())
-                print(f"   ✓ correo_bd agregado a cc_list")
-            else:
-                print(f"   ✗ correo_bd es igual al TO, no se agrega")
-        else:
-            print(f"   ✗ correo_bd está vacío después de strip()")
-    else:
-        print(f"   ✗ correo_bd es None o False")
-    
-    # Agregar correo de la empresa (si existe)
-    if cc_email:
-        print(f"   ✓ cc_email existe: {cc_email}")
-        if cc_email.strip():
-            print(f"   ✓ cc_email no está vacío")
-            # Evitar duplicados
-            if cc_email.strip().lower() not in [c.lower() for c in cc_list]:
-                cc_list.append(cc_email.strip())
-                print(f"   ✓ cc_email agregado a cc_list")
-            else:
-                print(f"   ✗ cc_email ya existe en cc_list")
-        else:
-            print(f"   ✗ cc_email está vacío después de strip()")
-    else:
-        print(f"   ✗ cc_email es None o False")
-    
-    print(f"   📧 cc_list final: {cc_list}")
+    if correo_bd and correo_bd.strip() and correo_bd.strip().lower() != email.lower():
+        cc_list.append(correo_bd.strip())
+
+    # Agregar correo de la empresa (si existe), evitando duplicados
+    if cc_email and cc_email.strip() and cc_email.strip().lower() not in [c.lower() for c in cc_list]:
+        cc_list.append(cc_email.strip())
+
+    log.debug("CC: to=%s correo_bd=%r cc_email=%r → cc_list=%s", email, correo_bd, cc_email, cc_list)
     
     # ✅ PAYLOAD CORRECTO para n8n
     payload = {
@@ -97,35 +73,35 @@ def enviar_a_n8n(
     }
     
     try:
-        print(f"📤 Enviando a n8n:")
-        print(f"   📧 TO: {email}")
-        print(f"   📧 CC: {', '.join(cc_list) if cc_list else 'ninguno'}")
-        print(f"   📱 WhatsApp: {whatsapp or 'ninguno'}")
-        print(f"   📋 Serial: {serial}")
-        print(f"   📝 Subject: {subject}")
-        
-        response = requests.post(
-            N8N_WEBHOOK_URL,
-            json=payload,
-            timeout=15,
-            headers={"Content-Type": "application/json"}
+        log.debug(
+            "📤 Enviando a n8n: to=%s cc=%s whatsapp=%s subject=%s",
+            email, ', '.join(cc_list) or 'ninguno', whatsapp or 'ninguno', subject
         )
         
+        from app.metricas import span
+        with span('n8n', tipo_notificacion):
+            response = requests.post(
+                N8N_WEBHOOK_URL,
+                json=payload,
+                timeout=15,
+                headers={"Content-Type": "application/json"}
+            )
+        
         if response.status_code in [200, 201]:
-            print(f"✅ Email enviado via n8n: {serial} ({tipo_notificacion})")
+            log.info("✅ Email enviado via n8n: %s (%s)", serial, tipo_notificacion)
             return True
         else:
-            print(f"❌ Error en n8n ({response.status_code}): {response.text}")
+            log.error("❌ Error en n8n (%s): %s", response.status_code, response.text[:500])
             return False
             
     except requests.exceptions.Timeout:
-        print(f"⏱️ Timeout enviando a n8n: {serial}")
+        log.error("⏱️ Timeout enviando a n8n: %s", serial)
         return False
     except requests.exceptions.ConnectionError:
-        print(f"🔌 Error de conexión con n8n: {N8N_WEBHOOK_URL}")
+        log.error("🔌 Error de conexión con n8n: %s", N8N_WEBHOOK_URL)
         return False
     except Exception as e:
-        print(f"❌ Error inesperado: {e}")
+        log.exception("❌ Error inesperado enviando a n8n: %s", e)
         return False
 
 
@@ -0,0 +1,505 @@
+"""
+Sesiones de Edición de PDF con Guardado Incremental
+IncaNeurobaeza - 2024
+
+Cada caso en edición tiene una copia de trabajo:
+- El PDF se descarga de Drive UNA sola vez al abrir la sesión
+- Cada operación se guarda con guardado incremental de PyMuPDF
+  (solo se agrega una revisión al final del archivo)
+- El journal guarda el tamaño previo de cada revisión, así que
+  "deshacer" es truncar el archivo (sin volver a descargar)
+- Drive solo se actualiza cuando el validador finaliza
+
+Varias instancias del portal: el journal y la copia de trabajo viven en el
+estado compartido (app.estado_compartido: Redis o, en una sola máquina,
+ESTADO_LOCAL_DIR) y el candado del serial excluye a todas las instancias.
+Se guarda en capas: el PDF completo al abrir y, por cada edición
+incremental, solo los bytes que agregó (deshacer borra la última capa).
+EDICION_DIR es solo un cache local de la copia: si otra instancia editó
+después (journal con otra versión), se vuelve a traer antes de operar. No
+hace falta enrutar al validador siempre a la misma instancia.
+"""
+
+import os
+import json
+import time
+import base64
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+
+import requests
+
+from app.estado_compartido import obtener_backend
+from app.metricas import span
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+# Cache local de las copias de trabajo (una subcarpeta por serial)
+EDICION_DIR = Path(os.environ.get(
+    "PDF_EDICION_DIR",
+    os.path.join(tempfile.gettempdir(), "incaneurobaeza_edicion")
+))
+
+# Sesiones sin actividad por más de este tiempo se suben automáticamente
+EDICION_TTL_HORAS = float(os.environ.get("PDF_EDICION_TTL_HORAS", "12"))
+
+# Claves en el estado compartido; expiran un día después de que el job las habría subido
+CLAVE_SESIONES = "edicion_pdf:sesiones"
+EXPIRACION_S = (EDICION_TTL_HORAS + 24) * 3600
+
+# Candado del serial: cubre descargas y la subida final a Drive
+CANDADO_TTL_S = 300
+CANDADO_ESPERA_S = 30
+
+
+def _md5_archivo(path) -> str:
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(bloque)
+    return md5.hexdigest()
+
+
+def descargar_pdf_drive(file_id: str, destino) -> Path:
+    """Descarga un PDF de Drive a un archivo local"""
+    download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
+    log.debug("📥 Descargando PDF desde: %s", download_url)
+
+    response = requests.get(download_url, timeout=60)
+    if response.status_code != 200:
+        raise Exception(f"Error descargando PDF (HTTP {response.status_code})")
+
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    with open(destino, 'wb') as f:
+        f.write(response.content)
+
+    return destino
+
+
+class SesionEdicionPDF:
+    """Copia de trabajo + journal de ediciones de un caso (en el estado compartido)"""
+
+    def __init__(self, serial: str):
+        self.serial = serial
+        self.clave = f"edicion_pdf:{serial}"
+        self.dir = EDICION_DIR / serial
+        self.pdf_path = self.dir / "trabajo.pdf"
+        self.version_path = self.dir / "version"
+
+    @property
+    def lock(self):
+        """Candado del serial entre instancias (with sesion.lock: ...)"""
+        return self._candado()
+
+    @contextmanager
+    def _candado(self):
+        with obtener_backend().candado(self.clave, ttl=CANDADO_TTL_S, espera=CANDADO_ESPERA_S) as obtenido:
+            if not obtenido:
+                raise TimeoutError(f"La sesión de edición de {self.serial} está ocupada")
+            yield
+
+    # ==================== ESTADO ====================
+
+    def existe(self) -> bool:
+        return obtener_backend().obtener(self.clave) is not None
+
+    def _leer_journal(self) -> dict:
+        valor = obtener_backend().obtener(self.clave)
+        if valor is None:
+            raise FileNotFoundError(f"No hay sesión de edición para {self.serial}")
+        return json.loads(valor)
+
+    def _indice(self, quitar: bool = False):
+        """Índice de sesiones activas en todas las instancias (lo recorre finalizar_sesiones_vencidas)"""
+        backend = obtener_backend()
+        with backend.candado(CLAVE_SESIONES, espera=5) as obtenido:
+            if not obtenido:
+                # Sin el candado se podría pisar la entrada de otro serial
+                raise TimeoutError("El índice de sesiones de edición está ocupado")
+            sesiones = json.loads(backend.obtener(CLAVE_SESIONES) or "{}")
+            if quitar:
+                if sesiones.pop(self.serial, None) is None:
+                    return
+            else:
+                sesiones[self.serial] = time.time()
+            backend.guardar(CLAVE_SESIONES, json.dumps(sesiones))
+
+    def _guardar_blob(self, nombre: str, contenido: bytes):
+        obtener_backend().guardar(f"{self.clave}:{nombre}", base64.b64encode(contenido).decode(), ttl=EXPIRACION_S)
+
+    def _leer_blob(self, nombre: str) -> bytes:
+        valor = obtener_backend().obtener(f"{self.clave}:{nombre}")
+        if valor is None:
+            raise FileNotFoundError(f"Falta {nombre} de la sesión de edición de {self.serial}")
+        return base64.b64decode(valor)
+
+    def _guardar_capa(self, journal: dict, desde: int = None):
+        """
+        Sube lo nuevo de la copia local: con `desde` solo los bytes que agregó
+        el guardado incremental, sin él el archivo completo (que reemplaza a
+        las capas anteriores)
+        """
+        nombre = f"v{journal.get('version', 0) + 1}" + (".pdf" if desde is None else ".delta")
+        with open(self.pdf_path, 'rb') as f:
+            f.seek(desde or 0)
+            self._guardar_blob(nombre, f.read())
+        if desde is None:
+            journal['capas'] = [nombre]
+        else:
+            journal['capas'].append(nombre)
+
+    def _reconstruir(self, capas: list):
+        """Copia local = archivo completo + revisiones incrementales, en orden"""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        temporal = self.pdf_path.with_suffix(".descarga")
+        with open(temporal, 'wb') as f:
+            for nombre in capas:
+                f.write(self._leer_blob(nombre))
+        os.replace(temporal, self.pdf_path)
+
+    def _publicar(self, journal: dict):
+        """Publica el journal como versión actual (con el candado tomado, después de _guardar_capa)"""
+        self._indice()
+        journal['version'] = journal.get('version', 0) + 1
+        journal['md5_actual'] = _md5_archivo(self.pdf_path)
+        journal['actualizado'] = datetime.now().isoformat()
+        obtener_backend().guardar(self.clave, json.dumps(journal), ttl=EXPIRACION_S)
+        self.version_path.write_text(str(journal['version']))
+
+    def _sincronizar(self, para_editar: bool = False) -> dict:
+        """
+        Reconstruye la copia local si falta o es de otra versión (la editó otra
+        instancia). para_editar: la copia va a cambiar; si la edición falla a
+        medias, la próxima vez se reconstruye en vez de usarla
+        """
+        journal = self._leer_journal()
+        local = self.version_path.read_text() if self.version_path.exists() else None
+        if local != str(journal['version']) or not self.pdf_path.exists():
+            self._reconstruir(journal['capas'])
+            self.version_path.write_text(str(journal['version']))
+        if para_editar:
+            self.version_path.unlink()
+        return journal
+
+    def estado(self) -> dict:
+        """Resumen de la sesión para el portal"""
+        if not self.existe():
+            return {"activa": False, "serial": self.serial}
+
+        journal = self._leer_journal()
+        return {
+            "activa": True,
+            "serial": self.serial,
+            "file_id": journal['file_id'],
+            "creado": journal['creado'],
+            "actualizado": journal.get('actualizado'),
+            "total_ediciones": len(journal['revisiones']),
+            "pendiente_subida": self._tiene_cambios(journal),
+            "ediciones": [r['descripcion'] for r in journal['revisiones']]
+        }
+
+    def _tiene_cambios(self, journal: dict) -> bool:
+        return bool(journal['revisiones']) and journal.get('md5_actual') != journal['md5_original']
+
+    # ==================== CICLO DE VIDA ====================
+
+    def abrir(self, file_id: str) -> dict:
+        """Crea la copia de trabajo (descarga de Drive solo si la sesión no existe)"""
+        if self.existe():
+            journal = self._leer_journal()
+            if journal['file_id'] == file_id:
+                return self._sincronizar()
+            # El caso apunta a otro archivo: la sesión vieja ya no aplica
+            log.warning("⚠️ Sesión de %s apuntaba a otro archivo, descartando...", self.serial)
+            self.descartar()
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        descargar_pdf_drive(file_id, self.pdf_path)
+
+        journal = {
+            "serial": self.serial,
+            "file_id": file_id,
+            "creado": datetime.now().isoformat(),
+            "md5_original": _md5_archivo(self.pdf_path),
+            "revisiones": [],
+            "capas": []
+        }
+        self._guardar_capa(journal)
+        self._publicar(journal)
+        log.info("📝 Sesión de edición abierta para %s", self.serial)
+        return journal
+
+    def abrir_desde_archivo(self, file_id: str, origen) -> dict:
+        """Usa un PDF ya editado (subido por el portal) como nueva revisión"""
+        # None = no hay versión previa, deshacer descarta la sesión
+        capas_previas = None
+
+        if not self.existe():
+            self.dir.mkdir(parents=True, exist_ok=True)
+            journal = {
+                "serial": self.serial,
+                "file_id": file_id,
+                "creado": datetime.now().isoformat(),
+                # Sin original descargado: cualquier contenido cuenta como cambio
+                "md5_original": None,
+                "revisiones": [],
+                "capas": []
+            }
+        else:
+            journal = self._sincronizar(para_editar=True)
+            capas_previas = list(journal['capas'])
+
+        shutil.copyfile(origen, self.pdf_path)
+        self._guardar_capa(journal)
+
+        journal['revisiones'].append({
+            "descripcion": "PDF reemplazado desde el portal",
+            "capas_previas": capas_previas,
+            "fecha": datetime.now().isoformat()
+        })
+        self._publicar(journal)
+        return journal
+
+    @span('pdf', 'editar')
+    def aplicar(self, operaciones: dict) -> list:
+        """
+        Aplica operaciones sobre la copia local y guarda incrementalmente
+
+        Operaciones soportadas:
+        - rotate: [{page_num, angle}]
+        - reorder: {new_order: [1, 0, 2, ...]}
+        - delete_page: {pages: [0, 2, 5]}
+        - crop_custom: [{page_num, x, y, width, height}]
+        - annotate: [{page_num, type, coords, text, color}]
+        - enhance_quality: {pages: [...]} (requiere procesamiento avanzado)
+        """
+        import fitz  # PyMuPDF
+
+        inicio = time.perf_counter()
+        journal = self._sincronizar(para_editar=True)
+        tamano_previo = self.pdf_path.stat().st_size
+        descripciones = []
+
+        doc = fitz.open(str(self.pdf_path))
+        try:
+            for op_type, op_data in operaciones.items():
+                log.debug("🔧 Procesando: %s", op_type)
+
+                if op_type == 'rotate':
+                    for item in op_data:
+                        doc[item['page_num']].set_rotation(item['angle'])
+                        descripciones.append(f"Página {item['page_num']} rotada {item['angle']}°")
+
+                elif op_type == 'reorder':
+                    doc.select(op_data['new_order'])
+                    descripciones.append(f"Páginas reordenadas {op_data['new_order']}")
+
+                elif op_type == 'delete_page':
+                    for page_num in sorted(op_data['pages'], reverse=True):
+                        doc.delete_page(page_num)
+                        descripciones.append(f"Página {page_num} eliminada")
+
+                elif op_type == 'crop_custom':
+                    for item in op_data:
+                        rect = fitz.Rect(
+                            item['x'], item['y'],
+                            item['x'] + item['width'], item['y'] + item['height']
+                        )
+                        doc[item['page_num']].set_cropbox(rect)
+                        descripciones.append(f"Página {item['page_num']} recortada")
+
+                elif op_type == 'annotate':
+                    for item in op_data:
+                        self._anotar(doc[item['page_num']], item)
+                        descripciones.append(f"Anotación {item['type']} en página {item['page_num']}")
+
+                elif op_type == 'enhance_quality':
+                    log.info("✨ Mejora de calidad solicitada (requiere procesamiento avanzado)")
+
+            if not descripciones:
+                return []
+
+            entrada = {
+                "descripcion": "; ".join(descripciones),
+                "fecha": datetime.now().isoformat()
+            }
+
+            if doc.can_save_incrementally():
+                # ✅ Solo se agrega la revisión al final del archivo
+                doc.save(str(self.pdf_path), incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+                entrada["tamano_previo"] = tamano_previo
+            else:
+                # Fallback: guardar completo; deshacer vuelve a las capas anteriores
+                tmp = self.dir / "trabajo.tmp.pdf"
+                doc.save(str(tmp))
+                doc.close()
+                doc = None
+                os.replace(tmp, self.pdf_path)
+                entrada["capas_previas"] = list(journal['capas'])
+        finally:
+            if doc is not None:
+                doc.close()
+
+        # Al estado compartido solo va la revisión agregada (o el archivo completo en el fallback)
+        self._guardar_capa(journal, entrada.get("tamano_previo"))
+        journal['revisiones'].append(entrada)
+        self._publicar(journal)
+
+        log.info("💾 %s: %s (%.1f ms)", self.serial, entrada['descripcion'], (time.perf_counter() - inicio) * 1000)
+        return descripciones
+
+    def _anotar(self, page, item):
+        import fitz
+
+        coords = tuple(item['coords'])
+        color = tuple(item.get('color', [1, 0, 0]))
+        tipo = item['type']
+
+        if tipo == 'highlight':
+            annot = page.add_highlight_annot(fitz.Rect(coords))
+        elif tipo == 'text':
+            annot = page.add_text_annot(fitz.Point(coords[0], coords[1]), item.get('text', ''))
+        elif tipo == 'rectangle':
+            annot = page.add_rect_annot(fitz.Rect(coords))
+            annot.set_border(width=2)
+        elif tipo == 'arrow':
+            annot = page.add_line_annot(fitz.Point(coords[0], coords[1]), fitz.Point(coords[2], coords[3]))
+            annot.set_border(width=2)
+            annot.set_line_ends(fitz.PDF_ANNOT_LE_NONE, fitz.PDF_ANNOT_LE_CLOSED_ARROW)
+        else:
+            raise ValueError(f"Tipo de anotación no soportado: {tipo}")
+
+        annot.set_colors(stroke=color)
+        annot.update()
+
+    def deshacer(self) -> str:
+        """Revierte la última edición sin volver a descargar de Drive"""
+        journal = self._sincronizar(para_editar=True)
+        if not journal['revisiones']:
+            return None
+
+        entrada = journal['revisiones'].pop()
+
+        if entrada.get('capas_previas', []) is None:
+            self.descartar()
+            log.info("↩️ %s: deshecho '%s' (sesión descartada)", self.serial, entrada['descripcion'])
+            return entrada['descripcion']
+
+        if 'tamano_previo' in entrada:
+            # Quitar la revisión incremental = truncar al tamaño previo
+            with open(self.pdf_path, 'r+b') as f:
+                f.truncate(entrada['tamano_previo'])
+            obtener_backend().borrar(f"{self.clave}:{journal['capas'].pop()}")
+        else:
+            for nombre in set(journal['capas']) - set(entrada['capas_previas']):
+                obtener_backend().borrar(f"{self.clave}:{nombre}")
+            journal['capas'] = entrada['capas_previas']
+            self._reconstruir(journal['capas'])
+
+        self._publicar(journal)
+        log.info("↩️ %s: deshecho '%s'", self.serial, entrada['descripcion'])
+        return entrada['descripcion']
+
+    def finalizar(self, drive_manager) -> dict:
+        """
+        Compacta la copia de trabajo y la sube a Drive (una sola vez)
+        Si el contenido no cambió respecto al original, no sube nada
+        """
+        import fitz
+
+        journal = self._sincronizar()
+
+        if not self._tiene_cambios(journal):
+            log.info("ℹ️ %s: sin cambios, no se sube a Drive", self.serial)
+            self.descartar()
+            return {"subido": False, "file_id": journal['file_id']}
+
+        final_path = self.dir / "final.pdf"
+        doc = fitz.open(str(self.pdf_path))
+        try:
+            doc.save(str(final_path), garbage=4, deflate=True)
+        finally:
+            doc.close()
+
+        updated_file = drive_manager.update_file_content(journal['file_id'], final_path)
+        self.descartar()
+
+        return {
+            "subido": True,
+            "file_id": journal['file_id'],
+            "link": updated_file.get('webViewLink'),
+            "total_ediciones": len(journal['revisiones'])
+        }
+
+    def descartar(self):
+        """Elimina el journal, la copia de trabajo compartida y el cache local"""
+        backend = obtener_backend()
+        valor = backend.obtener(self.clave)
+        if valor is not None:
+            journal = json.loads(valor)
+            capas = set(journal['capas'])
+            for entrada in journal['revisiones']:
+                capas.update(entrada.get('capas_previas') or [])
+            for nombre in capas:
+                backend.borrar(f"{self.clave}:{nombre}")
+        backend.borrar(self.clave)
+        self._indice(quitar=True)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+# ==================== UTILIDADES ====================
+
+def obtener_pdf_local(serial: str):
+    """Retorna la copia de trabajo (al día con las otras instancias) si el caso tiene una sesión activa"""
+    sesion = SesionEdicionPDF(serial)
+    if not sesion.existe():
+        return None
+    with sesion.lock:
+        sesion._sincronizar()
+    return sesion.pdf_path
+
+
+def finalizar_sesion_si_existe(serial: str, drive_manager=None) -> dict:
+    """Sube las ediciones pendientes de un caso (se llama al validar)"""
+    sesion = SesionEdicionPDF(serial)
+    if not sesion.existe():
+        return None
+
+    if drive_manager is None:
+        from app.drive_manager import DriveFileManager
+        drive_manager = DriveFileManager()
+
+    with sesion.lock:
+        if not sesion.existe():
+            return None
+        return sesion.finalizar(drive_manager)
+
+
+def finalizar_sesiones_vencidas():
+    """Sube sesiones abandonadas (sin actividad por más de EDICION_TTL_HORAS), de cualquier instancia"""
+    sesiones = json.loads(obtener_backend().obtener(CLAVE_SESIONES) or "{}")
+    limite = time.time() - EDICION_TTL_HORAS * 3600
+    finalizadas = 0
+
+    for serial, actualizado in sesiones.items():
+        if actualizado > limite:
+            continue
+
+        try:
+            resultado = finalizar_sesion_si_existe(serial)
+            if resultado:
+                finalizadas += 1
+                log.info("⏰ Sesión vencida de %s finalizada (subido: %s)", serial, resultado['subido'])
+            else:
+                # El journal expiró o ya se finalizó: solo queda la entrada del índice
+                SesionEdicionPDF(serial).descartar()
+        except Exception as e:
+            log.warning("⚠️ Error finalizando sesión vencida %s: %s", serial, e)
+
+    return finalizadas
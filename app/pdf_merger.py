@@ -1,13 +1,18 @@
 import tempfile
-import shutil
+import hashlib
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Tuple, Dict, Optional, Set
 from fastapi import UploadFile
-import fitz  # PyMuPDF
-from PIL import Image
 import io
 
-async def merge_pdfs_from_uploads(archivos: List[UploadFile], cedula: str, tipo: str) -> Tuple[Path, List[str]]:
+# PyMuPDF y PIL se importan al procesar el primer archivo (arranque más rápido)
+
+from app.metricas import span
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+def merge_pdfs_from_uploads(archivos: List[UploadFile], cedula: str, tipo: str) -> Tuple[Path, List[str]]:
     """
     Combina múltiples archivos (PDF, imágenes) en un solo PDF SIN portada
     
@@ -19,12 +24,53 @@ async def merge_pdfs_from_uploads(archivos: List[UploadFile], cedula: str, tipo:
     Returns:
         Tuple con la ruta del PDF final y lista de nombres originales
     """
+    pdf_final_path, original_filenames, _ = merge_pdfs_con_huellas(archivos, cedula, tipo)
+    return pdf_final_path, original_filenames
+
+
+def _copiar_con_hash(origen, destino) -> Tuple[str, int]:
+    """Copia el archivo subido calculando su SHA-256 en la misma pasada"""
+    sha = hashlib.sha256()
+    tamano = 0
+    for bloque in iter(lambda: origen.read(1024 * 1024), b''):
+        sha.update(bloque)
+        destino.write(bloque)
+        tamano += len(bloque)
+    return sha.hexdigest(), tamano
+
+
+@span('pdf', 'merge')
+def merge_pdfs_con_huellas(archivos: List[UploadFile], cedula: str, tipo: str,
+                           ya_recibidos: Optional[Set[str]] = None,
+                           pdf_base: Optional[bytes] = None) -> Tuple[Path, List[str], List[Dict]]:
+    """
+    Igual que merge_pdfs_from_uploads, pero además calcula la huella
+    (SHA-256) de cada archivo y el rango de páginas que ocupa en el PDF final
+    
+    - Si el mismo archivo viene dos veces en el envío, solo se incluye una vez
+    - Los archivos cuya huella está en ya_recibidos (el caso ya los tiene) no
+      se incluyen
+    
+    Args:
+        ya_recibidos: SHA-256 de los archivos que el caso ya recibió
+        pdf_base: PDF al que se agregan los archivos (sus páginas van primero)
+    
+    Returns:
+        Tuple con la ruta del PDF final, nombres originales y huellas:
+        [{sha256, nombre, tamano_bytes, pagina_inicio, pagina_fin, duplicado, ya_recibido}]
+        (páginas 0-indexadas; None si el archivo se omitió)
+    """
     if not archivos:
         raise ValueError("No se proporcionaron archivos")
     
+    import fitz  # PyMuPDF
+    
     # Crear PDF de salida
-    pdf_output = fitz.open()
+    pdf_output = fitz.open(stream=pdf_base, filetype="pdf") if pdf_base else fitz.open()
+    ya_recibidos = ya_recibidos or set()
     original_filenames = []
+    huellas = []
+    hashes_vistos = set()
     temp_files = []
     
     try:
@@ -34,15 +80,37 @@ async def merge_pdfs_from_uploads(archivos: List[UploadFile], cedula: str, tipo:
                 
             original_filenames.append(archivo.filename)
             
-            # Guardar archivo temporalmente
+            # Guardar archivo temporalmente (calculando la huella)
             with tempfile.NamedTemporaryFile(delete=False, suffix=Path(archivo.filename).suffix) as tmp:
-                shutil.copyfileobj(archivo.file, tmp)
+                sha256, tamano = _copiar_con_hash(archivo.file, tmp)
                 temp_path = Path(tmp.name)
                 temp_files.append(temp_path)
             
             # Resetear el archivo para próxima lectura si es necesario
             archivo.file.seek(0)
             
+            huella = {
+                'sha256': sha256,
+                'nombre': archivo.filename,
+                'tamano_bytes': tamano,
+                'pagina_inicio': None,
+                'pagina_fin': None,
+                'duplicado': sha256 in hashes_vistos,
+                'ya_recibido': sha256 in ya_recibidos
+            }
+            huellas.append(huella)
+            
+            if huella['duplicado']:
+                log.info("♻️ Archivo repetido en el mismo envío, se omite: %s", archivo.filename)
+                continue
+            if huella['ya_recibido']:
+                hashes_vistos.add(sha256)
+                log.info("♻️ Archivo ya recibido en el caso, se omite: %s", archivo.filename)
+                continue
+            hashes_vistos.add(sha256)
+            
+            paginas_antes = pdf_output.page_count
+            
             # Procesar según el tipo de archivo
             file_extension = Path(archivo.filename).suffix.lower()
             
@@ -70,6 +138,10 @@ async def merge_pdfs_from_uploads(archivos: List[UploadFile], cedula: str, tipo:
                 page = pdf_output.new_page()
                 text = f"Archivo adjunto:\n{archivo.filename}\n\nTipo: {file_extension}\nNota: Archivo no soportado para vista previa."
                 page.insert_text((50, 50), text, fontsize=12)
+            
+            if pdf_output.page_count > paginas_antes:
+                huella['pagina_inicio'] = paginas_antes
+                huella['pagina_fin'] = pdf_output.page_count - 1
     
     except Exception as e:
         # Limpiar archivos temporales en caso de error
@@ -84,15 +156,21 @@ async def merge_pdfs_from_uploads(archivos: List[UploadFile], cedula: str, tipo:
             temp_file.unlink(missing_ok=True)
     
     # Guardar PDF final (SIN portada)
-    pdf_final_path = Path(tempfile.mktemp(suffix=f'_{cedula}_{tipo}.pdf'))
+    # NamedTemporaryFile y no mktemp: el nombre queda reservado, sin carrera entre requests
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f'_{cedula}_{tipo}.pdf') as tmp:
+        pdf_final_path = Path(tmp.name)
     pdf_output.save(pdf_final_path)
     pdf_output.close()
     
-    return pdf_final_path, original_filenames
+    return pdf_final_path, original_filenames, huellas
 
 
-def convert_image_to_pdf(image_path: Path) -> fitz.Document:
+@span('pdf', 'imagen_a_pdf')
+def convert_image_to_pdf(image_path: Path) -> "fitz.Document":
     """Convierte una imagen a PDF usando PyMuPDF"""
+    import fitz  # PyMuPDF
+    from PIL import Image
+    
     try:
         # Abrir imagen con PIL para mejor manejo
         with Image.open(image_path) as img:
@@ -110,5 +188,5 @@ def convert_image_to_pdf(image_path: Path) -> fitz.Document:
             return pdf_doc
             
     except Exception as e:
-        print(f"Error convirtiendo imagen {image_path}: {e}")
+        log.warning("⚠️ Error convirtiendo imagen %s: %s", image_path, e)
         return None
\ No newline at end of file
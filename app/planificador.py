@@ -0,0 +1,471 @@
+"""
+Planificador Distribuido (un solo líder por despliegue)
+IncaNeurobaeza - 2024
+
+Con uvicorn --workers N o varias instancias, cada proceso arrancaba sus
+BackgroundScheduler: la sync del Excel corría N veces por minuto y los
+recordatorios de las 9 AM salían duplicados. Ahora:
+
+- Elección de líder: el proceso que obtiene el candado de líder es el único
+  que arranca el scheduler. Los demás reintentan cada LIDER_REINTENTO_SEGUNDOS
+  y toman el relevo si el líder muere (el candado se libera con su conexión
+  o su proceso)
+    · PostgreSQL: pg_try_advisory_lock en una conexión dedicada
+    · SQLite: flock sobre un archivo en PLANIFICADOR_LOCK_DIR (misma máquina)
+- Candado por job durante cada ejecución: durante un relevo nunca corren dos
+  copias del mismo job
+- Job store persistente (tabla apscheduler_jobs): el próximo disparo
+  sobrevive a reinicios y a cambios de líder
+- Misfires: coalesce + max_instances=1 + misfire_grace_time; los jobs
+  diarios guardan su última fecha en sync_state para correr una vez por día
+
+PLANIFICADOR_HABILITADO=false deja un proceso fuera de la elección (ej. un
+worker dedicado solo a la API).
+"""
+
+import os
+import time
+import zlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+PLANIFICADOR_HABILITADO = os.environ.get("PLANIFICADOR_HABILITADO", "true").lower() == "true"
+LIDER_REINTENTO_SEGUNDOS = int(os.environ.get("LIDER_REINTENTO_SEGUNDOS", "15"))
+MISFIRE_GRACIA_SEGUNDOS = int(os.environ.get("PLANIFICADOR_MISFIRE_SEGUNDOS", "300"))
+LOCK_DIR = Path(os.environ.get(
+    "PLANIFICADOR_LOCK_DIR",
+    os.path.join(tempfile.gettempdir(), "incapacidades_locks")
+))
+
+CLAVE_LIDER = "planificador:lider"
+
+_ID_PROCESO = f"{os.uname().nodename if hasattr(os, 'uname') else 'local'}:{os.getpid()}"
+
+
+def _clave_numerica(nombre: str) -> int:
+    """Clave estable de 63 bits para pg_advisory_lock"""
+    return zlib.crc32(nombre.encode()) | (zlib.crc32(nombre[::-1].encode()) << 31)
+
+
+# ==================== CANDADOS ====================
+
+class _CandadoPostgres:
+    """pg_try_advisory_lock en una conexión propia: se libera al cerrarla o si el proceso muere"""
+
+    def __init__(self, engine, nombre: str):
+        self.engine = engine
+        self.clave = _clave_numerica(nombre)
+        self._conexion = None
+
+    def intentar(self, esperar: bool = False) -> bool:
+        from sqlalchemy import text
+        if self._conexion is not None:
+            return True
+        conexion = self.engine.connect()
+        try:
+            if esperar:
+                conexion.execute(text("SELECT pg_advisory_lock(:clave)"), {"clave": self.clave})
+                obtenido = True
+            else:
+                obtenido = conexion.execute(
+                    text("SELECT pg_try_advisory_lock(:clave)"), {"clave": self.clave}
+                ).scalar()
+            conexion.commit()
+        except Exception:
+            conexion.close()
+            raise
+        if obtenido:
+            self._conexion = conexion
+            return True
+        conexion.close()
+        return False
+
+    def vigente(self) -> bool:
+        from sqlalchemy import text
+        if self._conexion is None:
+            return False
+        try:
+            self._conexion.execute(text("SELECT 1")).scalar()
+            self._conexion.commit()
+            return True
+        except Exception:
+            self._descartar()
+            return False
+
+    def liberar(self):
+        from sqlalchemy import text
+        if self._conexion is None:
+            return
+        try:
+            self._conexion.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": self.clave})
+            self._conexion.commit()
+        except Exception:
+            pass
+        self._descartar()
+
+    def _descartar(self):
+        try:
+            self._conexion.close()
+        except Exception:
+            pass
+        self._conexion = None
+
+
+class _CandadoArchivo:
+    """flock exclusivo (no bloqueante salvo esperar=True): lo libera el sistema operativo si el proceso muere"""
+
+    def __init__(self, nombre: str):
+        LOCK_DIR.mkdir(parents=True, exist_ok=True)
+        self.ruta = LOCK_DIR / (nombre.replace(":", "_").replace("/", "_") + ".lock")
+        self._archivo = None
+
+    def intentar(self, esperar: bool = False) -> bool:
+        import fcntl
+        if self._archivo is not None:
+            return True
+        archivo = open(self.ruta, "a+")
+        try:
+            fcntl.flock(archivo.fileno(), fcntl.LOCK_EX if esperar else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            archivo.close()
+            return False
+        archivo.seek(0)
+        archivo.truncate()
+        archivo.write(_ID_PROCESO)
+        archivo.flush()
+        self._archivo = archivo
+        return True
+
+    def vigente(self) -> bool:
+        return self._archivo is not None
+
+    def liberar(self):
+        import fcntl
+        if self._archivo is None:
+            return
+        try:
+            fcntl.flock(self._archivo.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._archivo.close()
+            self._archivo = None
+
+
+def crear_candado(nombre: str):
+    """Candado distribuido según el motor de la BD"""
+    from app.database import engine
+    if engine.dialect.name == "postgresql":
+        return _CandadoPostgres(engine, nombre)
+    return _CandadoArchivo(nombre)
+
+
+@contextmanager
+def candado_exclusivo(nombre: str, esperar: bool = False):
+    """
+    Sección exclusiva entre todos los procesos del despliegue. Con
+    esperar=False entrega False si otro proceso la tiene; con esperar=True
+    bloquea hasta obtenerla (ej. init_db con varios workers arrancando)
+    """
+    candado = crear_candado(nombre)
+    obtenido = candado.intentar(esperar=esperar)
+    try:
+        yield obtenido
+    finally:
+        if obtenido:
+            candado.liberar()
+
+
+def candado_job(job_id: str):
+    """Candado mientras corre un job (lo comparten el líder y los disparos manuales)"""
+    return candado_exclusivo(f"job:{job_id}")
+
+
+# ==================== EJECUCIÓN DE JOBS ====================
+
+# job_id → {'ref', 'trigger', 'trigger_args', 'nombre', 'una_vez_por_dia'}
+_definiciones: Dict[str, dict] = {}
+
+_stats = {
+    'ejecutados': 0,
+    'omitidos_candado': 0,
+    'omitidos_no_lider': 0,
+    'omitidos_ya_ejecutado': 0,
+    'errores': 0,
+    'ultimo_error': None,
+}
+
+
+# Opciones de APScheduler que registrar() acepta junto a las del trigger
+_OPCIONES_JOB = {
+    'coalesce': True,
+    'max_instances': 1,
+    'misfire_grace_time': MISFIRE_GRACIA_SEGUNDOS,
+}
+
+
+def _crear_trigger(definicion: dict, zona):
+    from apscheduler.triggers.cron import CronTrigger
+    from apscheduler.triggers.date import DateTrigger
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    clases = {'cron': CronTrigger, 'interval': IntervalTrigger, 'date': DateTrigger}
+    argumentos = {k: v for k, v in definicion['trigger_args'].items() if k not in _OPCIONES_JOB}
+    argumentos.setdefault('timezone', zona)
+    return clases[definicion['trigger']](**argumentos)
+
+
+def _resolver(ref: str) -> Callable:
+    from apscheduler.util import ref_to_obj
+    return ref_to_obj(ref)
+
+
+def ejecutar_job(job_id: str, ref: str, una_vez_por_dia: bool = False, forzar: bool = False):
+    """
+    Punto de entrada de todos los jobs (es lo que guarda el job store):
+    - Solo el líder ejecuta (salvo forzar=True, ej. endpoint manual)
+    - Candado del job: nunca dos copias a la vez entre procesos
+    - una_vez_por_dia: no repite si ya corrió hoy (misfire + relevo de líder)
+    """
+    if not forzar and not planificador.es_lider:
+        _stats['omitidos_no_lider'] += 1
+        return None
+
+    with candado_job(job_id) as obtenido:
+        if not obtenido:
+            _stats['omitidos_candado'] += 1
+            log.info("⏭️ Job %s ya corre en otro proceso, omitido", job_id)
+            return None
+
+        clave_dia = f"job:{job_id}:ultima_fecha"
+        hoy = datetime.now().date().isoformat()
+        if una_vez_por_dia and not forzar and _leer_estado(clave_dia) == hoy:
+            _stats['omitidos_ya_ejecutado'] += 1
+            log.info("⏭️ Job %s ya se ejecutó hoy, omitido", job_id)
+            return None
+
+        from app.logs import contexto_log
+        inicio = time.perf_counter()
+        try:
+            with contexto_log(job=job_id):
+                resultado = _resolver(ref)()
+            if una_vez_por_dia:
+                _guardar_estado(clave_dia, hoy)
+            _stats['ejecutados'] += 1
+            log.debug("✅ Job %s en %.0f ms", job_id, (time.perf_counter() - inicio) * 1000)
+            return resultado
+        except Exception as e:
+            _stats['errores'] += 1
+            _stats['ultimo_error'] = f"{job_id}: {e}"
+            log.exception("❌ Error en job %s: %s", job_id, e)
+            return None
+
+
+def _leer_estado(clave: str) -> Optional[str]:
+    from app.database import SessionLocal, SyncState
+    db = SessionLocal()
+    try:
+        fila = db.get(SyncState, clave)
+        return fila.valor if fila else None
+    finally:
+        db.close()
+
+
+def _guardar_estado(clave: str, valor: str):
+    from app.database import SessionLocal, SyncState
+    db = SessionLocal()
+    try:
+        fila = db.get(SyncState, clave)
+        if not fila:
+            fila = SyncState(clave=clave)
+            db.add(fila)
+        fila.valor = valor
+        fila.updated_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+# ==================== PLANIFICADOR ====================
+
+class Planificador:
+    """
+    Un BackgroundScheduler por despliegue. Expone running/shutdown() como
+    el BackgroundScheduler que reemplaza (main.py lo usa igual).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._candado = None
+        self._scheduler = None
+        self._hilo = None
+        self._detener = threading.Event()
+        self.es_lider = False
+        self.lider_desde = None
+
+    # ---------- registro ----------
+
+    def registrar(self, job_id: str, funcion: Callable, trigger: str, nombre: str = None,
+                  una_vez_por_dia: bool = False, **trigger_args):
+        """Declara un job (la función debe ser de módulo: se guarda por referencia)"""
+        from apscheduler.util import obj_to_ref
+        _definiciones[job_id] = {
+            'ref': obj_to_ref(funcion),
+            'trigger': trigger,
+            'trigger_args': trigger_args,
+            'nombre': nombre or job_id,
+            'una_vez_por_dia': una_vez_por_dia,
+        }
+        with self._lock:
+            if self._scheduler is not None:
+                self._agregar(job_id, _definiciones[job_id])
+
+    def _agregar(self, job_id: str, definicion: dict):
+        """
+        Agrega el job al store o lo actualiza conservando su próximo disparo:
+        add_job(replace_existing=True) recalculaba next_run_time en cada
+        relevo de líder y los disparos vencidos se perdían. El trigger solo
+        se reprograma si su definición cambió.
+        """
+        opciones = {**_OPCIONES_JOB, **{k: v for k, v in definicion['trigger_args'].items() if k in _OPCIONES_JOB}}
+        trigger = _crear_trigger(definicion, self._scheduler.timezone)
+        args = [job_id, definicion['ref'], definicion['una_vez_por_dia']]
+
+        job = self._scheduler.get_job(job_id)
+        if job is None:
+            self._scheduler.add_job(ejecutar_job, trigger, args=args, id=job_id, name=definicion['nombre'], **opciones)
+            return
+
+        cambios = {clave: valor for clave, valor in opciones.items() if getattr(job, clave) != valor}
+        if job.name != definicion['nombre']:
+            cambios['name'] = definicion['nombre']
+        if list(job.args) != args:
+            cambios['args'] = args
+        if cambios:
+            job.modify(**cambios)
+        if str(job.trigger) != str(trigger):
+            log.info("🔁 Job %s reprogramado: %s → %s", job_id, job.trigger, trigger)
+            job.reschedule(trigger)
+
+    def ejecutar_ahora(self, job_id: str, forzar: bool = False):
+        """Corre un job registrado en este hilo (solo si somos líderes, salvo forzar)"""
+        definicion = _definiciones[job_id]
+        return ejecutar_job(job_id, definicion['ref'], definicion['una_vez_por_dia'], forzar=forzar)
+
+    # ---------- ciclo de vida ----------
+
+    def iniciar(self):
+        """Primera elección en este hilo y luego reintentos en segundo plano"""
+        if not PLANIFICADOR_HABILITADO:
+            log.info("ℹ️ Planificador deshabilitado en este proceso (PLANIFICADOR_HABILITADO=false)")
+            return self
+        with self._lock:
+            if self._hilo is not None:
+                return self
+            self._detener.clear()
+            self._candado = crear_candado(CLAVE_LIDER)
+            self._ciclo_eleccion()
+            self._hilo = threading.Thread(target=self._bucle, name="eleccion_lider", daemon=True)
+            self._hilo.start()
+        return self
+
+    def _bucle(self):
+        while not self._detener.wait(LIDER_REINTENTO_SEGUNDOS):
+            with self._lock:
+                self._ciclo_eleccion()
+
+    def _ciclo_eleccion(self):
+        try:
+            if self.es_lider:
+                if not self._candado.vigente():
+                    log.warning("⚠️ Se perdió el candado de líder, deteniendo jobs")
+                    self._dejar_de_liderar()
+            elif self._candado.intentar():
+                self._liderar()
+        except Exception as e:
+            log.warning("⚠️ Error en la elección de líder: %s", e)
+            if self.es_lider:
+                self._dejar_de_liderar()
+
+    def _liderar(self):
+        from apscheduler.schedulers.background import BackgroundScheduler
+        from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+        from app.database import engine
+
+        scheduler = BackgroundScheduler(
+            jobstores={'default': SQLAlchemyJobStore(engine=engine, tablename='apscheduler_jobs')},
+            job_defaults=dict(_OPCIONES_JOB)
+        )
+        # Arranca en pausa para sincronizar el job store con los jobs declarados
+        scheduler.start(paused=True)
+        self._scheduler = scheduler
+        for job in scheduler.get_jobs():
+            if job.id not in _definiciones:
+                scheduler.remove_job(job.id)
+        for job_id, definicion in _definiciones.items():
+            self._agregar(job_id, definicion)
+        # Líder antes de reanudar: los disparos vencidos corren al reanudar
+        # y ejecutar_job los omite si aún no somos líderes
+        self.es_lider = True
+        self.lider_desde = datetime.now().isoformat()
+        scheduler.resume()
+
+        log.info("👑 Este proceso (%s) es el líder del planificador: %s jobs", _ID_PROCESO, len(_definiciones))
+
+    def _dejar_de_liderar(self):
+        if self._scheduler is not None:
+            try:
+                self._scheduler.shutdown(wait=False)
+            except Exception:
+                pass
+            self._scheduler = None
+        if self._candado is not None:
+            self._candado.liberar()
+        self.es_lider = False
+        self.lider_desde = None
+
+    @property
+    def running(self) -> bool:
+        """Hay un scheduler corriendo en el despliegue (aquí o en otro proceso)"""
+        return self._hilo is not None and (not self.es_lider or bool(self._scheduler and self._scheduler.running))
+
+    def shutdown(self, wait: bool = True):
+        self._detener.set()
+        with self._lock:
+            if self.es_lider:
+                if self._scheduler is not None and wait:
+                    try:
+                        self._scheduler.shutdown(wait=True)
+                    except Exception:
+                        pass
+                    self._scheduler = None
+                self._dejar_de_liderar()
+            self._hilo = None
+
+    def estado(self) -> dict:
+        jobs = []
+        if self._scheduler is not None:
+            for job in self._scheduler.get_jobs():
+                jobs.append({
+                    'id': job.id,
+                    'nombre': job.name,
+                    'proxima_ejecucion': job.next_run_time.isoformat() if job.next_run_time else None,
+                })
+        return {
+            'habilitado': PLANIFICADOR_HABILITADO,
+            'proceso': _ID_PROCESO,
+            'es_lider': self.es_lider,
+            'lider_desde': self.lider_desde,
+            'jobs_declarados': sorted(_definiciones),
+            'jobs': jobs,
+            **_stats,
+        }
+
+
+planificador = Planificador()
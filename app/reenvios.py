@@ -0,0 +1,170 @@
+"""
+Reenvíos de documentos - Tabla case_resubmissions
+IncaNeurobaeza - 2024
+
+Los reenvíos vivían en caso.metadata_form['reenvios'], una lista dentro de
+una columna JSON: cada aprobación o rechazo reescribía el blob entero y "casos
+con reenvío pendiente" obligaba a recorrer todos los casos. Ahora cada reenvío
+es una fila con índice por (estado, created_at).
+
+El historial antiguo se copia con migrate_reenvios.py; un caso que aún lo
+tenga en el JSON se migra solo la primera vez que se consulta.
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+
+from app.database import Case, CaseResubmission
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+PENDIENTE = 'PENDIENTE_REVISION'
+APROBADO = 'APROBADO'
+RECHAZADO = 'RECHAZADO'
+
+
+# ==================== LECTURA ====================
+
+def como_dict(reenvio: CaseResubmission) -> Dict:
+    """Mismo formato que tenía cada entrada de metadata_form['reenvios']"""
+    datos = {
+        'numero': reenvio.numero,
+        'fecha': reenvio.created_at.isoformat() if reenvio.created_at else None,
+        'link': reenvio.link,
+        'archivos': reenvio.archivos or [],
+        'archivos_repetidos': reenvio.archivos_repetidos or [],
+        'paginas_nuevas': reenvio.paginas_nuevas,
+        'estado': reenvio.estado,
+    }
+    if reenvio.validador_decision:
+        datos['validador_decision'] = reenvio.validador_decision
+    if reenvio.estado == APROBADO:
+        datos['fecha_aprobacion'] = reenvio.decidido_at.isoformat() if reenvio.decidido_at else None
+        datos['motivo'] = reenvio.motivo
+    elif reenvio.estado == RECHAZADO:
+        datos['fecha_rechazo'] = reenvio.decidido_at.isoformat() if reenvio.decidido_at else None
+        datos['motivo_rechazo'] = reenvio.motivo
+        datos['checks_faltantes'] = reenvio.checks_faltantes or []
+    return datos
+
+
+def reenvios_del_caso(db: Session, caso: Case) -> List[CaseResubmission]:
+    """
+    Reenvíos del caso en orden. Si el caso aún tiene la lista en el JSON la
+    migra y hace commit (llamar antes de modificar nada más en la sesión)
+    """
+    if caso.metadata_form and caso.metadata_form.get('reenvios'):
+        migrar_caso(db, caso)
+        db.commit()
+    return db.query(CaseResubmission).filter(
+        CaseResubmission.case_id == caso.id
+    ).order_by(CaseResubmission.numero).all()
+
+
+def ultimo_reenvio(db: Session, caso: Case) -> Optional[CaseResubmission]:
+    reenvios = reenvios_del_caso(db, caso)
+    return reenvios[-1] if reenvios else None
+
+
+# ==================== ESCRITURA ====================
+
+def registrar_reenvio(db: Session, caso: Case, link: str, archivos: List[str],
+                      archivos_repetidos: List[str] = None, paginas_nuevas: List[int] = None,
+                      drive_file_id: Optional[str] = None) -> CaseResubmission:
+    """Agrega el reenvío N+1 del caso (sin commit)"""
+    if caso.metadata_form and caso.metadata_form.get('reenvios'):
+        migrar_caso(db, caso)
+        db.flush()
+    numero = (db.query(func.max(CaseResubmission.numero))
+              .filter(CaseResubmission.case_id == caso.id).scalar() or 0) + 1
+    reenvio = CaseResubmission(
+        case_id=caso.id,
+        numero=numero,
+        link=link,
+        drive_file_id=drive_file_id,
+        archivos=archivos,
+        archivos_repetidos=archivos_repetidos or [],
+        paginas_nuevas=paginas_nuevas,
+        estado=PENDIENTE,
+    )
+    db.add(reenvio)
+    return reenvio
+
+
+def decidir(reenvio: CaseResubmission, estado: str, motivo: str = "", checks: List[str] = None):
+    """Aprobación o rechazo del validador (sin commit)"""
+    reenvio.estado = estado
+    reenvio.validador_decision = 'APROBAR' if estado == APROBADO else 'RECHAZAR'
+    reenvio.motivo = motivo
+    reenvio.checks_faltantes = checks if estado == RECHAZADO else None
+    reenvio.decidido_at = datetime.utcnow()
+
+
+# ==================== MIGRACIÓN DESDE metadata_form ====================
+
+def _fecha(valor) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(valor) if valor else None
+    except (TypeError, ValueError):
+        return None
+
+
+def migrar_caso(db: Session, caso: Case) -> int:
+    """
+    Copia metadata_form['reenvios'] del caso a case_resubmissions y quita la
+    lista del JSON (sin commit). Devuelve cuántas filas creó
+    """
+    entradas = (caso.metadata_form or {}).get('reenvios') or []
+    existentes = {n for (n,) in db.query(CaseResubmission.numero).filter(CaseResubmission.case_id == caso.id)}
+
+    creadas = 0
+    for numero, entrada in enumerate(entradas, start=1):
+        if numero in existentes:
+            continue
+        estado = entrada.get('estado') or PENDIENTE
+        db.add(CaseResubmission(
+            case_id=caso.id,
+            numero=numero,
+            link=entrada.get('link'),
+            archivos=entrada.get('archivos') or [],
+            archivos_repetidos=entrada.get('archivos_repetidos') or [],
+            paginas_nuevas=entrada.get('paginas_nuevas'),
+            estado=estado,
+            validador_decision=entrada.get('validador_decision'),
+            motivo=entrada.get('motivo_rechazo') if estado == RECHAZADO else entrada.get('motivo'),
+            checks_faltantes=entrada.get('checks_faltantes'),
+            created_at=_fecha(entrada.get('fecha')) or caso.updated_at or datetime.utcnow(),
+            decidido_at=_fecha(entrada.get('fecha_aprobacion') or entrada.get('fecha_rechazo')),
+        ))
+        creadas += 1
+
+    metadata = dict(caso.metadata_form)
+    metadata.pop('reenvios', None)
+    caso.metadata_form = metadata
+    flag_modified(caso, 'metadata_form')
+    return creadas
+
+
+def migrar_todos(db: Session, lote: int = 200) -> Dict:
+    """Backfill de todos los casos con reenvíos en el JSON, un commit por lote"""
+    stats = {'casos': 0, 'reenvios': 0}
+    ultimo_id = 0
+    while True:
+        casos = (db.query(Case).filter(Case.id > ultimo_id, Case.metadata_form.isnot(None))
+                 .order_by(Case.id).limit(lote).all())
+        if not casos:
+            break
+        ultimo_id = casos[-1].id
+        for caso in casos:
+            if (caso.metadata_form or {}).get('reenvios'):
+                stats['reenvios'] += migrar_caso(db, caso)
+                stats['casos'] += 1
+        db.commit()
+        db.expunge_all()
+    log.info("🔁 Reenvíos migrados: %s fila(s) de %s caso(s)", stats['reenvios'], stats['casos'])
+    return stats
@@ -0,0 +1,344 @@
+"""
+Réplicas de Lectura y Enrutamiento de Sesiones
+IncaNeurobaeza - 2024
+
+Los tableros del validador (bandeja, estadísticas, búsqueda relacional y
+exportación) solo leen, pero competían con las radicaciones en el único motor
+de app.database. Con DATABASE_REPLICA_URLS (URLs separadas por coma):
+
+- get_db_read / get_async_db_read (app.database) entregan una sesión sobre una
+  réplica; get_db_write (= get_db) y get_async_db siguen en el primario
+- Lee tus escrituras: tras un commit en el primario, las lecturas de ese
+  cliente siguen en el primario hasta que la réplica lo alcanzó (su retraso
+  medido, mínimo DB_LECTURA_PROPIA_SEG). El cliente se reconoce por la cookie
+  o el header X-BD-Escritura que pone ReplicasMiddleware, o por su IP cuando
+  el navegador no devuelve la cookie
+- Retraso: un hilo mide cada DB_REPLICA_CHEQUEO_SEG el atraso de cada réplica
+  (pg_last_xact_replay_timestamp). Una réplica caída, sin medir o con más de
+  DB_REPLICA_RETRASO_MAX_SEG de atraso sale de la rotación hasta recuperarse
+- Las sesiones de réplica son de solo lectura: un flush con cambios falla
+
+Sin réplicas configuradas todo va al primario, como antes.
+"""
+
+import os
+import time
+import random
+import threading
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
+
+REPLICA_URLS = [u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+RETRASO_MAX_SEG = float(os.environ.get("DB_REPLICA_RETRASO_MAX_SEG", "10"))
+CHEQUEO_SEG = float(os.environ.get("DB_REPLICA_CHEQUEO_SEG", "15"))
+LECTURA_PROPIA_SEG = float(os.environ.get("DB_LECTURA_PROPIA_SEG", "5"))
+POOL_REPLICA = int(os.environ.get("DB_REPLICA_POOL_SIZE", "10"))
+
+COOKIE = "bd_escritura"
+HEADER = b"x-bd-escritura"
+
+# Cuánto se recuerda la última escritura de cada IP (y tope de entradas)
+_MEMORIA_CLIENTE_SEG = 300
+_MAX_CLIENTES = 5000
+
+_SQL_RETRASO = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+_stats = {
+    'lecturas_primario': 0,
+    'lecturas_por_escritura_reciente': 0,
+    'escrituras_marcadas': 0,
+}
+
+
+# ==================== RÉPLICAS ====================
+
+class SesionReplica(Session):
+    """Sesión sobre una réplica: solo lectura"""
+
+
+@event.listens_for(SesionReplica, "before_flush")
+def _solo_lectura(session, flush_context, instances):
+    if session.new or session.dirty or session.deleted:
+        raise RuntimeError("Sesión de réplica: solo lectura (usa get_db_write para escribir)")
+
+
+class Replica:
+    def __init__(self, nombre: str, url: str):
+        from app.database import crear_engine, normalizar_url
+
+        self.nombre = nombre
+        self.url = normalizar_url(url)
+        self.engine = crear_engine(self.url, pool_size=POOL_REPLICA, max_overflow=POOL_REPLICA)
+        self.Session = sessionmaker(bind=self.engine, class_=SesionReplica, autoflush=False)
+        self._SessionAsync = None
+        self._lock = threading.Lock()
+
+        self.retraso: Optional[float] = None   # None = aún sin medir
+        self.error: Optional[str] = None
+        self.medida_en: Optional[float] = None
+        self.lecturas = 0
+
+        event.listen(self.engine, "handle_error", self._error_de_conexion)
+
+    @property
+    def disponible(self) -> bool:
+        return self.error is None and self.retraso is not None and self.retraso <= RETRASO_MAX_SEG
+
+    def alcanzo(self, escritura: float) -> bool:
+        """¿Ya tiene lo que se escribió en el primario en ese instante?"""
+        return time.time() - escritura > max(LECTURA_PROPIA_SEG, (self.retraso or 0) + 1)
+
+    def medir(self):
+        try:
+            with self.engine.connect() as conn:
+                if self.engine.dialect.name == "postgresql":
+                    retraso = float(conn.execute(_SQL_RETRASO).scalar() or 0)
+                else:
+                    conn.execute(text("SELECT 1"))
+                    retraso = 0.0
+        except Exception as e:
+            if self.error is None:
+                log.warning("⚠️ Réplica %s fuera de rotación: %s", self.nombre, e)
+            self.error = str(e)[:200]
+            return
+
+        if self.error is not None:
+            log.info("✅ Réplica %s de vuelta (retraso %.1fs)", self.nombre, retraso)
+        elif retraso > RETRASO_MAX_SEG and (self.retraso or 0) <= RETRASO_MAX_SEG:
+            log.warning("⚠️ Réplica %s atrasada %.1fs: lecturas al primario", self.nombre, retraso)
+        self.retraso, self.error, self.medida_en = retraso, None, time.time()
+
+    def _error_de_conexion(self, contexto):
+        # Conexión caída a mitad de un request: fuera de rotación ya, sin
+        # esperar al próximo chequeo
+        if contexto.is_disconnect or contexto.connection is None:
+            self.error = str(contexto.original_exception)[:200]
+
+    def fabrica_async(self):
+        if self._SessionAsync is None:
+            with self._lock:
+                if self._SessionAsync is None:
+                    from sqlalchemy.ext.asyncio import async_sessionmaker
+                    from app.database import crear_engine_async
+                    self._SessionAsync = async_sessionmaker(
+                        crear_engine_async(self.url), expire_on_commit=False, autoflush=False,
+                        sync_session_class=SesionReplica
+                    )
+        return self._SessionAsync
+
+    def estado(self) -> dict:
+        return {
+            'nombre': self.nombre,
+            'disponible': self.disponible,
+            'retraso_s': round(self.retraso, 2) if self.retraso is not None else None,
+            'error': self.error,
+            'medida_hace_s': round(time.time() - self.medida_en, 1) if self.medida_en else None,
+            'lecturas': self.lecturas,
+        }
+
+
+_replicas: Optional[List[Replica]] = None
+_replicas_lock = threading.Lock()
+
+
+def obtener_replicas() -> List[Replica]:
+    """Réplicas configuradas (se crean, y arranca el monitor, en el primer uso)"""
+    global _replicas
+    if _replicas is not None:
+        return _replicas
+    with _replicas_lock:
+        if _replicas is None:
+            replicas = [Replica(f"replica{i + 1}", url) for i, url in enumerate(REPLICA_URLS)]
+            if replicas:
+                threading.Thread(target=_monitor, args=(replicas,), name="monitor_replicas", daemon=True).start()
+                log.info("🔀 %s réplica(s) de lectura configurada(s)", len(replicas))
+            _replicas = replicas
+    return _replicas
+
+
+def _monitor(replicas: List[Replica]):
+    while True:
+        for replica in replicas:
+            replica.medir()
+        time.sleep(CHEQUEO_SEG)
+
+
+# ==================== LEE TUS ESCRITURAS ====================
+
+# Estado del request en curso: lo crea ReplicasMiddleware (los endpoints def
+# corren en el threadpool con una copia del contexto: el dict es el mismo)
+_peticion: ContextVar[Optional[dict]] = ContextVar('bd_peticion', default=None)
+_escrituras_por_cliente: Dict[str, float] = {}
+
+
+@event.listens_for(Session, "after_flush")
+def _tras_flush(session, flush_context):
+    session.info['escribio'] = True
+
+
+@event.listens_for(Session, "after_rollback")
+def _tras_rollback(session):
+    session.info.pop('escribio', None)
+
+
+@event.listens_for(Session, "after_commit")
+def _tras_commit(session):
+    if not session.info.pop('escribio', False) or isinstance(session, SesionReplica):
+        return
+    peticion = _peticion.get()
+    if peticion is None:
+        return
+    ahora = time.time()
+    peticion['escribio'] = ahora
+    _stats['escrituras_marcadas'] += 1
+    if peticion.get('cliente'):
+        _recordar_cliente(peticion['cliente'], ahora)
+
+
+def _recordar_cliente(cliente: str, instante: float):
+    if len(_escrituras_por_cliente) >= _MAX_CLIENTES:
+        limite = time.time() - _MEMORIA_CLIENTE_SEG
+        for clave, valor in list(_escrituras_por_cliente.items()):
+            if valor < limite:
+                _escrituras_por_cliente.pop(clave, None)
+    _escrituras_por_cliente[cliente] = instante
+
+
+def _ultima_escritura() -> Optional[float]:
+    peticion = _peticion.get()
+    if peticion is None:
+        return None
+    marcas = [peticion.get('escribio'), peticion.get('ultima_escritura'),
+              _escrituras_por_cliente.get(peticion.get('cliente'))]
+    marcas = [m for m in marcas if m]
+    return max(marcas) if marcas else None
+
+
+def elegir_replica() -> Optional[Replica]:
+    """Réplica para una lectura, o None si debe ir al primario"""
+    replicas = obtener_replicas()
+    if not replicas:
+        return None
+    candidatas = [r for r in replicas if r.disponible]
+    escritura = _ultima_escritura()
+    if escritura is not None:
+        al_dia = [r for r in candidatas if r.alcanzo(escritura)]
+        if candidatas and not al_dia:
+            _stats['lecturas_por_escritura_reciente'] += 1
+        candidatas = al_dia
+    if not candidatas:
+        _stats['lecturas_primario'] += 1
+        return None
+    replica = random.choice(candidatas)
+    replica.lecturas += 1
+    return replica
+
+
+def sesion_lectura() -> Session:
+    """Session para consultas: réplica elegida o el primario"""
+    replica = elegir_replica()
+    if replica is None:
+        from app.database import SessionLocal
+        return SessionLocal()
+    return replica.Session()
+
+
+def fabrica_lectura_async():
+    """async_sessionmaker de la réplica elegida, o None para usar el primario"""
+    replica = elegir_replica()
+    return replica.fabrica_async() if replica is not None else None
+
+
+async def cerrar_async():
+    for replica in _replicas or []:
+        if replica._SessionAsync is not None:
+            await replica._SessionAsync.kw['bind'].dispose()
+            replica._SessionAsync = None
+
+
+# ==================== MIDDLEWARE ====================
+
+def _clave_cliente(scope) -> Optional[str]:
+    for clave, valor in scope.get("headers") or []:
+        if clave == b"x-forwarded-for":
+            return valor.decode("latin-1").split(",")[0].strip() or None
+    cliente = scope.get("client")
+    return cliente[0] if cliente else None
+
+
+def _marca_de_cookie(cookies: str) -> Optional[float]:
+    for parte in cookies.split(";"):
+        nombre, _, valor = parte.strip().partition("=")
+        if nombre == COOKIE:
+            try:
+                return float(valor)
+            except ValueError:
+                return None
+    return None
+
+
+class ReplicasMiddleware:
+    """
+    ASGI puro: lee la última escritura del cliente (cookie/header) y, si el
+    request hizo commit en el primario, la devuelve actualizada
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not REPLICA_URLS:
+            await self.app(scope, receive, send)
+            return
+
+        ultima = None
+        for clave, valor in scope.get("headers") or []:
+            try:
+                if clave == HEADER:
+                    ultima = max(ultima or 0, float(valor))
+                elif clave == b"cookie":
+                    ultima = max(ultima or 0, _marca_de_cookie(valor.decode("latin-1")) or 0) or None
+            except ValueError:
+                pass
+
+        peticion = {'ultima_escritura': ultima, 'escribio': None, 'cliente': _clave_cliente(scope)}
+        token = _peticion.set(peticion)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start" and peticion['escribio']:
+                marca = f"{peticion['escribio']:.3f}"
+                vida = int(max(LECTURA_PROPIA_SEG, RETRASO_MAX_SEG)) + 1
+                mensaje["headers"] = list(mensaje.get("headers", [])) + [
+                    (HEADER, marca.encode()),
+                    (b"set-cookie", f"{COOKIE}={marca}; Max-Age={vida}; Path=/; SameSite=Lax".encode()),
+                ]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _peticion.reset(token)
+
+
+# ==================== ESTADO ====================
+
+def obtener_estadisticas() -> dict:
+    return {
+        'configuradas': len(REPLICA_URLS),
+        'replicas': [r.estado() for r in (_replicas or [])],
+        'clientes_recordados': len(_escrituras_por_cliente),
+        **_stats,
+    }
@@ -3,13 +3,15 @@ Sistema de Recordatorios Automáticos
 Ejecuta cada día a las 9 AM para verificar casos pendientes > 7 días
 """
 
-from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime, timedelta
 from app.database import SessionLocal, Case, EstadoCaso
 from app.ia_redactor import redactar_recordatorio_7dias, redactar_alerta_jefe_7dias
 from app.email_templates import get_email_template_universal
 import os
 from app.n8n_notifier import enviar_a_n8n
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
 
 def send_html_email(to_email: str, subject: str, html_body: str, caso=None) -> bool:
     """Envía email usando N8N"""
@@ -41,16 +43,16 @@ def send_html_email(to_email: str, subject: str, html_body: str, caso=None) -> b
     )
     
     if resultado:
-        print(f"✅ Email enviado a {to_email}")
+        log.info("✅ Email enviado a %s", to_email)
         return True
     
-    print(f"❌ Error enviando email")
+    log.error("❌ Error enviando email")
     return False
     brevo_from_email = os.environ.get("BREVO_FROM_EMAIL", "notificaciones@smtp-brevo.com")
     reply_to_email = os.environ.get("SMTP_EMAIL", "davidbaezaospino@gmail.com")
 
     if not brevo_api_key:
-        print("❌ Error: Falta BREVO_API_KEY")
+        log.error("❌ Error: Falta BREVO_API_KEY")
         return False
 
     try:
@@ -70,14 +72,14 @@ def send_html_email(to_email: str, subject: str, html_body: str, caso=None) -> b
         )
         
         api_response = api_instance.send_transac_email(send_smtp_email)
-        print(f"✅ Email enviado a {to_email} (ID: {api_response.message_id})")
+        log.info("✅ Email enviado a %s (ID: %s)", to_email, api_response.message_id)
         return True
         
     except ApiException as e:
-        print(f"❌ Error Brevo: {e}")
+        log.error("❌ Error Brevo: %s", e)
         return False
     except Exception as e:
-        print(f"❌ Error: {e}")
+        log.error("❌ Error: %s", e)
         return False
 
 
@@ -89,9 +91,7 @@ def verificar_casos_pendientes():
     db = SessionLocal()
     
     try:
-        print(f"\n{'='*60}")
-        print(f"🔍 Verificación de recordatorios - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"{'='*60}\n")
+        log.info("🔍 Verificación de recordatorios - %s", datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
         
         # Calcular fecha límite (hace 7 días)
         fecha_limite = datetime.now() - timedelta(days=7)
@@ -107,10 +107,10 @@ def verificar_casos_pendientes():
             Case.recordatorio_enviado == False
         ).all()
         
-        print(f"📊 Casos encontrados para recordatorio: {len(casos_pendientes)}")
+        log.info("📊 Casos encontrados para recordatorio: %s", len(casos_pendientes))
         
         if not casos_pendientes:
-            print(f"✅ No hay casos pendientes que requieran recordatorio\n")
+            log.info("✅ No hay casos pendientes que requieran recordatorio")
             return
         
         recordatorios_enviados = 0
@@ -121,17 +121,17 @@ def verificar_casos_pendientes():
                 empleado = caso.empleado
                 
                 if not empleado:
-                    print(f"⚠️ Caso {caso.serial} sin empleado asignado, omitiendo...")
+                    log.warning("⚠️ Caso %s sin empleado asignado, omitiendo...", caso.serial)
                     continue
                 
-                print(f"\n📧 Procesando caso {caso.serial}:")
-                print(f"   • Empleado: {empleado.nombre}")
-                print(f"   • Estado: {caso.estado.value}")
-                print(f"   • Días sin respuesta: {(datetime.now() - caso.updated_at).days}")
+                log.info("📧 Procesando caso %s:", caso.serial)
+                log.info("• Empleado: %s", empleado.nombre)
+                log.info("• Estado: %s", caso.estado.value)
+                log.info("• Días sin respuesta: %s", (datetime.now() - caso.updated_at).days)
                 
                 # ========== EMAIL A LA EMPLEADA ==========
                 if caso.email_form:
-                    print(f"   • Generando recordatorio con IA...")
+                    log.info("• Generando recordatorio con IA...")
                     
                     # Redactar con IA
                     contenido_ia = redactar_recordatorio_7dias(
@@ -161,13 +161,13 @@ def verificar_casos_pendientes():
                         caso=caso
                     ):
                         recordatorios_enviados += 1
-                        print(f"   ✅ Recordatorio enviado a empleada")
+                        log.info("✅ Recordatorio enviado a empleada")
                     else:
-                        print(f"   ❌ Error enviando recordatorio")
+                        log.error("❌ Error enviando recordatorio")
                 
                 # ========== EMAIL AL JEFE ==========
                 if empleado.jefe_email and empleado.jefe_nombre:
-                    print(f"   • Generando alerta para jefe ({empleado.jefe_nombre})...")
+                    log.info("• Generando alerta para jefe (%s)...", empleado.jefe_nombre)
                     
                     # Redactar con IA
                     contenido_jefe = redactar_alerta_jefe_7dias(
@@ -199,33 +199,31 @@ def verificar_casos_pendientes():
                         caso=None  # No agregar CCs al jefe
                     ):
                         alertas_jefe_enviadas += 1
-                        print(f"   ✅ Alerta enviada a jefe")
+                        log.info("✅ Alerta enviada a jefe")
                     else:
-                        print(f"   ❌ Error enviando alerta al jefe")
+                        log.error("❌ Error enviando alerta al jefe")
                 else:
-                    print(f"   ⚠️ Sin datos de jefe en el sistema")
+                    log.warning("⚠️ Sin datos de jefe en el sistema")
                 
                 # Marcar como enviado
                 caso.recordatorio_enviado = True
                 caso.fecha_recordatorio = datetime.now()
                 db.commit()
                 
-                print(f"   ✅ Caso {caso.serial} marcado como recordatorio enviado")
+                log.info("✅ Caso %s marcado como recordatorio enviado", caso.serial)
                 
             except Exception as e:
-                print(f"   ❌ Error procesando caso {caso.serial}: {e}")
+                log.error("❌ Error procesando caso %s: %s", caso.serial, e)
                 db.rollback()
                 continue
         
-        print(f"\n{'='*60}")
-        print(f"📊 RESUMEN:")
-        print(f"   • Recordatorios a empleadas: {recordatorios_enviados}")
-        print(f"   • Alertas a jefes: {alertas_jefe_enviadas}")
-        print(f"   • Total procesados: {len(casos_pendientes)}")
-        print(f"{'='*60}\n")
+        log.info("📊 RESUMEN:")
+        log.info("• Recordatorios a empleadas: %s", recordatorios_enviados)
+        log.info("• Alertas a jefes: %s", alertas_jefe_enviadas)
+        log.info("• Total procesados: %s", len(casos_pendientes))
         
     except Exception as e:
-        print(f"❌ Error general en verificación: {e}")
+        log.error("❌ Error general en verificación: %s", e)
         import traceback
         traceback.print_exc()
         db.rollback()
@@ -238,26 +236,21 @@ def iniciar_scheduler_recordatorios():
     Inicia el scheduler de recordatorios
     Se ejecuta todos los días a las 9:00 AM
     """
-    scheduler = BackgroundScheduler()
+    from app.planificador import planificador
     
-    # ✅ Agregar job: Todos los días a las 9 AM
-    scheduler.add_job(
-        verificar_casos_pendientes,
-        'cron',
-        hour=9,
-        minute=0,
-        id='recordatorios_7dias',
-        name='Verificación de recordatorios 7 días',
-        replace_existing=True
+    # ✅ Todos los días a las 9 AM, una sola vez por día en todo el despliegue.
+    # Si el líder estaba caído a las 9:00, corre al volver (hasta 3 h tarde)
+    planificador.registrar(
+        'recordatorios_7dias', verificar_casos_pendientes, 'cron',
+        nombre='Verificación de recordatorios 7 días',
+        una_vez_por_dia=True, misfire_grace_time=3 * 3600,
+        hour=9, minute=0
     )
+    planificador.iniciar()
     
-    scheduler.start()
-    
-    print("✅ Scheduler de recordatorios iniciado")
-    print("   • Frecuencia: Diaria a las 9:00 AM")
-    print("   • Job ID: recordatorios_7dias")
+    log.info("✅ Scheduler de recordatorios iniciado (diario 9:00 AM, job recordatorios_7dias)")
     
-    return scheduler
+    return planificador
 
 
 def test_recordatorios_manual():
@@ -265,9 +258,9 @@ def test_recordatorios_manual():
     Función para probar recordatorios manualmente (debugging)
     Ejecutar: python -c "from app.scheduler_recordatorios import test_recordatorios_manual; test_recordatorios_manual()"
     """
-    print("🧪 MODO TEST - Ejecutando verificación manual de recordatorios...\n")
+    log.info("🧪 MODO TEST - Ejecutando verificación manual de recordatorios...")
     verificar_casos_pendientes()
-    print("\n✅ Test completado")
+    log.info("✅ Test completado")
 
 
 if __name__ == "__main__":
@@ -5,9 +5,11 @@ Ejemplo: DB10850433740, DB10850433741, ...
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.database import Case
+from app.archivo import serial_existe, seriales_con_prefijo
 import re
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
 
 def generar_serial_unico(db: Session, nombre: str, cedula: str) -> str:
     """
@@ -39,11 +41,9 @@ def generar_serial_unico(db: Session, nombre: str, cedula: str) -> str:
     prefijo_base = f"{iniciales}{cedula}"
     
     # Paso 3: Buscar el último contador usado para esta persona
-    # Buscar todos los casos que empiecen con este prefijo
-    patron = f"{prefijo_base}%"
-    casos_existentes = db.query(Case.serial).filter(
-        Case.serial.like(patron)
-    ).order_by(Case.serial.desc()).all()
+    # Buscar todos los casos que empiecen con este prefijo (también los
+    # archivados: un serial no se repite aunque el caso ya no esté en cases)
+    casos_existentes = seriales_con_prefijo(db, prefijo_base)
     
     # Paso 4: Determinar el siguiente contador
     if not casos_existentes:
@@ -51,7 +51,7 @@ def generar_serial_unico(db: Session, nombre: str, cedula: str) -> str:
         contador = 0
     else:
         # Extraer el contador del último serial
-        ultimo_serial = casos_existentes[0][0]
+        ultimo_serial = casos_existentes[0]
         try:
             # Extraer los dígitos al final del serial
             ultimo_contador = int(ultimo_serial.replace(prefijo_base, ''))
@@ -65,14 +65,14 @@ def generar_serial_unico(db: Session, nombre: str, cedula: str) -> str:
     
     # Paso 6: Verificar que no exista (por si acaso)
     # Esto no debería pasar, pero es una medida de seguridad
-    existe = db.query(Case).filter(Case.serial == serial).first()
-    if existe:
+    # serial_existe solo toca los índices únicos de serial (cases y archivo)
+    if serial_existe(db, serial):
         # Si por alguna razón ya existe, incrementar hasta encontrar uno libre
-        while db.query(Case).filter(Case.serial == f"{prefijo_base}{contador}").first():
+        while serial_existe(db, f"{prefijo_base}{contador}"):
             contador += 1
         serial = f"{prefijo_base}{contador}"
     
-    print(f"✅ Serial generado: {serial} (contador: {contador})")
+    log.info("✅ Serial generado: %s (contador: %s)", serial, contador)
     return serial
 
 def extraer_iniciales(nombre_completo: str) -> str:
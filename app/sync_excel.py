@@ -4,65 +4,81 @@ Sincronización AUTOMÁTICA Google Sheets → PostgreSQL
 """
 
 import os
-import pandas as pd
+import threading
 import requests
 from datetime import datetime
 from app.database import SessionLocal, Employee, Company
 from io import BytesIO
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
 
 GOOGLE_DRIVE_FILE_ID = "1POt2ytSN61XbSpXUSUPyHdOVy2g7CRas"
 EXCEL_DOWNLOAD_URL = f"https://docs.google.com/spreadsheets/d/{GOOGLE_DRIVE_FILE_ID}/export?format=xlsx"
 LOCAL_CACHE_PATH = "/tmp/base_empleados_cache.xlsx"
 
+# La sync completa y la instantánea insertan las mismas cédulas: en el mismo
+# proceso se turnan; entre procesos la instantánea relee tras el IntegrityError
+_lock_sync = threading.Lock()
+
 def descargar_excel_desde_drive():
     """Descarga el Excel desde Google Drive"""
     try:
-        print(f"📥 Descargando Excel desde Google Sheets...")
-        response = requests.get(EXCEL_DOWNLOAD_URL, timeout=30)
+        log.info("📥 Descargando Excel desde Google Sheets...")
+        from app.google_endpoints import url_externa
+        response = requests.get(url_externa(EXCEL_DOWNLOAD_URL), timeout=30)
         
         if response.status_code == 200:
             with open(LOCAL_CACHE_PATH, 'wb') as f:
                 f.write(response.content)
-            print(f"✅ Excel descargado correctamente ({len(response.content)} bytes)")
+            log.info("✅ Excel descargado correctamente (%s bytes)", len(response.content))
             return LOCAL_CACHE_PATH
         else:
-            print(f"❌ Error descargando Excel: HTTP {response.status_code}")
+            log.error("❌ Error descargando Excel: HTTP %s", response.status_code)
             if os.path.exists(LOCAL_CACHE_PATH):
-                print(f"⚠️ Usando cache anterior")
+                log.warning("⚠️ Usando cache anterior")
                 return LOCAL_CACHE_PATH
             return None
     except Exception as e:
-        print(f"❌ Error descargando Excel: {e}")
+        log.error("❌ Error descargando Excel: %s", e)
         if os.path.exists(LOCAL_CACHE_PATH):
-            print(f"⚠️ Usando cache anterior")
+            log.warning("⚠️ Usando cache anterior")
             return LOCAL_CACHE_PATH
         return None
 
 
 def sincronizar_empleado_desde_excel(cedula: str):
     """Sincroniza UN empleado especifico (sync instantanea)"""
+    with _lock_sync:
+        return _sincronizar_empleado(cedula)
+
+
+def _sincronizar_empleado(cedula: str):
+    import pandas as pd
+    from sqlalchemy.exc import IntegrityError
+    
     db = SessionLocal()
     try:
         empleado_bd = db.query(Employee).filter(Employee.cedula == cedula).first()
         if empleado_bd:
-            print(f"✅ Empleado {cedula} ya esta en BD")
+            log.debug("✅ Empleado %s ya esta en BD", cedula)
             return empleado_bd
         
         excel_path = descargar_excel_desde_drive()
         if not excel_path:
-            print(f"❌ No se pudo descargar el Excel")
+            log.error("❌ No se pudo descargar el Excel")
             return None
         
         df = pd.read_excel(excel_path, sheet_name=0)
         try:
             cedula_int = int(cedula)
         except ValueError:
-            print(f"❌ Cedula invalida: {cedula}")
+            log.error("❌ Cedula invalida: %s", cedula)
             return None
         
         empleado_excel = df[df["cedula"] == cedula_int]
         if empleado_excel.empty:
-            print(f"❌ Empleado {cedula} no encontrado en Excel")
+            log.error("❌ Empleado %s no encontrado en Excel", cedula)
             return None
         
         row = empleado_excel.iloc[0]
@@ -90,10 +106,17 @@ def sincronizar_empleado_desde_excel(cedula: str):
         db.add(nuevo_empleado)
         db.commit()
         db.refresh(nuevo_empleado)
-        print(f"✅ Empleado {cedula} sincronizado: {nuevo_empleado.nombre}")
+        log.info("✅ Empleado %s sincronizado: %s", cedula, nuevo_empleado.nombre)
         return nuevo_empleado
+    except IntegrityError:
+        # Otro proceso (la sync completa del líder) lo insertó primero
+        db.rollback()
+        empleado_bd = db.query(Employee).filter(Employee.cedula == cedula).first()
+        if empleado_bd:
+            log.info("✅ Empleado %s ya insertado por otra sync", cedula)
+        return empleado_bd
     except Exception as e:
-        print(f"❌ Error sincronizando {cedula}: {e}")
+        log.error("❌ Error sincronizando %s: %s", cedula, e)
         db.rollback()
         return None
     finally:
@@ -108,19 +131,24 @@ def sincronizar_excel_completo():
     - Si editas Fila 3, actualiza ID 3 (NO crea ID 9)
     - Si Excel tiene 8 filas, BD tiene 8 empleados activos
     """
+    with _lock_sync:
+        _sincronizar_excel_completo()
+
+
+def _sincronizar_excel_completo():
+    import pandas as pd
+
     db = SessionLocal()
     try:
-        print(f"\n{'='*60}")
-        print(f"🔄 SYNC EXACTO Excel → PostgreSQL - {datetime.now().strftime('%H:%M:%S')}")
-        print(f"{'='*60}\n")
+        log.info("🔄 SYNC EXACTO Excel → PostgreSQL - %s", datetime.now().strftime('%H:%M:%S'))
         
         excel_path = descargar_excel_desde_drive()
         if not excel_path:
-            print(f"❌ No se pudo descargar el Excel, sync cancelado\n")
+            log.error("❌ No se pudo descargar el Excel, sync cancelado")
             return
         
         # ========== PASO 1: SYNC EMPRESAS (HOJA 2) ==========
-        print(f"📊 PASO 1: Sincronizando empresas (Hoja 2)...")
+        log.info("📊 PASO 1: Sincronizando empresas (Hoja 2)...")
         empresas_actualizadas = 0
         
         try:
@@ -130,13 +158,13 @@ def sincronizar_excel_completo():
             for nombre_hoja in nombres_posibles:
                 try:
                     df_empresas = pd.read_excel(excel_path, sheet_name=nombre_hoja)
-                    print(f"   ✅ Hoja encontrada: '{nombre_hoja}' ({len(df_empresas)} filas)")
+                    log.info("✅ Hoja encontrada: '%s' (%s filas)", nombre_hoja, len(df_empresas))
                     break
                 except:
                     continue
             
             if df_empresas is None:
-                print(f"   ⚠️ No se encontró Hoja 2. Continuando sin emails de copia...\n")
+                log.warning("⚠️ No se encontró Hoja 2. Continuando sin emails de copia...")
             else:
                 for _, row in df_empresas.iterrows():
                     try:
@@ -157,7 +185,7 @@ def sincronizar_excel_completo():
                                 empresa.updated_at = datetime.utcnow()
                                 db.commit()
                                 empresas_actualizadas += 1
-                                print(f"   🔄 {empresa_nombre} → {email_copia}")
+                                log.info("🔄 %s → %s", empresa_nombre, email_copia)
                         else:
                             nueva_empresa = Company(
                                 nombre=empresa_nombre,
@@ -168,33 +196,33 @@ def sincronizar_excel_completo():
                             db.add(nueva_empresa)
                             db.commit()
                             empresas_actualizadas += 1
-                            print(f"   ➕ {empresa_nombre} → {email_copia}")
+                            log.info("➕ %s → %s", empresa_nombre, email_copia)
                     
                     except Exception as e:
-                        print(f"   ❌ Error en empresa: {e}")
+                        log.error("❌ Error en empresa: %s", e)
                         db.rollback()
                 
                 if empresas_actualizadas > 0:
-                    print(f"   ✅ {empresas_actualizadas} empresas actualizadas\n")
+                    log.info("✅ %s empresas actualizadas", empresas_actualizadas)
                 else:
-                    print(f"   ℹ️ Sin cambios en empresas\n")
+                    log.info("ℹ️ Sin cambios en empresas")
         
         except Exception as e:
-            print(f"   ❌ Error leyendo Hoja 2: {e}\n")
+            log.error("❌ Error leyendo Hoja 2: %s", e)
         
         # ========== PASO 2: SYNC EMPLEADOS EXACTO ==========
-        print(f"📊 PASO 2: Sincronizando empleados (MODO EXACTO)...")
+        log.info("📊 PASO 2: Sincronizando empleados (MODO EXACTO)...")
         
         df = pd.read_excel(excel_path, sheet_name=0)
-        print(f"   📋 Excel tiene {len(df)} filas")
+        log.info("📋 Excel tiene %s filas", len(df))
         
         # Obtener TODOS los empleados de BD ordenados por ID
         empleados_bd = db.query(Employee).order_by(Employee.id).all()
-        print(f"   📋 BD tiene {len(empleados_bd)} empleados totales")
+        log.info("📋 BD tiene %s empleados totales", len(empleados_bd))
         
         # Crear lista de empleados activos en BD
         empleados_activos = [e for e in empleados_bd if e.activo]
-        print(f"   📋 BD tiene {len(empleados_activos)} empleados activos")
+        log.info("📋 BD tiene %s empleados activos", len(empleados_activos))
         
         nuevos = actualizados = eliminados = 0
         
@@ -268,13 +296,13 @@ def sincronizar_excel_completo():
                     nuevos += 1
             
             except Exception as e:
-                print(f"   ❌ Error en fila {idx + 2}: {e}")
+                log.error("❌ Error en fila %s: %s", idx + 2, e)
                 db.rollback()
         
         # ✅ ELIMINAR empleados sobrantes (si BD tiene más que Excel)
         total_filas_excel = len(df)
         if len(empleados_activos) > total_filas_excel:
-            print(f"   🗑️ BD tiene {len(empleados_activos) - total_filas_excel} empleados de más, eliminando...")
+            log.info("🗑️ BD tiene %s empleados de más, eliminando...", len(empleados_activos) - total_filas_excel)
             for i in range(total_filas_excel, len(empleados_activos)):
                 empleado_sobra = empleados_activos[i]
                 empleado_sobra.activo = False
@@ -283,17 +311,13 @@ def sincronizar_excel_completo():
                 eliminados += 1
         
         # RESUMEN
-        print(f"\n{'='*60}")
-        print(f"✅ SYNC COMPLETADO")
-        print(f"   • Empresas actualizadas: {empresas_actualizadas}")
-        print(f"   • Empleados nuevos: {nuevos}")
-        print(f"   • Empleados actualizados: {actualizados}")
-        print(f"   • Empleados eliminados: {eliminados}")
-        print(f"   • Total activos en BD: {total_filas_excel}")
-        print(f"{'='*60}\n")
+        log.info(
+            "✅ SYNC COMPLETADO: empresas=%s nuevos=%s actualizados=%s eliminados=%s activos=%s",
+            empresas_actualizadas, nuevos, actualizados, eliminados, total_filas_excel
+        )
         
     except Exception as e:
-        print(f"\n❌ ERROR GENERAL EN SYNC: {e}")
+        log.error("❌ ERROR GENERAL EN SYNC: %s", e)
         import traceback
         traceback.print_exc()
         db.rollback()
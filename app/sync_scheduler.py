@@ -1,64 +1,114 @@
 """
 Sincronización automática Excel → PostgreSQL + Verificación de Drive
 Ejecuta cada 1 MINUTO (Excel) y cada 5 MINUTOS (Drive token)
+Sube ediciones de PDF abandonadas cada 30 MINUTOS
+Vigila los cambios de Drive (Changes API) cada DRIVE_WATCHER_SEGUNDOS (60 por defecto)
+Archiva los casos cerrados antiguos cada día a las 3:00 AM (app.archivo)
+En SQLite: checkpoint del WAL cada SQLITE_CHECKPOINT_MIN y ANALYZE diario a las 3:30 AM
+
+Con varios workers/instancias solo el líder elegido en app.planificador los ejecuta
 """
 
-from apscheduler.schedulers.background import BackgroundScheduler
 from app.sync_excel import sincronizar_excel_completo
+from app.pdf_edicion import finalizar_sesiones_vencidas
+from app.drive_watcher import procesar_cambios, WATCHER_SEGUNDOS
+from app.archivo import archivar_casos
+from app.database import es_sqlite, checkpoint_sqlite, analizar_sqlite, SQLITE_CHECKPOINT_MIN
+from app.planificador import planificador
 import datetime
+from app.logs import obtener_logger
+
+log = obtener_logger(__name__)
 
 def verificar_drive_token():
-    """Verifica y RENUEVA el token de Drive preventivamente"""
+    """
+    Verifica el token de Drive con una llamada real. La renovación preventiva
+    la hace el temporizador de app.credenciales_google; aquí solo se renueva
+    si el token ya está por vencer (o si el temporizador quedó en backoff)
+    """
     try:
         from app.drive_uploader import get_authenticated_service
+        from app.google_endpoints import usando_endpoint_local
         
-        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] 🔄 Renovando token de Drive preventivamente...")
+        log.info("[%s] 🔄 Verificando token de Drive...", datetime.datetime.now().strftime('%H:%M:%S'))
+        if not usando_endpoint_local():
+            from app.credenciales_google import gestor
+            gestor.obtener()
         service = get_authenticated_service()
         
-        # Test rápido: listar 1 archivo para forzar uso del token
-        service.files().list(pageSize=1, fields="files(id)").execute()
+        # Test rápido: listar 1 archivo para forzar uso del token (y abrir el pool)
+        service.files_list(pageSize=1, fields="files(id)")
         
-        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] ✅ Token de Drive renovado y verificado")
+        log.info("[%s] ✅ Token de Drive verificado", datetime.datetime.now().strftime('%H:%M:%S'))
     except Exception as e:
-        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] ⚠️ Error renovando token: {e}")
+        log.warning("[%s] ⚠️ Error verificando token: %s", datetime.datetime.now().strftime('%H:%M:%S'), e)
 
-def iniciar_sincronizacion_automatica():
+def reanudar_comparaciones():
+    """Comparaciones de versiones que quedaron PENDIENTE (import perezoso: PyMuPDF y Pillow)"""
+    from app.comparador_versiones import reanudar_comparaciones as reanudar
+    return reanudar()
+
+def iniciar_sincronizacion_automatica(ejecutar_inicial: bool = True):
     """
     Inicia scheduler de sincronización automática
     ⏱️ Excel: Ejecuta cada 1 MINUTO
     ⏱️ Drive: Verifica cada 5 MINUTOS
-    """
     
-    scheduler = BackgroundScheduler()
+    ejecutar_inicial=False deja la sync inicial y el token de Drive al
+    calentamiento en segundo plano (app.arranque)
+    """
     
-    # ✅ Sincronización de Excel (cada 60 segundos)
-    scheduler.add_job(
-        sincronizar_excel_completo,
-        'interval',
-        seconds=60,
-        id='sync_excel_to_postgresql',
-        name='Sincronización Excel → PostgreSQL',
-        replace_existing=True
+    # Un solo proceso del despliegue ejecuta los jobs (app.planificador)
+    planificador.registrar(
+        'sync_excel_to_postgresql', sincronizar_excel_completo, 'interval',
+        nombre='Sincronización Excel → PostgreSQL', seconds=60
     )
-    
-    # ✅ Verificación de Drive token (cada 5 minutos)
-    scheduler.add_job(
-        verificar_drive_token,
-        'interval',
-        minutes=5,
-        id='verificar_drive_token',
-        name='Verificación de Token de Google Drive',
-        replace_existing=True
+    planificador.registrar(
+        'verificar_drive_token', verificar_drive_token, 'interval',
+        nombre='Verificación de Token de Google Drive', minutes=5
     )
+    planificador.registrar(
+        'finalizar_ediciones_pdf', finalizar_sesiones_vencidas, 'interval',
+        nombre='Subida de ediciones de PDF pendientes', minutes=30
+    )
+    # Vigilante de cambios en Drive: cache de carpetas, índice y drift
+    planificador.registrar(
+        'vigilante_cambios_drive', procesar_cambios, 'interval',
+        nombre='Vigilante de cambios en Drive (Changes API)', seconds=WATCHER_SEGUNDOS
+    )
+    # Comparaciones de versiones sin worker (reinicio o proceso caído)
+    planificador.registrar(
+        'reanudar_comparaciones', reanudar_comparaciones, 'interval',
+        nombre='Comparaciones de versiones pendientes', minutes=5
+    )
+    # Casos cerrados antiguos a las tablas de archivo (fuera del horario de radicación)
+    planificador.registrar(
+        'archivar_casos', archivar_casos, 'cron',
+        nombre='Archivo de casos cerrados', una_vez_por_dia=True,
+        misfire_grace_time=3 * 3600, hour=3, minute=0
+    )
+    if es_sqlite:
+        # Mantenimiento del perfil SQLite (app.database): WAL acotado y estadísticas al día
+        planificador.registrar(
+            'checkpoint_sqlite', checkpoint_sqlite, 'interval',
+            nombre='Checkpoint del WAL de SQLite', minutes=SQLITE_CHECKPOINT_MIN
+        )
+        planificador.registrar(
+            'analizar_sqlite', analizar_sqlite, 'cron',
+            nombre='ANALYZE de SQLite', una_vez_por_dia=True,
+            misfire_grace_time=3 * 3600, hour=3, minute=30
+        )
+    planificador.iniciar()
     
-    scheduler.start()
-    
-    print("🔄 Sincronización automática activada:")
-    print("   • Excel → PostgreSQL: cada 1 minuto")
-    print("   • Token de Drive: cada 5 minutos")
+    log.info(
+        "🔄 Sincronización automática activada: Excel cada 1 min, token de Drive cada 5 min, "
+        "ediciones de PDF cada 30 min, comparaciones pendientes cada 5 min, cambios en Drive cada %s s, archivo diario 3:00 (líder: %s)",
+        WATCHER_SEGUNDOS, 'este proceso' if planificador.es_lider else 'otro proceso'
+    )
     
-    # Ejecutar sync inicial inmediatamente
-    sincronizar_excel_completo()
-    verificar_drive_token()
+    # Ejecutar sync inicial inmediatamente (solo el líder)
+    if ejecutar_inicial:
+        planificador.ejecutar_ahora('sync_excel_to_postgresql')
+        planificador.ejecutar_ahora('verificar_drive_token')
     
-    return scheduler
\ No newline at end of file
+    return planificador
@@ -3,32 +3,45 @@ Router del Portal de Validadores - IncaNeurobaeza
 Endpoints para gestión, validación y búsqueda de casos
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Header, UploadFile, File, Form
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Header, UploadFile, File, Form, Query, Body
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse, Response
 import requests
 import io
 import os
-import tempfile
 import base64
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_, func
+import hashlib
+from sqlalchemy.orm import Session, selectinload, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, func, select, literal, cast, null, union_all, Boolean, String
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from pydantic import BaseModel
-import pandas as pd
-import sib_api_v3_sdk
 
 from app.database import (
-    get_db, Case, CaseDocument, CaseEvent, CaseNote, Employee, 
-    Company, SearchHistory, EstadoCaso, EstadoDocumento, TipoIncapacidad
+    get_db, get_db_read, get_async_db, get_async_db_read, Case, CaseDocument, CaseEvent, CaseNote, Employee, 
+    Company, SearchHistory, CaseResubmission, EstadoCaso, EstadoDocumento, TipoIncapacidad
 )
 from app.checks_disponibles import CHECKS_DISPONIBLES, obtener_checks_por_tipo
 from app.email_templates import get_email_template_universal
 from app.drive_manager import CaseFileOrganizer
 from app.n8n_notifier import enviar_a_n8n  # ✅ NUEVO
+from app.metricas import marca
+from app.logs import obtener_logger
+from app.busqueda import filtrar_por_texto, LIMITE_RESULTADOS
+from app.archivo import sello_archivado, leer_archivado, conteo_archivados
+from app.escritura_diferida import encolar
+from app.reenvios import (
+    APROBADO, PENDIENTE, RECHAZADO, como_dict, reenvios_del_caso, ultimo_reenvio,
+    decidir as decidir_reenvio
+)
+from app.estado_compartido import (
+    crear_directorio_de_trabajo, borrar_directorio_de_trabajo, nombre_seguro
+)
 
 router = APIRouter(prefix="/validador", tags=["Portal de Validadores"])
 
+log = obtener_logger(__name__)
+
 # ==================== MODELOS PYDANTIC ====================
 
 class FiltrosCasos(BaseModel):
@@ -76,11 +89,11 @@ def verificar_token_admin(x_admin_token: str = Header(...)):
     
     return True
 
-def registrar_evento(db: Session, case_id: int, accion: str, actor: str = "Sistema", 
-                     estado_anterior: str = None, estado_nuevo: str = None, 
-                     motivo: str = None, metadata: dict = None):
-    """Registra un evento en el historial del caso"""
-    evento = CaseEvent(
+def nuevo_evento(case_id: int, accion: str, actor: str = "Sistema",
+                 estado_anterior: str = None, estado_nuevo: str = None,
+                 motivo: str = None, metadata: dict = None) -> CaseEvent:
+    """Evento del historial del caso, sin agregar a ninguna sesión"""
+    return CaseEvent(
         case_id=case_id,
         actor=actor,
         accion=accion,
@@ -89,8 +102,16 @@ def registrar_evento(db: Session, case_id: int, accion: str, actor: str = "Siste
         motivo=motivo,
         metadata_json=metadata
     )
-    db.add(evento)
-    db.commit()
+
+def registrar_evento(db: Session, case_id: int, accion: str, actor: str = "Sistema", 
+                     estado_anterior: str = None, estado_nuevo: str = None, 
+                     motivo: str = None, metadata: dict = None):
+    """
+    Registra un evento en el historial del caso, en la unidad de trabajo del
+    request: se guarda con el próximo db.commit() del llamador (junto con el
+    cambio que registra) y se pierde si este hace rollback
+    """
+    db.add(nuevo_evento(case_id, accion, actor, estado_anterior, estado_nuevo, motivo, metadata))
 
 def enviar_email_con_adjuntos(to_email, subject, html_body, adjuntos_paths=[], caso=None, db=None):
     """
@@ -112,7 +133,7 @@ def enviar_email_con_adjuntos(to_email, subject, html_body, adjuntos_paths=[], c
                         'mimetype': 'application/pdf'
                     })
             except Exception as e:
-                print(f"⚠️ Error procesando adjunto {path}: {e}")
+                log.warning("⚠️ Error procesando adjunto %s: %s", path, e)
     
     # Determinar tipo de notificación desde el subject
     tipo_map = {
@@ -138,62 +159,25 @@ def enviar_email_con_adjuntos(to_email, subject, html_body, adjuntos_paths=[], c
     correo_bd = None
     whatsapp = None
     
-    print(f"🔍 DEBUG enviar_email_con_adjuntos:")
-    print(f"   to_email: {to_email}")
-    print(f"   caso: {caso}")
-    
     if caso:
-        print(f"   ✓ Caso existe")
-        
         # Email de copia de la empresa (Hoja 2)
-        if hasattr(caso, 'empresa'):
-            print(f"   ✓ caso.empresa existe: {caso.empresa}")
-            if caso.empresa:
-                print(f"     empresa.nombre: {caso.empresa.nombre}")
-                if hasattr(caso.empresa, 'email_copia'):
-                    print(f"     ✓ empresa.email_copia existe: {caso.empresa.email_copia}")
-                    if caso.empresa.email_copia:
-                        cc_empresa = caso.empresa.email_copia
-                        print(f"     ✅ CC empresa configurado: {cc_empresa}")
-                    else:
-                        print(f"     ✗ empresa.email_copia es None o vacío")
-                else:
-                    print(f"     ✗ empresa NO tiene atributo email_copia")
-            else:
-                print(f"   ✗ caso.empresa es None")
-        else:
-            print(f"   ✗ caso NO tiene atributo empresa")
+        empresa = getattr(caso, 'empresa', None)
+        if empresa and getattr(empresa, 'email_copia', None):
+            cc_empresa = empresa.email_copia
         
         # Email del empleado en BD (Hoja 1)
-        if hasattr(caso, 'empleado'):
-            print(f"   ✓ caso.empleado existe: {caso.empleado}")
-            if caso.empleado:
-                print(f"     empleado.nombre: {caso.empleado.nombre}")
-                if hasattr(caso.empleado, 'correo'):
-                    print(f"     ✓ empleado.correo existe: {caso.empleado.correo}")
-                    if caso.empleado.correo:
-                        correo_bd = caso.empleado.correo
-                        print(f"     ✅ CC empleado BD configurado: {correo_bd}")
-                    else:
-                        print(f"     ✗ empleado.correo es None o vacío")
-                else:
-                    print(f"     ✗ empleado NO tiene atributo correo")
-            else:
-                print(f"   ✗ caso.empleado es None")
-        else:
-            print(f"   ✗ caso NO tiene atributo empleado")
-    else:
-        print(f"   ✗ Caso es None")
-    
-    # ✅ OBTENER TELÉFONO
-    if caso:
-        if hasattr(caso, 'telefono_form') and caso.telefono_form:
+        empleado = getattr(caso, 'empleado', None)
+        if empleado and getattr(empleado, 'correo', None):
+            correo_bd = empleado.correo
+        
+        # ✅ OBTENER TELÉFONO
+        if getattr(caso, 'telefono_form', None):
             whatsapp = caso.telefono_form
-            print(f"   ✅ WhatsApp configurado: {whatsapp}")
     
-    print(f"   📧 cc_empresa final: {cc_empresa}")
-    print(f"   📧 correo_bd final: {correo_bd}")
-    print(f"   📱 whatsapp final: {whatsapp}")
+    log.debug(
+        "Destinatarios: to=%s cc_empresa=%s correo_bd=%s whatsapp=%s",
+        to_email, cc_empresa, correo_bd, whatsapp
+    )
     
     # Enviar a n8n
     resultado = enviar_a_n8n(
@@ -239,7 +223,7 @@ def send_html_email(to_email, subject, html_body, caso=None):
                         'mimetype': 'application/pdf'
                     })
             except Exception as e:
-                print(f"⚠️ Error procesando adjunto {path}: {e}")
+                log.warning("⚠️ Error procesando adjunto %s: %s", path, e)
     
     # Determinar tipo de notificación desde el subject
     tipo_map = {
@@ -268,11 +252,11 @@ def send_html_email(to_email, subject, html_body, caso=None):
         if hasattr(caso, 'empresa') and caso.empresa:
             if hasattr(caso.empresa, 'email_copia') and caso.empresa.email_copia:
                 cc_email = caso.empresa.email_copia
-                print(f"📧 CC configurado: {cc_email} ({caso.empresa.nombre})")
+                log.debug("📧 CC configurado: %s (%s)", cc_email, caso.empresa.nombre)
             else:
-                print(f"ℹ️ Empresa {caso.empresa.nombre} sin email de copia configurado")
+                log.debug("ℹ️ Empresa %s sin email de copia configurado", caso.empresa.nombre)
         else:
-            print(f"⚠️ Caso {caso.serial} sin empresa asociada")
+            log.warning("⚠️ Caso %s sin empresa asociada", caso.serial)
     
     # Enviar a n8n
     resultado = enviar_a_n8n(
@@ -286,9 +270,9 @@ def send_html_email(to_email, subject, html_body, caso=None):
     )
     
     if resultado:
-        print(f"✅ Email enviado: TO={to_email}, CC_EMPRESA={cc_empresa or 'N/A'}, CC_BD={correo_bd or 'N/A'}")
+        log.info("✅ Email enviado: TO=%s, CC_EMPRESA=%s, CC_BD=%s", to_email, cc_empresa or 'N/A', correo_bd or 'N/A')
     else:
-        print(f"❌ Error enviando email")
+        log.error("❌ Error enviando email")
     
     return resultado
 
@@ -309,21 +293,23 @@ def obtener_email_tthh(empresa_nombre):
 
 @router.get("/empresas")
 async def listar_empresas(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     _: bool = Depends(verificar_token_admin)
 ):
     """Lista todas las empresas activas"""
     try:
-        empresas = db.query(Company.nombre).filter(Company.activa == True).distinct().all()
-        empresas_list = [e[0] for e in empresas if e[0]]
+        empresas = (await db.execute(
+            select(Company.nombre).where(Company.activa == True).distinct()
+        )).scalars().all()
+        empresas_list = [e for e in empresas if e]
         
-        print(f"✅ Empresas encontradas: {len(empresas_list)}")
+        log.debug("✅ Empresas encontradas: %s", len(empresas_list))
         
         return {
             "empresas": sorted(empresas_list)
         }
     except Exception as e:
-        print(f"❌ Error en /empresas: {e}")
+        log.error("❌ Error en /empresas: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/casos")
@@ -334,44 +320,43 @@ async def listar_casos(
     q: Optional[str] = None,
     page: int = 1,
     page_size: int = 20,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db_read),
     _: bool = Depends(verificar_token_admin)
 ):
     """Lista casos con filtros avanzados"""
     
-    query = db.query(Case)
+    query = select(Case)
     
     if empresa and empresa != "all" and empresa != "undefined":
-        company = db.query(Company).filter(Company.nombre == empresa).first()
-        if company:
-            query = query.filter(Case.company_id == company.id)
+        company_id = await db.scalar(select(Company.id).where(Company.nombre == empresa))
+        if company_id:
+            query = query.where(Case.company_id == company_id)
     
     if estado and estado != "all" and estado != "undefined":
         try:
-            query = query.filter(Case.estado == EstadoCaso[estado])
+            query = query.where(Case.estado == EstadoCaso[estado])
         except KeyError:
             pass
     
     if tipo and tipo != "all" and tipo != "undefined":
         try:
-            query = query.filter(Case.tipo == TipoIncapacidad[tipo])
+            query = query.where(Case.tipo == TipoIncapacidad[tipo])
         except KeyError:
             pass
     
-    if q:
-        query = query.join(Employee, Case.employee_id == Employee.id, isouter=True)
-        query = query.filter(
-            or_(
-                Case.serial.ilike(f"%{q}%"),
-                Case.cedula.ilike(f"%{q}%"),
-                Employee.nombre.ilike(f"%{q}%")
-            )
-        )
+    orden = [Case.created_at.desc()]
+    if q and q.strip():
+        # Índices de búsqueda (app.busqueda): prefijo de serial/cédula y nombre sin tildes
+        query, orden = filtrar_por_texto(query, q)
     
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     offset = (page - 1) * page_size
-    casos = query.order_by(Case.created_at.desc()).offset(offset).limit(page_size).all()
+    # Empleado y empresa en la misma ida a la BD (en async no hay lazy load)
+    casos = (await db.execute(
+        query.options(selectinload(Case.empleado), selectinload(Case.empresa))
+        .order_by(*orden).offset(offset).limit(page_size)
+    )).scalars().all()
     
     items = []
     for caso in casos:
@@ -395,32 +380,160 @@ async def listar_casos(
         "total": total,
         "page": page,
         "page_size": page_size,
+        "total_pages": (total + page_size - 1) // page_size,
+        # Con q el índice entrega como mucho LIMITE_RESULTADOS: la bandeja pide precisar
+        "busqueda_limitada": bool(q and q.strip()) and total >= LIMITE_RESULTADOS
+    }
+
+# ==================== DETALLE DEL CASO ====================
+# El portal consulta el detalle cada pocos segundos. El ETag sale de una sola
+# consulta con los sellos del caso (updated_at del caso, empleado y empresa,
+# último evento/nota/documento): si el navegador ya tiene esa versión se
+# responde 304 sin cargar el caso ni armar el JSON.
+
+DETALLE_PAGINA_MAX = 500
+
+
+def _etag(*partes) -> str:
+    return '"' + hashlib.sha1(":".join(str(p) for p in partes).encode()).hexdigest() + '"'
+
+
+def _etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match (comparación débil, RFC 9110): lista de ETags o *"""
+    if not if_none_match:
+        return False
+    candidatos = [e.strip().removeprefix('W/') for e in if_none_match.split(',')]
+    return '*' in candidatos or etag in candidatos
+
+
+def _subconsulta(columna, agregado=func.max):
+    """agregado(columna) de la tabla hija del caso de la consulta externa (índice por case_id)"""
+    tabla = columna.class_
+    return select(agregado(columna)).where(tabla.case_id == Case.id).scalar_subquery()
+
+
+def _pagina(page: int, page_size: int) -> slice:
+    page_size = min(max(page_size, 1), DETALLE_PAGINA_MAX)
+    inicio = (max(page, 1) - 1) * page_size
+    return slice(inicio, inicio + page_size)
+
+
+def _paginacion(pagina: slice, total: int) -> dict:
+    page_size = pagina.stop - pagina.start
+    return {
+        "page": pagina.start // page_size + 1,
+        "page_size": page_size,
+        "total": total,
         "total_pages": (total + page_size - 1) // page_size
     }
 
+
+async def _historial_y_notas(db, case_id: int, pag_eventos: slice, pag_notas: slice):
+    """
+    La página pedida del historial y la de notas en una sola consulta (UNION ALL
+    de las dos páginas; cada fila con los atributos que usa _detalle_como_dict)
+    """
+    def texto(columna=None):
+        return columna if columna is not None else cast(null(), String)
+
+    paginas = [
+        select(
+            literal('evento').label('origen'), CaseEvent.id, CaseEvent.created_at,
+            CaseEvent.actor, CaseEvent.accion, CaseEvent.estado_anterior, CaseEvent.estado_nuevo, CaseEvent.motivo,
+            texto().label('autor'), texto().label('contenido'), cast(null(), Boolean).label('es_importante')
+        ).where(CaseEvent.case_id == case_id)
+        .order_by(CaseEvent.created_at.desc(), CaseEvent.id.desc())
+        .offset(pag_eventos.start).limit(pag_eventos.stop - pag_eventos.start),
+        select(
+            literal('nota'), CaseNote.id, CaseNote.created_at,
+            texto(), texto(), texto(), texto(), texto(),
+            CaseNote.autor, CaseNote.contenido, CaseNote.es_importante
+        ).where(CaseNote.case_id == case_id)
+        .order_by(CaseNote.created_at.desc(), CaseNote.id.desc())
+        .offset(pag_notas.start).limit(pag_notas.stop - pag_notas.start),
+    ]
+    # ORDER BY/LIMIT por página: cada una va en su subconsulta (SQLite no los acepta en un miembro del UNION)
+    union = union_all(*(select(pagina.subquery()) for pagina in paginas)).subquery()
+    filas = (await db.execute(
+        select(union).order_by(union.c.origen, union.c.created_at.desc(), union.c.id.desc())
+    )).all()
+    return [f for f in filas if f.origen == 'evento'], [f for f in filas if f.origen == 'nota']
+
+
 @router.get("/casos/{serial}")
 async def detalle_caso(
     serial: str,
-    db: Session = Depends(get_db),
+    historial_page: int = 1,
+    historial_page_size: int = 100,
+    notas_page: int = 1,
+    notas_page_size: int = 100,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
     _: bool = Depends(verificar_token_admin)
 ):
-    """Obtiene el detalle completo de un caso"""
+    """Obtiene el detalle completo de un caso (historial y notas paginados, ETag/304)"""
+    
+    pag_eventos = _pagina(historial_page, historial_page_size)
+    pag_notas = _pagina(notas_page, notas_page_size)
+    
+    sello = (await db.execute(
+        select(
+            Case.id, Case.updated_at, Employee.updated_at.label('empleado_at'), Company.updated_at.label('empresa_at'),
+            _subconsulta(CaseEvent.id).label('ultimo_evento'),
+            _subconsulta(CaseEvent.id, func.count).label('eventos'),
+            _subconsulta(CaseNote.id).label('ultima_nota'),
+            _subconsulta(CaseNote.id, func.count).label('notas'),
+            _subconsulta(CaseDocument.updated_at).label('documentos_at'),
+        )
+        .outerjoin(Employee, Employee.id == Case.employee_id)
+        .outerjoin(Company, Company.id == Case.company_id)
+        .where(Case.serial == serial)
+    )).first()
+    
+    if sello is None:
+        # Casos cerrados antiguos: tablas de archivo (app.archivo)
+        sello = await sello_archivado(db, serial)
+        if sello is None:
+            raise HTTPException(status_code=404, detail="Caso no encontrado")
+        etag = _etag("archivo", sello.id, sello.archivado_at, pag_eventos, pag_notas)
+    else:
+        etag = _etag(*sello, pag_eventos, pag_notas)
     
-    caso = db.query(Case).filter(Case.serial == serial).first()
-    if not caso:
-        raise HTTPException(status_code=404, detail="Caso no encontrado")
+    cabeceras = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_coincide(if_none_match, etag):
+        return Response(status_code=304, headers=cabeceras)
     
-    empleado = caso.empleado
-    empresa = caso.empresa
-    documentos = caso.documentos
-    eventos = db.query(CaseEvent).filter(CaseEvent.case_id == caso.id).order_by(CaseEvent.created_at.desc()).all()
-    notas = db.query(CaseNote).filter(CaseNote.case_id == caso.id).order_by(CaseNote.created_at.desc()).all()
+    if getattr(sello, 'archivado_at', None) is not None:
+        detalle = _detalle_como_dict(**await leer_archivado(db, sello.id, pag_eventos, pag_notas))
+    else:
+        # Caso, empleado, empresa y documentos en un SELECT con JOIN; historial y notas en un segundo
+        caso = (await db.execute(
+            select(Case).where(Case.id == sello.id).options(
+                joinedload(Case.empleado), joinedload(Case.empresa), joinedload(Case.documentos)
+            )
+        )).unique().scalar_one()
+        eventos, notas = await _historial_y_notas(db, caso.id, pag_eventos, pag_notas)
+        detalle = _detalle_como_dict(
+            caso,
+            caso.empleado.nombre if caso.empleado else None,
+            caso.empresa.nombre if caso.empresa else None,
+            caso.documentos, eventos, notas
+        )
     
+    detalle["paginacion"] = {
+        "historial": _paginacion(pag_eventos, sello.eventos),
+        "notas": _paginacion(pag_notas, sello.notas),
+    }
+    return JSONResponse(content=detalle, headers=cabeceras)
+
+def _detalle_como_dict(caso, nombre_empleado, nombre_empresa, documentos, eventos, notas) -> dict:
+    """Respuesta de detalle_caso (modelos o filas del archivo, con los mismos atributos)"""
+    archivado_at = getattr(caso, 'archivado_at', None)
     return {
         "serial": caso.serial,
         "cedula": caso.cedula,
-        "nombre": empleado.nombre if empleado else "No registrado",
-        "empresa": empresa.nombre if empresa else "Otra empresa",
+        "nombre": nombre_empleado or "No registrado",
+        "empresa": nombre_empresa or "Otra empresa",
         "tipo": caso.tipo.value if caso.tipo else None,
         "subtipo": caso.subtipo,
         "dias_incapacidad": caso.dias_incapacidad,
@@ -436,6 +549,8 @@ async def detalle_caso(
         "telefono_form": caso.telefono_form,
         "created_at": caso.created_at.isoformat(),
         "updated_at": caso.updated_at.isoformat(),
+        "archivado": archivado_at is not None,
+        "archivado_at": archivado_at.isoformat() if archivado_at else None,
         "documentos": [
             {
                 "id": doc.id,
@@ -473,7 +588,7 @@ async def detalle_caso(
     }
 
 @router.post("/casos/{serial}/estado")
-async def cambiar_estado(
+def cambiar_estado(
     serial: str,
     cambio: CambioEstado,
     db: Session = Depends(get_db),
@@ -506,18 +621,19 @@ async def cambiar_estado(
                 doc.estado_doc = EstadoDocumento(doc_data.get("estado_doc", "PENDIENTE"))
                 doc.observaciones = cambio.motivo
     
-    registrar_evento(
-        db, caso.id, "cambio_estado", 
+    db.add(nuevo_evento(
+        caso.id, "cambio_estado", 
         actor="Validador",
         estado_anterior=estado_anterior,
         estado_nuevo=nuevo_estado,
         motivo=cambio.motivo,
         metadata={"fecha_limite": cambio.fecha_limite} if cambio.fecha_limite else None
-    )
+    ))
     
     if nuevo_estado in ["INCOMPLETA", "ILEGIBLE", "INCOMPLETA_ILEGIBLE"]:
         caso.bloquea_nueva = True
     
+    # Estado, documentos y evento en una sola transacción
     db.commit()
     
     return {
@@ -529,7 +645,7 @@ async def cambiar_estado(
     }
 
 @router.post("/casos/{serial}/nota")
-async def agregar_nota(
+def agregar_nota(
     serial: str,
     nota: NotaRapida,
     db: Session = Depends(get_db),
@@ -537,12 +653,12 @@ async def agregar_nota(
 ):
     """Agrega una nota rápida al caso"""
     
-    caso = db.query(Case).filter(Case.serial == serial).first()
-    if not caso:
+    case_id = db.query(Case.id).filter(Case.serial == serial).scalar()
+    if not case_id:
         raise HTTPException(status_code=404, detail="Caso no encontrado")
     
     nueva_nota = CaseNote(
-        case_id=caso.id,
+        case_id=case_id,
         autor="Validador",
         contenido=nota.contenido,
         es_importante=nota.es_importante
@@ -560,32 +676,39 @@ async def agregar_nota(
 @router.get("/stats")
 async def obtener_estadisticas(
     empresa: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db_read),
     _: bool = Depends(verificar_token_admin)
 ):
     """Obtiene estadísticas para el dashboard"""
     
-    query = db.query(Case)
+    # Un solo GROUP BY en vez de un COUNT por estado
+    query = select(Case.estado, func.count()).group_by(Case.estado)
     
+    company_id = None
     if empresa and empresa != "all" and empresa != "undefined":
-        company = db.query(Company).filter(Company.nombre == empresa).first()
-        if company:
-            query = query.filter(Case.company_id == company.id)
+        company_id = await db.scalar(select(Company.id).where(Company.nombre == empresa))
+        if company_id:
+            query = query.where(Case.company_id == company_id)
+    
+    por_estado = dict((await db.execute(query)).all())
+    # Los casos cerrados archivados (app.archivo) siguen contando
+    for estado, cantidad in (await db.execute(conteo_archivados(company_id))).all():
+        por_estado[estado] = por_estado.get(estado, 0) + cantidad
     
     stats = {
-        "total_casos": query.count(),
-        "incompletas": query.filter(Case.estado == EstadoCaso.INCOMPLETA).count(),
-        "eps": query.filter(Case.estado == EstadoCaso.EPS_TRANSCRIPCION).count(),
-        "tthh": query.filter(Case.estado == EstadoCaso.DERIVADO_TTHH).count(),
-        "completas": query.filter(Case.estado == EstadoCaso.COMPLETA).count(),
-        "nuevos": query.filter(Case.estado == EstadoCaso.NUEVO).count(),
-        "causa_extra": query.filter(Case.estado == EstadoCaso.CAUSA_EXTRA).count(),
+        "total_casos": sum(por_estado.values()),
+        "incompletas": por_estado.get(EstadoCaso.INCOMPLETA, 0),
+        "eps": por_estado.get(EstadoCaso.EPS_TRANSCRIPCION, 0),
+        "tthh": por_estado.get(EstadoCaso.DERIVADO_TTHH, 0),
+        "completas": por_estado.get(EstadoCaso.COMPLETA, 0),
+        "nuevos": por_estado.get(EstadoCaso.NUEVO, 0),
+        "causa_extra": por_estado.get(EstadoCaso.CAUSA_EXTRA, 0),
     }
     
     return stats
 
 @router.get("/reglas/requisitos")
-async def obtener_requisitos_documentos(
+def obtener_requisitos_documentos(
     tipo: str,
     dias: Optional[int] = None,
     vehiculo_fantasma: Optional[bool] = None,
@@ -660,12 +783,12 @@ async def obtener_requisitos_documentos(
     }
 
 @router.post("/busqueda-relacional")
-async def busqueda_relacional(
+def busqueda_relacional(
     request: BusquedaRelacionalRequest,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db_read),
     _: bool = Depends(verificar_token_admin)
 ):
-    """Búsqueda relacional avanzada"""
+    """Búsqueda relacional avanzada (consultas en réplica, historial diferido)"""
     
     resultados = []
     filtros_globales = request.filtros_globales or {}
@@ -740,17 +863,15 @@ async def busqueda_relacional(
                 ]
             })
     
-    historial = SearchHistory(
-        usuario="Validador",
-        tipo_busqueda="relacional",
-        parametros_json={
+    encolar(SearchHistory, {
+        "usuario": "Validador",
+        "tipo_busqueda": "relacional",
+        "parametros_json": {
             "filtros_globales": filtros_globales,
             "total_registros": len(request.registros)
         },
-        resultados_count=len(resultados)
-    )
-    db.add(historial)
-    db.commit()
+        "resultados_count": len(resultados)
+    })
     
     return {
         "resultados": resultados,
@@ -759,14 +880,15 @@ async def busqueda_relacional(
     }
 
 @router.post("/busqueda-relacional/excel")
-async def busqueda_relacional_desde_excel(
+def busqueda_relacional_desde_excel(
     archivo: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db_lectura: Session = Depends(get_db_read),
     _: bool = Depends(verificar_token_admin)
 ):
     """Búsqueda relacional desde Excel"""
+    import pandas as pd
     
-    contents = await archivo.read()
+    contents = archivo.file.read()
     
     try:
         if archivo.filename.endswith(('.xlsx', '.xls')):
@@ -832,24 +954,19 @@ async def busqueda_relacional_desde_excel(
     
     request = BusquedaRelacionalRequest(registros=registros)
     
-    historial = SearchHistory(
-        usuario="Validador",
-        tipo_busqueda="relacional_excel",
-        parametros_json={
+    resultados_response = busqueda_relacional(request, db_lectura, True)
+    
+    encolar(SearchHistory, {
+        "usuario": "Validador",
+        "tipo_busqueda": "relacional_excel",
+        "parametros_json": {
             "archivo": archivo.filename,
             "columnas_detectadas": list(columnas_detectadas.keys()),
             "total_filas": len(registros)
         },
-        resultados_count=0,
-        archivo_nombre=archivo.filename
-    )
-    db.add(historial)
-    db.commit()
-    
-    resultados_response = await busqueda_relacional(request, db, True)
-    
-    historial.resultados_count = resultados_response["total_encontrados"]
-    db.commit()
+        "resultados_count": resultados_response["total_encontrados"],
+        "archivo_nombre": archivo.filename
+    })
     
     return {
         **resultados_response,
@@ -859,16 +976,17 @@ async def busqueda_relacional_desde_excel(
     }
 
 @router.get("/exportar/casos")
-async def exportar_casos(
+def exportar_casos(
     formato: str = "xlsx",
     empresa: Optional[str] = None,
     estado: Optional[str] = None,
     desde: Optional[str] = None,
     hasta: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db_read),
     _: bool = Depends(verificar_token_admin)
 ):
     """Exportar casos a Excel"""
+    import pandas as pd
     
     query = db.query(Case).join(Employee, Case.employee_id == Employee.id, isouter=True)
     
@@ -941,7 +1059,7 @@ async def exportar_casos(
         raise HTTPException(status_code=400, detail="Formato no soportado. Use 'xlsx' o 'csv'")
 
 @router.get("/casos/{serial}/pdf")
-async def obtener_pdf_caso(
+def obtener_pdf_caso(
     serial: str,
     db: Session = Depends(get_db),
     _: bool = Depends(verificar_token_admin)
@@ -955,6 +1073,19 @@ async def obtener_pdf_caso(
     if not caso.drive_link:
         raise HTTPException(status_code=404, detail="Este caso no tiene PDF asociado")
     
+    # ✅ Si hay ediciones pendientes, mostrar la copia de trabajo
+    from app.pdf_edicion import obtener_pdf_local
+    pdf_local = obtener_pdf_local(serial)
+    if pdf_local:
+        return FileResponse(
+            str(pdf_local),
+            media_type="application/pdf",
+            headers={
+                "Content-Disposition": f"inline; filename={serial}.pdf",
+                "Access-Control-Allow-Origin": "*"
+            }
+        )
+    
     try:
         drive_id = None
         if "/file/d/" in caso.drive_link:
@@ -984,11 +1115,11 @@ async def obtener_pdf_caso(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error obteniendo PDF para {serial}: {e}")
+        log.error("❌ Error obteniendo PDF para %s: %s", serial, e)
         raise HTTPException(status_code=500, detail=f"Error procesando PDF: {str(e)}")
 
 @router.post("/casos/{serial}/validar")
-async def validar_caso_con_checks(
+def validar_caso_con_checks(
     serial: str,
     accion: str = Form(...),
     checks: List[str] = Form(default=[]),
@@ -1007,6 +1138,16 @@ async def validar_caso_con_checks(
     
     empleado = caso.empleado
     
+    # ✅ Subir ediciones pendientes del PDF antes de mover/notificar
+    try:
+        from app.pdf_edicion import finalizar_sesion_si_existe
+        resultado_edicion = finalizar_sesion_si_existe(serial)
+        if resultado_edicion and resultado_edicion.get('link'):
+            caso.drive_link = resultado_edicion['link']
+    except Exception as e:
+        log.warning("⚠️ Error subiendo ediciones pendientes de %s: %s", serial, e)
+    marca('finalizar_edicion')
+    
    # ✅ Cambiar estado en BD
     estado_map = {
         'completa': EstadoCaso.COMPLETA,
@@ -1017,20 +1158,33 @@ async def validar_caso_con_checks(
         'falsa': EstadoCaso.DERIVADO_TTHH
     }
     nuevo_estado = estado_map[accion]
+    estado_anterior = caso.estado.value
     caso.estado = nuevo_estado
     
-    # ✅ GUARDAR CHECKS EN METADATA (para sistema de reenvío)
+    # ✅ GUARDAR CHECKS EN METADATA (para sistema de reenvío y reportes por check)
+    # (asignación nueva: el JSON no rastrea mutaciones en sitio)
     if checks:
-        if not caso.metadata_form:
-            caso.metadata_form = {}
-        caso.metadata_form['checks_seleccionados'] = checks
+        caso.metadata_form = {**(caso.metadata_form or {}), 'checks_seleccionados': checks}
     
     # ✅ BLOQUEAR si es incompleta/ilegible
     if accion in ['incompleta', 'ilegible']:
         caso.bloquea_nueva = True
-        print(f"🔒 Caso {serial} BLOQUEADO - Empleado debe reenviar")
+        log.info("🔒 Caso %s BLOQUEADO - Empleado debe reenviar", serial)
     
+    # Registrar evento (mismo commit que el cambio de estado; incompleta/ilegible
+    # se redactan con IA, que siempre devuelve texto aunque sea la plantilla de respaldo)
+    usa_ia = accion in ['incompleta', 'ilegible']
+    registrar_evento(
+        db, caso.id, 
+        "validacion_con_ia" if usa_ia else "validacion_estatica",
+        actor="Validador",
+        estado_anterior=estado_anterior,
+        estado_nuevo=nuevo_estado.value,
+        motivo=observaciones,
+        metadata={"checks": checks, "usa_ia": usa_ia}
+    )
     db.commit()
+    marca('guardar_estado')
     
     # ✅ Mover archivo en Drive según el estado
     if accion in ['incompleta', 'ilegible']:
@@ -1048,28 +1202,26 @@ async def validar_caso_con_checks(
             elif 'eps' in checks_str or 'transcri' in checks_str:
                 motivo_categoria = 'EPS_No_Transcritas'
         
-        nuevo_link = incomplete_mgr.mover_a_incompletas(caso, motivo_categoria)
-        if nuevo_link:
-            caso.drive_link = nuevo_link
-            db.commit()
-            print(f"✅ Archivo movido a Incompletas/{motivo_categoria}: {nuevo_link}")
+        # En segundo plano: si Drive falla queda en /drive/drift (operacion_fallida)
+        incomplete_mgr.mover_a_incompletas(caso, motivo_categoria)
     else:
         # Usar el gestor normal para otros estados
         organizer = CaseFileOrganizer()
-        nuevo_link = organizer.mover_caso_segun_estado(caso, nuevo_estado.value, observaciones)
-        if nuevo_link:
-            caso.drive_link = nuevo_link
-            db.commit()
-            print(f"✅ Archivo movido en Drive: {nuevo_link}")
+        organizer.mover_caso_segun_estado(caso, nuevo_estado.value, observaciones)
+    marca('mover_drive')
     
     # Procesar adjuntos si los hay
     adjuntos_paths = []
+    directorio_adjuntos = None
     if adjuntos:
+        # Directorio único del request: dos validaciones del mismo caso no se pisan
+        directorio_adjuntos = crear_directorio_de_trabajo(f"{serial}_adjuntos")
         for i, adjunto in enumerate(adjuntos):
-            temp_path = os.path.join(tempfile.gettempdir(), f"{serial}_adjunto_{i}_{adjunto.filename}")
+            temp_path = str(directorio_adjuntos / f"{serial}_adjunto_{i}_{nombre_seguro(adjunto.filename)}")
             with open(temp_path, "wb") as f:
-                f.write(await adjunto.read())
+                f.write(adjunto.file.read())
             adjuntos_paths.append(temp_path)
+    marca('adjuntos')
     
     # ✅ SISTEMA HÍBRIDO: IA vs Plantillas
     from app.ia_redactor import (
@@ -1083,7 +1235,7 @@ async def validar_caso_con_checks(
     # ========== LÓGICA HÍBRIDA ==========
     if accion in ['incompleta', 'ilegible']:
         # ✅ USAR IA para casos complejos
-        print(f"🤖 Generando email con IA Claude Haiku para {serial}...")
+        log.info("🤖 Generando email con IA Claude Haiku para %s...", serial)
         
         if accion == 'incompleta':
             contenido_ia = redactar_email_incompleta(
@@ -1126,7 +1278,7 @@ async def validar_caso_con_checks(
     
     elif accion == 'tthh':
         # ✅ USAR IA para alerta a TTHH
-        print(f"🚨 Generando alerta TTHH con IA para {serial}...")
+        log.info("🚨 Generando alerta TTHH con IA para %s...", serial)
         
         contenido_ia_tthh = redactar_alerta_tthh(
             empleado.nombre if empleado else 'Colaborador/a',
@@ -1183,7 +1335,7 @@ async def validar_caso_con_checks(
     
     elif accion in ['completa', 'eps', 'falsa']:
         # ✅ PLANTILLAS ESTÁTICAS (Gratis)
-        print(f"📄 Usando plantilla estática para {accion}...")
+        log.debug("📄 Usando plantilla estática para %s...", accion)
         
         email_empleada = get_email_template_universal(
             tipo_email=accion,
@@ -1210,38 +1362,25 @@ async def validar_caso_con_checks(
             caso=caso  # ✅ COPIA AUTOMÁTICA
         )
     
-    # Limpiar adjuntos temporales
-    for temp_file in adjuntos_paths:
-        try:
-            os.remove(temp_file)
-        except:
-            pass
+    marca('redactar_y_notificar')
     
-    # Registrar evento
-    registrar_evento(
-        db, caso.id, 
-        "validacion_con_ia" if contenido_ia else "validacion_estatica",
-        actor="Validador",
-        estado_anterior=caso.estado.value,
-        estado_nuevo=nuevo_estado.value,
-        motivo=observaciones,
-        metadata={"checks": checks, "usa_ia": bool(contenido_ia)}
-    )
+    # Limpiar adjuntos temporales
+    borrar_directorio_de_trabajo(directorio_adjuntos)
     
     # ✅ SINCRONIZAR CON GOOGLE SHEETS
     try:
-        from app.google_sheets_tracker import actualizar_caso_en_sheet, registrar_cambio_estado_sheet
-        actualizar_caso_en_sheet(caso, accion="actualizar")
-        registrar_cambio_estado_sheet(
+        from app.google_sheets_tracker import sincronizar_cambio_estado
+        sincronizar_cambio_estado(
             caso, 
             estado_anterior=caso.estado.value,
             estado_nuevo=nuevo_estado.value,
             validador="Sistema",
             observaciones=observaciones
         )
-        print(f"✅ Caso {serial} sincronizado con Google Sheets")
+        log.info("✅ Caso %s sincronizado con Google Sheets", serial)
     except Exception as e:
-        print(f"⚠️ Error sincronizando con Sheets: {e}")
+        log.warning("⚠️ Error sincronizando con Sheets: %s", e)
+    marca('sheets')
     
     return {
         "status": "ok",
@@ -1256,7 +1395,7 @@ async def validar_caso_con_checks(
 
 # ✅ NUEVO: Endpoint para notificación libre con IA
 @router.post("/casos/{serial}/notificar-libre")
-async def notificar_libre_con_ia(
+def notificar_libre_con_ia(
     serial: str,
     mensaje_personalizado: str = Form(...),
     adjuntos: List[UploadFile] = File(default=[]),
@@ -1276,7 +1415,7 @@ async def notificar_libre_con_ia(
     # ✅ Redactar con IA
     from app.ia_redactor import redactar_mensaje_personalizado
     
-    print(f"🤖 Redactando mensaje personalizado con IA para {serial}...")
+    log.info("🤖 Redactando mensaje personalizado con IA para %s...", serial)
     
     contenido_ia = redactar_mensaje_personalizado(
         empleado.nombre if empleado else 'Colaborador/a',
@@ -1286,11 +1425,13 @@ async def notificar_libre_con_ia(
     
     # Procesar adjuntos
     adjuntos_paths = []
+    directorio_adjuntos = None
     if adjuntos:
+        directorio_adjuntos = crear_directorio_de_trabajo(f"{serial}_extra")
         for i, adjunto in enumerate(adjuntos):
-            temp_path = os.path.join(tempfile.gettempdir(), f"{serial}_extra_{i}_{adjunto.filename}")
+            temp_path = str(directorio_adjuntos / f"{serial}_extra_{i}_{nombre_seguro(adjunto.filename)}")
             with open(temp_path, "wb") as f:
-                f.write(await adjunto.read())
+                f.write(adjunto.file.read())
             adjuntos_paths.append(temp_path)
     
     # Insertar en plantilla
@@ -1317,11 +1458,7 @@ async def notificar_libre_con_ia(
     )
     
     # Limpiar adjuntos
-    for temp_file in adjuntos_paths:
-        try:
-            os.remove(temp_file)
-        except:
-            pass
+    borrar_directorio_de_trabajo(directorio_adjuntos)
     
     # Registrar evento
     registrar_evento(
@@ -1331,6 +1468,7 @@ async def notificar_libre_con_ia(
         motivo=mensaje_personalizado[:200],  # Primeros 200 caracteres
         metadata={"mensaje_original": mensaje_personalizado}
     )
+    db.commit()
     
     return {
         "status": "ok",
@@ -1339,7 +1477,7 @@ async def notificar_libre_con_ia(
     }
 
 @router.get("/checks-disponibles/{tipo_incapacidad}")
-async def obtener_checks_disponibles_endpoint(
+def obtener_checks_disponibles_endpoint(
     tipo_incapacidad: str,
     db: Session = Depends(get_db),
     _: bool = Depends(verificar_token_admin)
@@ -1351,323 +1489,266 @@ async def obtener_checks_disponibles_endpoint(
         "tipo_incapacidad": tipo_incapacidad,
         "checks": checks
     }
+
+@router.get("/reportes/casos-por-checks")
+async def casos_por_checks(
+    checks: str,
+    modo: str = "alguno",
+    quincena: Optional[str] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    vigentes: bool = False,
+    empresa: Optional[str] = None,
+    campo: List[str] = Query(default=[]),
+    page: int = 1,
+    page_size: int = 50,
+    db: AsyncSession = Depends(get_async_db_read),
+    _: bool = Depends(verificar_token_admin)
+):
+    """
+    Casos marcados con checks de CHECKS_DISPONIBLES en un periodo
+    
+    - checks: códigos separados por coma (soat_faltante,furips_faltante)
+    - modo: 'alguno' o 'todos' los checks
+    - quincena: 'actual', 'anterior' o AAAA-MM-1/2 (o desde/hasta AAAA-MM-DD)
+    - vigentes: solo casos que todavía tienen esos checks (no resueltos)
+    - campo: filtros del formulario, ej. campo=vehiculo_fantasma:Sí
+    """
+    from app.filtros_metadata import (
+        checks_marcados_en, checks_vigentes, campo_igual, rango_quincena, CAMPOS_METADATA
+    )
+    
+    codigos = [c.strip() for c in checks.split(",") if c.strip()]
+    desconocidos = [c for c in codigos if c not in CHECKS_DISPONIBLES]
+    if not codigos or desconocidos:
+        raise HTTPException(status_code=400, detail=f"Checks no válidos: {', '.join(desconocidos) or '(vacío)'}")
+    if modo not in ("alguno", "todos"):
+        raise HTTPException(status_code=400, detail="Modo inválido. Use 'alguno' o 'todos'")
+    
+    try:
+        if quincena:
+            inicio, fin = rango_quincena(quincena)
+        else:
+            inicio = datetime.fromisoformat(desde) if desde else None
+            fin = datetime.fromisoformat(hasta) if hasta else None
+            if fin and len(hasta) == 10:
+                fin += timedelta(days=1)  # fecha sola: el día completo
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    query = select(Case).where(checks_marcados_en(codigos, modo, inicio, fin))
+    if vigentes:
+        query = query.where(checks_vigentes(codigos, modo))
+    
+    for filtro in campo:
+        clave, _sep, valor = filtro.partition(":")
+        if clave not in CAMPOS_METADATA:
+            raise HTTPException(status_code=400, detail=f"Campo no filtrable: {clave}")
+        query = query.where(campo_igual(clave, valor))
+    
+    if empresa and empresa != "all" and empresa != "undefined":
+        company_id = await db.scalar(select(Company.id).where(Company.nombre == empresa))
+        if company_id:
+            query = query.where(Case.company_id == company_id)
+    
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    casos = (await db.execute(
+        query.options(selectinload(Case.empleado), selectinload(Case.empresa))
+        .order_by(Case.created_at.desc()).offset((page - 1) * page_size).limit(page_size)
+    )).scalars().all()
+    
+    return {
+        "checks": codigos,
+        "modo": modo,
+        "desde": inicio.isoformat() if inicio else None,
+        "hasta": fin.isoformat() if fin else None,
+        "items": [{
+            "serial": caso.serial,
+            "cedula": caso.cedula,
+            "nombre": caso.empleado.nombre if caso.empleado else "No registrado",
+            "empresa": caso.empresa.nombre if caso.empresa else "Otra empresa",
+            "tipo": caso.tipo.value if caso.tipo else None,
+            "estado": caso.estado.value,
+            "checks_vigentes": (caso.metadata_form or {}).get("checks_seleccionados", []),
+            "created_at": caso.created_at.isoformat()
+        } for caso in casos],
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": (total + page_size - 1) // page_size
+    }
 # ==================== AGREGAR AL FINAL DE app/validador.py ====================
 
 @router.post("/casos/{serial}/editar-pdf")
-async def editar_pdf_caso(
+def editar_pdf_caso(
     serial: str,
-    request: Request,
+    datos: dict = Body(...),
     token: str = Header(None, alias="X-Admin-Token"),
     db: Session = Depends(get_db)
 ):
     """
-    Edita el PDF de un caso con múltiples operaciones
+    Edita el PDF de un caso sobre una copia local de trabajo
+    
+    Body: {"operaciones": {...}, "finalizar": false}
+    - Las ediciones se guardan incrementalmente en local (milisegundos)
+    - Drive se actualiza al finalizar (finalizar=true, /editar-pdf/finalizar
+      o al validar el caso)
+    
+    Operaciones soportadas:
+    - rotate: [{page_num, angle}]
+    - crop_custom: [{page_num, x, y, width, height}]
+    - reorder: {new_order: [1, 0, 2, ...]}
+    - annotate: [{page_num, type, coords: [x1,y1,x2,y2], text, color: [r,g,b]}]
+    - delete_page: {pages: [0, 2, 5]}
     """
+    from app.pdf_edicion import SesionEdicionPDF
+    from app.drive_manager import DriveFileManager, extraer_file_id
+    
     verificar_token_admin(token)
     
-    try:
-        datos = await request.json()
-        operaciones = datos.get('operaciones', {})
-        print(f"📝 Operaciones recibidas: {operaciones}")
-    except:
-        raise HTTPException(status_code=400, detail="Datos inválidos")
+    operaciones = datos.get('operaciones', {})
+    finalizar = bool(datos.get('finalizar', False))
+    log.debug("📝 Operaciones recibidas: %s", operaciones)
     
     caso = db.query(Case).filter(Case.serial == serial).first()
     if not caso or not caso.drive_link:
         raise HTTPException(status_code=404, detail="Caso o PDF no encontrado")
     
-    # Extraer file_id
-    if '/file/d/' in caso.drive_link:
-        file_id = caso.drive_link.split('/file/d/')[1].split('/')[0]
-    elif 'id=' in caso.drive_link:
-        file_id = caso.drive_link.split('id=')[1].split('&')[0]
-    else:
+    file_id = extraer_file_id(caso.drive_link)
+    if not file_id:
         raise HTTPException(status_code=400, detail="Link de Drive inválido")
     
-    download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
-    print(f"📥 Descargando PDF desde: {download_url}")
-    
-    response = requests.get(download_url)
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Error descargando PDF")
-    
-    temp_input = os.path.join(tempfile.gettempdir(), f"{serial}_original.pdf")
-    temp_output = os.path.join(tempfile.gettempdir(), f"{serial}_edited.pdf")
-    
-    with open(temp_input, 'wb') as f:
-        f.write(response.content)
-    
-    print(f"✅ PDF descargado: {temp_input}")
+    sesion = SesionEdicionPDF(serial)
     
     try:
-        import fitz  # PyMuPDF
-        pdf_doc = fitz.open(temp_input)
-        
-        # PROCESAR OPERACIONES
-        for op_type, op_data in operaciones.items():
-            print(f"🔧 Procesando: {op_type}")
+        with sesion.lock:
+            sesion.abrir(file_id)
+            modificaciones = sesion.aplicar(operaciones)
             
-            if op_type == 'rotate':
-                for item in op_data:
-                    page_num = item['page_num']
-                    angle = item['angle']
-                    print(f"   🔄 Rotando página {page_num} {angle}°")
-                    page = pdf_doc[page_num]
-                    page.set_rotation(angle)
-            
-            elif op_type == 'enhance_quality':
-                # Nota: enhance_quality requiere procesamiento de imagen
-                # Por ahora solo loguear
-                print(f"   ✨ Mejora de calidad solicitada (requiere procesamiento avanzado)")
-        
-        # Guardar PDF
-        pdf_doc.save(temp_output, garbage=4, deflate=True)
-        pdf_doc.close()
-        print(f"💾 PDF guardado: {temp_output}")
-        
-        # Subir a Drive
-        from app.drive_manager import CaseFileOrganizer
-        organizer = CaseFileOrganizer()
-        nuevo_link = organizer.actualizar_pdf_editado(caso, temp_output)
+            resultado_subida = None
+            if finalizar:
+                resultado_subida = sesion.finalizar(DriveFileManager())
         
-        if nuevo_link:
-            caso.drive_link = nuevo_link
+        if resultado_subida and resultado_subida.get('link'):
+            caso.drive_link = resultado_subida['link']
             db.commit()
-            print(f"✅ PDF actualizado en Drive")
-        
-        # Limpiar
-        os.remove(temp_input)
-        os.remove(temp_output)
+            log.info("✅ PDF actualizado en Drive")
         
         return {
             "status": "ok",
             "serial": serial,
-            "nuevo_link": nuevo_link,
-            "mensaje": "PDF editado correctamente"
+            "nuevo_link": caso.drive_link,
+            "modificaciones": modificaciones,
+            "pendiente_subida": sesion.existe(),
+            "mensaje": "PDF editado y actualizado en Drive" if finalizar else "PDF editado (pendiente de subir a Drive)"
         }
     
+    except TimeoutError as e:
+        # Otra instancia o pestaña está editando el mismo PDF
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
-        print(f"❌ Error: {e}")
-        if os.path.exists(temp_input): os.remove(temp_input)
-        if os.path.exists(temp_output): os.remove(temp_output)
-        raise HTTPException(status_code=500, detail=str(e))
-    from app.pdf_editor import PDFEditor
-    import cv2
-    import numpy as np
-    from app.validador import verificar_token_admin
-    
-    verificar_token_admin(token)
-    
-    try:
-        datos = await request.json()
-        operaciones = datos.get('operaciones', {})
-    except:
-        raise HTTPException(status_code=400, detail="Datos inválidos")
-    
-    caso = db.query(Case).filter(Case.serial == serial).first()
-    if not caso or not caso.drive_link:
-        raise HTTPException(status_code=404, detail="Caso o PDF no encontrado")
-    
-    # Extraer file_id y descargar PDF
-    if '/file/d/' in caso.drive_link:
-        file_id = caso.drive_link.split('/file/d/')[1].split('/')[0]
-    elif 'id=' in caso.drive_link:
-        file_id = caso.drive_link.split('id=')[1].split('&')[0]
-    else:
-        raise HTTPException(status_code=400, detail="Link de Drive inválido")
-    
-    download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
-    response = requests.get(download_url)
-    
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Error descargando PDF")
+        log.error("❌ Error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error editando PDF: {str(e)}")
+
+@router.get("/casos/{serial}/editar-pdf/estado")
+def estado_edicion_pdf(
+    serial: str,
+    _: bool = Depends(verificar_token_admin)
+):
+    """Estado de la sesión de edición (ediciones pendientes de subir)"""
+    from app.pdf_edicion import SesionEdicionPDF
     
-    temp_input = os.path.join(tempfile.gettempdir(), f"{serial}_original.pdf")
-    temp_output = os.path.join(tempfile.gettempdir(), f"{serial}_edited.pdf")
+    return SesionEdicionPDF(serial).estado()
+
+@router.post("/casos/{serial}/editar-pdf/deshacer")
+def deshacer_edicion_pdf(
+    serial: str,
+    _: bool = Depends(verificar_token_admin)
+):
+    """Deshace la última edición usando el journal (sin descargar de Drive)"""
+    from app.pdf_edicion import SesionEdicionPDF
     
-    with open(temp_input, 'wb') as f:
-        f.write(response.content)
+    sesion = SesionEdicionPDF(serial)
+    if not sesion.existe():
+        raise HTTPException(status_code=404, detail="No hay sesión de edición activa")
     
     try:
-        editor = PDFEditor(temp_input)
-        
-        # ✅ PROCESAR OPERACIONES
-        for op_type, op_data in operaciones.items():
-            if op_type == 'enhance_quality':
-                for page_num in op_data.get('pages', []):
-                    editor.enhance_page_quality(page_num)
-            
-            elif op_type == 'rotate':
-                for item in op_data:
-                    editor.rotate_page(item['page_num'], item['angle'])
-            
-            elif op_type == 'aplicar_filtro':
-                editor.aplicar_filtro_imagen(op_data['page_num'], op_data['filtro'])
-            
-            elif op_type == 'crop_auto':
-                for item in op_data:
-                    editor.auto_crop_page(item['page_num'], item.get('margin', 10))
-            
-            elif op_type == 'deskew':
-                page_num = op_data.get('page_num', 0)
-                page = editor.doc[page_num]
-                mat = fitz.Matrix(2.0, 2.0)
-                pix = page.get_pixmap(matrix=mat)
-                img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
-                
-                deskewed = editor.auto_deskew(img_array)
-                
-                from PIL import Image
-                img_pil = Image.fromarray(deskewed)
-                img_bytes = io.BytesIO()
-                img_pil.save(img_bytes, format='PNG')
-                img_bytes.seek(0)
-                
-                rect = page.rect
-                page.clean_contents()
-                page.insert_image(rect, stream=img_bytes.getvalue())
-        
-        editor.save_changes(temp_output)
-        
-        # Subir a Drive
-        from app.drive_manager import CaseFileOrganizer
-        organizer = CaseFileOrganizer()
-        nuevo_link = organizer.actualizar_pdf_editado(caso, temp_output)
-        
-        if nuevo_link:
-            caso.drive_link = nuevo_link
-            db.commit()
-        
-        os.remove(temp_input)
-        os.remove(temp_output)
-        
-        return {
-            "status": "ok",
-            "serial": serial,
-            "nuevo_link": nuevo_link,
-            "modificaciones": editor.get_modifications_log(),
-            "mensaje": "PDF editado y actualizado en Drive"
-        }
+        with sesion.lock:
+            deshecho = sesion.deshacer()
+    except TimeoutError as e:
+        # Otra instancia o pestaña está editando el mismo PDF
+        raise HTTPException(status_code=409, detail=str(e))
     
-    except Exception as e:
-        if os.path.exists(temp_input):
-            os.remove(temp_input)
-        if os.path.exists(temp_output):
-            os.remove(temp_output)
-        raise HTTPException(status_code=500, detail=f"Error editando PDF: {str(e)}")
+    if not deshecho:
+        raise HTTPException(status_code=400, detail="No hay ediciones para deshacer")
+    
+    return {
+        "status": "ok",
+        "serial": serial,
+        "deshecho": deshecho,
+        **sesion.estado()
+    }
+
+@router.post("/casos/{serial}/editar-pdf/finalizar")
+def finalizar_edicion_pdf(
+    serial: str,
     db: Session = Depends(get_db),
     _: bool = Depends(verificar_token_admin)
 ):
-    """
-    Edita el PDF de un caso con múltiples operaciones
-    
-    Operaciones soportadas:
-    - enhance_quality: {page_num: int}
-    - rotate: {page_num: int, angle: int}
-    - crop_auto: {page_num: int, margin: int}
-    - crop_custom: {page_num: int, x: int, y: int, width: int, height: int}
-    - reorder: {new_order: [1, 0, 2, ...]}
-    - annotate: {page_num: int, type: str, coords: [x1,y1,x2,y2], text: str, color: [r,g,b]}
-    - delete_page: {pages: [0, 2, 5]}
-    """
-    from app.pdf_editor import PDFEditor
+    """Sube a Drive la versión final de la copia de trabajo"""
+    from app.pdf_edicion import finalizar_sesion_si_existe
     
     caso = db.query(Case).filter(Case.serial == serial).first()
-    if not caso or not caso.drive_link:
-        raise HTTPException(status_code=404, detail="Caso o PDF no encontrado")
-    
-    # Extraer file_id y descargar PDF
-    if '/file/d/' in caso.drive_link:
-        file_id = caso.drive_link.split('/file/d/')[1].split('/')[0]
-    elif 'id=' in caso.drive_link:
-        file_id = caso.drive_link.split('id=')[1].split('&')[0]
-    else:
-        raise HTTPException(status_code=400, detail="Link de Drive inválido")
+    if not caso:
+        raise HTTPException(status_code=404, detail="Caso no encontrado")
     
-    download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
-    response = requests.get(download_url)
+    try:
+        resultado = finalizar_sesion_si_existe(serial)
+    except TimeoutError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error subiendo PDF: {str(e)}")
     
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Error descargando PDF")
+    if resultado is None:
+        raise HTTPException(status_code=404, detail="No hay sesión de edición activa")
     
-    temp_input = os.path.join(tempfile.gettempdir(), f"{serial}_original.pdf")
-    temp_output = os.path.join(tempfile.gettempdir(), f"{serial}_edited.pdf")
+    if resultado.get('link'):
+        caso.drive_link = resultado['link']
+        registrar_evento(
+            db, caso.id,
+            "pdf_editado",
+            actor="Validador",
+            motivo=f"PDF editado ({resultado['total_ediciones']} ediciones)"
+        )
+        db.commit()
     
-    with open(temp_input, 'wb') as f:
-        f.write(response.content)
+    return {
+        "status": "ok",
+        "serial": serial,
+        "subido": resultado['subido'],
+        "nuevo_link": caso.drive_link,
+        "mensaje": "PDF actualizado en Drive" if resultado['subido'] else "Sin cambios, no fue necesario subir"
+    }
+
+@router.delete("/casos/{serial}/editar-pdf")
+def descartar_edicion_pdf(
+    serial: str,
+    _: bool = Depends(verificar_token_admin)
+):
+    """Descarta la copia de trabajo sin tocar Drive"""
+    from app.pdf_edicion import SesionEdicionPDF
     
+    sesion = SesionEdicionPDF(serial)
     try:
-        editor = PDFEditor(temp_input)
-        
-        for op_type, op_data in operaciones.items():
-            if op_type == 'enhance_quality':
-                for page_num in op_data.get('pages', []):
-                    editor.enhance_page_quality(page_num)
-            
-            elif op_type == 'rotate':
-                for item in op_data:
-                    editor.rotate_page(item['page_num'], item['angle'])
-            
-            elif op_type == 'crop_auto':
-                for item in op_data:
-                    editor.auto_crop_page(item['page_num'], item.get('margin', 10))
-            
-            elif op_type == 'crop_custom':
-                for item in op_data:
-                    editor.crop_page_custom(
-                        item['page_num'],
-                        item['x'], item['y'],
-                        item['width'], item['height']
-                    )
-            
-            elif op_type == 'reorder':
-                editor.reorder_pages(op_data['new_order'])
-            
-            elif op_type == 'annotate':
-                for item in op_data:
-                    color_tuple = tuple(item.get('color', [1, 0, 0]))
-                    editor.add_annotation(
-                        item['page_num'],
-                        item['type'],
-                        tuple(item['coords']),
-                        item.get('text', ''),
-                        color_tuple
-                    )
-            
-            elif op_type == 'delete_page':
-                for page_num in sorted(op_data['pages'], reverse=True):
-                    editor.delete_page(page_num)
-        
-        editor.save_changes(temp_output)
-        
-        # Subir a Drive
-        organizer = CaseFileOrganizer()
-        nuevo_link = organizer.actualizar_pdf_editado(caso, temp_output)
-        
-        if nuevo_link:
-            caso.drive_link = nuevo_link
-            db.commit()
-        
-        os.remove(temp_input)
-        os.remove(temp_output)
-        
-        return {
-            "status": "ok",
-            "serial": serial,
-            "nuevo_link": nuevo_link,
-            "modificaciones": editor.get_modifications_log(),
-            "mensaje": "PDF editado y actualizado en Drive"
-        }
+        with sesion.lock:
+            sesion.descartar()
+    except TimeoutError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
-    except Exception as e:
-        if os.path.exists(temp_input):
-            os.remove(temp_input)
-        if os.path.exists(temp_output):
-            os.remove(temp_output)
-        raise HTTPException(status_code=500, detail=f"Error editando PDF: {str(e)}")
+    return {"status": "ok", "serial": serial, "mensaje": "Ediciones descartadas"}
 
 @router.post("/casos/{serial}/crear-adjunto")
-async def crear_adjunto_desde_pdf(
+def crear_adjunto_desde_pdf(
     serial: str,
     page_num: int,
     coords: List[int],
@@ -1690,14 +1771,23 @@ async def crear_adjunto_desde_pdf(
     else:
         raise HTTPException(status_code=400, detail="Link inválido")
     
-    download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
-    response = requests.get(download_url)
+    directorio = crear_directorio_de_trabajo(f"{serial}_recorte")
+    temp_pdf = str(directorio / f"{serial}_temp.pdf")
+    temp_img = str(directorio / f"{serial}_adjunto_{page_num}.png")
     
-    temp_pdf = os.path.join(tempfile.gettempdir(), f"{serial}_temp.pdf")
-    temp_img = os.path.join(tempfile.gettempdir(), f"{serial}_adjunto_{page_num}.png")
+    # ✅ Usar la copia de trabajo si existe (evita descargar de nuevo)
+    from app.pdf_edicion import obtener_pdf_local
+    pdf_local = obtener_pdf_local(serial)
     
-    with open(temp_pdf, 'wb') as f:
-        f.write(response.content)
+    if pdf_local:
+        import shutil
+        shutil.copyfile(pdf_local, temp_pdf)
+    else:
+        download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
+        response = requests.get(download_url)
+        
+        with open(temp_pdf, 'wb') as f:
+            f.write(response.content)
     
     try:
         manager = PDFAttachmentManager()
@@ -1710,8 +1800,7 @@ async def crear_adjunto_desde_pdf(
         with open(temp_img, 'rb') as f:
             img_data = f.read()
         
-        os.remove(temp_pdf)
-        os.remove(temp_img)
+        borrar_directorio_de_trabajo(directorio)
         
         return StreamingResponse(
             io.BytesIO(img_data),
@@ -1720,17 +1809,71 @@ async def crear_adjunto_desde_pdf(
         )
     
     except Exception as e:
-        if os.path.exists(temp_pdf):
-            os.remove(temp_pdf)
-        if os.path.exists(temp_img):
-            os.remove(temp_img)
+        borrar_directorio_de_trabajo(directorio)
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 # ==================== ENDPOINTS PARA MANEJO DE REENVÍOS ====================
 
+@router.get("/reenvios/pendientes")
+async def listar_reenvios_pendientes(
+    empresa: Optional[str] = None,
+    page: int = 1,
+    page_size: int = 50,
+    db: AsyncSession = Depends(get_async_db_read),
+    _: bool = Depends(verificar_token_admin)
+):
+    """
+    Reenvíos esperando revisión en todas las empresas, el más antiguo primero
+    (una consulta sobre el índice (estado, created_at) de case_resubmissions)
+    """
+    
+    query = select(CaseResubmission).where(CaseResubmission.estado == PENDIENTE)
+    
+    if empresa and empresa != "all" and empresa != "undefined":
+        query = query.join(Case, CaseResubmission.case_id == Case.id).join(
+            Company, Case.company_id == Company.id
+        ).where(Company.nombre == empresa)
+    
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    
+    reenvios = (await db.execute(
+        query.options(
+            selectinload(CaseResubmission.caso).selectinload(Case.empleado),
+            selectinload(CaseResubmission.caso).selectinload(Case.empresa)
+        ).order_by(CaseResubmission.created_at).offset((page - 1) * page_size).limit(page_size)
+    )).scalars().all()
+    
+    ahora = datetime.utcnow()
+    items = []
+    for reenvio in reenvios:
+        caso = reenvio.caso
+        items.append({
+            "serial": caso.serial,
+            "cedula": caso.cedula,
+            "nombre": caso.empleado.nombre if caso.empleado else "No registrado",
+            "empresa": caso.empresa.nombre if caso.empresa else "Otra empresa",
+            "tipo": caso.tipo.value if caso.tipo else None,
+            "estado_caso": caso.estado.value,
+            "numero_reenvio": reenvio.numero,
+            "fecha": reenvio.created_at.isoformat() if reenvio.created_at else None,
+            "horas_esperando": round((ahora - reenvio.created_at).total_seconds() / 3600, 1) if reenvio.created_at else None,
+            "link": reenvio.link,
+            "archivos": reenvio.archivos or []
+        })
+    
+    return {
+        "items": items,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": (total + page_size - 1) // page_size
+    }
+
+
 @router.get("/casos/{serial}/comparar-versiones")
-async def comparar_versiones_reenvio(
+def comparar_versiones_reenvio(
     serial: str,
+    recalcular: bool = False,
     db: Session = Depends(get_db),
     _: bool = Depends(verificar_token_admin)
 ):
@@ -1738,6 +1881,8 @@ async def comparar_versiones_reenvio(
     Muestra al validador ambas versiones para comparar:
     - Versión incompleta anterior
     - Versión reenviada nueva
+    - Páginas iguales / cambiadas / agregadas / eliminadas con miniaturas
+      (si aún no está lista, "comparacion.estado" es PENDIENTE)
     """
     
     caso = db.query(Case).filter(Case.serial == serial).first()
@@ -1746,11 +1891,27 @@ async def comparar_versiones_reenvio(
         raise HTTPException(status_code=404, detail="Caso no encontrado")
     
     # Verificar si hay reenvíos
-    if not caso.metadata_form or 'reenvios' not in caso.metadata_form:
+    reenvios = [como_dict(r) for r in reenvios_del_caso(db, caso)]
+    if not reenvios:
         raise HTTPException(status_code=404, detail="No hay reenvíos para este caso")
     
-    reenvios = caso.metadata_form['reenvios']
-    ultimo_reenvio = reenvios[-1]
+    ultimo = reenvios[-1]
+    
+    # Comparación página por página (precalculada en segundo plano al recibir el reenvío)
+    from app.drive_manager import extraer_file_id
+    from app.database import VersionComparison
+    from app.comparador_versiones import programar_comparacion
+    
+    comparacion = None
+    file_id_anterior = extraer_file_id(caso.drive_link)
+    file_id_nuevo = extraer_file_id(ultimo['link'])
+    if file_id_anterior and file_id_nuevo and file_id_anterior != file_id_nuevo:
+        comparacion = db.query(VersionComparison).filter(
+            VersionComparison.file_id_anterior == file_id_anterior,
+            VersionComparison.file_id_nuevo == file_id_nuevo
+        ).first()
+        if not comparacion or comparacion.estado == 'ERROR' or recalcular:
+            comparacion = programar_comparacion(db, caso.id, file_id_anterior, file_id_nuevo, forzar=recalcular)
     
     return {
         "serial": serial,
@@ -1764,18 +1925,25 @@ async def comparar_versiones_reenvio(
             "fecha": caso.updated_at.isoformat()
         },
         "version_nueva": {
-            "link": ultimo_reenvio['link'],
-            "estado": ultimo_reenvio['estado'],
-            "fecha": ultimo_reenvio['fecha'],
-            "archivos": ultimo_reenvio['archivos']
+            "link": ultimo['link'],
+            "estado": ultimo['estado'],
+            "fecha": ultimo['fecha'],
+            "archivos": ultimo['archivos'],
+            "paginas_nuevas": ultimo.get('paginas_nuevas'),
+            "archivos_repetidos": ultimo.get('archivos_repetidos', [])
         },
         "total_reenvios": len(reenvios),
-        "historial_reenvios": reenvios
+        "historial_reenvios": reenvios,
+        "comparacion": {
+            "estado": comparacion.estado,
+            "resultado": comparacion.resultado if comparacion.estado == 'LISTA' else None,
+            "error": comparacion.error
+        } if comparacion else None
     }
 
 
 @router.post("/casos/{serial}/aprobar-reenvio")
-async def aprobar_reenvio(
+def aprobar_reenvio(
     serial: str,
     decision: str = Form(...),  # 'aprobar' o 'rechazar'
     motivo: str = Form(default=""),
@@ -1794,45 +1962,45 @@ async def aprobar_reenvio(
     if not caso:
         raise HTTPException(status_code=404, detail="Caso no encontrado")
     
-    if not caso.metadata_form or 'reenvios' not in caso.metadata_form:
+    reenvio = ultimo_reenvio(db, caso)
+    if not reenvio:
         raise HTTPException(status_code=400, detail="No hay reenvíos pendientes")
     
-    reenvios = caso.metadata_form['reenvios']
-    ultimo_reenvio = reenvios[-1]
-    
     if decision == 'aprobar':
         # ✅ APROBAR REENVÍO
         
-        print(f"✅ Aprobando reenvío de {serial}...")
+        log.info("✅ Aprobando reenvío de %s...", serial)
         
         # 1. Buscar y eliminar versión incompleta de Drive
-        from app.drive_manager import IncompleteFileManager
+        # (las operaciones de Drive se acumulan y se envían en batch después del commit)
+        from app.drive_manager import IncompleteFileManager, DriveOperationsBatcher
         incomplete_mgr = IncompleteFileManager()
+        batcher = DriveOperationsBatcher()
         
         version_incompleta = incomplete_mgr.buscar_version_incompleta(serial)
         if version_incompleta:
-            print(f"   🗑️ Eliminando versión incompleta: {version_incompleta['filename']}")
-            incomplete_mgr.eliminar_version_incompleta(version_incompleta['file_id'])
+            log.info("🗑️ Eliminando versión incompleta: %s", version_incompleta['filename'])
+            incomplete_mgr.eliminar_version_incompleta(version_incompleta['file_id'], batcher=batcher)
+            
+            # Las huellas siguen siendo válidas, pero ya no hay archivo al cual referenciar
+            from app.database import DocumentBlob
+            db.query(DocumentBlob).filter(
+                DocumentBlob.case_id == caso.id,
+                DocumentBlob.drive_file_id == version_incompleta['file_id']
+            ).update({DocumentBlob.drive_file_id: None}, synchronize_session=False)
         
         # 2. Actualizar caso con nueva versión
-        caso.drive_link = ultimo_reenvio['link']
+        caso.drive_link = reenvio.link
         caso.estado = EstadoCaso.COMPLETA
         caso.bloquea_nueva = False  # ✅ DESBLOQUEAR
         
-        # 3. Actualizar metadata
-        ultimo_reenvio['estado'] = 'APROBADO'
-        ultimo_reenvio['fecha_aprobacion'] = datetime.now().isoformat()
-        ultimo_reenvio['validador_decision'] = 'APROBAR'
-        ultimo_reenvio['motivo'] = motivo or "Documentos correctos"
-        caso.metadata_form['reenvios'][-1] = ultimo_reenvio
+        # 3. Registrar la decisión en el reenvío
+        decidir_reenvio(reenvio, APROBADO, motivo or "Documentos correctos")
         
         # 4. Mover archivo en Drive a Validadas
         from app.drive_manager import CaseFileOrganizer
         organizer = CaseFileOrganizer()
-        nuevo_link = organizer.mover_caso_segun_estado(caso, 'COMPLETA')
-        if nuevo_link:
-            caso.drive_link = nuevo_link
-            print(f"   ✅ Archivo movido a Validadas: {nuevo_link}")
+        organizer.mover_caso_segun_estado(caso, 'COMPLETA', batcher=batcher)
         
         # 5. Registrar evento
         registrar_evento(
@@ -1845,6 +2013,7 @@ async def aprobar_reenvio(
         )
         
         db.commit()
+        batcher.ejecutar_en_segundo_plano()
         
         # 6. Enviar email al empleado
         from app.email_templates import get_email_template_universal
@@ -1869,13 +2038,12 @@ async def aprobar_reenvio(
             caso=caso
         )
         
-        print(f"✅ Reenvío APROBADO: {serial} - Caso desbloqueado y validado")
+        log.info("✅ Reenvío APROBADO: %s - Caso desbloqueado y validado", serial)
         
         # 7. Sincronizar con Sheets
         try:
-            from app.google_sheets_tracker import actualizar_caso_en_sheet, registrar_cambio_estado_sheet
-            actualizar_caso_en_sheet(caso, accion="actualizar")
-            registrar_cambio_estado_sheet(
+            from app.google_sheets_tracker import sincronizar_cambio_estado
+            sincronizar_cambio_estado(
                 caso,
                 estado_anterior="INCOMPLETA",
                 estado_nuevo="COMPLETA",
@@ -1883,7 +2051,7 @@ async def aprobar_reenvio(
                 observaciones="Reenvío aprobado"
             )
         except Exception as e:
-            print(f"⚠️ Error sincronizando con Sheets: {e}")
+            log.warning("⚠️ Error sincronizando con Sheets: %s", e)
         
         return {
             "success": True,
@@ -1898,7 +2066,7 @@ async def aprobar_reenvio(
     elif decision == 'rechazar':
         # ❌ RECHAZAR REENVÍO
         
-        print(f"❌ Rechazando reenvío de {serial}...")
+        log.info("❌ Rechazando reenvío de %s...", serial)
         
         # 1. Determinar categoría para Incompletas
         motivo_categoria = 'Faltan_Soportes'  # Default
@@ -1917,34 +2085,28 @@ async def aprobar_reenvio(
             elif 'eps' in motivo.lower():
                 motivo_categoria = 'EPS_No_Transcritas'
         
-        # 2. Mover nueva versión TAMBIÉN a Incompletas
-        from app.drive_manager import IncompleteFileManager
+        # 2. Mover nueva versión TAMBIÉN a Incompletas (se envía después del commit)
+        from app.drive_manager import IncompleteFileManager, DriveOperationsBatcher
         incomplete_mgr = IncompleteFileManager()
+        batcher = DriveOperationsBatcher()
         
         # Crear caso temporal con el nuevo link para moverlo
         caso_temp = caso
-        caso_temp.drive_link = ultimo_reenvio['link']
-        
-        nuevo_link_incompleta = incomplete_mgr.mover_a_incompletas(caso_temp, motivo_categoria)
+        caso_temp.drive_link = reenvio.link
         
-        if nuevo_link_incompleta:
-            print(f"   📁 Nueva versión movida a Incompletas/{motivo_categoria}")
+        if incomplete_mgr.mover_a_incompletas(caso_temp, motivo_categoria, batcher=batcher):
+            log.info("📁 Nueva versión en cola para Incompletas/%s", motivo_categoria)
         
-        # 3. Actualizar metadata
-        ultimo_reenvio['estado'] = 'RECHAZADO'
-        ultimo_reenvio['fecha_rechazo'] = datetime.now().isoformat()
-        ultimo_reenvio['validador_decision'] = 'RECHAZAR'
-        ultimo_reenvio['motivo_rechazo'] = motivo
-        ultimo_reenvio['checks_faltantes'] = checks
-        caso.metadata_form['reenvios'][-1] = ultimo_reenvio
+        # 3. Registrar la decisión en el reenvío
+        decidir_reenvio(reenvio, RECHAZADO, motivo, checks)
         
         # 4. Mantener bloqueo y estado incompleto
         caso.estado = EstadoCaso.INCOMPLETA
         caso.bloquea_nueva = True  # ✅ SIGUE BLOQUEADO
         
-        # 5. Guardar checks en metadata para próximo intento
+        # 5. Guardar checks en metadata para próximo intento (asignación nueva: el JSON no rastrea mutaciones)
         if checks:
-            caso.metadata_form['checks_seleccionados'] = checks
+            caso.metadata_form = {**(caso.metadata_form or {}), 'checks_seleccionados': checks}
         
         # 6. Registrar evento
         registrar_evento(
@@ -1958,12 +2120,13 @@ async def aprobar_reenvio(
         )
         
         db.commit()
+        batcher.ejecutar_en_segundo_plano()
         
         # 7. Enviar email al empleado con IA
         from app.email_templates import get_email_template_universal
         from app.ia_redactor import redactar_email_incompleta
         
-        print(f"   🤖 Generando email con IA para notificar rechazo...")
+        log.info("🤖 Generando email con IA para notificar rechazo...")
         
         contenido_ia = redactar_email_incompleta(
             caso.empleado.nombre if caso.empleado else 'Colaborador/a',
@@ -1994,13 +2157,12 @@ async def aprobar_reenvio(
             caso=caso
         )
         
-        print(f"❌ Reenvío RECHAZADO: {serial} - Caso sigue bloqueado")
+        log.info("❌ Reenvío RECHAZADO: %s - Caso sigue bloqueado", serial)
         
         # 8. Sincronizar con Sheets
         try:
-            from app.google_sheets_tracker import actualizar_caso_en_sheet, registrar_cambio_estado_sheet
-            actualizar_caso_en_sheet(caso, accion="actualizar")
-            registrar_cambio_estado_sheet(
+            from app.google_sheets_tracker import sincronizar_cambio_estado
+            sincronizar_cambio_estado(
                 caso,
                 estado_anterior="NUEVO",
                 estado_nuevo="INCOMPLETA",
@@ -2008,7 +2170,7 @@ async def aprobar_reenvio(
                 observaciones=f"Reenvío rechazado - {motivo_categoria}"
             )
         except Exception as e:
-            print(f"⚠️ Error sincronizando con Sheets: {e}")
+            log.warning("⚠️ Error sincronizando con Sheets: %s", e)
         
         return {
             "success": True,
@@ -2026,7 +2188,7 @@ async def aprobar_reenvio(
 
 
 @router.get("/casos/{serial}/historial-reenvios")
-async def obtener_historial_reenvios(
+def obtener_historial_reenvios(
     serial: str,
     db: Session = Depends(get_db),
     _: bool = Depends(verificar_token_admin)
@@ -2040,7 +2202,8 @@ async def obtener_historial_reenvios(
     if not caso:
         raise HTTPException(status_code=404, detail="Caso no encontrado")
     
-    if not caso.metadata_form or 'reenvios' not in caso.metadata_form:
+    reenvios = [como_dict(r) for r in reenvios_del_caso(db, caso)]
+    if not reenvios:
         return {
             "serial": serial,
             "tiene_reenvios": False,
@@ -2048,8 +2211,6 @@ async def obtener_historial_reenvios(
             "historial": []
         }
     
-    reenvios = caso.metadata_form['reenvios']
-    
     return {
         "serial": serial,
         "tiene_reenvios": True,
@@ -2060,7 +2221,7 @@ async def obtener_historial_reenvios(
     }
 
 @router.post("/casos/{serial}/desbloquear")
-async def desbloquear_caso_manual(
+def desbloquear_caso_manual(
     serial: str,
     motivo: str = Form(...),
     db: Session = Depends(get_db),
@@ -2093,7 +2254,7 @@ async def desbloquear_caso_manual(
     
     db.commit()
     
-    print(f"🔓 Caso {serial} desbloqueado manualmente por validador")
+    log.info("🔓 Caso %s desbloqueado manualmente por validador", serial)
     
     return {
         "success": True,
@@ -2102,53 +2263,64 @@ async def desbloquear_caso_manual(
     }
 
 @router.post("/casos/{serial}/guardar-pdf-editado")
-async def guardar_pdf_editado(
+def guardar_pdf_editado(
     serial: str,
     archivo: UploadFile = File(...),
+    finalizar: bool = Form(default=False),
     db: Session = Depends(get_db),
     _: bool = Depends(verificar_token_admin)
 ):
     """
-    Guarda un PDF editado en Drive reemplazando el original
+    Guarda un PDF editado como copia de trabajo del caso
+    Se sube a Drive al finalizar (finalizar=true, /editar-pdf/finalizar o al validar)
     """
     import shutil
+    from app.pdf_edicion import SesionEdicionPDF
+    from app.drive_manager import DriveFileManager, extraer_file_id
     
     caso = db.query(Case).filter(Case.serial == serial).first()
     if not caso:
         raise HTTPException(status_code=404, detail="Caso no encontrado")
     
-    temp_path = os.path.join(tempfile.gettempdir(), f"{serial}_edited.pdf")
+    file_id = extraer_file_id(caso.drive_link)
+    if not file_id:
+        raise HTTPException(status_code=400, detail="Link de Drive inválido")
+    
+    directorio = crear_directorio_de_trabajo(f"{serial}_editado")
+    temp_path = str(directorio / f"{serial}_edited.pdf")
     
     try:
         with open(temp_path, 'wb') as f:
             shutil.copyfileobj(archivo.file, f)
         
-        organizer = CaseFileOrganizer()
-        nuevo_link = organizer.actualizar_pdf_editado(caso, temp_path)
+        sesion = SesionEdicionPDF(serial)
+        resultado = None
         
-        if nuevo_link:
-            caso.drive_link = nuevo_link
-            db.commit()
-            
+        with sesion.lock:
+            sesion.abrir_desde_archivo(file_id, temp_path)
+            if finalizar:
+                resultado = sesion.finalizar(DriveFileManager())
+        
+        borrar_directorio_de_trabajo(directorio)
+        
+        if resultado and resultado.get('link'):
+            caso.drive_link = resultado['link']
             registrar_evento(
                 db, caso.id,
                 "pdf_editado",
                 actor="Validador",
                 motivo="PDF editado con herramientas de anotación"
             )
-            
-            os.remove(temp_path)
-            
-            return {
-                "status": "ok",
-                "serial": serial,
-                "nuevo_link": nuevo_link,
-                "mensaje": "PDF actualizado exitosamente en Drive"
-            }
-        else:
-            raise HTTPException(status_code=500, detail="Error actualizando PDF en Drive")
+            db.commit()
+        
+        return {
+            "status": "ok",
+            "serial": serial,
+            "nuevo_link": caso.drive_link,
+            "pendiente_subida": not finalizar,
+            "mensaje": "PDF actualizado exitosamente en Drive" if finalizar else "PDF guardado (pendiente de subir a Drive)"
+        }
     
     except Exception as e:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
\ No newline at end of file
+        borrar_directorio_de_trabajo(directorio)
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -0,0 +1,181 @@
+"""
+Benchmark de Arranque en Frío
+Ejecutar:
+    python benchmark_arranque.py                  # diferido vs. síncrono, 3 repeticiones
+    python benchmark_arranque.py --repeticiones 5 --json arranque.json
+    python benchmark_arranque.py --modos diferido --latencia-ms 200
+
+Mide, en intérpretes nuevos y con una BD SQLite temporal:
+    1. import app.main                       (python -c, tiempo de pared)
+    2. Cold start del servidor: desde lanzar uvicorn hasta el primer 200 de /ping
+       - diferido: ARRANQUE_DIFERIDO=true  (sync/token de Drive en segundo plano)
+       - sincrono: ARRANQUE_DIFERIDO=false (comportamiento anterior)
+    3. Cuánto tarda el calentamiento en segundo plano (/status → "arranque")
+    4. Desglose de importación (python -X importtime, app.arranque)
+
+Las APIs de Google/n8n son las de fake_google_server.py (en este proceso), con
+--latencia-ms para simular la red de Render → Google.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import tempfile
+import subprocess
+from pathlib import Path
+
+import httpx
+
+RAIZ = Path(__file__).resolve().parent
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _entorno(fake: str, tmp: Path, diferido: bool) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "GOOGLE_API_ENDPOINT": fake,
+        "N8N_WEBHOOK_URL": f"{fake}webhook/incapacidades",
+        "GOOGLE_SHEETS_ID": "fake-sheet",
+        "DATABASE_URL": f"sqlite:///{tmp / 'arranque.db'}",
+        "DRIVE_UPLOAD_SESSIONS_DIR": str(tmp / "sesiones"),
+        "ADMIN_TOKEN": "benchmark",
+        "ARRANQUE_DIFERIDO": "true" if diferido else "false",
+        "ARRANQUE_DEMORA_CALENTAMIENTO": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    return env
+
+
+def medir_importacion(env: dict) -> float:
+    inicio = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app.main"], cwd=RAIZ, env=env,
+                   check=True, capture_output=True)
+    return (time.perf_counter() - inicio) * 1000
+
+
+def medir_cold_start(env: dict, timeout: float) -> dict:
+    """Lanza uvicorn, espera el primer 200 y luego el fin del calentamiento"""
+    puerto = _puerto_libre()
+    url = f"http://127.0.0.1:{puerto}"
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(puerto), "--log-level", "warning"],
+        cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    resultado = {'primer_200_ms': None, 'calentado_ms': None, 'fases_ms': {}, 'calentamiento': {}}
+    try:
+        with httpx.Client(timeout=5) as cliente:
+            limite = inicio + timeout
+            while time.perf_counter() < limite:
+                try:
+                    if cliente.get(f"{url}/ping").status_code == 200:
+                        resultado['primer_200_ms'] = (time.perf_counter() - inicio) * 1000
+                        break
+                except httpx.TransportError:
+                    pass
+                if proceso.poll() is not None:
+                    raise RuntimeError(f"uvicorn terminó con código {proceso.returncode}")
+                time.sleep(0.02)
+
+            while resultado['primer_200_ms'] and time.perf_counter() < limite:
+                arranque = cliente.get(f"{url}/status").json().get('arranque', {})
+                if arranque.get('calentado') or not arranque.get('calentando'):
+                    resultado['calentado_ms'] = (time.perf_counter() - inicio) * 1000
+                    resultado['fases_ms'] = arranque.get('fases_ms', {})
+                    resultado['calentamiento'] = {
+                        k: v.get('ms') for k, v in arranque.get('calentamiento', {}).items()
+                    }
+                    break
+                time.sleep(0.05)
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+    return resultado
+
+
+def _resumen(valores):
+    valores = [v for v in valores if v is not None]
+    if not valores:
+        return {'mediana': None, 'min': None, 'max': None}
+    return {'mediana': round(statistics.median(valores), 1), 'min': round(min(valores), 1),
+            'max': round(max(valores), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque en frío del backend")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--modos", default="diferido,sincrono", help="diferido, sincrono o ambos")
+    parser.add_argument("--latencia-ms", type=int, default=100, help="Latencia de las APIs falsas")
+    parser.add_argument("--empleados", type=int, default=500, help="Filas del Excel falso")
+    parser.add_argument("--puerto-fake", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--sin-perfil", dest="perfil", action="store_false")
+    parser.add_argument("--json", help="Guardar el resultado en este archivo")
+    args = parser.parse_args()
+
+    import fake_google_server
+    fake_google_server.excel.generar(args.empleados)
+    fake_google_server.simulador.configurar('todos', latencia_ms=args.latencia_ms)
+    fake_google_server.iniciar_en_hilo(args.puerto_fake)
+    fake = f"http://127.0.0.1:{args.puerto_fake}/"
+
+    informe = {'latencia_ms': args.latencia_ms, 'repeticiones': args.repeticiones, 'modos': {}}
+
+    for modo in [m.strip() for m in args.modos.split(",") if m.strip()]:
+        importaciones, primeros, calentados, ultima = [], [], [], {}
+        for _ in range(args.repeticiones):
+            with tempfile.TemporaryDirectory(prefix="benchmark_arranque_") as tmp:
+                env = _entorno(fake, Path(tmp), diferido=(modo == "diferido"))
+                importaciones.append(medir_importacion(env))
+                ultima = medir_cold_start(env, args.timeout)
+                primeros.append(ultima['primer_200_ms'])
+                calentados.append(ultima['calentado_ms'])
+        informe['modos'][modo] = {
+            'import_app_main_ms': _resumen(importaciones),
+            'primer_200_ms': _resumen(primeros),
+            'calentado_ms': _resumen(calentados),
+            'fases_ms': ultima.get('fases_ms'),
+            'calentamiento_ms': ultima.get('calentamiento'),
+        }
+
+    if args.perfil:
+        from app.arranque import perfil_importaciones, resumen_importaciones
+        with tempfile.TemporaryDirectory(prefix="benchmark_arranque_") as tmp:
+            os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmp) / 'perfil.db'}"
+            informe['perfil_importacion'] = resumen_importaciones(perfil_importaciones('app.main'), top=10)
+
+    print(f"\n⏱️ Arranque en frío (latencia APIs {args.latencia_ms} ms, {args.repeticiones} repeticiones, mediana)\n")
+    print(f"{'modo':<10} {'import':>10} {'primer 200':>12} {'calentado':>12}")
+    for modo, datos in informe['modos'].items():
+        print(f"{modo:<10} {datos['import_app_main_ms']['mediana'] or 0:>9.0f}ms "
+              f"{datos['primer_200_ms']['mediana'] or 0:>10.0f}ms {datos['calentado_ms']['mediana'] or 0:>10.0f}ms")
+        if datos['calentamiento_ms']:
+            detalle = ", ".join(f"{k} {v:.0f}ms" for k, v in datos['calentamiento_ms'].items() if v is not None)
+            print(f"{'':<10} calentamiento: {detalle}")
+
+    if informe.get('perfil_importacion'):
+        perfil = informe['perfil_importacion']
+        print(f"\nimport app.main: {perfil['total_ms']:.0f} ms — imports directos más caros:")
+        for fila in perfil['top']:
+            print(f"   {fila['modulo']:<40} {fila['acumulado_ms']:8.1f} ms")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(informe, indent=2, ensure_ascii=False))
+        print(f"\n💾 Resultado guardado en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
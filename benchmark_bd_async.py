@@ -0,0 +1,278 @@
+"""
+Benchmark de Sesión Async vs. Síncrona en Endpoints async
+Ejecutar:
+    python benchmark_bd_async.py                          # 20.000 casos, concurrencia 1/8/32
+    python benchmark_bd_async.py --casos 50000 --concurrencias 1,16,64 --duracion 10
+    python benchmark_bd_async.py --json bd_async.json
+
+Un solo worker de uvicorn (un proceso nuevo por ronda) sobre una BD SQLite
+temporal. Para cada concurrencia, N clientes piden en bucle la bandeja del
+validador con búsqueda de texto (GET /validador/casos?q=...) mientras una
+sonda pide /ping cada 20 ms:
+    - async:    el endpoint real, con get_async_db (AsyncSession)
+    - sincrono: la misma consulta desde un endpoint async con get_db, como
+                estaban antes los handlers (ruta /_benchmark/casos-sincrono)
+
+La latencia de /ping muestra cuánto bloquea el event loop cada variante: con
+la sesión síncrona cada consulta frena todos los demás requests del worker.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import httpx
+
+RAIZ = Path(__file__).resolve().parent
+TOKEN = "benchmark"
+
+
+# ==================== ENTORNO ====================
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def preparar_entorno(casos: int) -> Path:
+    """BD SQLite temporal con datos; las variables las heredan los servidores"""
+    tmp = Path(tempfile.mkdtemp(prefix="benchmark_bd_async_"))
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp / 'bd_async.db'}"
+    os.environ["ADMIN_TOKEN"] = TOKEN
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from app.database import init_db
+    init_db()
+    poblar(casos)
+    return tmp
+
+
+def servir(puerto: int):
+    """Modo --servidor: el backend con la ruta de referencia, en un worker"""
+    import uvicorn
+    from app.main import app
+    from app.database import engine
+    from app.busqueda import preparar_indices
+    preparar_indices(engine)  # sin lifespan no corre init_db
+    registrar_ruta_sincrona(app)
+    uvicorn.run(app, host="127.0.0.1", port=puerto, log_level="warning", lifespan="off")
+
+
+class Servidor:
+    """Backend nuevo por ronda: una ronda que satura el pool no contamina la siguiente"""
+
+    def __init__(self):
+        self.puerto = _puerto_libre()
+        self.url = f"http://127.0.0.1:{self.puerto}"
+        self.proceso = None
+
+    def __enter__(self):
+        self.proceso = subprocess.Popen(
+            [sys.executable, __file__, "--servidor", "--puerto", str(self.puerto)],
+            cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        limite = time.perf_counter() + 60
+        with httpx.Client(timeout=2) as cliente:
+            while time.perf_counter() < limite:
+                try:
+                    if cliente.get(f"{self.url}/ping").status_code == 200:
+                        return self
+                except httpx.TransportError:
+                    pass
+                if self.proceso.poll() is not None:
+                    raise RuntimeError(f"el servidor terminó con código {self.proceso.returncode}")
+                time.sleep(0.05)
+        raise RuntimeError("el servidor no respondió /ping en 60s")
+
+    def __exit__(self, *exc):
+        self.proceso.terminate()
+        try:
+            self.proceso.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proceso.kill()
+        return False
+
+
+def poblar(casos: int):
+    from datetime import datetime, timedelta
+    from app.database import SessionLocal, Company, Employee, Case, EstadoCaso, TipoIncapacidad
+
+    inicio = time.perf_counter()
+    db = SessionLocal()
+    try:
+        empresas = [Company(nombre=f"EMPRESA_{i}", nit=f"900{i}") for i in range(5)]
+        db.add_all(empresas)
+        db.flush()
+        empleados = [
+            Employee(cedula=str(800000000 + i), nombre=f"EMPLEADO {i} {random.choice('ABCDEFGH')}",
+                     company_id=empresas[i % len(empresas)].id)
+            for i in range(max(1, casos // 10))
+        ]
+        db.add_all(empleados)
+        db.flush()
+
+        estados, tipos = list(EstadoCaso), list(TipoIncapacidad)
+        ahora = datetime.utcnow()
+        db.bulk_insert_mappings(Case, [
+            {
+                'serial': f"BENCH{i:07d}",
+                'cedula': empleados[i % len(empleados)].cedula,
+                'employee_id': empleados[i % len(empleados)].id,
+                'company_id': empleados[i % len(empleados)].company_id,
+                'tipo': tipos[i % len(tipos)],
+                'estado': estados[i % len(estados)],
+                'created_at': ahora - timedelta(minutes=i),
+                'updated_at': ahora,
+            }
+            for i in range(casos)
+        ])
+        db.commit()
+    finally:
+        db.close()
+    print(f"🗄️  {casos} casos cargados en {time.perf_counter() - inicio:.1f}s")
+
+
+def registrar_ruta_sincrona(app):
+    """Referencia: la consulta de /validador/casos con la sesión síncrona dentro de un endpoint async"""
+    from typing import Optional
+    from fastapi import Depends
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import Session, selectinload
+    from app.database import get_db, Case
+    from app.busqueda import filtrar_por_texto
+
+    @app.get("/_benchmark/casos-sincrono")
+    async def casos_sincrono(q: Optional[str] = None, page: int = 1, page_size: int = 20,
+                             db: Session = Depends(get_db)):
+        query, orden = select(Case), [Case.created_at.desc()]
+        if q:
+            query, orden = filtrar_por_texto(query, q)
+        total = db.scalar(select(func.count()).select_from(query.subquery()))
+        casos = db.execute(query.options(selectinload(Case.empleado), selectinload(Case.empresa))
+                           .order_by(*orden).offset((page - 1) * page_size).limit(page_size)).scalars().all()
+        return {
+            "items": [{"serial": c.serial, "nombre": c.empleado.nombre if c.empleado else None} for c in casos],
+            "total": total,
+        }
+
+
+# ==================== CARGA ====================
+
+RUTAS = {
+    'async': "/validador/casos",
+    'sincrono': "/_benchmark/casos-sincrono",
+}
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round((len(ordenados) - 1) * p / 100)))]
+
+
+async def ronda(url: str, modo: str, concurrencia: int, duracion: float, timeout: float) -> dict:
+    tiempos, errores, sonda = [], 0, []
+    fin = time.perf_counter() + duracion
+    limites = httpx.Limits(max_connections=concurrencia + 2, max_keepalive_connections=concurrencia + 2)
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limites,
+                                 headers={'X-Admin-Token': TOKEN}) as cliente:
+        async def cliente_virtual():
+            nonlocal errores
+            while time.perf_counter() < fin:
+                inicio = time.perf_counter()
+                try:
+                    r = await cliente.get(RUTAS[modo], params={'q': f"EMPLEADO {random.randint(0, 999)}",
+                                                               'page': random.randint(1, 3)})
+                    if r.status_code != 200:
+                        errores += 1
+                except httpx.HTTPError:
+                    errores += 1
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+
+        async def sondear():
+            while time.perf_counter() < fin:
+                inicio = time.perf_counter()
+                try:
+                    await cliente.get("/ping")
+                except httpx.HTTPError:
+                    pass
+                sonda.append((time.perf_counter() - inicio) * 1000)
+                await asyncio.sleep(0.02)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(sondear(), *(cliente_virtual() for _ in range(concurrencia)))
+        total = time.perf_counter() - inicio
+
+    return {
+        'modo': modo,
+        'concurrencia': concurrencia,
+        'peticiones': len(tiempos),
+        'rps': round(len(tiempos) / total, 1),
+        'p50_ms': round(_percentil(tiempos, 50), 1),
+        'p95_ms': round(_percentil(tiempos, 95), 1),
+        'ping_p50_ms': round(_percentil(sonda, 50), 1),
+        'ping_p95_ms': round(_percentil(sonda, 95), 1),
+        'errores': errores,
+    }
+
+
+def imprimir(filas):
+    print("\n" + "=" * 92)
+    print(f"{'Modo':<10}{'Conc.':>6}{'N':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'/ping p50':>12}{'/ping p95':>12}{'err':>6}")
+    print("-" * 92)
+    for f in filas:
+        print(f"{f['modo']:<10}{f['concurrencia']:>6}{f['peticiones']:>8}{f['rps']:>9}{f['p50_ms']:>9}"
+              f"{f['p95_ms']:>9}{f['ping_p50_ms']:>12}{f['ping_p95_ms']:>12}{f['errores']:>6}")
+    print("=" * 92)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sesión async vs. síncrona en endpoints async (un worker)")
+    parser.add_argument("--casos", type=int, default=20000)
+    parser.add_argument("--concurrencias", default="1,8,32")
+    parser.add_argument("--duracion", type=float, default=6.0, help="Segundos por ronda")
+    parser.add_argument("--modos", default="sincrono,async")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Timeout por petición")
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    parser.add_argument("--servidor", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--puerto", type=int, default=8020, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servidor:
+        servir(args.puerto)
+        return 0
+
+    tmp = preparar_entorno(args.casos)
+    print(f"🧪 BD en {tmp}")
+    concurrencias = [int(c) for c in args.concurrencias.split(',')]
+    modos = [m.strip() for m in args.modos.split(',')]
+
+    filas = []
+    for concurrencia in concurrencias:
+        for modo in modos:
+            with Servidor() as servidor:
+                fila = asyncio.run(ronda(servidor.url, modo, concurrencia, args.duracion, args.timeout))
+            print(f"⏱️  {modo:<9} x{concurrencia:<3} → {fila['rps']} req/s, p95 {fila['p95_ms']} ms, "
+                  f"/ping p95 {fila['ping_p95_ms']} ms, {fila['errores']} error(es)")
+            filas.append(fila)
+
+    imprimir(filas)
+    if args.json:
+        Path(args.json).write_text(json.dumps(filas, indent=2))
+        print(f"💾 Resultados en {args.json}")
+    return 0 if all(f['errores'] == 0 for f in filas if f['modo'] == 'async') else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Benchmark de Carga End-to-End
+Ejecutar:
+    # Todo en un proceso: APIs falsas + backend + BD SQLite temporal
+    python benchmark_carga.py --levantar --usuarios 10 --duracion 60
+
+    # Contra un backend ya levantado (con GOOGLE_API_ENDPOINT / N8N_WEBHOOK_URL
+    # apuntando a fake_google_server.py)
+    python benchmark_carga.py --url http://127.0.0.1:8000 --admin-token XXX --usuarios 20
+
+Cada usuario virtual repite el flujo de radicación y validación:
+    1. POST /subir-incapacidad/                        (empleado de carga, PDF de 1-3 páginas)
+    2. GET  /validador/casos                           (bandeja del validador)
+    3. POST /validador/casos/{serial}/validar          (accion=completa)   — casos pares
+       POST /validador/casos/{serial}/estado           (→ INCOMPLETA)       — casos impares
+       POST /casos/{serial}/reenviar                   (nueva versión)
+
+Reporta por endpoint: peticiones, req/s, p50/p95/p99/máx (ms), % errores (5xx o
+fallo de conexión) y % rechazos (4xx, ej. 409 por caso bloqueante).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+
+import httpx
+
+CEDULA_BASE = 900000000
+
+
+# ==================== MÉTRICAS ====================
+
+class Metricas:
+    def __init__(self):
+        self.muestras = {}  # endpoint → [(ms, status)]
+        self.inicio = None
+        self.fin = None
+
+    def registrar(self, endpoint: str, ms: float, status: int):
+        self.muestras.setdefault(endpoint, []).append((ms, status))
+
+    @staticmethod
+    def _percentil(ordenados, p):
+        if not ordenados:
+            return 0.0
+        k = (len(ordenados) - 1) * p / 100
+        inf, sup = int(k), min(int(k) + 1, len(ordenados) - 1)
+        return ordenados[inf] + (ordenados[sup] - ordenados[inf]) * (k - inf)
+
+    def resumen(self) -> dict:
+        duracion = max((self.fin or time.perf_counter()) - (self.inicio or 0), 1e-9)
+        filas = {}
+        for endpoint, muestras in sorted(self.muestras.items()):
+            tiempos = sorted(ms for ms, _ in muestras)
+            errores = sum(1 for _, st in muestras if st == 0 or st >= 500)
+            rechazos = sum(1 for _, st in muestras if 400 <= st < 500)
+            codigos = {}
+            for _, st in muestras:
+                codigos[str(st)] = codigos.get(str(st), 0) + 1
+            filas[endpoint] = {
+                'peticiones': len(muestras),
+                'rps': round(len(muestras) / duracion, 2),
+                'p50_ms': round(self._percentil(tiempos, 50), 1),
+                'p95_ms': round(self._percentil(tiempos, 95), 1),
+                'p99_ms': round(self._percentil(tiempos, 99), 1),
+                'max_ms': round(tiempos[-1], 1) if tiempos else 0.0,
+                'errores_pct': round(100 * errores / len(muestras), 2),
+                'rechazos_pct': round(100 * rechazos / len(muestras), 2),
+                'codigos': codigos,
+            }
+        total = sum(len(m) for m in self.muestras.values())
+        return {
+            'duracion_s': round(duracion, 2),
+            'peticiones': total,
+            'rps_total': round(total / duracion, 2),
+            'endpoints': filas
+        }
+
+    def imprimir(self):
+        r = self.resumen()
+        print("\n" + "=" * 104)
+        print(f"📊 RESULTADOS ({r['peticiones']} peticiones en {r['duracion_s']}s → {r['rps_total']} req/s)")
+        print("=" * 104)
+        print(f"{'Endpoint':<44}{'N':>6}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'máx':>9}{'err%':>7}{'4xx%':>7}")
+        print("-" * 104)
+        for endpoint, f in r['endpoints'].items():
+            print(f"{endpoint:<44}{f['peticiones']:>6}{f['rps']:>8}{f['p50_ms']:>9}{f['p95_ms']:>9}"
+                  f"{f['p99_ms']:>9}{f['max_ms']:>9}{f['errores_pct']:>7}{f['rechazos_pct']:>7}")
+        print("=" * 104)
+        return r
+
+
+# ==================== PETICIONES ====================
+
+def generar_pdf(paginas: int) -> bytes:
+    """PDF liviano con texto (la carga la pone el backend, no el tamaño del archivo)"""
+    import fitz
+    doc = fitz.open()
+    for i in range(paginas):
+        pagina = doc.new_page()
+        pagina.insert_text((72, 72), f"Incapacidad de carga - página {i + 1} - {random.random()}")
+    datos = doc.tobytes()
+    doc.close()
+    return datos
+
+
+async def medir(cliente: httpx.AsyncClient, metricas: Metricas, endpoint: str, metodo: str, url: str, **kwargs):
+    inicio = time.perf_counter()
+    try:
+        respuesta = await cliente.request(metodo, url, **kwargs)
+        status = respuesta.status_code
+    except httpx.HTTPError:
+        respuesta, status = None, 0
+    metricas.registrar(endpoint, (time.perf_counter() - inicio) * 1000, status)
+    return respuesta
+
+
+class Escenario:
+    def __init__(self, args, metricas: Metricas):
+        self.args = args
+        self.metricas = metricas
+        self.admin = {'X-Admin-Token': args.admin_token}
+        self.siguiente_cedula = 0
+        self.iteraciones = 0
+
+    def _cedula(self) -> str:
+        cedula = CEDULA_BASE + (self.siguiente_cedula % self.args.empleados)
+        self.siguiente_cedula += 1
+        return str(cedula)
+
+    async def iteracion(self, cliente: httpx.AsyncClient):
+        m = self.metricas
+        numero = self.iteraciones
+        self.iteraciones += 1
+
+        pdf = generar_pdf(random.randint(1, 3))
+        r = await medir(cliente, m, "POST /subir-incapacidad/", "POST", "/subir-incapacidad/",
+                        data={'cedula': self._cedula(), 'tipo': 'enfermedad_general',
+                              'email': 'carga@carga.test', 'telefono': '3000000000'},
+                        files=[('archivos', ('incapacidad.pdf', pdf, 'application/pdf'))])
+        serial = None
+        if r is not None and r.status_code == 200:
+            try:
+                serial = r.json().get('consecutivo') or r.json().get('serial')
+            except ValueError:
+                serial = None
+
+        await medir(cliente, m, "GET /validador/casos", "GET", "/validador/casos",
+                    params={'page': 1, 'page_size': 20}, headers=self.admin)
+
+        if not serial:
+            return
+
+        if numero % 2 == 0:
+            await medir(cliente, m, "POST /validador/casos/{serial}/validar", "POST",
+                        f"/validador/casos/{serial}/validar",
+                        data={'accion': 'completa', 'observaciones': 'benchmark'}, headers=self.admin)
+        else:
+            r = await medir(cliente, m, "POST /validador/casos/{serial}/estado", "POST",
+                            f"/validador/casos/{serial}/estado",
+                            json={'estado': 'INCOMPLETA', 'motivo': 'benchmark'}, headers=self.admin)
+            if r is not None and r.status_code == 200:
+                nuevo = generar_pdf(random.randint(1, 2))
+                await medir(cliente, m, "POST /casos/{serial}/reenviar", "POST", f"/casos/{serial}/reenviar",
+                            files=[('archivos', ('reenvio.pdf', nuevo, 'application/pdf'))])
+
+    async def usuario(self, cliente: httpx.AsyncClient, fin: float):
+        while time.perf_counter() < fin:
+            if self.args.iteraciones and self.iteraciones >= self.args.iteraciones:
+                return
+            await self.iteracion(cliente)
+            if self.args.pausa_ms:
+                await asyncio.sleep(self.args.pausa_ms / 1000)
+
+
+async def ejecutar(args) -> Metricas:
+    metricas = Metricas()
+    escenario = Escenario(args, metricas)
+    limites = httpx.Limits(max_connections=args.usuarios * 2, max_keepalive_connections=args.usuarios)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limites) as cliente:
+        # Calentamiento (no se mide): primera conexión a Drive, caches de carpetas
+        if args.calentamiento:
+            await escenario.iteracion(cliente)
+            metricas.muestras.clear()
+
+        print(f"🚀 {args.usuarios} usuarios virtuales durante {args.duracion}s contra {args.url}")
+        metricas.inicio = time.perf_counter()
+        fin = metricas.inicio + args.duracion
+        await asyncio.gather(*(escenario.usuario(cliente, fin) for _ in range(args.usuarios)))
+        metricas.fin = time.perf_counter()
+    return metricas
+
+
+# ==================== MODO --levantar ====================
+
+def levantar_entorno(args):
+    """APIs falsas + backend en hilos del mismo proceso, con BD SQLite temporal"""
+    tmp = Path(tempfile.mkdtemp(prefix="benchmark_carga_"))
+    fake = f"http://127.0.0.1:{args.puerto_fake}/"
+
+    os.environ["GOOGLE_API_ENDPOINT"] = fake
+    os.environ["N8N_WEBHOOK_URL"] = f"{fake}webhook/incapacidades"
+    os.environ["GOOGLE_SHEETS_ID"] = "fake-sheet"
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp / 'carga.db'}")
+    os.environ["DRIVE_UPLOAD_SESSIONS_DIR"] = str(tmp / "sesiones")
+    os.environ["ADMIN_TOKEN"] = args.admin_token
+
+    import uvicorn
+    import fake_google_server
+
+    fake_google_server.excel.generar(args.empleados)
+    fake_google_server.simulador.configurar('todos', latencia_ms=args.latencia_ms,
+                                            jitter_ms=args.jitter_ms, tasa_error=args.tasa_error)
+    fake_google_server.simulador.configurar('drive', cuota_por_minuto=args.cuota_drive)
+    fake_google_server.simulador.configurar('sheets', cuota_por_minuto=args.cuota_sheets)
+    fake_google_server.iniciar_en_hilo(args.puerto_fake)
+
+    from app.main import app
+    servidor = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.puerto, log_level="warning"))
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.1)
+
+    args.url = f"http://127.0.0.1:{args.puerto}"
+    print(f"🧪 Entorno local listo (APIs falsas en {fake}, BD en {os.environ['DATABASE_URL']})")
+    return fake_google_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga end-to-end del backend de incapacidades")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--admin-token", default=os.environ.get("ADMIN_TOKEN", "benchmark"))
+    parser.add_argument("--usuarios", type=int, default=10, help="Usuarios virtuales concurrentes")
+    parser.add_argument("--duracion", type=int, default=30, help="Segundos de carga")
+    parser.add_argument("--iteraciones", type=int, default=0, help="Tope de flujos completos (0 = sin tope)")
+    parser.add_argument("--pausa-ms", type=int, default=0, help="Pausa entre flujos de un mismo usuario")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--empleados", type=int, default=200, help="Cédulas de carga a rotar (desde 900000000)")
+    parser.add_argument("--sin-calentamiento", dest="calentamiento", action="store_false")
+    parser.add_argument("--json", help="Guardar el resumen en este archivo")
+
+    local = parser.add_argument_group("modo --levantar (APIs falsas + backend en este proceso)")
+    local.add_argument("--levantar", action="store_true")
+    local.add_argument("--puerto", type=int, default=8010)
+    local.add_argument("--puerto-fake", type=int, default=8765)
+    local.add_argument("--latencia-ms", type=int, default=50)
+    local.add_argument("--jitter-ms", type=int, default=20)
+    local.add_argument("--tasa-error", type=float, default=0.0)
+    local.add_argument("--cuota-drive", type=int, default=0)
+    local.add_argument("--cuota-sheets", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = levantar_entorno(args) if args.levantar else None
+
+    metricas = asyncio.run(ejecutar(args))
+    resumen = metricas.imprimir()
+
+    if fake is not None:
+        simulacion = fake.simulador.resumen()
+        print("🧪 APIs falsas: " + ", ".join(
+            f"{s} {d['llamadas']} llamadas ({d['errores_simulados']} errores, {d['cuota_excedida']} por cuota)"
+            for s, d in simulacion.items()))
+        resumen['apis_falsas'] = simulacion
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(resumen, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resumen guardado en {args.json}")
+
+    errores = sum(f['errores_pct'] for f in resumen['endpoints'].values())
+    return 0 if resumen['peticiones'] and errores == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+Benchmark de SQLite con lecturas y escrituras concurrentes (un servidor, sin DATABASE_URL)
+Ejecutar:
+    python benchmark_sqlite.py                       # 50.000 casos, 4 escritores, 8 lectores, 10 s
+    python benchmark_sqlite.py --casos 200000 --escritores 8 --lectores 16 --duracion 30
+    python benchmark_sqlite.py --json sqlite.json
+
+La misma carga sobre dos copias de una BD SQLite temporal, en hilos del
+mismo proceso (como los requests de un worker de uvicorn):
+    - escritores: validación de un caso (lee el caso, cambia estado, agrega
+                  un CaseEvent, commit)
+    - lectores:   bandeja del validador (casos de un estado, los 20 más
+                  recientes, y el conteo)
+    - sync:       cada segundo, 500 empleados actualizados en una transacción
+                  (como la sincronización del Excel cada 60 s, más seguida)
+Variantes:
+    - antes:  el motor de antes (solo check_same_thread y WAL, conexiones
+              que escriben a la vez y esperan el candado de SQLite)
+    - perfil: app.database (pragmas, una conexión de escritura, pool de lectores)
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+
+
+def poblar(casos: int):
+    from datetime import datetime, timedelta
+    from app.database import engine, Company, Employee, Case, EstadoCaso, TipoIncapacidad
+    from sqlalchemy import insert
+
+    empleados = max(1, casos // 10)
+    estados, tipos = list(EstadoCaso), list(TipoIncapacidad)
+    ahora = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Company), [{'nombre': f"EMPRESA_{i}", 'activa': True} for i in range(5)])
+        conn.execute(insert(Employee), [
+            {'cedula': str(800000000 + i), 'nombre': f"EMPLEADO {i}", 'company_id': i % 5 + 1, 'activo': True}
+            for i in range(empleados)
+        ])
+        conn.execute(insert(Case), [
+            {
+                'serial': f"BENCH{i:07d}", 'cedula': str(800000000 + i % empleados),
+                'employee_id': i % empleados + 1, 'company_id': i % empleados % 5 + 1,
+                'tipo': tipos[i % len(tipos)], 'estado': estados[i % len(estados)],
+                'created_at': ahora - timedelta(minutes=i), 'updated_at': ahora,
+            }
+            for i in range(casos)
+        ])
+    return empleados
+
+
+def motor_de_antes(url: str):
+    """crear_engine de SQLite antes del perfil"""
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+
+    motor = create_engine(url, echo=False, connect_args={"check_same_thread": False})
+
+    def wal(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+    event.listen(motor, "connect", wal)
+    return sessionmaker(autocommit=False, autoflush=False, bind=motor), motor
+
+
+# ==================== CARGA ====================
+
+class Medidas:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tiempos = {'escritura': [], 'lectura': [], 'sync': []}
+        self.errores = {'escritura': 0, 'lectura': 0, 'sync': 0}
+        self.bloqueos = 0
+
+    def registrar(self, tipo: str, funcion):
+        inicio = time.perf_counter()
+        try:
+            funcion()
+        except Exception as e:
+            with self.lock:
+                self.errores[tipo] += 1
+                self.bloqueos += 'locked' in str(e)
+            return
+        with self.lock:
+            self.tiempos[tipo].append((time.perf_counter() - inicio) * 1000)
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))], 1)
+
+
+def correr(Sesion, casos: int, empleados: int, escritores: int, lectores: int, duracion: float) -> dict:
+    from datetime import datetime
+    from sqlalchemy import select, func, update
+    from app.database import Case, CaseEvent, Employee, EstadoCaso
+
+    estados = list(EstadoCaso)
+    medidas = Medidas()
+    fin = time.perf_counter() + duracion
+
+    def validar():
+        db = Sesion()
+        try:
+            caso = db.get(Case, random.randint(1, casos))
+            anterior, caso.estado = caso.estado, random.choice(estados)
+            caso.updated_at = datetime.utcnow()
+            db.add(CaseEvent(case_id=caso.id, accion="benchmark", actor="Validador",
+                             estado_anterior=anterior.value, estado_nuevo=caso.estado.value))
+            db.commit()
+        finally:
+            db.close()
+
+    def bandeja():
+        db = Sesion()
+        try:
+            estado = random.choice(estados)
+            db.execute(select(Case.serial, Case.estado).where(Case.estado == estado)
+                       .order_by(Case.created_at.desc()).limit(20)).all()
+            db.scalar(select(func.count()).select_from(Case).where(Case.estado == estado))
+        finally:
+            db.close()
+
+    def sincronizar():
+        db = Sesion()
+        try:
+            db.execute(update(Employee), [
+                {'id': i, 'telefono': str(random.randint(3000000000, 3999999999))}
+                for i in random.sample(range(1, empleados + 1), min(500, empleados))
+            ])
+            db.commit()
+        finally:
+            db.close()
+
+    def bucle(tipo, funcion, pausa=0.0):
+        while time.perf_counter() < fin:
+            medidas.registrar(tipo, funcion)
+            if pausa:
+                time.sleep(pausa)
+
+    hilos = (
+        [threading.Thread(target=bucle, args=('escritura', validar)) for _ in range(escritores)]
+        + [threading.Thread(target=bucle, args=('lectura', bandeja)) for _ in range(lectores)]
+        + [threading.Thread(target=bucle, args=('sync', sincronizar, 1.0))]
+    )
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    resultado = {'bloqueos': medidas.bloqueos}
+    for tipo, tiempos in medidas.tiempos.items():
+        resultado[tipo] = {
+            'ops_s': round(len(tiempos) / duracion, 1),
+            'p50_ms': _percentil(tiempos, 0.5),
+            'p95_ms': _percentil(tiempos, 0.95),
+            'p99_ms': _percentil(tiempos, 0.99),
+            'errores': medidas.errores[tipo],
+        }
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite: lecturas y escrituras concurrentes, antes vs. perfil")
+    parser.add_argument("--casos", type=int, default=50_000)
+    parser.add_argument("--escritores", type=int, default=4)
+    parser.add_argument("--lectores", type=int, default=8)
+    parser.add_argument("--duracion", type=float, default=10.0, help="Segundos por variante")
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="benchmark_sqlite_"))
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp / 'perfil.db'}"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from app.database import init_db, SessionLocal, checkpoint_sqlite
+    print(f"🧪 SQLite en {tmp}: {args.casos} casos, {args.escritores} escritores, "
+          f"{args.lectores} lectores, sync cada 1 s, {args.duracion:.0f} s por variante")
+    init_db()
+    empleados = poblar(args.casos)
+    checkpoint_sqlite()
+    shutil.copy(tmp / 'perfil.db', tmp / 'antes.db')
+
+    SesionAntes, motor_antes = motor_de_antes(f"sqlite:///{tmp / 'antes.db'}")
+    resultados = {'casos': args.casos, 'escritores': args.escritores, 'lectores': args.lectores}
+    for variante, Sesion in (('antes', SesionAntes), ('perfil', SessionLocal)):
+        r = correr(Sesion, args.casos, empleados, args.escritores, args.lectores, args.duracion)
+        resultados[variante] = r
+        print(f"\n{'🐢' if variante == 'antes' else '🚀'} {variante}  ({r['bloqueos']} 'database is locked')")
+        for tipo in ('escritura', 'lectura', 'sync'):
+            m = r[tipo]
+            print(f"   {tipo:<10} {m['ops_s']:>8} ops/s   p50 {m['p50_ms']} ms   p95 {m['p95_ms']} ms   "
+                  f"p99 {m['p99_ms']} ms   {m['errores']} errores")
+    motor_antes.dispose()
+
+    antes, perfil = resultados['antes'], resultados['perfil']
+    print(f"\n✅ escrituras {perfil['escritura']['ops_s'] / max(antes['escritura']['ops_s'], 0.1):.1f}x, "
+          f"lecturas {perfil['lectura']['ops_s'] / max(antes['lectura']['ops_s'], 0.1):.1f}x, "
+          f"errores {sum(m['errores'] for m in (antes[t] for t in ('escritura', 'lectura', 'sync')))} → "
+          f"{sum(m['errores'] for m in (perfil[t] for t in ('escritura', 'lectura', 'sync')))}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(resultados, indent=2))
+        print(f"💾 Resultados en {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Fixtures de las pruebas (pytest)
+Ejecutar: python -m pytest -q
+
+Todas las pruebas corren en un solo proceso: el entorno se fija aquí, antes
+de que cualquier test_*.py importe app. BD SQLite temporal, Google (Drive,
+Sheets) y n8n falsos de fake_google_server.py, estado compartido local y
+directorios de trabajo temporales. Nada habla con servicios reales.
+
+Los parámetros que los módulos leen del entorno al importarse (topes,
+tiempos, tamaños de bloque) los cambia cada prueba con monkeypatch.
+"""
+
+import os
+import socket
+import tempfile
+from pathlib import Path
+
+import pytest
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+TMP = Path(tempfile.mkdtemp(prefix="pruebas_"))
+PUERTO_GOOGLE = puerto_libre()
+
+# Antes de importar app
+os.environ["DATABASE_URL"] = f"sqlite:///{TMP / 'pruebas.db'}"
+os.environ["ADMIN_TOKEN"] = "prueba"
+os.environ["LOG_LEVEL"] = "WARNING"
+os.environ["GOOGLE_API_ENDPOINT"] = f"http://127.0.0.1:{PUERTO_GOOGLE}/"
+os.environ["GOOGLE_SHEETS_ID"] = "fake-sheet"
+os.environ["N8N_WEBHOOK_URL"] = f"http://127.0.0.1:{PUERTO_GOOGLE}/webhook/incapacidades"
+os.environ["DRIVE_UPLOAD_SESSIONS_DIR"] = str(TMP / "sesiones")
+os.environ["ESTADO_LOCAL_DIR"] = str(TMP / "estado")
+os.environ["DIRECTORIO_TRABAJO"] = str(TMP / "trabajo")
+os.environ.pop("ESTADO_COMPARTIDO_URL", None)
+os.environ.pop("REDIS_URL", None)
+os.environ.pop("DATABASE_REPLICA_URLS", None)
+
+# Scripts manuales contra el backend o Google reales
+collect_ignore = ["test_conexion.py", "test_drive.py", "app/test_bloqueo.py"]
+
+HEADERS = {'X-Admin-Token': 'prueba'}
+
+
+@pytest.fixture(scope="session")
+def tmp_pruebas() -> Path:
+    return TMP
+
+
+@pytest.fixture(scope="session")
+def _bd_creada():
+    from app.database import init_db
+    init_db()
+
+
+@pytest.fixture
+def bd(_bd_creada):
+    """BD vacía para la prueba (las tablas y los índices del buscador se crean una vez)"""
+    from app.database import Base, engine
+    with engine.begin() as conn:
+        for tabla in reversed(Base.metadata.sorted_tables):
+            conn.execute(tabla.delete())
+    yield
+
+
+@pytest.fixture
+def cliente(bd):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    return TestClient(app)
+
+
+@pytest.fixture(scope="session")
+def _servidor_google():
+    from fake_google_server import iniciar_en_hilo
+    servidor = iniciar_en_hilo(PUERTO_GOOGLE)
+    yield servidor
+    servidor.should_exit = True
+
+
+@pytest.fixture
+def google(_servidor_google):
+    """Google y n8n falsos vacíos, sin latencia ni errores, y el cache de carpetas limpio"""
+    import fake_google_server
+    from app.drive_uploader import clear_folder_cache
+
+    fake_google_server.drive.reiniciar()
+    fake_google_server.sheets.reiniciar()
+    fake_google_server.n8n.reiniciar()
+    fake_google_server.simulador.configurar('todos', latencia_ms=0, jitter_ms=0, tasa_error=0.0, cuota_por_minuto=0)
+    clear_folder_cache()
+    yield fake_google_server
+    fake_google_server.simulador.configurar('todos', latencia_ms=0, jitter_ms=0, tasa_error=0.0, cuota_por_minuto=0)
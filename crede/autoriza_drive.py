@@ -1,4 +1,6 @@
-﻿from googleapiclient.discovery import build
+﻿# Script manual: usa googleapiclient, que la app ya no instala
+# (pip install google-api-python-client para correrlo)
+from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 import pickle
@@ -0,0 +1,741 @@
+"""
+Servidor falso de APIs externas: Google Drive v3, Google Sheets v4 y webhook de n8n
+(subconjunto usado por el backend)
+Ejecutar: python fake_google_server.py --port 8765 [--latencia-ms 80 --tasa-error 0.01 --cuota-drive 600]
+
+Luego arrancar el backend (o los scripts de prueba) con:
+    GOOGLE_API_ENDPOINT=http://127.0.0.1:8765/
+    N8N_WEBHOOK_URL=http://127.0.0.1:8765/webhook/incapacidades
+    GOOGLE_SHEETS_ID=fake-sheet
+
+Implementa en memoria:
+- Drive files: list (q simple), get (+ alt=media), create, update (addParents /
+  removeParents / trashed / name), copy, delete
+- Drive: subidas reanudables (/upload/drive/v3/files?uploadType=resumable) por bloques
+- Drive permissions.create (se acepta y se ignora)
+- Drive changes.getStartPageToken / changes.list
+- Drive batch (/batch/drive/v3, multipart/mixed)
+- Sheets spreadsheets.values: get, update, append
+- Excel de empleados: GET /spreadsheets/d/{id}/export (xlsx generado con
+  los empleados de carga, ver POST /_fake/empleados)
+- n8n: POST /webhook/{nombre}, GET /healthz
+
+Simulación por servicio (drive, sheets, n8n), por CLI o POST /_fake/config:
+- latencia_ms (+ jitter_ms): demora de cada respuesta
+- tasa_error: fracción de llamadas que responden 500
+- cuota_por_minuto: pasado el límite responde como Google (403 userRateLimitExceeded
+  en Drive, 429 RESOURCE_EXHAUSTED en Sheets; 429 en n8n)
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import urlsplit, parse_qs
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+
+app = FastAPI(title="Fake Google APIs")
+
+
+# ==================== ESTADO EN MEMORIA ====================
+
+class EstadoDrive:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self.lock:
+            self.archivos = {}
+            self.cambios = []  # [(numero, file_id, removed)]
+            self.sesiones = {}  # upload_id → {metadata, file_id, datos, tamano}
+            self.contador_cambios = 1
+            self.llamadas = {}
+
+    def registrar_cambio(self, file_id, removed=False):
+        self.contador_cambios += 1
+        self.cambios.append((self.contador_cambios, file_id, removed))
+
+    def contar(self, clave):
+        self.llamadas[clave] = self.llamadas.get(clave, 0) + 1
+
+
+drive = EstadoDrive()
+
+
+class EstadoSheets:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self.lock:
+            self.hojas = {}  # (spreadsheet_id, hoja) → [[celdas]]
+
+    def filas(self, spreadsheet_id, hoja):
+        return self.hojas.setdefault((spreadsheet_id, hoja), [])
+
+
+class EstadoN8n:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self.lock:
+            self.recibidos = 0
+            self.por_tipo = {}
+            self.ultimos = deque(maxlen=50)
+
+
+# Empleados de carga: cédulas CEDULA_BASE, CEDULA_BASE+1, ...
+CEDULA_BASE = 900000000
+
+
+class EstadoExcel:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.generar()
+
+    def generar(self, cantidad: int = 200, empresas: int = 3):
+        with self.lock:
+            self.empresas = [f"EMPRESA_CARGA_{i + 1}" for i in range(empresas)]
+            self.empleados = [{
+                'cedula': CEDULA_BASE + i,
+                'nombre': f"EMPLEADO CARGA {i + 1}",
+                'correo': f"empleado{i + 1}@carga.test",
+                'telefono': f"300{i:07d}",
+                'empresa': self.empresas[i % empresas],
+                'eps': 'EPS CARGA',
+                'jefe_nombre': 'JEFE CARGA',
+                'jefe_email': 'jefe@carga.test',
+            } for i in range(cantidad)]
+            self._xlsx = None
+
+    def xlsx(self) -> bytes:
+        """Excel con la misma forma que la base real (Hoja 1 empleados, Hoja 2 empresas)"""
+        import io
+        import pandas as pd
+
+        with self.lock:
+            if self._xlsx is None:
+                salida = io.BytesIO()
+                with pd.ExcelWriter(salida, engine='openpyxl') as writer:
+                    pd.DataFrame(self.empleados).to_excel(writer, sheet_name='Hoja 1', index=False)
+                    pd.DataFrame([{'nombre': e, 'email_copia': f"copia@{e.lower()}.test"} for e in self.empresas]
+                                 ).to_excel(writer, sheet_name='Hoja 2', index=False)
+                self._xlsx = salida.getvalue()
+            return self._xlsx
+
+
+sheets = EstadoSheets()
+n8n = EstadoN8n()
+excel = EstadoExcel()
+
+
+# ==================== SIMULACIÓN (LATENCIA / ERRORES / CUOTAS) ====================
+
+SERVICIOS = ('drive', 'sheets', 'n8n')
+
+
+class Simulador:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.config = {s: {'latencia_ms': 0, 'jitter_ms': 0, 'tasa_error': 0.0, 'cuota_por_minuto': 0}
+                       for s in SERVICIOS}
+        self.ventanas = {s: deque() for s in SERVICIOS}
+        self.contadores = {s: {'llamadas': 0, 'errores_simulados': 0, 'cuota_excedida': 0} for s in SERVICIOS}
+
+    def configurar(self, servicio, **valores):
+        with self.lock:
+            destino = SERVICIOS if servicio in (None, 'todos') else (servicio,)
+            for s in destino:
+                for clave, valor in valores.items():
+                    if clave in self.config[s] and valor is not None:
+                        self.config[s][clave] = type(self.config[s][clave])(valor)
+
+    def demora(self, servicio) -> float:
+        c = self.config[servicio]
+        return max(0, c['latencia_ms'] + random.uniform(-c['jitter_ms'], c['jitter_ms'])) / 1000
+
+    def falla(self, servicio):
+        """None si la llamada pasa; si no (status, cuerpo) al estilo de la API real"""
+        with self.lock:
+            c = self.config[servicio]
+            self.contadores[servicio]['llamadas'] += 1
+
+            if c['cuota_por_minuto']:
+                ahora = time.monotonic()
+                ventana = self.ventanas[servicio]
+                while ventana and ahora - ventana[0] > 60:
+                    ventana.popleft()
+                if len(ventana) >= c['cuota_por_minuto']:
+                    self.contadores[servicio]['cuota_excedida'] += 1
+                    if servicio == 'drive':
+                        return _error(403, "User Rate Limit Exceeded", 'userRateLimitExceeded')
+                    if servicio == 'sheets':
+                        return 429, {'error': {'code': 429, 'status': 'RESOURCE_EXHAUSTED',
+                                               'message': "Quota exceeded for quota metric 'Read/Write requests'"}}
+                    return 429, {'message': 'Too Many Requests'}
+                ventana.append(ahora)
+
+            if c['tasa_error'] and random.random() < c['tasa_error']:
+                self.contadores[servicio]['errores_simulados'] += 1
+                if servicio == 'n8n':
+                    return 500, {'message': 'Error in workflow'}
+                return _error(500, "Backend Error", 'backendError')
+        return None
+
+    def resumen(self):
+        with self.lock:
+            return {s: {**self.config[s], **self.contadores[s]} for s in SERVICIOS}
+
+
+simulador = Simulador()
+
+
+def _servicio_de(ruta: str) -> str:
+    if ruta.startswith('/v4/spreadsheets') or ruta.startswith('/spreadsheets/d/'):
+        return 'sheets'
+    if ruta.startswith('/webhook') or ruta.startswith('/healthz'):
+        return 'n8n'
+    return 'drive'
+
+
+def _ahora():
+    return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def _error(codigo, mensaje, razon):
+    return codigo, {'error': {'code': codigo, 'message': mensaje, 'errors': [{'reason': razon, 'message': mensaje}]}}
+
+
+def _vista(archivo):
+    """Metadatos públicos de un archivo (sin el contenido)"""
+    datos = {k: v for k, v in archivo.items() if k != 'contenido'}
+    datos['webViewLink'] = f"https://drive.google.com/file/d/{archivo['id']}/view"
+    datos['webContentLink'] = f"https://drive.google.com/uc?id={archivo['id']}&export=download"
+    return datos
+
+
+def _nuevo_archivo(metadata, contenido=None):
+    file_id = uuid.uuid4().hex[:28]
+    archivo = {
+        'id': file_id,
+        'name': metadata.get('name', 'Sin nombre'),
+        'mimeType': metadata.get('mimeType') or ('application/pdf' if contenido is not None else 'application/octet-stream'),
+        'parents': metadata.get('parents') or ['root'],
+        'description': metadata.get('description'),
+        'trashed': False,
+        'modifiedTime': _ahora(),
+        'contenido': contenido,
+    }
+    _poner_contenido(archivo, contenido)
+    drive.archivos[file_id] = archivo
+    drive.registrar_cambio(file_id)
+    return archivo
+
+
+def _poner_contenido(archivo, contenido):
+    if contenido is None:
+        return
+    archivo['contenido'] = contenido
+    archivo['md5Checksum'] = hashlib.md5(contenido).hexdigest()
+    archivo['headRevisionId'] = uuid.uuid4().hex[:16]
+    archivo['size'] = str(len(contenido))
+    archivo['modifiedTime'] = _ahora()
+
+
+# ==================== CONSULTAS (q) ====================
+
+_CLAUSULAS = [
+    (re.compile(r"^name\s*=\s*'(.*)'$"), lambda a, v: a['name'] == v),
+    (re.compile(r"^name\s+contains\s+'(.*)'$"), lambda a, v: v in a['name']),
+    (re.compile(r"^mimeType\s*=\s*'(.*)'$"), lambda a, v: a['mimeType'] == v),
+    (re.compile(r"^mimeType\s*!=\s*'(.*)'$"), lambda a, v: a['mimeType'] != v),
+    (re.compile(r"^'(.*)'\s+in\s+parents$"), lambda a, v: v in a['parents']),
+    (re.compile(r"^trashed\s*=\s*(true|false)$"), lambda a, v: a['trashed'] == (v == 'true')),
+]
+
+
+def _filtro(q):
+    if not q:
+        return lambda a: not a['trashed']
+    condiciones = []
+    for parte in re.split(r"\s+and\s+", q.strip()):
+        for patron, funcion in _CLAUSULAS:
+            m = patron.match(parte.strip())
+            if m:
+                condiciones.append((funcion, m.group(1).replace("\\'", "'")))
+                break
+        else:
+            raise ValueError(f"Cláusula no soportada por el servidor falso: {parte}")
+    return lambda a: all(f(a, v) for f, v in condiciones)
+
+
+# ==================== OPERACIONES DRIVE ====================
+
+def files_list(query, body):
+    try:
+        filtro = _filtro(query.get('q'))
+    except ValueError as e:
+        return _error(400, str(e), 'invalidQuery')
+    tamano = int(query.get('pageSize', 100))
+    inicio = int(query.get('pageToken') or 0)
+    encontrados = sorted((a for a in drive.archivos.values() if filtro(a)), key=lambda a: a['modifiedTime'])
+    pagina = encontrados[inicio:inicio + tamano]
+    respuesta = {'files': [_vista(a) for a in pagina]}
+    if inicio + tamano < len(encontrados):
+        respuesta['nextPageToken'] = str(inicio + tamano)
+    return 200, respuesta
+
+
+def files_get(query, body, file_id):
+    archivo = drive.archivos.get(file_id)
+    if not archivo:
+        return _error(404, f"File not found: {file_id}.", 'notFound')
+    if query.get('alt') == 'media':
+        return 200, archivo.get('contenido') or b''
+    return 200, _vista(archivo)
+
+
+def files_create(query, body):
+    return 200, _vista(_nuevo_archivo(body or {}))
+
+
+def files_update(query, body, file_id):
+    archivo = drive.archivos.get(file_id)
+    if not archivo:
+        return _error(404, f"File not found: {file_id}.", 'notFound')
+
+    quitar = [p for p in (query.get('removeParents') or '').split(',') if p]
+    agregar = [p for p in (query.get('addParents') or '').split(',') if p]
+    if quitar or agregar:
+        archivo['parents'] = [p for p in archivo['parents'] if p not in quitar] + agregar
+    for campo in ('name', 'description', 'trashed'):
+        if body and campo in body:
+            archivo[campo] = body[campo]
+
+    archivo['modifiedTime'] = _ahora()
+    drive.registrar_cambio(file_id)
+    return 200, _vista(archivo)
+
+
+def files_copy(query, body, file_id):
+    original = drive.archivos.get(file_id)
+    if not original:
+        return _error(404, f"File not found: {file_id}.", 'notFound')
+    metadata = {'name': (body or {}).get('name', original['name']),
+                'mimeType': original['mimeType'],
+                'parents': (body or {}).get('parents') or original['parents']}
+    return 200, _vista(_nuevo_archivo(metadata, original.get('contenido')))
+
+
+def files_delete(query, body, file_id):
+    if file_id not in drive.archivos:
+        return _error(404, f"File not found: {file_id}.", 'notFound')
+    del drive.archivos[file_id]
+    drive.registrar_cambio(file_id, removed=True)
+    return 204, None
+
+
+def permissions_create(query, body, file_id):
+    if file_id not in drive.archivos:
+        return _error(404, f"File not found: {file_id}.", 'notFound')
+    return 200, {'id': 'anyoneWithLink', 'type': (body or {}).get('type'), 'role': (body or {}).get('role')}
+
+
+def changes_start(query, body):
+    return 200, {'startPageToken': str(drive.contador_cambios + 1)}
+
+
+def changes_list(query, body):
+    desde = int(query.get('pageToken') or 1)
+    tamano = int(query.get('pageSize', 100))
+    pendientes = [c for c in drive.cambios if c[0] >= desde]
+    pagina = pendientes[:tamano]
+
+    cambios = []
+    for numero, file_id, removed in pagina:
+        archivo = drive.archivos.get(file_id)
+        cambio = {'fileId': file_id, 'removed': removed or archivo is None, 'time': _ahora()}
+        if archivo is not None and not removed:
+            cambio['file'] = _vista(archivo)
+        cambios.append(cambio)
+
+    respuesta = {'changes': cambios}
+    if len(pendientes) > tamano:
+        respuesta['nextPageToken'] = str(pagina[-1][0] + 1)
+    else:
+        respuesta['newStartPageToken'] = str(drive.contador_cambios + 1)
+    return 200, respuesta
+
+
+# ==================== SUBIDAS REANUDABLES ====================
+
+def iniciar_subida(query, body, file_id=None, base_url=''):
+    if file_id and file_id not in drive.archivos:
+        return _error(404, f"File not found: {file_id}.", 'notFound')
+    upload_id = uuid.uuid4().hex
+    drive.sesiones[upload_id] = {'metadata': body or {}, 'file_id': file_id, 'datos': bytearray()}
+    return 200, {'__location__': f"{base_url}upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}"}
+
+
+def subir_bloque(upload_id, content_range, datos):
+    sesion = drive.sesiones.get(upload_id)
+    if not sesion:
+        return _error(404, "Upload session not found", 'notFound')
+
+    m = re.match(r"bytes (\*|(\d+)-(\d+))/(\d+|\*)", content_range or '')
+    if not m:
+        return _error(400, "Invalid Content-Range", 'badRequest')
+
+    total = None if m.group(4) == '*' else int(m.group(4))
+    if m.group(1) != '*':
+        inicio = int(m.group(2))
+        if inicio != len(sesion['datos']):
+            # Drive descarta lo que no encaja y reporta cuánto tiene
+            sesion['datos'] = sesion['datos'][:inicio] if inicio < len(sesion['datos']) else sesion['datos']
+        else:
+            sesion['datos'].extend(datos)
+
+    if total is not None and len(sesion['datos']) >= total:
+        contenido = bytes(sesion['datos'][:total])
+        del drive.sesiones[upload_id]
+        if sesion['file_id']:
+            archivo = drive.archivos[sesion['file_id']]
+            _poner_contenido(archivo, contenido)
+            drive.registrar_cambio(archivo['id'])
+        else:
+            archivo = _nuevo_archivo(sesion['metadata'], contenido)
+        return 200, _vista(archivo)
+
+    recibidos = len(sesion['datos'])
+    return 308, {'__range__': f"bytes=0-{recibidos - 1}" if recibidos else None}
+
+
+# ==================== SHEETS ====================
+
+def _columna(letras):
+    numero = 0
+    for letra in letras:
+        numero = numero * 26 + (ord(letra) - 64)
+    return numero - 1
+
+
+def _rango(rango):
+    """'Hoja!A2:J5' → (hoja, col_ini, fila_ini, col_fin, fila_fin); filas base 0 o None"""
+    hoja, _, celdas = rango.partition('!')
+    if not celdas:
+        hoja, celdas = 'Sheet1', hoja
+    inicio, _, fin = celdas.partition(':')
+    fin = fin or inicio
+    m_ini = re.match(r"^([A-Z]+)(\d*)$", inicio.upper())
+    m_fin = re.match(r"^([A-Z]+)(\d*)$", fin.upper())
+    if not m_ini or not m_fin:
+        raise ValueError(f"Rango no soportado: {rango}")
+    return (
+        hoja.strip("'"),
+        _columna(m_ini.group(1)), int(m_ini.group(2)) - 1 if m_ini.group(2) else None,
+        _columna(m_fin.group(1)), int(m_fin.group(2)) - 1 if m_fin.group(2) else None,
+    )
+
+
+def values_get(query, body, spreadsheet_id, rango):
+    try:
+        hoja, c0, f0, c1, f1 = _rango(rango)
+    except ValueError as e:
+        return _error(400, str(e), 'badRequest')
+    with sheets.lock:
+        filas = sheets.filas(spreadsheet_id, hoja)
+        seleccion = filas[(f0 or 0):(f1 + 1 if f1 is not None else None)]
+        valores = [fila[c0:c1 + 1] for fila in seleccion]
+    while valores and not valores[-1]:
+        valores.pop()
+    return 200, {'range': rango, 'majorDimension': 'ROWS', 'values': valores}
+
+
+def values_update(query, body, spreadsheet_id, rango):
+    try:
+        hoja, c0, f0, c1, f1 = _rango(rango)
+    except ValueError as e:
+        return _error(400, str(e), 'badRequest')
+    valores = (body or {}).get('values', [])
+    with sheets.lock:
+        filas = sheets.filas(spreadsheet_id, hoja)
+        for i, fila_nueva in enumerate(valores):
+            indice = (f0 or 0) + i
+            while len(filas) <= indice:
+                filas.append([])
+            fila = filas[indice]
+            while len(fila) < c0 + len(fila_nueva):
+                fila.append('')
+            fila[c0:c0 + len(fila_nueva)] = fila_nueva
+    return 200, {'spreadsheetId': spreadsheet_id, 'updatedRange': rango,
+                 'updatedRows': len(valores), 'updatedCells': sum(len(f) for f in valores)}
+
+
+def values_append(query, body, spreadsheet_id, rango):
+    try:
+        hoja, c0, _, _, _ = _rango(rango)
+    except ValueError as e:
+        return _error(400, str(e), 'badRequest')
+    valores = (body or {}).get('values', [])
+    with sheets.lock:
+        filas = sheets.filas(spreadsheet_id, hoja)
+        inicio = len(filas)
+        for fila_nueva in valores:
+            filas.append([''] * c0 + list(fila_nueva))
+    return 200, {'spreadsheetId': spreadsheet_id, 'tableRange': rango,
+                 'updates': {'updatedRange': f"{hoja}!A{inicio + 1}", 'updatedRows': len(valores)}}
+
+
+# ==================== N8N ====================
+
+def excel_export(query, body, file_id):
+    return 200, excel.xlsx()
+
+
+def n8n_webhook(query, body, nombre):
+    with n8n.lock:
+        n8n.recibidos += 1
+        tipo = (body or {}).get('tipo_notificacion', 'desconocido')
+        n8n.por_tipo[tipo] = n8n.por_tipo.get(tipo, 0) + 1
+        n8n.ultimos.append({'webhook': nombre, 'tipo': tipo, 'serial': (body or {}).get('serial')})
+    return 200, {'message': 'Workflow was started'}
+
+
+def n8n_health(query, body):
+    return 200, {'status': 'ok'}
+
+
+# ==================== RUTEO ====================
+
+_RUTAS = [
+    ('GET', re.compile(r"^/drive/v3/files$"), files_list),
+    ('POST', re.compile(r"^/drive/v3/files$"), files_create),
+    ('GET', re.compile(r"^/drive/v3/changes/startPageToken$"), changes_start),
+    ('GET', re.compile(r"^/drive/v3/changes$"), changes_list),
+    ('POST', re.compile(r"^/drive/v3/files/([^/]+)/copy$"), files_copy),
+    ('POST', re.compile(r"^/drive/v3/files/([^/]+)/permissions$"), permissions_create),
+    ('GET', re.compile(r"^/drive/v3/files/([^/]+)$"), files_get),
+    ('PATCH', re.compile(r"^/drive/v3/files/([^/]+)$"), files_update),
+    ('DELETE', re.compile(r"^/drive/v3/files/([^/]+)$"), files_delete),
+    ('POST', re.compile(r"^/v4/spreadsheets/([^/]+)/values/(.+):append$"), values_append),
+    ('GET', re.compile(r"^/v4/spreadsheets/([^/]+)/values/(.+)$"), values_get),
+    ('PUT', re.compile(r"^/v4/spreadsheets/([^/]+)/values/(.+)$"), values_update),
+    ('GET', re.compile(r"^/spreadsheets/d/([^/]+)/export$"), excel_export),
+    ('POST', re.compile(r"^/webhook/([^/]+)$"), n8n_webhook),
+    ('GET', re.compile(r"^/healthz$"), n8n_health),
+]
+
+
+def despachar(metodo, ruta, query, body, headers, base_url, datos_crudos=b''):
+    """Ejecuta una llamada (directa o dentro de un batch) → (status, json|bytes|None, headers)"""
+    falla = simulador.falla(_servicio_de(ruta))
+    if falla:
+        return (*falla, {})
+
+    with drive.lock:
+        plantilla = re.sub(r'/(files|spreadsheets)/[^/]+', r'/\1/{id}', ruta)
+        drive.contar(f"{metodo} {plantilla}")
+
+        if ruta.startswith('/upload/drive/v3/files'):
+            if metodo == 'PUT' and query.get('upload_id'):
+                status, data = subir_bloque(query['upload_id'], headers.get('content-range'), datos_crudos)
+            elif query.get('uploadType') == 'resumable':
+                m = re.match(r"^/upload/drive/v3/files/([^/]+)$", ruta)
+                status, data = iniciar_subida(query, body, m.group(1) if m else None, base_url)
+            else:
+                return (*_error(400, "Solo se soportan subidas reanudables", 'badRequest'), {})
+            extra = {}
+            if isinstance(data, dict) and '__location__' in data:
+                extra['Location'] = data.pop('__location__')
+                data = None
+            if isinstance(data, dict) and '__range__' in data:
+                rango = data.pop('__range__')
+                if rango:
+                    extra['Range'] = rango
+                data = None
+            return status, data, extra
+
+        for m_ruta, patron, funcion in _RUTAS:
+            m = patron.match(ruta)
+            if m and m_ruta == metodo:
+                status, data = funcion(query, body, *m.groups())
+                return status, data, {}
+
+        return (*_error(404, f"Ruta no implementada en el servidor falso: {metodo} {ruta}", 'notFound'), {})
+
+
+def _a_respuesta(status, data, extra):
+    if isinstance(data, (bytes, bytearray)):
+        return Response(content=bytes(data), status_code=status, headers=extra, media_type='application/octet-stream')
+    if data is None:
+        return Response(status_code=status, headers=extra)
+    return Response(content=json.dumps(data), status_code=status, headers=extra, media_type='application/json')
+
+
+def _query(url_query):
+    return {k: v[0] for k, v in parse_qs(url_query, keep_blank_values=True).items()}
+
+
+def _json_o_nada(datos):
+    try:
+        return json.loads(datos) if datos else None
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+@app.post("/batch/drive/v3")
+async def batch(request: Request):
+    """Batch multipart/mixed: cada parte es una petición HTTP completa"""
+    crudo = await request.body()
+    tipo = request.headers.get('content-type', '')
+    mensaje = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {tipo}\r\n\r\n".encode() + crudo)
+
+    await asyncio.sleep(simulador.demora('drive'))
+
+    frontera = f"batch_{uuid.uuid4().hex}"
+    partes = []
+    base_url = str(request.base_url)
+
+    for parte in mensaje.iter_parts():
+        content_id = (parte.get('Content-ID') or '').strip('<>')
+        texto = parte.get_payload(decode=True) or b''
+        linea, _, resto = texto.partition(b'\n')
+        metodo, url, _ = linea.decode().strip().split(' ', 2)
+        sub = BytesParser(policy=HTTP).parsebytes(resto)
+        body_sub = sub.get_payload(decode=True) or b''
+        partido = urlsplit(url)
+        status, data, _ = despachar(metodo, partido.path, _query(partido.query),
+                                    _json_o_nada(body_sub), {}, base_url)
+
+        cuerpo = '' if data is None else json.dumps(data)
+        partes.append(
+            f"--{frontera}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+            f"HTTP/1.1 {status} OK\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n{cuerpo}\r\n"
+        )
+
+    contenido = "".join(partes) + f"--{frontera}--\r\n"
+    return Response(content=contenido, media_type=f"multipart/mixed; boundary={frontera}")
+
+
+@app.get("/_fake/estado")
+async def estado():
+    """Resumen del estado del servidor falso (para scripts de prueba)"""
+    with drive.lock:
+        drive_estado = {
+            'archivos': len(drive.archivos),
+            'cambios': len(drive.cambios),
+            'sesiones_subida': len(drive.sesiones),
+        }
+        llamadas = dict(drive.llamadas)
+    with sheets.lock:
+        sheets_estado = {f"{sid}/{hoja}": len(filas) for (sid, hoja), filas in sheets.hojas.items()}
+    with n8n.lock:
+        n8n_estado = {'recibidos': n8n.recibidos, 'por_tipo': dict(n8n.por_tipo), 'ultimos': list(n8n.ultimos)[-10:]}
+    return {
+        **drive_estado,
+        'llamadas': llamadas,
+        'sheets_filas': sheets_estado,
+        'n8n': n8n_estado,
+        'simulacion': simulador.resumen()
+    }
+
+
+@app.post("/_fake/config")
+async def configurar(request: Request):
+    """
+    Cambia la simulación en caliente. Cuerpo: {"servicio": "drive"|"sheets"|"n8n"|"todos",
+    "latencia_ms": 120, "jitter_ms": 40, "tasa_error": 0.02, "cuota_por_minuto": 600}
+    """
+    datos = _json_o_nada(await request.body()) or {}
+    servicio = datos.pop('servicio', 'todos')
+    if servicio not in SERVICIOS + ('todos',):
+        return _a_respuesta(*_error(400, f"Servicio desconocido: {servicio}", 'badRequest'), {})
+    simulador.configurar(servicio, **datos)
+    return simulador.resumen()
+
+
+@app.post("/_fake/empleados")
+async def generar_empleados(request: Request):
+    """Regenera el Excel de empleados. Cuerpo: {"cantidad": 500, "empresas": 3}"""
+    datos = _json_o_nada(await request.body()) or {}
+    excel.generar(int(datos.get('cantidad', 200)), int(datos.get('empresas', 3)))
+    return {'cedula_base': CEDULA_BASE, 'cantidad': len(excel.empleados), 'empresas': excel.empresas}
+
+
+@app.post("/_fake/reiniciar")
+async def reiniciar():
+    drive.reiniciar()
+    sheets.reiniciar()
+    n8n.reiniciar()
+    return {'ok': True}
+
+
+@app.api_route("/{ruta:path}", methods=["GET", "POST", "PATCH", "PUT", "DELETE"])
+async def api_falsa(ruta: str, request: Request):
+    crudo = await request.body()
+    await asyncio.sleep(simulador.demora(_servicio_de("/" + ruta)))
+    status, data, extra = despachar(
+        request.method,
+        "/" + ruta,
+        dict(request.query_params),
+        _json_o_nada(crudo),
+        {k.lower(): v for k, v in request.headers.items()},
+        str(request.base_url),
+        crudo
+    )
+    return _a_respuesta(status, data, extra)
+
+
+def iniciar_en_hilo(port: int = 8765):
+    """Arranca el servidor en un hilo (para scripts de prueba en el mismo proceso)"""
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    servidor = uvicorn.Server(config)
+    hilo = threading.Thread(target=servidor.run, daemon=True)
+    hilo.start()
+    while not servidor.started:
+        time.sleep(0.05)
+    return servidor
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Servidor falso de Google Drive / Sheets / n8n")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latencia-ms", type=int, default=0, help="Latencia base de todas las APIs")
+    parser.add_argument("--jitter-ms", type=int, default=0)
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="Fracción de llamadas que responden 500")
+    parser.add_argument("--cuota-drive", type=int, default=0, help="Llamadas por minuto (0 = sin límite)")
+    parser.add_argument("--cuota-sheets", type=int, default=0)
+    parser.add_argument("--cuota-n8n", type=int, default=0)
+    args = parser.parse_args()
+
+    simulador.configurar('todos', latencia_ms=args.latencia_ms, jitter_ms=args.jitter_ms, tasa_error=args.tasa_error)
+    simulador.configurar('drive', cuota_por_minuto=args.cuota_drive)
+    simulador.configurar('sheets', cuota_por_minuto=args.cuota_sheets)
+    simulador.configurar('n8n', cuota_por_minuto=args.cuota_n8n)
+
+    print(f"🧪 APIs falsas en http://127.0.0.1:{args.port}/")
+    print(f"   Exporta GOOGLE_API_ENDPOINT=http://127.0.0.1:{args.port}/")
+    print(f"   Exporta N8N_WEBHOOK_URL=http://127.0.0.1:{args.port}/webhook/incapacidades")
+    print(f"   Exporta GOOGLE_SHEETS_ID=fake-sheet")
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
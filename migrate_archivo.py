@@ -0,0 +1,58 @@
+"""
+Script de migración: tablas de archivo de casos cerrados + índices por case_id
+Ejecutar: python migrate_archivo.py            # crea tablas e índices
+          python migrate_archivo.py --archivar # además corre el archivo ahora
+(con DATABASE_URL apuntando a la BD; se puede correr varias veces)
+"""
+
+import os
+import sys
+
+from sqlalchemy import text
+
+from app.database import init_db, engine
+
+# create_all no agrega índices a tablas que ya existen. Sin ellos el archivo
+# (DELETE ... WHERE case_id IN) y detalle_caso recorren las tablas completas
+INDICES = [
+    ("ix_case_documents_case_id", "case_documents"),
+    ("ix_case_events_case_id", "case_events"),
+    ("ix_case_notes_case_id", "case_notes"),
+]
+
+
+def migrar_archivo():
+    print("🔄 Creando tablas *_archivo (si no existen)...")
+    init_db()
+
+    es_pg = engine.dialect.name == "postgresql"
+    # CONCURRENTLY: no bloquea las escrituras mientras se construye (va fuera de transacción)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for nombre, tabla in INDICES:
+            conn.execute(text(
+                f"CREATE INDEX {'CONCURRENTLY ' if es_pg else ''}IF NOT EXISTS {nombre} ON {tabla} (case_id)"
+            ))
+            print(f"  ✅ Índice {nombre}")
+
+    print("\n✅ Migración completada\n")
+
+
+if __name__ == "__main__":
+    print("""
+╔═══════════════════════════════════════════════════════╗
+║    MIGRACIÓN: Archivo de casos cerrados               ║
+╚═══════════════════════════════════════════════════════╝
+    """)
+
+    database_url = os.environ.get("DATABASE_URL", "")
+    print(f"📊 Base de datos: {database_url.split('@')[1] if '@' in database_url else 'Local'}\n")
+
+    migrar_archivo()
+
+    if "--archivar" in sys.argv:
+        from app.archivo import archivar_casos, ARCHIVO_DIAS
+        print(f"🗄️ Archivando casos cerrados sin cambios en {ARCHIVO_DIAS} días...")
+        stats = archivar_casos()
+        print(f"  ✅ {stats['casos']} caso(s) en {stats['lotes']} lote(s), {stats['duracion_s']}s")
+        for tabla, filas in stats['filas'].items():
+            print(f"     {tabla}: {filas}")
@@ -43,7 +43,9 @@ def migrar_base_datos():
         
         migraciones_cases = [
             "ALTER TABLE cases ADD COLUMN IF NOT EXISTS recordatorio_enviado BOOLEAN DEFAULT FALSE;",
-            "ALTER TABLE cases ADD COLUMN IF NOT EXISTS fecha_recordatorio TIMESTAMP;"
+            "ALTER TABLE cases ADD COLUMN IF NOT EXISTS fecha_recordatorio TIMESTAMP;",
+            "ALTER TABLE cases ADD COLUMN IF NOT EXISTS drive_file_id VARCHAR(100);",
+            "ALTER TABLE cases ADD COLUMN IF NOT EXISTS drive_parent_id VARCHAR(100);"
         ]
         
         for sql in migraciones_cases:
@@ -80,14 +82,14 @@ def migrar_base_datos():
             SELECT column_name 
             FROM information_schema.columns 
             WHERE table_name='cases' 
-            AND column_name IN ('recordatorio_enviado', 'fecha_recordatorio');
+            AND column_name IN ('recordatorio_enviado', 'fecha_recordatorio', 'drive_file_id', 'drive_parent_id');
         """))
         columnas_cases = [row[0] for row in result_cases]
         
-        if len(columnas_cases) == 2:
-            print(f"  ✅ Tabla 'cases': 2/2 columnas nuevas OK")
+        if len(columnas_cases) == 4:
+            print(f"  ✅ Tabla 'cases': 4/4 columnas nuevas OK")
         else:
-            print(f"  ⚠️ Tabla 'cases': {len(columnas_cases)}/2 columnas encontradas")
+            print(f"  ⚠️ Tabla 'cases': {len(columnas_cases)}/4 columnas encontradas")
         
         print("\n✅ Migración completada exitosamente\n")
         
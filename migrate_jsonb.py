@@ -0,0 +1,67 @@
+"""
+Script de migración: metadata_form y metadata_json a JSONB con índices GIN
+Ejecutar: python migrate_jsonb.py
+(solo PostgreSQL; en SQLite las columnas siguen como JSON y no hay nada que hacer)
+"""
+
+import os
+
+from sqlalchemy import text
+
+from app.database import engine
+
+MIGRACIONES = [
+    ("cases.metadata_form → JSONB",
+     "ALTER TABLE cases ALTER COLUMN metadata_form TYPE JSONB USING metadata_form::jsonb"),
+    ("case_events.metadata_json → JSONB",
+     "ALTER TABLE case_events ALTER COLUMN metadata_json TYPE JSONB USING metadata_json::jsonb"),
+]
+
+# CONCURRENTLY: no bloquea las escrituras mientras se construye (va fuera de transacción)
+INDICES = [
+    ("ix_cases_metadata_form_gin",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_cases_metadata_form_gin "
+     "ON cases USING gin (metadata_form jsonb_path_ops)"),
+    ("ix_case_events_metadata_json_gin",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_case_events_metadata_json_gin "
+     "ON case_events USING gin (metadata_json jsonb_path_ops)"),
+]
+
+
+def migrar_jsonb():
+    if engine.dialect.name != "postgresql":
+        print("⚠️ La BD no es PostgreSQL: nada que migrar (SQLite usa las funciones JSON1)")
+        return
+
+    with engine.begin() as conn:
+        for nombre, sql in MIGRACIONES:
+            tipo = conn.execute(text(
+                "SELECT data_type FROM information_schema.columns WHERE table_name = :tabla AND column_name = :columna"
+            ), {'tabla': nombre.split('.')[0], 'columna': nombre.split('.')[1].split()[0]}).scalar()
+            if tipo == 'jsonb':
+                print(f"  ⚠️ {nombre}: ya es JSONB, omitiendo...")
+                continue
+            conn.execute(text(sql))
+            print(f"  ✅ {nombre}")
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for nombre, sql in INDICES:
+            conn.execute(text(sql))
+            print(f"  ✅ Índice {nombre}")
+        conn.execute(text("ANALYZE cases"))
+        conn.execute(text("ANALYZE case_events"))
+
+    print("\n✅ Migración completada\n")
+
+
+if __name__ == "__main__":
+    print("""
+╔═══════════════════════════════════════════════════════╗
+║    MIGRACIÓN: metadata a JSONB + índices GIN          ║
+╚═══════════════════════════════════════════════════════╝
+    """)
+
+    database_url = os.environ.get("DATABASE_URL", "")
+    print(f"📊 Base de datos: {database_url.split('@')[1] if '@' in database_url else 'Local'}\n")
+
+    migrar_jsonb()
@@ -0,0 +1,46 @@
+"""
+Script de migración: Reenvíos de metadata_form['reenvios'] a case_resubmissions
+Ejecutar: python migrate_reenvios.py
+(con DATABASE_URL apuntando a la BD; se puede correr varias veces)
+"""
+
+import os
+
+from app.database import init_db, SessionLocal, CaseResubmission
+from app.reenvios import migrar_todos
+
+
+def migrar_reenvios():
+    """Crea la tabla (si falta) y copia los reenvíos de cada caso"""
+
+    print("🔄 Creando tabla case_resubmissions (si no existe)...")
+    init_db()
+
+    print("🔄 Copiando reenvíos desde metadata_form...\n")
+    db = SessionLocal()
+    try:
+        stats = migrar_todos(db)
+        print(f"  ✅ {stats['reenvios']} reenvío(s) de {stats['casos']} caso(s)")
+
+        total = db.query(CaseResubmission).count()
+        pendientes = db.query(CaseResubmission).filter(CaseResubmission.estado == 'PENDIENTE_REVISION').count()
+        print(f"\n📋 case_resubmissions: {total} fila(s), {pendientes} pendiente(s) de revisión")
+        print("\n✅ Migración completada\n")
+    except Exception as e:
+        print(f"❌ Error en migración: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("""
+╔═══════════════════════════════════════════════════════╗
+║   MIGRACIÓN: Reenvíos a la tabla case_resubmissions   ║
+╚═══════════════════════════════════════════════════════╝
+    """)
+
+    database_url = os.environ.get("DATABASE_URL", "")
+    print(f"📊 Base de datos: {database_url.split('@')[1] if '@' in database_url else 'Local'}\n")
+
+    migrar_reenvios()
@@ -0,0 +1,125 @@
+"""
+Pruebas - Archivo de casos cerrados
+Ejecutar: python -m pytest -q test_archivo.py
+
+Casos COMPLETA antiguos (con documentos, eventos, notas, reenvíos, huellas,
+comparaciones e índice de Drive), un COMPLETA reciente y un INCOMPLETA
+antiguo: qué se archiva, por lotes, la lectura de detalle_caso desde el
+archivo, las estadísticas y que generar_serial_unico no repita seriales
+archivados.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, func
+
+from app.database import (
+    SessionLocal, Case, CaseDocument, CaseEvent, CaseNote, CaseResubmission, DocumentBlob,
+    DriveFile, VersionComparison, Company, Employee, EstadoCaso, TipoIncapacidad,
+    cases_archivo, ARCHIVO_HIJAS
+)
+from app.archivo import archivar_casos, serial_existe
+from app.serial_generator import generar_serial_unico
+from conftest import HEADERS
+
+
+@pytest.fixture
+def sembrado(bd):
+    db = SessionLocal()
+    try:
+        empresa = Company(nombre="ALFA")
+        db.add(empresa)
+        db.flush()
+        empleado = Employee(cedula="123", nombre="David Baeza", company_id=empresa.id)
+        db.add(empleado)
+        db.flush()
+
+        hace_400 = datetime.utcnow() - timedelta(days=400)
+        casos = {}
+        for serial, estado, fecha in [
+            ("DB1230", EstadoCaso.COMPLETA, hace_400),
+            ("DB1231", EstadoCaso.COMPLETA, hace_400),
+            ("OTRO1", EstadoCaso.COMPLETA, datetime.utcnow() - timedelta(days=10)),
+            ("OTRO2", EstadoCaso.INCOMPLETA, hace_400),
+        ]:
+            caso = Case(serial=serial, cedula="123", employee_id=empleado.id, company_id=empresa.id,
+                        tipo=TipoIncapacidad.ENFERMEDAD_GENERAL, estado=estado,
+                        created_at=fecha, updated_at=fecha)
+            db.add(caso)
+            db.flush()
+            casos[serial] = caso
+
+        viejo = casos["DB1230"]
+        db.add(CaseDocument(case_id=viejo.id, doc_tipo="incapacidad"))
+        db.add_all([CaseEvent(case_id=viejo.id, accion="creado", created_at=hace_400),
+                    CaseEvent(case_id=viejo.id, accion="validado", estado_nuevo="COMPLETA",
+                              created_at=hace_400 + timedelta(hours=1))])
+        db.add(CaseNote(case_id=viejo.id, contenido="Radicada en EPS", created_at=hace_400))
+        db.add(CaseResubmission(case_id=viejo.id, numero=1, estado='APROBADO'))
+        db.add(DocumentBlob(case_id=viejo.id, sha256="a" * 64, drive_file_id="F1"))
+        db.add(VersionComparison(case_id=viejo.id, file_id_anterior="F0", file_id_nuevo="F1"))
+        db.add(DriveFile(file_id="F1", serial="DB1230", case_id=viejo.id, rol="completa"))
+        db.add(CaseEvent(case_id=casos["OTRO2"].id, accion="creado"))
+        db.commit()
+    finally:
+        db.close()
+
+
+def contar(db, tabla, **filtros):
+    query = select(func.count()).select_from(tabla)
+    for columna, valor in filtros.items():
+        query = query.where(tabla.c[columna] == valor)
+    return db.scalar(query)
+
+
+def test_archiva_solo_cerrados_antiguos_por_lotes(sembrado):
+    stats = archivar_casos(dias=365, lote=1)
+    assert (stats['casos'], stats['lotes']) == (2, 2)
+
+    db = SessionLocal()
+    try:
+        assert sorted(db.scalars(select(Case.serial))) == ["OTRO1", "OTRO2"]
+        hijas = {nombre: contar(db, tabla) for nombre, tabla in ARCHIVO_HIJAS.items()}
+        assert hijas == {
+            'case_documents': 1, 'case_events': 2, 'case_notes': 1, 'case_resubmissions': 1, 'document_blobs': 1
+        }
+        calientes = [db.scalar(select(func.count()).select_from(m)) for m in
+                     (CaseDocument, CaseEvent, CaseNote, CaseResubmission, DocumentBlob, VersionComparison)]
+        assert calientes == [0, 1, 0, 0, 0, 0]
+        archivo_drive = db.scalar(select(DriveFile).where(DriveFile.file_id == "F1"))
+        assert archivo_drive.serial == "DB1230" and archivo_drive.case_id is None
+    finally:
+        db.close()
+
+    repetido = archivar_casos(dias=365)
+    db = SessionLocal()
+    try:
+        assert repetido['casos'] == 0 and contar(db, cases_archivo) == 2
+    finally:
+        db.close()
+
+
+def test_seriales_archivados_no_se_repiten(sembrado):
+    archivar_casos(dias=365)
+    db = SessionLocal()
+    try:
+        assert serial_existe(db, "DB1231") and not serial_existe(db, "DB1232")
+        assert generar_serial_unico(db, "David Baeza", "123") == "DB1232"
+    finally:
+        db.close()
+
+
+def test_detalle_y_estadisticas_desde_el_archivo(sembrado, cliente):
+    antes = cliente.get("/validador/stats", headers=HEADERS).json()
+    archivar_casos(dias=365)
+
+    detalle = cliente.get("/validador/casos/DB1230", headers=HEADERS)
+    assert detalle.status_code == 200
+    datos = detalle.json()
+    assert datos['archivado'] and datos['nombre'] == "David Baeza"
+    assert [e['accion'] for e in datos['historial']] == ['validado', 'creado']
+    assert len(datos['notas']) == 1 and len(datos['documentos']) == 1
+    assert cliente.get("/validador/casos/NOEXISTE", headers=HEADERS).status_code == 404
+
+    assert cliente.get("/validador/stats", headers=HEADERS).json() == antes
@@ -0,0 +1,69 @@
+"""
+Pruebas - Arranque en frío: imports perezosos y calentamiento diferido
+Ejecutar: python -m pytest -q test_arranque.py
+
+Que importar app.main no cargue las librerías pesadas (en un intérprete
+nuevo), el calentamiento en segundo plano con su registro por tarea y el
+resumen del perfil de importación.
+"""
+
+import sys
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from app import arranque
+
+PESADOS = ('pandas', 'fitz', 'PIL.Image', 'anthropic', 'cv2', 'skimage', 'numpy', 'reportlab', 'openpyxl')
+
+
+def test_importar_la_app_no_carga_librerias_pesadas(tmp_path):
+    # El entorno de conftest (BD temporal, Google falso) pasa al subproceso
+    codigo = f"import sys, app.main; print(','.join(m for m in {PESADOS!r} if m in sys.modules))"
+    resultado = subprocess.run([sys.executable, "-c", codigo], cwd=Path(__file__).parent,
+                               capture_output=True, text=True, timeout=120)
+    assert resultado.returncode == 0, resultado.stderr
+    assert resultado.stdout.strip() == "", f"cargados al importar: {resultado.stdout.strip()}"
+
+
+@pytest.fixture
+def estado_limpio(monkeypatch):
+    monkeypatch.setattr(arranque, "PERFIL_ARRANQUE", False)
+    monkeypatch.setattr(arranque, "_fases", {})
+    monkeypatch.setattr(arranque, "_calentamiento", {})
+    monkeypatch.setattr(arranque, "_estado", {'calentando': False, 'calentado': False, 'inicio_calentamiento': None})
+
+
+def test_calentamiento_en_segundo_plano(estado_limpio):
+    orden = []
+
+    def fallar():
+        raise RuntimeError("sin token")
+
+    hilo = arranque.calentar_en_segundo_plano([
+        ('sync', lambda: orden.append('sync')),
+        ('drive', fallar),
+        ('modulos', lambda: arranque.precargar_modulos(['json', 'modulo_que_no_existe'])),
+    ], demora=0)
+    hilo.join(5)
+
+    estado = arranque.obtener_estado()
+    assert orden == ['sync'] and estado['calentado'] and not estado['calentando']
+    assert estado['calentamiento']['sync']['ok'] and estado['calentamiento']['modulos']['ok']
+    drive = estado['calentamiento']['drive']
+    assert not drive['ok'] and drive['error'] == "sin token" and drive['ms'] is not None
+    assert 'calentado' in estado['fases_ms']
+
+
+def test_resumen_del_perfil():
+    filas = [
+        {'modulo': 'encodings', 'nivel': 1, 'propio_ms': 1.0, 'acumulado_ms': 2.0},
+        {'modulo': 'fastapi.routing', 'nivel': 2, 'propio_ms': 30.0, 'acumulado_ms': 30.0},
+        {'modulo': 'fastapi', 'nivel': 1, 'propio_ms': 10.0, 'acumulado_ms': 40.0},
+        {'modulo': 'app.main', 'nivel': 0, 'propio_ms': 5.0, 'acumulado_ms': 47.0},
+    ]
+    resumen = arranque.resumen_importaciones(filas, top=1)
+    assert resumen['total_ms'] == 47.0
+    assert resumen['top'] == [{'modulo': 'fastapi', 'acumulado_ms': 40.0}]
+    assert resumen['por_paquete_ms'] == {'fastapi': 40.0}
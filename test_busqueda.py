@@ -0,0 +1,111 @@
+"""
+Pruebas - Buscador de la bandeja (índice FTS5)
+Ejecutar: python -m pytest -q test_busqueda.py
+
+Casos y empleados con tildes: el relleno de casos_busqueda al crearla, los
+triggers (caso nuevo, cambio de serial, empleado renombrado, caso borrado),
+las búsquedas por prefijo y sin tildes, el serial exacto primero y el tope
+de coincidencias de /validador/casos.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app.database import engine, SessionLocal, Case, Company, Employee, EstadoCaso, TipoIncapacidad
+from app import busqueda, validador
+from conftest import HEADERS
+
+
+def nuevo_caso(db, serial, empleado, empresa, minutos):
+    caso = Case(serial=serial, cedula=empleado.cedula, employee_id=empleado.id, company_id=empresa.id,
+                tipo=TipoIncapacidad.ENFERMEDAD_GENERAL, estado=EstadoCaso.NUEVO,
+                created_at=datetime.now() - timedelta(minutes=minutos))
+    db.add(caso)
+    return caso
+
+
+@pytest.fixture
+def sembrado(bd):
+    """Casos creados antes de que exista casos_busqueda (deben entrar por el relleno)"""
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS casos_busqueda"))
+        for trigger in ('casos_busqueda_ai', 'casos_busqueda_au', 'casos_busqueda_ad', 'casos_busqueda_emp_au'):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    db = SessionLocal()
+    try:
+        empresa = Company(nombre="ALFA")
+        db.add(empresa)
+        db.flush()
+        jose = Employee(cedula="1023456789", nombre="José Muñoz Castaño", company_id=empresa.id)
+        lucia = Employee(cedula="52987654", nombre="Lucía Peña", company_id=empresa.id)
+        db.add_all([jose, lucia])
+        db.flush()
+        nuevo_caso(db, "INC100", jose, empresa, 30)
+        nuevo_caso(db, "INC1001", lucia, empresa, 20)
+        db.commit()
+    finally:
+        db.close()
+    assert busqueda.preparar_indices(engine) == 'fts5'
+
+
+def seriales(cliente, q, **params):
+    r = cliente.get("/validador/casos", params={'q': q, **params}, headers=HEADERS)
+    assert r.status_code == 200
+    return [i['serial'] for i in r.json()['items']]
+
+
+def test_relleno_tildes_y_prefijos(sembrado, cliente):
+    assert seriales(cliente, "jose munoz") == ['INC100']
+    assert seriales(cliente, "CASTAÑO") == ['INC100']
+    assert seriales(cliente, "52987") == ['INC1001']
+    assert seriales(cliente, "inc100") == ['INC100', 'INC1001']
+
+
+def test_triggers_siguen_los_cambios(sembrado, cliente):
+    db = SessionLocal()
+    try:
+        empresa = db.query(Company).first()
+        lucia = db.query(Employee).filter_by(cedula="52987654").one()
+        nuevo_caso(db, "INC2000", lucia, empresa, 10)
+        db.commit()
+        assert seriales(cliente, "inc2000") == ['INC2000']
+
+        caso = db.query(Case).filter_by(serial="INC2000").one()
+        caso.serial = "INC3000"
+        lucia.nombre = "Lucía Ramírez"
+        db.commit()
+        assert seriales(cliente, "inc2000") == []
+        assert seriales(cliente, "inc3000") == ['INC3000']
+        assert seriales(cliente, "ramirez") == ['INC3000', 'INC1001']
+        assert seriales(cliente, "pena") == []
+
+        db.delete(caso)
+        db.commit()
+        assert seriales(cliente, "ramirez") == ['INC1001']
+    finally:
+        db.close()
+
+
+def test_tope_de_coincidencias(sembrado, cliente, monkeypatch):
+    monkeypatch.setattr(busqueda, "LIMITE_RESULTADOS", 5)
+    monkeypatch.setattr(validador, "LIMITE_RESULTADOS", 5)
+    db = SessionLocal()
+    try:
+        empresa = db.query(Company).first()
+        lucia = db.query(Employee).filter_by(cedula="52987654").one()
+        for i in range(8):
+            nuevo_caso(db, f"TOP{i}", lucia, empresa, 8 - i)
+        db.commit()
+    finally:
+        db.close()
+
+    r = cliente.get("/validador/casos", params={'q': 'top', 'page_size': 20}, headers=HEADERS).json()
+    assert r['total'] == 5 and r['busqueda_limitada']
+    assert [i['serial'] for i in r['items']] == ['TOP7', 'TOP6', 'TOP5', 'TOP4', 'TOP3']
+
+
+def test_sin_indice_usa_ilike(sembrado, cliente, monkeypatch):
+    monkeypatch.setattr(busqueda, "_motor", None)
+    assert seriales(cliente, "Muñoz") == ['INC100']
@@ -0,0 +1,90 @@
+"""
+Pruebas - Carga masiva de empleados (/admin/migrar-excel)
+Ejecutar: python -m pytest -q test_carga_empleados.py
+
+Un Excel con cédulas leídas como número, filas incompletas, cédulas
+repetidas, empleados y empresas que ya existen: el upsert por cédula, que no
+se borren columnas que el Excel no trae, el informe por lote y el índice del
+buscador tras renombrar.
+"""
+
+import pandas as pd
+import pytest
+from sqlalchemy import select, func, text
+
+from app.database import engine, SessionLocal, Company, Employee, Case, TipoIncapacidad
+from app.carga_empleados import cargar_empleados, preparar_dataframe
+import app.main as main
+from conftest import HEADERS
+
+
+@pytest.fixture
+def sembrado(bd):
+    db = SessionLocal()
+    try:
+        empresa = Company(nombre="ALFA")
+        db.add(empresa)
+        db.flush()
+        empleado = Employee(cedula="100", nombre="Nombre Viejo", correo="viejo@alfa.co", company_id=empresa.id,
+                            jefe_nombre="Jefa Alfa", activo=False)
+        db.add(empleado)
+        db.flush()
+        db.add(Case(serial="NV1000", cedula="100", employee_id=empleado.id, company_id=empresa.id,
+                    tipo=TipoIncapacidad.ENFERMEDAD_GENERAL))
+        db.commit()
+    finally:
+        db.close()
+
+
+def excel():
+    # cedula como float (como la lee pandas si hay celdas vacías en la columna)
+    return pd.DataFrame({
+        'cedula': [100.0, 200.0, 300.0, None, 200.0, 400.0],
+        'nombre': ["Nombre Nuevo", "Ana", "Luis", "Sin Cédula", "Ana María", None],
+        'correo': ["nuevo@alfa.co", "ana@beta.co", "luis@alfa.co", "x@x.co", "anamaria@beta.co", "y@y.co"],
+        'telefono': [3001234567.0, None, 3109876543.0, None, None, None],
+        'empresa': ["ALFA", "BETA", " ALFA ", "ALFA", "BETA", "ALFA"],
+    })
+
+
+def test_preparar_dataframe():
+    limpio, errores = preparar_dataframe(excel())
+    assert list(limpio['cedula']) == ["100", "300", "200"]
+    assert limpio.iloc[0]['telefono'] == "3001234567"
+    assert len(errores) == 3 and "Fila 5" in errores[0] and "Fila 7" in errores[1]
+
+
+def test_upsert_por_cedula(sembrado):
+    resumen = cargar_empleados(excel(), lote=2)
+    assert (resumen['insertados'], resumen['actualizados'], resumen['empresas_nuevas']) == (2, 1, 1)
+    assert [(l['lote'], l['filas']) for l in resumen['lotes']] == [(1, 2), (2, 1)]
+    assert all(l['error'] is None for l in resumen['lotes'])
+
+    db = SessionLocal()
+    try:
+        empleado = db.scalar(select(Employee).where(Employee.cedula == "100"))
+        assert empleado.nombre == "Nombre Nuevo" and empleado.activo and empleado.jefe_nombre == "Jefa Alfa"
+        ana = db.scalar(select(Employee).where(Employee.cedula == "200"))
+        assert ana.nombre == "Ana María" and ana.empresa.nombre == "BETA"
+        assert db.scalar(select(func.count()).select_from(Company)) == 2
+    finally:
+        db.close()
+
+    with engine.connect() as conn:
+        indexado = conn.execute(text(
+            "SELECT rowid FROM casos_busqueda WHERE casos_busqueda MATCH '\"nuevo\"*'"
+        )).scalars().all()
+    assert len(indexado) == 1
+
+
+def test_migrar_excel(sembrado, cliente, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DATA_PATH", str(tmp_path / "base_empleados.xlsx"))
+    cargar_empleados(excel())
+    excel().to_excel(main.DATA_PATH, index=False)
+    respuesta = cliente.post("/admin/migrar-excel", headers=HEADERS)
+    assert respuesta.status_code == 200
+    datos = respuesta.json()
+    assert datos['migraciones_exitosas'] == 0 and datos['actualizados'] == 3
+
+    pd.DataFrame({'cedula': [1], 'nombre': ["X"]}).to_excel(main.DATA_PATH, index=False)
+    assert cliente.post("/admin/migrar-excel", headers=HEADERS).status_code == 400
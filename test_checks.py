@@ -0,0 +1,81 @@
+"""
+Pruebas - Reporte de casos por checks
+Ejecutar: python -m pytest -q test_checks.py
+
+Casos con eventos de validación de distintas fechas: filtro por uno o
+varios checks, solo vigentes, campo del formulario, quincenas y errores de
+parámetros de /validador/reportes/casos-por-checks.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database import SessionLocal, Case, CaseEvent, Company, EstadoCaso, TipoIncapacidad
+from app.filtros_metadata import rango_quincena
+from conftest import HEADERS
+
+URL = "/validador/reportes/casos-por-checks"
+
+# serial: (días atrás del evento, checks marcados, checks vigentes, vehiculo_fantasma)
+CASOS = {
+    'C1': (0, ['soat_faltante'], ['soat_faltante'], 'Sí'),
+    'C2': (0, ['soat_faltante', 'furips_faltante'], [], 'No'),
+    'C3': (0, ['epicrisis_faltante'], ['epicrisis_faltante'], 'No'),
+    'C4': (40, ['soat_faltante'], ['soat_faltante'], 'Sí'),
+    'C5': (0, [], [], 'No'),
+}
+
+
+@pytest.fixture
+def sembrado(bd):
+    db = SessionLocal()
+    try:
+        empresa = Company(nombre="ALFA")
+        db.add(empresa)
+        db.flush()
+        for serial, (dias, marcados, vigentes, fantasma) in CASOS.items():
+            fecha = datetime.now() - timedelta(days=dias)
+            caso = Case(serial=serial, cedula=serial, company_id=empresa.id, tipo=TipoIncapacidad.ACCIDENTE_TRANSITO,
+                        estado=EstadoCaso.INCOMPLETA, created_at=fecha,
+                        metadata_form={'checks_seleccionados': vigentes, 'vehiculo_fantasma': fantasma})
+            db.add(caso)
+            db.flush()
+            db.add(CaseEvent(case_id=caso.id, accion="validacion_estatica", actor="Validador",
+                             metadata_json={'checks': marcados, 'usa_ia': False}, created_at=fecha))
+        db.commit()
+    finally:
+        db.close()
+
+
+def seriales(cliente, **params):
+    r = cliente.get(URL, params=params, headers=HEADERS)
+    assert r.status_code == 200
+    return sorted(i['serial'] for i in r.json()['items'])
+
+
+@pytest.mark.parametrize("params, esperado", [
+    ({'checks': "soat_faltante", 'desde': "hace_30"}, ['C1', 'C2']),
+    ({'checks': "soat_faltante"}, ['C1', 'C2', 'C4']),
+    ({'checks': "furips_faltante,epicrisis_faltante"}, ['C2', 'C3']),
+    ({'checks': "soat_faltante,furips_faltante", 'modo': "todos"}, ['C2']),
+    ({'checks': "soat_faltante", 'vigentes': "true"}, ['C1', 'C4']),
+    ({'checks': "soat_faltante", 'campo': "vehiculo_fantasma:Sí", 'desde': "hace_30"}, ['C1']),
+    ({'checks': "soat_faltante", 'quincena': "actual"}, ['C1', 'C2']),
+])
+def test_casos_por_checks(sembrado, cliente, params, esperado):
+    if params.get('desde') == "hace_30":
+        params = {**params, 'desde': (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")}
+    assert seriales(cliente, **params) == esperado
+
+
+def test_check_o_campo_desconocido(sembrado, cliente):
+    assert cliente.get(URL, params={'checks': 'no_existe'}, headers=HEADERS).status_code == 400
+    assert cliente.get(URL, params={'checks': 'soat_faltante', 'campo': 'cedula:1'},
+                       headers=HEADERS).status_code == 400
+
+
+def test_rangos_de_quincena():
+    assert rango_quincena('actual', datetime(2024, 2, 20)) == (datetime(2024, 2, 16), datetime(2024, 3, 1))
+    assert rango_quincena('anterior', datetime(2024, 3, 3)) == (datetime(2024, 2, 16), datetime(2024, 3, 1))
+    assert rango_quincena('2024-12-1') == (datetime(2024, 12, 1), datetime(2024, 12, 16))
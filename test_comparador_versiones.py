@@ -0,0 +1,105 @@
+"""
+Pruebas - Comparador de versiones entre reenvíos (contra Drive falso)
+Ejecutar: python -m pytest -q test_comparador_versiones.py
+
+Una comparación PENDIENTE sin worker (reinicio, proceso caído) la retoma
+reanudar_comparaciones; con el lease vigente de otro worker no se repite.
+Las miniaturas del resultado tienen tope.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import comparador_versiones
+from app.comparador_versiones import programar_comparacion, reanudar_comparaciones
+from app.database import SessionLocal, Case, Company, EstadoCaso, TipoIncapacidad, VersionComparison
+from app.drive_manager import extraer_file_id
+from app.drive_uploader import upload_to_drive
+
+
+def crear_pdf(ruta, textos):
+    import fitz
+    doc = fitz.open()
+    for texto in textos:
+        pagina = doc.new_page()
+        pagina.draw_rect(fitz.Rect(72, 72, 540, 300), fill=(0, 0, 0) if texto == "negro" else None)
+        pagina.insert_text((72, 400), texto, fontsize=40)
+    doc.save(ruta)
+    doc.close()
+    return ruta
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    """Executor propio para esperar a que el worker termine"""
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(comparador_versiones, "_executor", executor)
+    return executor
+
+
+@pytest.fixture
+def versiones(bd, google, tmp_path):
+    """(db, case_id, file_id anterior, file_id nuevo): 3 páginas de 4 cambian"""
+    anterior = crear_pdf(tmp_path / "anterior.pdf", ["uno", "dos", "tres", "cuatro"])
+    nuevo = crear_pdf(tmp_path / "nuevo.pdf", ["uno", "negro", "negro", "negro"])
+    link_anterior = upload_to_drive(anterior, "EMPRESA_TEST", "1001", "enfermedad_general", consecutivo="SERIAL1")
+    link_nuevo = upload_to_drive(nuevo, "EMPRESA_TEST", "1001", "enfermedad_general", consecutivo="SERIAL1")
+
+    db = SessionLocal()
+    empresa = Company(nombre="EMPRESA_TEST")
+    db.add(empresa)
+    db.flush()
+    caso = Case(serial="SERIAL1", cedula="1001", company_id=empresa.id, tipo=TipoIncapacidad.ENFERMEDAD_GENERAL,
+                estado=EstadoCaso.INCOMPLETA)
+    db.add(caso)
+    db.commit()
+    yield db, caso.id, extraer_file_id(link_anterior), extraer_file_id(link_nuevo)
+    db.close()
+
+
+def pendiente(db, case_id, anterior, nuevo, tomada_at):
+    fila = VersionComparison(case_id=case_id, file_id_anterior=anterior, file_id_nuevo=nuevo,
+                             estado='PENDIENTE', tomada_at=tomada_at)
+    db.add(fila)
+    db.commit()
+    return fila
+
+
+def test_pendiente_sin_worker_se_retoma(versiones, executor):
+    db, case_id, anterior, nuevo = versiones
+    # Lease de un worker que murió hace una hora
+    fila = pendiente(db, case_id, anterior, nuevo, datetime.utcnow() - timedelta(hours=1))
+
+    assert reanudar_comparaciones() == 1
+    executor.shutdown(wait=True)
+    db.expire_all()
+    assert fila.estado == 'LISTA' and fila.tomada_at is None
+    assert fila.resultado['resumen'] == {'igual': 1, 'cambiada': 3, 'agregada': 0, 'eliminada': 0}
+    assert reanudar_comparaciones() == 0
+
+
+def test_lease_vigente_no_se_repite(versiones, executor):
+    db, case_id, anterior, nuevo = versiones
+    fila = pendiente(db, case_id, anterior, nuevo, datetime.utcnow())
+
+    assert reanudar_comparaciones() == 0
+    # Programarla de nuevo (otro reenvío, otro proceso) tampoco la calcula dos veces
+    programar_comparacion(db, case_id, anterior, nuevo)
+    executor.shutdown(wait=True)
+    db.expire_all()
+    assert fila.estado == 'PENDIENTE' and fila.resultado is None
+
+
+def test_tope_de_miniaturas(versiones, executor, monkeypatch):
+    db, case_id, anterior, nuevo = versiones
+    monkeypatch.setattr(comparador_versiones, "MAX_MINIATURAS", 1)
+    fila = programar_comparacion(db, case_id, anterior, nuevo)
+    executor.shutdown(wait=True)
+    db.expire_all()
+
+    paginas = fila.resultado['paginas']
+    assert [p['tipo'] for p in paginas] == ['igual', 'cambiada', 'cambiada', 'cambiada']
+    assert [('miniatura' in p) for p in paginas] == [False, True, False, False]
+    assert fila.resultado['miniaturas_omitidas'] == 2
@@ -0,0 +1,161 @@
+"""
+Pruebas - Gestor de credenciales de Google
+Ejecutar: python -m pytest -q test_credenciales.py
+
+No habla con Google: el "refresh" es una función de prueba que tarda 300 ms
+y cuenta cuántas veces se llamó. Single-flight, lectura sin locks, backoff
+sin bloquear, renovación proactiva, adopción del token de otra instancia y
+el reintento de google_rest tras un 401 (servidor HTTP local).
+"""
+
+import json
+import time
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from app import credenciales_google, google_endpoints, google_rest
+from app.estado_compartido import BackendLocal
+from app.credenciales_google import GestorCredenciales, ErrorCredenciales
+
+
+class RenovadorFalso:
+    """Emite tok1, tok2, ... con la vida indicada; puede fallar a pedido"""
+
+    def __init__(self, vida=3600, demora=0.3, prefijo="tok"):
+        self.vida, self.demora, self.prefijo = vida, demora, prefijo
+        self.llamadas = 0
+        self.fallar = False
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.llamadas += 1
+            n = self.llamadas
+        time.sleep(self.demora)
+        if self.fallar:
+            raise RuntimeError("invalid_client: prueba")
+        return Credentials(
+            token=f"{self.prefijo}{n}",
+            expiry=datetime.datetime.utcnow() + datetime.timedelta(seconds=self.vida)
+        )
+
+
+def en_paralelo(funcion, hilos=20):
+    salida, errores = [], []
+
+    def correr():
+        try:
+            salida.append(funcion())
+        except Exception as e:
+            errores.append(e)
+
+    ts = [threading.Thread(target=correr) for _ in range(hilos)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return salida, errores
+
+
+@pytest.fixture(autouse=True)
+def tiempos_cortos(monkeypatch):
+    monkeypatch.setattr(credenciales_google, "RENOVAR_ANTES_SEG", 4)
+    monkeypatch.setattr(credenciales_google, "MARGEN_SEG", 2)
+
+
+@pytest.fixture
+def servidor_401():
+    """Responde 401 salvo que el Bearer sea estado['esperado']"""
+    estado = {'esperado': None, 'peticiones': 0}
+
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            estado['peticiones'] += 1
+            ok = self.headers.get('authorization') == f"Bearer {estado['esperado']}"
+            self.send_response(200 if ok else 401)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({'ok': ok}).encode())
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}/", estado
+    servidor.shutdown()
+
+
+def test_single_flight_y_camino_caliente(tmp_path):
+    renovador = RenovadorFalso()
+    gestor = GestorCredenciales(renovador, estado=BackendLocal(tmp_path))
+    salida, errores = en_paralelo(gestor.obtener)
+    assert not errores
+    assert renovador.llamadas == 1 and {c.token for c in salida} == {"tok1"}
+
+    inicio = time.perf_counter()
+    for _ in range(100_000):
+        gestor.obtener()
+    us = (time.perf_counter() - inicio) * 1e6 / 100_000
+    assert renovador.llamadas == 1 and us < 20, f"{us:.2f} µs por llamada"
+
+
+def test_401_simultaneos_renuevan_una_vez(tmp_path):
+    renovador = RenovadorFalso()
+    gestor = GestorCredenciales(renovador, estado=BackendLocal(tmp_path))
+    gestor.obtener()
+    salida, _ = en_paralelo(lambda: gestor.renovar(rechazado="tok1"), hilos=10)
+    assert renovador.llamadas == 2 and {c.token for c in salida} == {"tok2"}
+    gestor.renovar(rechazado="tok1")
+    assert renovador.llamadas == 2
+
+
+def test_backoff_sin_bloquear(tmp_path):
+    malo = RenovadorFalso()
+    malo.fallar = True
+    gestor = GestorCredenciales(malo, estado=BackendLocal(tmp_path))
+    with pytest.raises(ErrorCredenciales):
+        gestor.obtener()
+    inicio = time.perf_counter()
+    with pytest.raises(ErrorCredenciales, match="pausa"):
+        gestor.obtener()
+    assert (time.perf_counter() - inicio) * 1000 < 50
+    assert malo.llamadas == 1
+
+
+def test_renovacion_proactiva(tmp_path):
+    # Vida 6 s, renovar 4 s antes → a los ~2-3 s
+    proactivo = RenovadorFalso(vida=6, demora=0.05)
+    gestor = GestorCredenciales(proactivo, estado=BackendLocal(tmp_path))
+    gestor.obtener()
+    limite = time.time() + 6
+    while time.time() < limite and gestor.token_actual() != "tok2":
+        time.sleep(0.1)
+    assert proactivo.llamadas == 2 and gestor.token_actual() == "tok2"
+    assert gestor.estado()['proactivas'] >= 1
+
+
+def test_otra_instancia_adopta_el_token(tmp_path):
+    ren_a, ren_b = RenovadorFalso(prefijo="a"), RenovadorFalso(prefijo="b")
+    inst_a = GestorCredenciales(ren_a, estado=BackendLocal(tmp_path))
+    inst_b = GestorCredenciales(ren_b, estado=BackendLocal(tmp_path))
+    inst_a.obtener()
+    assert inst_b.obtener().token == "a1" and ren_b.llamadas == 0
+
+
+def test_google_rest_renueva_tras_401(tmp_path, monkeypatch, servidor_401):
+    url, estado = servidor_401
+    ren = RenovadorFalso(demora=0.01)
+    gestor = GestorCredenciales(ren, estado=BackendLocal(tmp_path))
+    gestor.obtener()                      # tok1 (el servidor lo rechaza)
+    estado['esperado'] = "tok2"
+    monkeypatch.setattr(google_endpoints, "usando_endpoint_local", lambda: False)
+    monkeypatch.setattr(credenciales_google, "gestor", gestor)
+
+    respuesta = google_rest.ejecutar(google_rest.solicitar('drive', 'prueba', 'GET', url))
+    assert respuesta.status_code == 200
+    assert ren.llamadas == 2 and estado['peticiones'] == 2
@@ -0,0 +1,126 @@
+"""
+Pruebas - Detalle del caso con ETag y paginación
+Ejecutar: python -m pytest -q test_detalle_caso.py
+
+Un caso de historial largo y un caso archivado: el ETag y el 304 (una sola
+consulta), que el ETag cambie con notas, estado y nombre del empleado, la
+paginación del historial y las consultas por respuesta completa.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.database import (
+    SessionLocal, obtener_engine_async, Case, CaseDocument, CaseEvent, CaseNote, Company, Employee,
+    EstadoCaso, TipoIncapacidad
+)
+from app.archivo import archivar_casos
+from conftest import HEADERS
+
+URL = "/validador/casos/LARGO1"
+
+
+@pytest.fixture
+def sembrado(bd):
+    db = SessionLocal()
+    try:
+        empresa = Company(nombre="ALFA")
+        db.add(empresa)
+        db.flush()
+        empleado = Employee(cedula="100", nombre="Ana Pérez", company_id=empresa.id)
+        db.add(empleado)
+        db.flush()
+        inicio = datetime.utcnow() - timedelta(days=30)
+        largo = Case(serial="LARGO1", cedula="100", employee_id=empleado.id, company_id=empresa.id,
+                     tipo=TipoIncapacidad.ENFERMEDAD_GENERAL, estado=EstadoCaso.INCOMPLETA)
+        viejo = Case(serial="VIEJO1", cedula="100", employee_id=empleado.id, company_id=empresa.id,
+                     tipo=TipoIncapacidad.ENFERMEDAD_GENERAL, estado=EstadoCaso.COMPLETA,
+                     created_at=inicio - timedelta(days=400), updated_at=inicio - timedelta(days=400))
+        db.add_all([largo, viejo])
+        db.flush()
+        db.add(CaseDocument(case_id=largo.id, doc_tipo="incapacidad"))
+        db.add_all([CaseEvent(case_id=largo.id, accion=f"evento_{i}", created_at=inicio + timedelta(minutes=i))
+                    for i in range(250)])
+        db.add_all([CaseEvent(case_id=viejo.id, accion=f"viejo_{i}", created_at=inicio + timedelta(minutes=i))
+                    for i in range(3)])
+        db.add(CaseNote(case_id=largo.id, contenido="Primera nota"))
+        db.commit()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def consultas():
+    """Sentencias SQL que ejecuta el motor async (el de detalle_caso)"""
+    contador = {'total': 0}
+
+    def contar(*args):
+        contador['total'] += 1
+
+    motor = obtener_engine_async().sync_engine
+    event.listen(motor, "before_cursor_execute", contar)
+
+    def medir(funcion):
+        antes = contador['total']
+        resultado = funcion()
+        return resultado, contador['total'] - antes
+
+    yield medir
+    event.remove(motor, "before_cursor_execute", contar)
+
+
+def test_etag_y_304(sembrado, cliente, consultas):
+    r, n = consultas(lambda: cliente.get(URL, headers=HEADERS))
+    etag = r.headers.get('etag')
+    assert r.status_code == 200 and etag and 'no-cache' in r.headers.get('cache-control', '')
+    # sello; caso+empleado+empresa+documentos; historial+notas
+    assert n == 3
+
+    r304, n = consultas(lambda: cliente.get(URL, headers={**HEADERS, 'If-None-Match': etag}))
+    assert r304.status_code == 304 and r304.headers.get('etag') == etag and n == 1
+    r304 = cliente.get(URL, headers={**HEADERS, 'If-None-Match': f'"otro", W/{etag}'})
+    assert r304.status_code == 304
+
+
+def test_historial_paginado(sembrado, cliente):
+    datos = cliente.get(URL, headers=HEADERS).json()
+    assert len(datos['historial']) == 100 and datos['historial'][0]['accion'] == "evento_249"
+    assert datos['paginacion']['historial'] == {'page': 1, 'page_size': 100, 'total': 250, 'total_pages': 3}
+    # Historial y notas salen de la misma consulta: cada lista con sus campos
+    [nota] = datos['notas']
+    assert nota['contenido'] == "Primera nota" and nota['es_importante'] is False and nota['created_at']
+    assert set(datos['historial'][0]) == {'id', 'actor', 'accion', 'estado_anterior', 'estado_nuevo', 'motivo', 'created_at'}
+
+    etag = cliente.get(URL, headers=HEADERS).headers['etag']
+    pagina3 = cliente.get(URL, params={'historial_page': 3}, headers={**HEADERS, 'If-None-Match': etag})
+    assert pagina3.status_code == 200 and pagina3.headers['etag'] != etag
+    assert len(pagina3.json()['historial']) == 50 and pagina3.json()['historial'][-1]['accion'] == "evento_0"
+
+
+def test_etag_cambia_con_nota_y_empleado(sembrado, cliente):
+    etag = cliente.get(URL, headers=HEADERS).headers['etag']
+    cliente.post(f"{URL}/nota", json={'contenido': "Segunda nota"}, headers=HEADERS)
+    tras_nota = cliente.get(URL, headers={**HEADERS, 'If-None-Match': etag})
+    assert tras_nota.status_code == 200 and len(tras_nota.json()['notas']) == 2
+
+    etag = tras_nota.headers['etag']
+    db = SessionLocal()
+    try:
+        db.query(Employee).filter_by(cedula="100").one().nombre = "Ana María Pérez"
+        db.commit()
+    finally:
+        db.close()
+    renombrado = cliente.get(URL, headers={**HEADERS, 'If-None-Match': etag})
+    assert renombrado.status_code == 200 and renombrado.json()['nombre'] == "Ana María Pérez"
+
+
+def test_caso_archivado_y_404(sembrado, cliente):
+    archivar_casos(dias=365)
+    archivado = cliente.get("/validador/casos/VIEJO1", headers=HEADERS)
+    assert archivado.status_code == 200
+    assert archivado.json()['archivado'] and archivado.json()['paginacion']['historial']['total'] == 3
+    repetido = cliente.get("/validador/casos/VIEJO1", headers={**HEADERS, 'If-None-Match': archivado.headers['etag']})
+    assert repetido.status_code == 304
+    assert cliente.get("/validador/casos/NADA", headers=HEADERS).status_code == 404
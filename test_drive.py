@@ -1,3 +1,5 @@
+# Script manual: usa googleapiclient, que la app ya no instala
+# (pip install google-api-python-client para correrlo)
 from pathlib import Path
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
@@ -0,0 +1,96 @@
+"""
+Pruebas - Operaciones de Drive en segundo plano (contra Drive falso)
+Ejecutar: python -m pytest -q test_drive_batch.py
+
+Un movimiento confirmado actualiza el caso y el índice; uno que Drive
+rechaza, o un lote que falla entero, queda en drive_drift como
+operacion_fallida (visible en /drive/drift) en vez de solo en el log. Los
+gestores no devuelven un link "nuevo" sin confirmar.
+"""
+
+import pytest
+
+from app import drive_manager
+from app.database import SessionLocal, Case, Company, DriveDrift, DriveFile, EstadoCaso, TipoIncapacidad
+from app.drive_manager import CaseFileOrganizer, IncompleteFileManager, DriveOperationsBatcher
+from app.drive_uploader import upload_to_drive
+from conftest import HEADERS
+
+
+@pytest.fixture
+def caso(bd, google, tmp_path):
+    ruta = tmp_path / "caso.pdf"
+    ruta.write_bytes(b"%PDF-1.4 prueba")
+    link = upload_to_drive(ruta, "EMPRESA_TEST", "1001", "enfermedad_general", consecutivo="SERIAL1")
+    db = SessionLocal()
+    empresa = Company(nombre="EMPRESA_TEST")
+    db.add(empresa)
+    db.flush()
+    caso = Case(serial="SERIAL1", cedula="1001", company_id=empresa.id, tipo=TipoIncapacidad.ENFERMEDAD_GENERAL,
+                estado=EstadoCaso.NUEVO, drive_link=link)
+    db.add(caso)
+    db.commit()
+    yield db, caso
+    db.close()
+
+
+def fallidas(db):
+    db.expire_all()
+    return db.query(DriveDrift).filter(DriveDrift.tipo == 'operacion_fallida').all()
+
+
+def test_movimiento_confirmado(caso):
+    db, caso = caso
+    batcher = DriveOperationsBatcher()
+    assert CaseFileOrganizer().mover_caso_segun_estado(caso, 'INCOMPLETA', batcher=batcher) is True
+    db.commit()
+    operaciones = batcher.ejecutar_en_segundo_plano().result(10)
+
+    assert [op['resultado'] for op in operaciones] == ['ok']
+    db.expire_all()
+    fila = db.query(DriveFile).filter(DriveFile.file_id == caso.drive_file_id).one()
+    assert fila.carpeta_ruta == "Incompletas/EMPRESA_TEST/Faltan_Soportes"
+    assert caso.drive_parent_id == fila.carpeta_id and not fallidas(db)
+
+
+def test_operacion_rechazada_queda_registrada(caso, cliente):
+    db, caso = caso
+    antes = drive_manager.obtener_estadisticas()['fallidas']
+    caso.drive_link = "https://drive.google.com/file/d/NO_EXISTE/view"
+    batcher = DriveOperationsBatcher()
+    IncompleteFileManager().mover_a_incompletas(caso, 'Ilegibles', batcher=batcher)
+    db.commit()
+    operaciones = batcher.ejecutar_en_segundo_plano().result(10)
+
+    assert operaciones[0]['resultado'] == 'error'
+    [fallo] = fallidas(db)
+    assert fallo.file_id == "NO_EXISTE" and fallo.case_id == caso.id
+    assert fallo.detalle['operacion'] == 'mover' and fallo.detalle['ruta'] == "Incompletas/EMPRESA_TEST/Ilegibles"
+    assert drive_manager.obtener_estadisticas()['fallidas'] == antes + 1
+
+    r = cliente.get("/drive/drift", params={'tipo': 'operacion_fallida'}, headers=HEADERS).json()
+    assert r['total'] == 1 and r['operaciones_en_segundo_plano']['fallidas'] == antes + 1
+
+
+def test_lote_fallido_completo(caso, monkeypatch):
+    db, caso = caso
+
+    def drive_caido(service, ruta):
+        raise RuntimeError("Drive caído")
+
+    monkeypatch.setattr(drive_manager, "obtener_id_carpeta", drive_caido)
+    batcher = DriveOperationsBatcher()
+    CaseFileOrganizer().mover_caso_segun_estado(caso, 'COMPLETA', batcher=batcher)
+    db.commit()
+    operaciones = batcher.ejecutar_en_segundo_plano().result(10)
+
+    # Movimiento a Validadas y copia a Completas: las dos quedan registradas
+    assert [op['resultado'] for op in operaciones] == ['error', 'error']
+    assert sorted(f.detalle['operacion'] for f in fallidas(db)) == ['copiar', 'mover']
+    assert all(f.detalle['error'] == "Drive caído" for f in fallidas(db))
+
+
+def test_sin_link_no_hay_movimiento(caso):
+    db, caso = caso
+    caso.drive_link = None
+    assert CaseFileOrganizer().mover_caso_segun_estado(caso, 'INCOMPLETA') is None
@@ -0,0 +1,62 @@
+"""
+Pruebas - Índice local de archivos en Drive (tabla drive_files)
+Ejecutar: python -m pytest -q test_drive_index.py
+
+El serial que se deduce del nombre del PDF (y que un nombre sin
+consecutivo no se confunda con un serial), el rol según la carpeta y el
+registro que enlaza el archivo con su caso.
+"""
+
+import pytest
+
+from app.database import SessionLocal, Case, Company, EstadoCaso, TipoIncapacidad
+from app.drive_index import serial_desde_nombre, rol_desde_ruta, registrar_archivo, buscar_por_serial
+
+
+@pytest.mark.parametrize("nombre, serial", [
+    ("DB10850433740_1085043374_Enfermedad_General_2024-05-01.pdf", "DB10850433740"),
+    ("DB10850433740_REENVIO_20240501_101010.pdf", "DB10850433740"),
+    # Sin consecutivo: empieza por la cédula
+    ("1085043374_Enfermedad_General_2024-05-01.pdf", None),
+    ("Informe_final.pdf", None),
+    ("sin-guiones.pdf", None),
+    (None, None),
+])
+def test_serial_desde_nombre(nombre, serial):
+    assert serial_desde_nombre(nombre) == serial
+
+
+def test_rol_desde_ruta():
+    assert rol_desde_ruta("Incompletas/EMPRESA") == 'incompleta'
+    assert rol_desde_ruta("Completas/EMPRESA/2024") == 'completa'
+    assert rol_desde_ruta("Incapacidades_validadas/EMPRESA") == 'validada'
+    assert rol_desde_ruta(None, "DB1_REENVIO_20240501.pdf") == 'reenvio'
+    assert rol_desde_ruta("EMPRESA/Enfermedad_General") == 'por_validar'
+    assert rol_desde_ruta(None) is None
+
+
+def test_registro_enlaza_con_el_caso(bd):
+    db = SessionLocal()
+    empresa = Company(nombre="ALFA")
+    db.add(empresa)
+    db.flush()
+    db.add(Case(serial="DB10850433740", cedula="1085043374", company_id=empresa.id,
+                tipo=TipoIncapacidad.ENFERMEDAD_GENERAL, estado=EstadoCaso.NUEVO))
+    db.commit()
+
+    con_serial = registrar_archivo("F1", nombre="DB10850433740_1085043374_Enfermedad_General_2024-05-01.pdf",
+                                   carpeta_ruta="Incompletas/ALFA", db=db)
+    sin_serial = registrar_archivo("F2", nombre="1085043374_Enfermedad_General_2024-05-01.pdf",
+                                   carpeta_ruta="ALFA/Enfermedad_General", db=db)
+    assert con_serial.serial == "DB10850433740" and con_serial.case_id is not None
+    assert con_serial.rol == 'incompleta'
+    assert sin_serial.serial is None and sin_serial.case_id is None
+
+    db.commit()
+
+    # Una actualización sin nombre (sesión propia) no borra el serial ya conocido
+    registrar_archivo("F1", md5="abc")
+    db.expire_all()
+    archivos = buscar_por_serial(db, "DB10850433740")
+    assert [(a.file_id, a.md5) for a in archivos] == [("F1", "abc")]
+    db.close()
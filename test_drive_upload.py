@@ -0,0 +1,75 @@
+"""
+Pruebas - Subidas a Drive (contra Drive falso)
+Ejecutar: python -m pytest -q test_drive_upload.py
+
+upload_to_drive deja el PDF público con una sola llamada de permisos y en
+el índice local; una subida cortada se reanuda desde el último byte que
+Drive confirmó (sesión guardada en disco).
+"""
+
+import os
+
+import pytest
+
+from app import drive_upload_manager
+from app.database import SessionLocal, DriveFile
+from app.drive_uploader import upload_to_drive, get_authenticated_service
+from app.drive_upload_manager import subir_archivo_reanudable, obtener_estadisticas
+
+
+@pytest.fixture
+def service(bd, google, tmp_path, monkeypatch):
+    monkeypatch.setattr(drive_upload_manager, "CHUNK_SIZE", drive_upload_manager._BLOQUE_MINIMO)
+    monkeypatch.setattr(drive_upload_manager, "SESIONES_DIR", tmp_path / "sesiones")
+    return get_authenticated_service()
+
+
+def test_upload_publico_e_indexado(service, google, tmp_path):
+    ruta = tmp_path / "caso.pdf"
+    ruta.write_bytes(b"%PDF-1.4 prueba")
+    link = upload_to_drive(ruta, "EMPRESA_TEST", "1001", "enfermedad_general", consecutivo="SERIAL1")
+
+    db = SessionLocal()
+    try:
+        fila = db.query(DriveFile).filter(DriveFile.serial == "SERIAL1").one()
+    finally:
+        db.close()
+    assert fila.file_id in link and fila.carpeta_ruta.startswith("Incapacidades/EMPRESA_TEST")
+    assert service.files_get_media(fila.file_id) == ruta.read_bytes()
+    assert google.drive.llamadas.get("POST /drive/v3/files/{id}/permissions") == 1
+
+
+class CorteTrasUnBloque:
+    """El service real, pero la conexión "se cae" después del primer bloque"""
+
+    def __init__(self, service):
+        self._service = service
+        self.enviados = 0
+
+    def subida_enviar(self, *args, **kwargs):
+        if self.enviados == 1:
+            raise ConnectionResetError("conexión cortada")
+        self.enviados += 1
+        return self._service.subida_enviar(*args, **kwargs)
+
+    def __getattr__(self, nombre):
+        return getattr(self._service, nombre)
+
+
+def test_subida_cortada_se_reanuda(service, tmp_path):
+    ruta = tmp_path / "grande.bin"
+    ruta.write_bytes(os.urandom(700 * 1024))
+    metadata = {'name': 'grande.bin'}
+
+    with pytest.raises(ConnectionResetError):
+        subir_archivo_reanudable(CorteTrasUnBloque(service), ruta, metadata, 'application/octet-stream', 'id')
+    assert len(list(drive_upload_manager.SESIONES_DIR.glob("*.json"))) == 1
+
+    antes = obtener_estadisticas()
+    subido = subir_archivo_reanudable(service, ruta, metadata, 'application/octet-stream', 'id')
+    despues = obtener_estadisticas()
+    assert service.files_get_media(subido['id']) == ruta.read_bytes()
+    assert despues['reanudadas'] == antes['reanudadas'] + 1
+    # Solo faltaba lo que Drive no había confirmado
+    assert despues['bytes_subidos'] - antes['bytes_subidos'] == 700 * 1024 - drive_upload_manager._BLOQUE_MINIMO
+    assert not list(drive_upload_manager.SESIONES_DIR.glob("*.json"))
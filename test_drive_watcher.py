@@ -0,0 +1,139 @@
+"""
+Pruebas - Vigilante de cambios en Drive (contra Drive falso)
+Ejecutar: python -m pytest -q test_drive_watcher.py
+
+No usa Google: fake_google_server.py en un hilo (fixture google). Subidas
+propias que no son drift (tampoco las del batcher cuando el vigilante lee el
+cambio antes de que el índice se actualice), movimientos y borrados hechos a
+mano, renombre de carpetas, la pasada sin cambios y el drift que no se
+cuenta si la página hace rollback.
+"""
+
+import pytest
+
+from app.database import SessionLocal, DriveFile, DriveDrift
+from app.drive_index import operacion_anunciada
+from app.drive_manager import DriveOperationsBatcher
+from app.drive_uploader import upload_to_drive, get_authenticated_service, get_cached_folder_path
+from app import drive_watcher
+from app.drive_watcher import procesar_cambios
+
+
+def drift_de(db, file_id):
+    return {d.tipo for d in db.query(DriveDrift).filter(DriveDrift.file_id == file_id).all()}
+
+
+def crear_pdf(ruta):
+    import fitz
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), ruta.name)
+    doc.save(ruta)
+    doc.close()
+    return ruta
+
+
+@pytest.fixture
+def service(bd, google):
+    service = get_authenticated_service()
+    inicial = procesar_cambios(service)
+    assert inicial.get('ok') and inicial.get('inicial')
+    return service
+
+
+@pytest.fixture
+def subidos(service, tmp_path):
+    upload_to_drive(crear_pdf(tmp_path / "a.pdf"), "EMPRESA_TEST", "1001", "enfermedad_general", consecutivo="SERIAL1")
+    upload_to_drive(crear_pdf(tmp_path / "b.pdf"), "EMPRESA_TEST", "1002", "enfermedad_general", consecutivo="SERIAL2")
+    db = SessionLocal()
+    try:
+        a = db.query(DriveFile).filter(DriveFile.serial == "SERIAL1").one()
+        b = db.query(DriveFile).filter(DriveFile.serial == "SERIAL2").one()
+        return a, b
+    finally:
+        db.close()
+
+
+def test_cambios_propios_no_son_drift(service, subidos):
+    r = procesar_cambios(service)
+    db = SessionLocal()
+    try:
+        assert r.get('ok') and db.query(DriveDrift).count() == 0
+    finally:
+        db.close()
+    r = procesar_cambios(service)
+    assert r.get('ok') and r.get('leidos') == 0
+
+
+def test_batcher_antes_de_actualizar_el_indice(service, subidos, monkeypatch):
+    a, b = subidos
+    original = DriveOperationsBatcher._actualizar_bd
+
+    # El vigilante corre entre el cambio en Drive y la actualización del índice
+    def vigilante_primero(self, operaciones):
+        procesar_cambios(service)
+        original(self, operaciones)
+
+    monkeypatch.setattr(DriveOperationsBatcher, "_actualizar_bd", vigilante_primero)
+    batcher = DriveOperationsBatcher(service)
+    batcher.mover(a.file_id, ["Incompletas", "EMPRESA_TEST"], parent_anterior=a.carpeta_id)
+    batcher.eliminar(b.file_id)
+    assert [op['resultado'] for op in batcher.ejecutar()] == ['ok', 'ok']
+
+    db = SessionLocal()
+    try:
+        assert db.query(DriveDrift).count() == 0
+        fila_a = db.query(DriveFile).filter(DriveFile.file_id == a.file_id).one()
+        assert fila_a.carpeta_ruta == "Incompletas/EMPRESA_TEST"
+        assert db.query(DriveFile).filter(DriveFile.file_id == b.file_id).one().eliminado
+        # Los avisos se quitan junto con la actualización del índice
+        assert operacion_anunciada(db, a.file_id) is None and operacion_anunciada(db, b.file_id) is None
+    finally:
+        db.close()
+
+
+def test_movimiento_y_borrado_manual(service, subidos):
+    a, b = subidos
+    otra = service.files_create(
+        body={'name': 'Revisar', 'mimeType': 'application/vnd.google-apps.folder', 'parents': ['root']},
+        fields='id'
+    )['id']
+    service.files_update(a.file_id, addParents=otra, removeParents=a.carpeta_id, fields='id')
+    service.files_delete(b.file_id)
+
+    procesar_cambios(service)
+    db = SessionLocal()
+    try:
+        fila_a = db.query(DriveFile).filter(DriveFile.file_id == a.file_id).one()
+        fila_b = db.query(DriveFile).filter(DriveFile.file_id == b.file_id).one()
+        assert 'movido_manual' in drift_de(db, a.file_id)
+        assert fila_a.carpeta_id == otra and fila_a.carpeta_ruta == 'Revisar'
+        assert 'eliminado_manual' in drift_de(db, b.file_id) and fila_b.eliminado
+    finally:
+        db.close()
+
+
+def test_renombre_de_carpeta(service, subidos):
+    empresa_id = service.files_list(
+        q="name='EMPRESA_TEST' and mimeType='application/vnd.google-apps.folder'", fields='files(id)'
+    )['files'][0]['id']
+    service.files_update(empresa_id, body={'name': 'EMPRESA_NUEVA'}, fields='id')
+    procesar_cambios(service)
+    assert get_cached_folder_path(empresa_id) == 'Incapacidades/EMPRESA_NUEVA'
+
+
+def test_drift_sin_commit_no_se_cuenta(service, subidos, monkeypatch):
+    a, _ = subidos
+    service.files_delete(a.file_id)
+    antes = drive_watcher._stats['drift_detectado']
+
+    def falla(*args):
+        raise RuntimeError("sin conexión")
+
+    with monkeypatch.context() as m:
+        m.setattr(drive_watcher, "guardar_estado", falla)
+        assert not procesar_cambios(service).get('ok')
+    assert drive_watcher._stats['drift_detectado'] == antes
+
+    r = procesar_cambios(service)
+    assert r.get('ok') and r.get('drift') == 1
+    assert drive_watcher._stats['drift_detectado'] == antes + 1
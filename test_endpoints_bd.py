@@ -0,0 +1,109 @@
+"""
+Pruebas - Endpoints con sesión síncrona de BD fuera del event loop
+Ejecutar: python -m pytest -q test_endpoints_bd.py
+
+Los endpoints que reciben Session = Depends(get_db) son def: FastAPI los
+corre en el threadpool. Si fueran async def, esperar la conexión de
+escritura (o Drive, o el merge de PDFs) congelaría a todos los demás. Lo
+mismo los que toman el candado de una sesión de edición de PDF (espera de
+hasta CANDADO_ESPERA_S), que además responden 409 si está ocupada.
+"""
+
+import asyncio
+import inspect
+import time
+
+import httpx
+from fastapi.routing import APIRoute
+
+from app import estado_compartido, pdf_edicion
+from app.database import SessionLocal, engine, get_db, get_db_read, Case, Company, EstadoCaso, TipoIncapacidad
+from app.estado_compartido import BackendLocal, configurar_backend, obtener_backend
+from app.pdf_edicion import SesionEdicionPDF
+from app.main import app
+from conftest import HEADERS
+
+
+def dependencias(dependant):
+    for dep in dependant.dependencies:
+        yield dep.call
+        yield from dependencias(dep)
+
+
+def rutas(rutas_app):
+    """APIRoutes de la app, incluidas las de los routers montados con include_router."""
+    for ruta in rutas_app:
+        if isinstance(ruta, APIRoute):
+            yield ruta
+        elif hasattr(ruta, 'original_router'):
+            yield from rutas(ruta.original_router.routes)
+
+
+def test_endpoints_con_sesion_sincrona_no_son_async():
+    asincronos = [
+        f"{sorted(ruta.methods)} {ruta.path}"
+        for ruta in rutas(app.routes)
+        if {get_db, get_db_read} & set(dependencias(ruta.dependant))
+        and inspect.iscoroutinefunction(ruta.endpoint)
+    ]
+    assert not asincronos, asincronos
+
+
+# Lo que usa el candado de la sesión de edición (app.pdf_edicion)
+USAN_CANDADO_DE_EDICION = ('SesionEdicionPDF', 'obtener_pdf_local', 'finalizar_sesion_si_existe')
+
+
+def test_endpoints_con_candado_de_edicion_no_son_async():
+    con_candado = [
+        ruta for ruta in rutas(app.routes)
+        if any(nombre in inspect.getsource(ruta.endpoint) for nombre in USAN_CANDADO_DE_EDICION)
+    ]
+    assert len(con_candado) >= 6
+    asincronos = [f"{sorted(ruta.methods)} {ruta.path}" for ruta in con_candado
+                  if inspect.iscoroutinefunction(ruta.endpoint)]
+    assert not asincronos, asincronos
+
+
+def test_sesion_de_edicion_ocupada_responde_409(cliente, tmp_path, monkeypatch):
+    monkeypatch.setattr(estado_compartido, "_backend", None)
+    configurar_backend(BackendLocal(tmp_path))
+    monkeypatch.setattr(pdf_edicion, "CANDADO_ESPERA_S", 0.1)
+    obtener_backend().guardar("edicion_pdf:OCUPADO", "{}")
+
+    with SesionEdicionPDF("OCUPADO").lock:
+        assert cliente.post("/validador/casos/OCUPADO/editar-pdf/deshacer", headers=HEADERS).status_code == 409
+        assert cliente.delete("/validador/casos/OCUPADO/editar-pdf", headers=HEADERS).status_code == 409
+
+
+def test_escritura_en_espera_no_bloquea_el_bucle(bd, monkeypatch):
+    db = SessionLocal()
+    empresa = Company(nombre="ALFA")
+    db.add(empresa)
+    db.flush()
+    db.add(Case(serial="HILO01", cedula="1", company_id=empresa.id, tipo=TipoIncapacidad.ENFERMEDAD_GENERAL,
+                estado=EstadoCaso.NUEVO))
+    db.commit()
+    db.close()
+    # Si el endpoint bloqueara el bucle, la prueba falla en segundos y no en 30
+    monkeypatch.setattr(engine.pool, "_timeout", 5)
+
+    async def escenario():
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://prueba") as c:
+            # La única conexión de escritura ocupada: el cambio de tipo queda esperando
+            with engine.connect():
+                cambio = asyncio.create_task(c.post("/validador/casos/HILO01/cambiar-tipo",
+                                                    json={'nuevo_tipo': 'labor'}, headers=HEADERS))
+                await asyncio.sleep(0.3)
+                inicio = time.perf_counter()
+                r = await c.get("/health/drive-token")
+                espera = time.perf_counter() - inicio
+                assert r.status_code == 200 and espera < 1, f"{espera:.2f}s con una escritura en espera"
+                assert not cambio.done()
+            return await asyncio.wait_for(cambio, 10)
+
+    r = asyncio.run(escenario())
+    assert r.status_code == 200
+    db = SessionLocal()
+    assert db.query(Case).filter(Case.serial == "HILO01").one().tipo == TipoIncapacidad.ENFERMEDAD_LABORAL
+    db.close()
@@ -0,0 +1,159 @@
+"""
+Pruebas - Escritura diferida y eventos en la unidad de trabajo
+Ejecutar: python -m pytest -q test_escritura_diferida.py
+
+Las búsquedas relacionales no escriben en el request (SearchHistory queda en
+la cola y se inserta en bloque), el vaciado por cantidad de filas, el
+descarte con la cola llena, que detener() escriba lo pendiente y que
+registrar_evento se guarde con el commit del request (uno solo) y no por su
+cuenta.
+"""
+
+import queue
+import time
+
+import pytest
+from sqlalchemy import event, select, func
+
+from app.database import engine, SessionLocal, Case, CaseEvent, Company, Employee, SearchHistory, TipoIncapacidad
+from app import escritura_diferida
+from app.escritura_diferida import encolar, vaciar, detener, obtener_estadisticas
+from app.validador import registrar_evento
+from conftest import HEADERS
+
+
+@pytest.fixture
+def cola(monkeypatch):
+    """Cola pequeña (50), vaciado cada 20 filas y sin vaciado por tiempo"""
+    detener()
+    monkeypatch.setattr(escritura_diferida, "ESCRITURA_DIFERIDA_MS", 60000)
+    monkeypatch.setattr(escritura_diferida, "ESCRITURA_DIFERIDA_FILAS", 20)
+    monkeypatch.setattr(escritura_diferida, "ESCRITURA_DIFERIDA_MAXIMA", 50)
+    monkeypatch.setattr(escritura_diferida, "_cola", queue.Queue(maxsize=50))
+    monkeypatch.setattr(escritura_diferida, "_stats", {**escritura_diferida._stats, 'escritas': 0, 'descartadas': 0})
+    yield
+    detener()
+
+
+@pytest.fixture
+def sembrado(bd, cola):
+    db = SessionLocal()
+    try:
+        empresa = Company(nombre="ALFA")
+        db.add(empresa)
+        db.flush()
+        empleado = Employee(cedula="100", nombre="Ana Pérez", company_id=empresa.id)
+        db.add(empleado)
+        db.flush()
+        db.add(Case(serial="BLOQ1", cedula="100", employee_id=empleado.id, company_id=empresa.id,
+                    tipo=TipoIncapacidad.ENFERMEDAD_GENERAL, bloquea_nueva=True))
+        db.commit()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def sql():
+    """INSERT y COMMIT que llegan al primario"""
+    cuenta = {'inserts': 0, 'commits': 0}
+
+    def sentencia(conn, cursor, sql, *args):
+        cuenta['inserts'] += sql.lstrip().upper().startswith("INSERT")
+
+    def commit(conn):
+        cuenta['commits'] += 1
+
+    event.listen(engine, "before_cursor_execute", sentencia)
+    event.listen(engine, "commit", commit)
+    yield cuenta
+    event.remove(engine, "before_cursor_execute", sentencia)
+    event.remove(engine, "commit", commit)
+
+
+def contar(modelo, *filtros):
+    with engine.connect() as conn:
+        return conn.scalar(select(func.count()).select_from(modelo).where(*filtros))
+
+
+def test_busqueda_sin_escribir_en_el_request(sembrado, cliente, sql):
+    antes = time.time()
+    r = cliente.post("/validador/busqueda-relacional", json={'registros': [{'cedula': "100"}]}, headers=HEADERS)
+    assert r.status_code == 200
+    assert sql == {'inserts': 0, 'commits': 0}
+    assert contar(SearchHistory) == 0 and obtener_estadisticas()['pendientes'] == 1
+
+    r = cliente.post("/validador/busqueda-relacional/excel", files={'archivo': ("lista.csv", b"cedula\n100\n999\n")},
+                     headers=HEADERS)
+    assert r.status_code == 200
+    vaciar()
+    with engine.connect() as conn:
+        filas = conn.execute(select(SearchHistory.tipo_busqueda, SearchHistory.resultados_count,
+                                    SearchHistory.archivo_nombre, SearchHistory.created_at)
+                             .order_by(SearchHistory.id)).all()
+    # Con el conteo final del Excel
+    assert [(f[0], f[1], f[2]) for f in filas] == \
+        [("relacional", 1, None), ("relacional", 1, None), ("relacional_excel", 1, "lista.csv")]
+    # created_at es la hora del request, no la del lote
+    assert abs(filas[0][3].timestamp() - antes) < 60
+
+
+def test_un_commit_por_lote(sembrado, sql):
+    with escritura_diferida._escribiendo:  # el hilo no vacía a las 20 filas
+        for i in range(15):
+            encolar(SearchHistory, {'usuario': "lote", 'resultados_count': i,
+                                    'archivo_nombre': "x" if i % 2 else None})
+            encolar(SearchHistory, {'usuario': "lote", 'resultados_count': i})
+    vaciar()
+    assert contar(SearchHistory, SearchHistory.usuario == "lote") == 30
+    # Un commit y un INSERT por juego de columnas (o el hilo, o vaciar())
+    assert sql == {'inserts': 2, 'commits': 1}
+
+
+def test_vaciado_por_filas(sembrado):
+    for _ in range(20):
+        encolar(SearchHistory, {'usuario': "umbral"})
+    limite = time.time() + 5
+    while contar(SearchHistory, SearchHistory.usuario == "umbral") < 20 and time.time() < limite:
+        time.sleep(0.05)
+    assert contar(SearchHistory, SearchHistory.usuario == "umbral") == 20
+
+
+def test_cola_llena_y_detener(sembrado):
+    escritura_diferida._escribiendo.acquire()  # el hilo no puede vaciar mientras se llena
+    try:
+        aceptadas = sum(encolar(SearchHistory, {'usuario': "llena"}) for _ in range(60))
+    finally:
+        escritura_diferida._escribiendo.release()
+    assert aceptadas == 50 and obtener_estadisticas()['descartadas'] == 10
+    vaciar()
+
+    encolar(SearchHistory, {'usuario': "al_apagar"})
+    detener()
+    assert contar(SearchHistory, SearchHistory.usuario.in_(["llena", "al_apagar"])) == 51
+    assert not obtener_estadisticas()['activo']
+
+
+def test_registrar_evento_no_hace_commit(sembrado):
+    db = SessionLocal()
+    try:
+        caso_id = db.scalar(select(Case.id).where(Case.serial == "BLOQ1"))
+        registrar_evento(db, caso_id, "prueba_rollback")
+        db.rollback()
+    finally:
+        db.close()
+    assert contar(CaseEvent, CaseEvent.accion == "prueba_rollback") == 0
+
+
+def test_desbloqueo_en_un_solo_commit(sembrado, cliente, sql):
+    r = cliente.post("/validador/casos/BLOQ1/desbloquear", data={'motivo': "Documentos recibidos"}, headers=HEADERS)
+    assert r.status_code == 200 and sql['commits'] == 1
+    with engine.connect() as conn:
+        assert not conn.scalar(select(Case.bloquea_nueva).where(Case.serial == "BLOQ1"))
+    assert contar(CaseEvent, CaseEvent.accion == "desbloqueo_manual") == 1
+
+
+def test_status_incluye_la_escritura_diferida(sembrado, cliente):
+    encolar(SearchHistory, {'usuario': "status"})
+    vaciar()
+    estado = cliente.get("/status").json()['escritura_diferida']
+    assert estado['escritas'] == 1 and estado['pendientes'] == 0
@@ -0,0 +1,129 @@
+"""
+Pruebas - Estado compartido entre instancias
+Ejecutar: python -m pytest -q test_estado_compartido.py
+
+Sin Redis real: fakeredis como servidor TCP en un hilo (un Redis local de
+mentira) y dos instancias del portal con dos clientes distintos. También el
+backend local y los directorios de trabajo.
+"""
+
+import time
+import threading
+
+import pytest
+
+from app import estado_compartido, drive_uploader
+from app.estado_compartido import (
+    BackendLocal, BackendRedis, configurar_backend, esperar_turno,
+    directorio_de_trabajo, crear_directorio_de_trabajo, borrar_directorio_de_trabajo,
+    nombre_seguro
+)
+from app.logs import contexto_log
+from conftest import puerto_libre
+
+
+@pytest.fixture(scope="module")
+def url_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    puerto = puerto_libre()
+    servidor = fakeredis.TcpFakeServer(("127.0.0.1", puerto), server_type="redis")
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"redis://127.0.0.1:{puerto}/0"
+    servidor.shutdown()
+
+
+@pytest.fixture
+def backend_global(monkeypatch):
+    """configurar_backend() cambia el backend del proceso: se restaura al terminar"""
+    monkeypatch.setattr(estado_compartido, "_backend", estado_compartido._backend)
+
+
+def probar_contrato(a, b):
+    """a y b son dos 'instancias' sobre el mismo estado"""
+    a.guardar("google:token", '{"token": "abc"}', ttl=60)
+    assert b.obtener("google:token") == '{"token": "abc"}'
+    a.guardar("efimera", "x", ttl=0.2)
+    time.sleep(0.4)
+    assert b.obtener("efimera") is None
+    b.borrar("google:token")
+    assert a.obtener("google:token") is None
+
+    # Candado: mientras a lo tiene, b no lo obtiene; al soltarlo sí
+    with a.candado("renovando", ttl=5) as obtenido_a:
+        with b.candado("renovando", ttl=5, espera=0.2) as obtenido_b:
+            assert obtenido_a and not obtenido_b
+    with b.candado("renovando", ttl=5) as obtenido_b:
+        assert obtenido_b
+
+    # Cubeta de 1/s con ráfaga 5: 5 turnos inmediatos, el 6º espera ~1s
+    esperas = [(a if i % 2 else b).consumir("drive", 1, 5) for i in range(6)]
+    assert esperas[:5] == [0.0] * 5
+    assert 0.5 < esperas[5] <= 1.0
+
+
+def test_backend_local(tmp_path):
+    # Dos objetos = dos workers en la misma máquina (solo las claves simples
+    # y los candados cruzan procesos)
+    local_a, local_b = BackendLocal(tmp_path), BackendLocal(tmp_path)
+    probar_contrato(local_a, local_a)
+    local_a.guardar("compartida", "1")
+    assert local_b.obtener("compartida") == "1"
+    with local_a.candado("x") as uno, local_b.candado("x", espera=0.1) as otro:
+        assert uno and not otro
+
+
+def test_backend_redis(url_redis):
+    probar_contrato(BackendRedis(url_redis), BackendRedis(url_redis))
+
+
+def test_cubeta_compartida_entre_hilos(url_redis, backend_global):
+    configurar_backend(BackendRedis(url_redis))
+    inicio = time.perf_counter()
+    hilos = [
+        threading.Thread(target=lambda: [esperar_turno("concurrencia", 20, 5) for _ in range(10)])
+        for _ in range(4)
+    ]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    # 40 turnos, ráfaga 5 → ~35/20 = 1.75s como mínimo
+    assert time.perf_counter() - inicio >= 1.5
+
+
+def test_cache_de_carpetas_y_token_entre_instancias(url_redis, backend_global):
+    redis_a, redis_b = BackendRedis(url_redis), BackendRedis(url_redis)
+    configurar_backend(redis_a)
+    drive_uploader._recordar_carpeta("id-inc", "Incapacidades", "root")
+    drive_uploader._recordar_carpeta("id-emp", "EMPRESA", "id-inc")
+    configurar_backend(redis_b)
+    assert drive_uploader.get_cached_folder_path("id-emp") == "Incapacidades/EMPRESA"
+    drive_uploader.update_cached_folder("id-emp", "EMPRESA_NUEVA")
+    configurar_backend(redis_a)
+    assert drive_uploader.get_cached_folder_path("id-emp") == "Incapacidades/EMPRESA_NUEVA"
+    drive_uploader.forget_folder("id-emp")
+    assert drive_uploader.get_cached_folder_name("id-emp") is None
+
+    from app.credenciales_google import CLAVE_TOKEN
+    redis_b.guardar(CLAVE_TOKEN, '{"token": "t1", "expiry": "2099-01-01T00:00:00"}')
+    assert (drive_uploader.leer_token_cache() or {}).get('token') == 't1'
+    redis_b.borrar(CLAVE_TOKEN)
+
+
+def test_respaldo_local_si_redis_no_responde():
+    caido = BackendRedis(f"redis://127.0.0.1:{puerto_libre()}/0")
+    caido.guardar("respaldo", "ok")
+    assert caido.obtener("respaldo") == "ok"
+
+
+def test_directorios_de_trabajo():
+    with contexto_log(request_id="req1"):
+        with directorio_de_trabajo("EC123_recorte") as d1:
+            d2 = crear_directorio_de_trabajo("EC123_recorte")
+            (d1 / "EC123_temp.pdf").write_bytes(b"uno")
+            (d2 / "EC123_temp.pdf").write_bytes(b"dos")
+            assert d1 != d2 and (d1 / "EC123_temp.pdf").read_bytes() == b"uno"
+            assert "req1" in d1.name
+            borrar_directorio_de_trabajo(d2)
+    assert not d1.exists()
+    assert nombre_seguro("../../etc/passwd") == "passwd"
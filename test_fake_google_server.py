@@ -0,0 +1,81 @@
+"""
+Pruebas - Servidor falso de Google/n8n y métricas del benchmark de carga
+Ejecutar: python -m pytest -q test_fake_google_server.py
+
+Que el servidor falso responda como las APIs reales ante cuota y errores
+(lo que ejercitan los reintentos del backend), los cambios de Drive, el
+webhook de n8n desde el notificador del backend y los percentiles y
+porcentajes de error que reporta benchmark_carga.py.
+"""
+
+import httpx
+import pytest
+
+from benchmark_carga import Metricas
+from conftest import PUERTO_GOOGLE
+
+URL = f"http://127.0.0.1:{PUERTO_GOOGLE}"
+
+
+@pytest.fixture
+def api(google):
+    for ventana in google.simulador.ventanas.values():
+        ventana.clear()
+    with httpx.Client(base_url=URL) as cliente:
+        yield cliente
+
+
+def test_cuota_como_google(api, google):
+    google.simulador.configurar('drive', cuota_por_minuto=2)
+    google.simulador.configurar('sheets', cuota_por_minuto=1)
+    drive = [api.get("/drive/v3/files") for _ in range(3)]
+    assert [r.status_code for r in drive] == [200, 200, 403]
+    assert drive[2].json()['error']['errors'][0]['reason'] == 'userRateLimitExceeded'
+
+    rango = "/v4/spreadsheets/fake-sheet/values/Casos_Activos!A:B"
+    assert api.get(rango).status_code == 200
+    r = api.get(rango)
+    assert r.status_code == 429 and r.json()['error']['status'] == 'RESOURCE_EXHAUSTED'
+    assert google.simulador.resumen()['drive']['cuota_excedida'] == 1
+
+
+def test_errores_simulados(api, google):
+    google.simulador.configurar('drive', tasa_error=1.0)
+    r = api.get("/drive/v3/files")
+    assert r.status_code == 500 and r.json()['error']['errors'][0]['reason'] == 'backendError'
+    # Solo el servicio configurado falla
+    assert api.get("/healthz").status_code == 200
+
+
+def test_cambios_de_drive(api):
+    token = api.get("/drive/v3/changes/startPageToken").json()['startPageToken']
+    creado = api.post("/drive/v3/files", json={'name': 'caso.pdf'}).json()
+    api.delete(f"/drive/v3/files/{creado['id']}")
+    cambios = api.get("/drive/v3/changes", params={'pageToken': token}).json()
+    assert [c['fileId'] for c in cambios['changes']] == [creado['id'], creado['id']]
+    assert cambios['changes'][-1]['removed'] and 'newStartPageToken' in cambios
+
+
+def test_webhook_n8n_desde_el_backend(api):
+    from app.n8n_notifier import enviar_a_n8n
+    assert enviar_a_n8n('confirmacion', "ana@correo.com", "SER001", "Asunto", "<p>hola</p>")
+    n8n = api.get("/_fake/estado").json()['n8n']
+    assert n8n['recibidos'] == 1 and n8n['por_tipo'] == {'confirmacion': 1}
+    assert n8n['ultimos'][0]['serial'] == "SER001"
+
+
+def test_metricas_del_benchmark():
+    metricas = Metricas()
+    metricas.inicio, metricas.fin = 0.0, 2.0
+    for ms in range(1, 101):
+        metricas.registrar("GET /validador/casos", float(ms), 200)
+    for status in (200, 409, 500, 0):
+        metricas.registrar("POST /subir-incapacidad/", 10.0, status)
+    r = metricas.resumen()
+    casos = r['endpoints']["GET /validador/casos"]
+    assert (casos['p50_ms'], casos['p95_ms'], casos['p99_ms'], casos['max_ms']) == (50.5, 95.0, 99.0, 100.0)
+    assert casos['rps'] == 50.0 and r['peticiones'] == 104
+    subir = r['endpoints']["POST /subir-incapacidad/"]
+    # 0 = sin respuesta (timeout o conexión): cuenta como error
+    assert subir['errores_pct'] == 50.0 and subir['rechazos_pct'] == 25.0
+    assert subir['codigos'] == {'200': 1, '409': 1, '500': 1, '0': 1}
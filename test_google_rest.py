@@ -0,0 +1,166 @@
+"""
+Pruebas - Cliente REST de Google (contra Drive/Sheets falsos)
+Ejecutar: python -m pytest -q test_google_rest.py
+
+No usa Google: fake_google_server.py en un hilo (fixture google) y un
+servidor HTTP mínimo para el Retry-After. Llamadas en paralelo con reunir(),
+reintentos ante 5xx y cuota, Retry-After, errores no reintentables, Sheets,
+subidas reanudables y la fachada síncrona desde varios hilos.
+"""
+
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import google_rest, metricas, drive_upload_manager
+from app.google_rest import ErrorGoogle, cliente_sincrono, ejecutar, drive
+from app.drive_upload_manager import subir_archivo_reanudable
+
+
+@pytest.fixture
+def api(google, monkeypatch):
+    """Cliente de Drive con bloques de 256 KB y esperas cortas"""
+    monkeypatch.setattr(drive_upload_manager, "CHUNK_SIZE", drive_upload_manager._BLOQUE_MINIMO)
+    monkeypatch.setattr(google_rest, "REINTENTOS", 6)
+    monkeypatch.setattr(google_rest, "ESPERA_MAX_SEG", 2)
+    return cliente_sincrono('drive')
+
+
+@pytest.fixture
+def archivos(api):
+    carpeta = api.files_create(body={'name': 'Pruebas', 'mimeType': 'application/vnd.google-apps.folder'},
+                               fields='id')
+    ids = [api.files_create(body={'name': f"doc_{i}.pdf", 'parents': [carpeta['id']]}, fields='id')['id']
+           for i in range(10)]
+    return carpeta['id'], ids
+
+
+@pytest.fixture
+def servidor_retry_after():
+    """Responde 429 con Retry-After: 1 la primera vez y 200 después"""
+    estado = {'peticiones': 0, 'instantes': []}
+
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            estado['peticiones'] += 1
+            estado['instantes'].append(time.monotonic())
+            if estado['peticiones'] == 1:
+                self.send_response(429)
+                self.send_header('Retry-After', "1")
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{"error": {"code": 429, "message": "Too Many Requests"}}')
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{"ok": true}')
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}/", estado
+    servidor.shutdown()
+
+
+def test_crear_y_listar(api, archivos):
+    carpeta, _ = archivos
+    lista = api.files_list(q=f"'{carpeta}' in parents and trashed=false", fields="files(id, name)")
+    assert len(lista.get('files', [])) == 10
+
+
+def test_reunir_en_paralelo(api, archivos, google):
+    _, ids = archivos
+    google.simulador.configurar('drive', latencia_ms=150)
+    inicio = time.perf_counter()
+    for file_id in ids:
+        api.files_get(file_id, fields='id')
+    secuencial = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    salida = api.reunir({file_id: drive.files_get(file_id, fields='id') for file_id in ids})
+    paralelo = time.perf_counter() - inicio
+    assert all(e is None for _, e in salida.values())
+    assert paralelo * 3 < secuencial, f"{secuencial:.2f}s secuencial vs {paralelo:.2f}s en paralelo"
+
+
+def test_5xx_reintentados(api, archivos, google):
+    _, ids = archivos
+    antes = google_rest.obtener_estadisticas()['reintentos']
+    google.simulador.configurar('drive', tasa_error=0.3)
+    for file_id in ids:
+        api.files_get(file_id, fields='id')
+    assert google_rest.obtener_estadisticas()['reintentos'] > antes
+
+
+def test_clasificacion_de_errores(api):
+    cuota = ErrorGoogle('drive', 'files.list', 403,
+                        {'error': {'errors': [{'reason': 'userRateLimitExceeded'}], 'message': 'cuota'}})
+    permiso = ErrorGoogle('drive', 'files.list', 403,
+                          {'error': {'errors': [{'reason': 'insufficientPermissions'}], 'message': 'no'}})
+    assert cuota.reintentable and not permiso.reintentable
+    with pytest.raises(ErrorGoogle) as error:
+        api.files_get("no-existe")
+    assert error.value.status == 404 and not error.value.reintentable
+
+
+def test_retry_after_respetado(api, servidor_retry_after):
+    url, estado = servidor_retry_after
+    resp = ejecutar(google_rest.solicitar('drive', 'prueba', 'GET', url))
+    assert resp.status_code == 200 and len(estado['instantes']) == 2
+    assert 0.9 <= estado['instantes'][1] - estado['instantes'][0] < 2
+
+
+def test_sheets(google):
+    hojas = cliente_sincrono('sheets')
+    hojas.values_append("hoja_prueba", "Casos_Activos!A:J", body={'values': [['S1', 'Ana'], ['S2', 'Luis']]},
+                        valueInputOption="RAW", insertDataOption="INSERT_ROWS")
+    hojas.values_update("hoja_prueba", "Casos_Activos!A2:J2", body={'values': [['S2', 'Luisa']]},
+                        valueInputOption="RAW")
+    assert hojas.values_get("hoja_prueba", "Casos_Activos!A:B").get('values') == [['S1', 'Ana'], ['S2', 'Luisa']]
+
+
+def test_sesion_reanudable_desde_el_offset(api):
+    datos = os.urandom(700 * 1024)
+    total = len(datos)
+    uri = api.subida_iniciar({'name': 'parcial.bin'}, total, 'application/octet-stream', fields='id')
+    api.subida_enviar(uri, datos[:256 * 1024], 0, total)
+    estado_sesion, offset = api.subida_consultar(uri, total)
+    assert estado_sesion == 'parcial' and offset == 256 * 1024
+    estado_fin, archivo = api.subida_enviar(uri, datos[offset:], offset, total)
+    assert estado_fin == 'completa' and api.files_get_media(archivo['id']) == datos
+
+
+def test_subida_por_bloques_con_errores(api, google, tmp_path):
+    ruta = tmp_path / "grande.bin"
+    ruta.write_bytes(os.urandom(1500 * 1024))
+    google.simulador.configurar('drive', tasa_error=0.15)
+    subido = subir_archivo_reanudable(api, ruta, {'name': 'grande.bin'}, 'application/octet-stream', 'id')
+    google.simulador.configurar('drive', tasa_error=0.0)
+    assert api.files_get_media(subido['id']) == ruta.read_bytes()
+
+
+def test_fachada_desde_muchos_hilos(api, archivos):
+    _, ids = archivos
+    errores = []
+
+    def leer():
+        try:
+            for file_id in ids[:5]:
+                api.files_get(file_id, fields='id')
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=leer) for _ in range(16)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert not errores and google_rest.obtener_estadisticas()['pools'] >= 1
+
+    llamadas = metricas.resumen()['llamadas']
+    assert 'drive.files.get' in llamadas
@@ -0,0 +1,114 @@
+"""
+Pruebas - Adjuntos repetidos en reenviar / completar (contra Drive falso)
+Ejecutar: python -m pytest -q test_huellas_documentos.py
+
+Los archivos que el caso ya tiene, y los repetidos dentro del mismo envío,
+quedan fuera del PDF combinado y la respuesta dice cuáles fueron. Completar
+agrega los documentos nuevos al final del PDF del caso.
+"""
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import comparador_versiones
+from app.database import SessionLocal, Case, Company, DocumentBlob, EstadoCaso, TipoIncapacidad
+from app.drive_manager import extraer_file_id
+from app.drive_uploader import upload_to_drive, get_authenticated_service
+from app.huellas_documentos import registrar_huellas
+from app.pdf_merger import merge_pdfs_con_huellas
+
+
+def pdf(*textos) -> bytes:
+    import fitz
+    doc = fitz.open()
+    for texto in textos:
+        doc.new_page().insert_text((72, 72), texto)
+    contenido = doc.tobytes()
+    doc.close()
+    return contenido
+
+
+def paginas(file_id):
+    import fitz
+    with fitz.open(stream=get_authenticated_service().files_get_media(file_id), filetype="pdf") as doc:
+        return [pagina.get_text().strip() for pagina in doc]
+
+
+class Subido:
+    """Lo mínimo de UploadFile que usa merge_pdfs_con_huellas"""
+
+    def __init__(self, nombre, contenido):
+        self.filename = nombre
+        self.file = io.BytesIO(contenido)
+
+
+INCAPACIDAD = pdf("incapacidad 1", "incapacidad 2")
+EPICRISIS = pdf("epicrisis")
+SOPORTE = pdf("soporte")
+
+
+@pytest.fixture
+def caso(bd, google, tmp_path, monkeypatch):
+    """Caso INCOMPLETA cuyo PDF en Drive es la incapacidad (2 páginas, huella registrada)"""
+    monkeypatch.setattr(comparador_versiones, "_executor", ThreadPoolExecutor(max_workers=1))
+    ruta, _, huellas = merge_pdfs_con_huellas([Subido("incapacidad.pdf", INCAPACIDAD)], "1001", "enfermedad_general")
+    link = upload_to_drive(ruta, "EMPRESA_TEST", "1001", "enfermedad_general", consecutivo="SERIAL1")
+    ruta.unlink()
+
+    db = SessionLocal()
+    empresa = Company(nombre="EMPRESA_TEST")
+    db.add(empresa)
+    db.flush()
+    caso = Case(serial="SERIAL1", cedula="1001", company_id=empresa.id, tipo=TipoIncapacidad.ENFERMEDAD_GENERAL,
+                estado=EstadoCaso.INCOMPLETA, drive_link=link, drive_file_id=extraer_file_id(link))
+    db.add(caso)
+    db.flush()
+    registrar_huellas(db, caso.id, huellas, caso.drive_file_id)
+    db.commit()
+    yield db, caso
+    comparador_versiones._executor.shutdown(wait=True)
+    db.close()
+
+
+def test_reenvio_sin_repetidos(caso, cliente):
+    db, caso = caso
+    r = cliente.post("/casos/SERIAL1/reenviar", files=[
+        ("archivos", ("incapacidad.pdf", INCAPACIDAD, "application/pdf")),
+        ("archivos", ("epicrisis.pdf", EPICRISIS, "application/pdf")),
+        ("archivos", ("epicrisis_copia.pdf", EPICRISIS, "application/pdf")),
+    ])
+    assert r.status_code == 200, r.text
+    cuerpo = r.json()
+    assert cuerpo['archivos_repetidos'] == ["incapacidad.pdf"]
+    assert [(o['nombre'], o['motivo']) for o in cuerpo['archivos_omitidos']] == [
+        ("epicrisis_copia.pdf", 'repetido_en_envio'), ("incapacidad.pdf", 'ya_recibido')
+    ]
+    ya_recibido = cuerpo['archivos_omitidos'][1]
+    assert ya_recibido['drive_file_id'] == caso.drive_file_id and (ya_recibido['pagina_inicio'], ya_recibido['pagina_fin']) == (0, 1)
+    # El PDF del reenvío solo trae lo nuevo
+    assert paginas(extraer_file_id(cuerpo['nuevo_link'])) == ["epicrisis"]
+
+
+def test_completar_agrega_al_final(caso, cliente):
+    db, caso = caso
+    r = cliente.post("/casos/SERIAL1/completar", files=[
+        ("archivos", ("incapacidad.pdf", INCAPACIDAD, "application/pdf")),
+        ("archivos", ("soporte.pdf", SOPORTE, "application/pdf")),
+    ])
+    assert r.status_code == 200, r.text
+    assert [o['nombre'] for o in r.json()['archivos_omitidos']] == ["incapacidad.pdf"]
+    assert paginas(caso.drive_file_id) == ["incapacidad 1", "incapacidad 2", "soporte"]
+
+    db.expire_all()
+    blobs = {b.nombre_original: (b.pagina_inicio, b.pagina_fin) for b in db.query(DocumentBlob).all()}
+    assert blobs == {"incapacidad.pdf": (0, 1), "soporte.pdf": (2, 2)}
+
+
+def test_solo_repetidos(caso, cliente):
+    r = cliente.post("/casos/SERIAL1/completar", files=[
+        ("archivos", ("otra_vez.pdf", INCAPACIDAD, "application/pdf")),
+    ])
+    assert r.status_code == 409
+    assert r.json()['archivos_omitidos'][0]['motivo'] == 'ya_recibido'
@@ -0,0 +1,104 @@
+"""
+Pruebas - Logging estructurado
+Ejecutar: python -m pytest -q test_logs.py
+
+El filtro de nivel antes de crear el registro, el DEBUG por caso, el
+muestreo, la cola que descarta en vez de bloquear, el request_id de cada
+request y el formato JSON con el contexto.
+"""
+
+import json
+import queue
+import logging
+
+import pytest
+
+from app import logs
+from app.logs import obtener_logger, contexto_log, activar_debug_serial, desactivar_debug_serial
+from conftest import HEADERS
+
+
+class Captura(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.registros = []
+        self.addFilter(logs._FiltroContexto())
+
+    def emit(self, record):
+        self.registros.append(record)
+
+    def mensajes(self):
+        return [r.getMessage() for r in self.registros]
+
+
+@pytest.fixture
+def captura(monkeypatch):
+    """Registros de incapacidades.* en una lista, con nivel INFO"""
+    monkeypatch.setattr(logs, "_nivel", logging.INFO)
+    monkeypatch.setattr(logs, "LOG_MUESTREO_DEBUG", 1.0)
+    # Instala la cola antes: configurar_logging reemplaza los handlers de la raíz
+    logs.configurar_logging()
+    manejador = Captura()
+    raiz = logging.getLogger(logs.RAIZ)
+    raiz.addHandler(manejador)
+    yield manejador
+    raiz.removeHandler(manejador)
+
+
+def test_nivel_y_debug_por_caso(captura):
+    log = obtener_logger("app.prueba")
+    log.debug("apagado %s", "x")
+    log.info("encendido")
+    assert captura.mensajes() == ["encendido"]
+
+    activar_debug_serial("S1")
+    try:
+        with contexto_log(serial="S1"):
+            log.debug("detalle de %s", "S1")
+        with contexto_log(serial="S2"):
+            log.debug("detalle de %s", "S2")
+    finally:
+        desactivar_debug_serial("S1")
+    assert captura.mensajes()[1:] == ["detalle de S1"] and captura.registros[1].serial == "S1"
+
+
+def test_muestreo(captura, monkeypatch):
+    log = obtener_logger("app.prueba")
+    log.info("nunca", muestreo=0.0)
+    log.info("siempre", muestreo=1.0)
+    # Las advertencias no se muestrean
+    log.warning("advertencia", muestreo=0.0)
+    monkeypatch.setattr(logs, "_nivel", logging.DEBUG)
+    monkeypatch.setattr(logs, "LOG_MUESTREO_DEBUG", 0.0)
+    log.debug("debug muestreado")
+    assert captura.mensajes() == ["siempre", "advertencia"]
+
+
+def test_cola_llena_descarta_sin_bloquear():
+    manejador = logs._ColaSinBloqueo(queue.Queue(maxsize=1))
+    antes = dict(logs._stats)
+    for i in range(3):
+        manejador.handle(logging.makeLogRecord({'msg': f"registro {i}"}))
+    assert logs._stats['encolados'] - antes['encolados'] == 1
+    assert logs._stats['descartados'] - antes['descartados'] == 2
+
+
+def test_formato_json_con_contexto(captura):
+    with contexto_log(request_id="abc123", serial="S9", cedula="77"):
+        obtener_logger("app.prueba").info("hola %s", "mundo")
+    datos = json.loads(logs.FormatoJSON().format(captura.registros[0]))
+    assert datos['msg'] == "hola mundo" and datos['logger'] == "incapacidades.prueba"
+    assert (datos['request_id'], datos['serial'], datos['cedula']) == ("abc123", "S9", "77")
+
+
+def test_request_id_en_la_respuesta(cliente):
+    r = cliente.get("/", headers={'X-Request-ID': "mi-request"})
+    assert r.headers['x-request-id'] == "mi-request"
+    generado = cliente.get("/").headers['x-request-id']
+    assert len(generado) == 12 and generado != "mi-request"
+
+
+def test_estado_de_logs_solo_con_token(cliente):
+    assert cliente.get("/logs").status_code == 403
+    r = cliente.get("/logs", headers=HEADERS)
+    assert r.status_code == 200 and 'seriales_debug' in r.json()
@@ -0,0 +1,94 @@
+"""
+Pruebas - Métricas por request, spans y /metrics
+Ejecutar: python -m pytest -q test_metricas.py
+
+Histogramas y percentiles, span como `with` y como decorador (también
+async), el middleware con etapas (header Server-Timing, /status) y el
+texto de Prometheus que sirve la app.
+"""
+
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import metricas
+from app.metricas import Histograma, MetricasMiddleware, span, marca, exportar_prometheus, resumen
+
+
+@pytest.fixture(autouse=True)
+def limpias():
+    metricas.reiniciar()
+    yield
+    metricas.reiniciar()
+
+
+def test_histograma():
+    hist = Histograma()
+    for ms in range(1, 101):
+        hist.observar(ms / 1000)
+    hist.observar(0.2, error="HTTP 500")
+    assert hist.total == 101 and hist.errores == 1 and hist.ultimo_error == "HTTP 500"
+    # ≤ 5 ms, ≤ 10 ms, ≤ 25 ms...
+    assert hist.buckets[:3] == [5, 5, 15]
+    assert hist.percentiles() == {'p50_ms': 51.0, 'p95_ms': 96.0, 'p99_ms': 100.0}
+
+
+def test_span_con_y_como_decorador():
+    @span('drive', 'files.get')
+    def leer():
+        return "ok"
+
+    @span('n8n', 'webhook')
+    async def notificar():
+        raise RuntimeError("caído")
+
+    assert leer() == "ok"
+    with pytest.raises(RuntimeError):
+        asyncio.run(notificar())
+    with span('pdf', 'merge'):
+        pass
+
+    llamadas = resumen()['llamadas']
+    assert llamadas['drive.files.get']['total'] == 1 and llamadas['pdf.merge']['errores'] == 0
+    assert llamadas['n8n.webhook']['ultimo_error'] == "RuntimeError: caído"
+
+
+def test_middleware_con_etapas():
+    app = FastAPI()
+    app.add_middleware(MetricasMiddleware)
+
+    @app.get("/casos/{serial}")
+    def caso(serial: str):
+        with span('db', 'SELECT'):
+            marca('consulta')
+        marca('respuesta')
+        return {'serial': serial}
+
+    cliente = TestClient(app)
+    r = cliente.get("/casos/S1")
+    cliente.get("/casos/S2")
+    timing = r.headers['server-timing']
+    assert timing.startswith("consulta;dur=") and "respuesta;dur=" in timing and "total;dur=" in timing
+
+    estado = resumen()
+    assert estado['rutas']['GET /casos/{serial}']['total'] == 2
+    assert set(estado['etapas']['/casos/{serial}']) == {'consulta', 'respuesta'}
+    assert estado['requests_mas_lentos'][0]['llamadas'][0]['span'] == "db.SELECT"
+
+
+def test_metrics_y_status_de_la_app(cliente):
+    cliente.get("/ping")
+    r = cliente.get("/metrics")
+    assert r.status_code == 200 and r.headers['content-type'].startswith("text/plain")
+    texto = r.text
+    assert '# TYPE incapacidades_http_request_duration_seconds histogram' in texto
+    assert 'incapacidades_http_request_duration_seconds_count{method="GET",route="/ping",status="200"} 1' in texto
+    assert 'le="+Inf"' in texto and "incapacidades_uptime_seconds" in texto
+
+    # /status con datos en vivo (no textos fijos)
+    estado = cliente.get("/status").json()
+    assert estado['stats']['requests'] == 2 and estado['stats']['response_time_p95_ms'] > 0
+    assert set(estado['rutas']) == {"GET /ping", "GET /metrics"}
+    assert 'route="/status"' in exportar_prometheus()
@@ -0,0 +1,108 @@
+"""
+Pruebas - Sesiones de edición de PDF entre instancias
+Ejecutar: python -m pytest -q test_pdf_edicion.py
+
+Dos "instancias" con su propio EDICION_DIR y el mismo estado compartido:
+lo que edita una lo ve y lo deshace la otra, el candado del serial las
+excluye, y el job de sesiones vencidas sube las de cualquiera.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from app import estado_compartido, pdf_edicion
+from app.estado_compartido import BackendLocal, configurar_backend
+from app.pdf_edicion import SesionEdicionPDF, finalizar_sesiones_vencidas, obtener_pdf_local
+
+
+def paginas(ruta):
+    import fitz
+    with fitz.open(str(ruta)) as doc:
+        return [(pagina.get_text().strip(), pagina.rotation) for pagina in doc]
+
+
+@pytest.fixture
+def instancias(tmp_path, monkeypatch):
+    """Cambia de instancia: cada una con su cache local, estado compartido común"""
+    monkeypatch.setattr(estado_compartido, "_backend", None)
+    configurar_backend(BackendLocal(tmp_path / "compartido"))
+
+    def descargar(file_id, destino):
+        import fitz
+        doc = fitz.open()
+        for texto in ("uno", "dos", "tres"):
+            doc.new_page().insert_text((72, 72), texto)
+        Path(destino).parent.mkdir(parents=True, exist_ok=True)
+        doc.save(str(destino))
+        doc.close()
+        return Path(destino)
+
+    monkeypatch.setattr(pdf_edicion, "descargar_pdf_drive", descargar)
+
+    def usar(nombre):
+        monkeypatch.setattr(pdf_edicion, "EDICION_DIR", tmp_path / nombre)
+        return SesionEdicionPDF("SERIAL1")
+
+    return usar
+
+
+class DriveFalso:
+    def __init__(self):
+        self.subidos = []
+
+    def update_file_content(self, file_id, ruta):
+        self.subidos.append((file_id, paginas(ruta)))
+        return {'webViewLink': f"https://drive.google.com/file/d/{file_id}/view"}
+
+
+def test_otra_instancia_continua_la_sesion(instancias):
+    a = instancias("a")
+    with a.lock:
+        a.abrir("F1")
+        a.aplicar({'rotate': [{'page_num': 0, 'angle': 90}]})
+
+    b = instancias("b")
+    assert b.estado()['total_ediciones'] == 1 and b.estado()['pendiente_subida']
+    with b.lock:
+        b.abrir("F1")
+        b.aplicar({'delete_page': {'pages': [2]}})
+    assert paginas(obtener_pdf_local("SERIAL1")) == [("uno", 90), ("dos", 0)]
+
+    # a tiene en cache la versión anterior: deshace sobre la de b
+    a = instancias("a")
+    with a.lock:
+        assert a.deshacer() == "Página 2 eliminada"
+    assert paginas(a.pdf_path) == [("uno", 90), ("dos", 0), ("tres", 0)]
+
+    drive = DriveFalso()
+    b = instancias("b")
+    with b.lock:
+        resultado = b.finalizar(drive)
+    assert resultado['subido'] and drive.subidos == [("F1", [("uno", 90), ("dos", 0), ("tres", 0)])]
+    assert not a.existe() and not b.pdf_path.exists()
+
+
+def test_candado_entre_instancias(instancias, monkeypatch):
+    monkeypatch.setattr(pdf_edicion, "CANDADO_ESPERA_S", 0.1)
+    a, b = instancias("a"), instancias("b")
+    with a.lock:
+        with pytest.raises(TimeoutError):
+            with b.lock:
+                pass
+
+
+def test_sesiones_vencidas_de_otra_instancia(instancias, monkeypatch):
+    a = instancias("a")
+    with a.lock:
+        a.abrir("F1")
+        a.aplicar({'rotate': [{'page_num': 1, 'angle': 180}]})
+
+    instancias("b")
+    drive = DriveFalso()
+    monkeypatch.setattr("app.drive_manager.DriveFileManager", lambda: drive)
+    assert finalizar_sesiones_vencidas() == 0
+    monkeypatch.setattr(pdf_edicion, "EDICION_TTL_HORAS", 0)
+    assert finalizar_sesiones_vencidas() == 1
+    assert drive.subidos == [("F1", [("uno", 0), ("dos", 180), ("tres", 0)])]
+    assert finalizar_sesiones_vencidas() == 0
@@ -0,0 +1,102 @@
+"""
+Pruebas - Planificador con líder elegido y job store persistente
+Ejecutar: python -m pytest -q test_planificador.py
+
+Un disparo vencido guardado en apscheduler_jobs corre cuando asume un líder
+nuevo (no se recalcula al registrar), un cambio en la definición sí
+reprograma el job y un proceso que no es líder no ejecuta jobs.
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import planificador as modulo
+from app.planificador import Planificador
+
+_ejecutado = threading.Event()
+
+
+def marcar():
+    _ejecutado.set()
+
+
+@pytest.fixture
+def nuevo_planificador(bd, tmp_path, monkeypatch):
+    """Fabrica de procesos 'candidatos' sobre la misma BD y el mismo directorio de candados"""
+    monkeypatch.setattr(modulo, "LOCK_DIR", tmp_path)
+    monkeypatch.setattr(modulo, "PLANIFICADOR_HABILITADO", True)
+    monkeypatch.setattr(modulo, "_definiciones", {})
+    _ejecutado.clear()
+    creados = []
+
+    def crear():
+        p = Planificador()
+        # ejecutar_job consulta el planificador del proceso
+        monkeypatch.setattr(modulo, "planificador", p)
+        creados.append(p)
+        return p
+
+    yield crear
+    for p in creados:
+        p.shutdown(wait=False)
+    p = crear()
+    p.iniciar()
+    for job in p._scheduler.get_jobs():
+        p._scheduler.remove_job(job.id)
+    p.shutdown(wait=False)
+
+
+def test_disparo_vencido_corre_con_el_lider_nuevo(nuevo_planificador):
+    anterior = nuevo_planificador()
+    anterior.registrar('prueba_vencido', marcar, 'interval', hours=1)
+    anterior.iniciar()
+    assert anterior.es_lider
+    # El líder cae y el disparo queda vencido hace un minuto (dentro de la gracia)
+    almacen = anterior._scheduler._jobstores['default']
+    anterior.shutdown(wait=False)
+    job = almacen.lookup_job('prueba_vencido')
+    job.next_run_time = datetime.now().astimezone() - timedelta(minutes=1)
+    almacen.update_job(job)
+    assert not _ejecutado.is_set()
+
+    nuevo = nuevo_planificador()
+    nuevo.registrar('prueba_vencido', marcar, 'interval', hours=1)
+    nuevo.iniciar()
+    assert nuevo.es_lider
+    assert _ejecutado.wait(5), "el disparo vencido no corrió"
+
+
+def test_cambio_de_definicion_reprograma(nuevo_planificador):
+    anterior = nuevo_planificador()
+    anterior.registrar('prueba_cambio', marcar, 'interval', hours=1)
+    anterior.iniciar()
+    antes = anterior._scheduler.get_job('prueba_cambio').next_run_time
+    anterior.shutdown(wait=False)
+
+    igual = nuevo_planificador()
+    igual.registrar('prueba_cambio', marcar, 'interval', hours=1)
+    igual.iniciar()
+    assert igual._scheduler.get_job('prueba_cambio').next_run_time == antes
+    igual.shutdown(wait=False)
+
+    cambiado = nuevo_planificador()
+    cambiado.registrar('prueba_cambio', marcar, 'interval', nombre="Cada dos horas", hours=2,
+                       misfire_grace_time=60)
+    cambiado.iniciar()
+    job = cambiado._scheduler.get_job('prueba_cambio')
+    assert job.next_run_time > antes + timedelta(minutes=30)
+    assert job.name == "Cada dos horas" and job.misfire_grace_time == 60
+
+
+def test_sin_liderazgo_no_ejecuta(nuevo_planificador):
+    lider = nuevo_planificador()
+    lider.registrar('prueba_lider', marcar, 'interval', hours=1)
+    lider.iniciar()
+    otro = nuevo_planificador()
+    otro.iniciar()
+    assert lider.es_lider and not otro.es_lider
+    assert modulo.ejecutar_job('prueba_lider', 'test_planificador:marcar') is None
+    assert not _ejecutado.is_set()
+    assert otro.ejecutar_ahora('prueba_lider', forzar=True) is None and _ejecutado.is_set()
@@ -0,0 +1,115 @@
+"""
+Pruebas - Reenvíos en la tabla case_resubmissions
+Ejecutar: python -m pytest -q test_reenvios.py
+
+Casos que aún guardan los reenvíos en metadata_form['reenvios']: el
+backfill, la migración perezosa al consultar un caso, la numeración, la
+decisión del validador y la bandeja de reenvíos pendientes de todas las
+empresas.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app.database import SessionLocal, Case, Company, CaseResubmission, EstadoCaso, TipoIncapacidad
+from app.reenvios import APROBADO, RECHAZADO, migrar_todos, reenvios_del_caso, registrar_reenvio, decidir, como_dict
+from conftest import HEADERS
+
+
+def entrada_json(dias, estado='PENDIENTE_REVISION', **extra):
+    return {
+        'fecha': (datetime.now() - timedelta(days=dias)).isoformat(),
+        'link': f"https://drive.google.com/file/d/R{dias}/view",
+        'archivos': [f"doc_{dias}.pdf"],
+        'estado': estado,
+        **extra
+    }
+
+
+@pytest.fixture
+def db(bd):
+    db = SessionLocal()
+    empresas = [Company(nombre="ALFA"), Company(nombre="BETA")]
+    db.add_all(empresas)
+    db.flush()
+    casos = []
+    for i in range(6):
+        metadata = {'checks_seleccionados': ['ilegible']}
+        if i < 4:
+            metadata['reenvios'] = [
+                entrada_json(10 + i, 'RECHAZADO', fecha_rechazo=datetime.now().isoformat(),
+                             validador_decision='RECHAZAR', motivo_rechazo='borroso', checks_faltantes=['ilegible']),
+                entrada_json(i),
+            ]
+        casos.append(Case(serial=f"RE{i:03d}", cedula=str(i), company_id=empresas[i % 2].id,
+                          tipo=TipoIncapacidad.ENFERMEDAD_GENERAL, estado=EstadoCaso.NUEVO, metadata_form=metadata))
+    db.add_all(casos)
+    db.commit()
+    yield db
+    db.close()
+
+
+def caso(db, serial):
+    return db.query(Case).filter(Case.serial == serial).one()
+
+
+def test_migracion_perezosa(db):
+    reenvios = reenvios_del_caso(db, caso(db, "RE000"))
+    db.expire_all()
+    migrado = caso(db, "RE000")
+    assert [r.numero for r in reenvios] == [1, 2]
+    assert 'reenvios' not in migrado.metadata_form and migrado.metadata_form.get('checks_seleccionados')
+    anterior = como_dict(reenvios[0])
+    assert anterior['estado'] == 'RECHAZADO' and anterior['motivo_rechazo'] == 'borroso'
+    assert anterior['checks_faltantes'] == ['ilegible']
+
+
+def test_backfill_idempotente(db):
+    reenvios_del_caso(db, caso(db, "RE000"))
+    stats = migrar_todos(db)
+    otra_vez = migrar_todos(db)
+    assert stats['casos'] == 3 and db.query(CaseResubmission).count() == 8 and otra_vez['reenvios'] == 0
+
+
+def test_numeracion_y_decision(db):
+    migrar_todos(db)
+    nuevo = registrar_reenvio(db, caso(db, "RE001"), "https://drive.google.com/file/d/NUEVO/view", ["nuevo.pdf"],
+                              paginas_nuevas=[1, 2])
+    primero = registrar_reenvio(db, caso(db, "RE005"), "https://drive.google.com/file/d/P/view", ["p.pdf"])
+    db.commit()
+    assert nuevo.numero == 3 and primero.numero == 1
+
+    decidir(nuevo, APROBADO, "ok")
+    decidir(primero, RECHAZADO, "faltan soportes", ["soporte"])
+    db.commit()
+    assert nuevo.decidido_at is not None and primero.checks_faltantes == ["soporte"]
+
+
+def test_bandeja_de_pendientes(db, cliente):
+    migrar_todos(db)
+    r = cliente.get("/validador/reenvios/pendientes", headers=HEADERS)
+    assert r.status_code == 200
+    datos = r.json()
+    # Todas las empresas, la más antigua primero
+    assert datos['total'] == 4 and [i['serial'] for i in datos['items']] == ["RE003", "RE002", "RE001", "RE000"]
+    r = cliente.get("/validador/reenvios/pendientes", params={'empresa': 'BETA'}, headers=HEADERS)
+    assert r.status_code == 200 and sorted(i['serial'] for i in r.json()['items']) == ["RE001", "RE003"]
+
+
+def test_historial_del_caso(db, cliente):
+    migrar_todos(db)
+    nuevo = registrar_reenvio(db, caso(db, "RE001"), "https://drive.google.com/file/d/NUEVO/view", ["nuevo.pdf"])
+    decidir(nuevo, APROBADO, "ok")
+    db.commit()
+    r = cliente.get("/validador/casos/RE001/historial-reenvios", headers=HEADERS)
+    assert r.status_code == 200
+    assert [h['estado'] for h in r.json()['historial']] == ['RECHAZADO', 'PENDIENTE_REVISION', 'APROBADO']
+
+
+def test_pendientes_por_indice(db):
+    plan = " ".join(str(f[-1]) for f in db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT * FROM case_resubmissions WHERE estado = 'PENDIENTE_REVISION' ORDER BY created_at"
+    )))
+    assert "ix_case_resubmissions_estado_created" in plan
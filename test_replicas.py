@@ -0,0 +1,110 @@
+"""
+Pruebas - Réplicas de lectura y lee-tus-escrituras
+Ejecutar: python -m pytest -q test_replicas.py
+
+Sin PostgreSQL: el primario y la "réplica" son dos archivos SQLite con datos
+distintos, así se ve en cada respuesta a cuál BD fue la lectura. El
+enrutamiento de los tableros, la cookie/header tras una escritura, el
+respaldo por IP, la exclusión por retraso o caída y que la réplica no
+acepte escrituras.
+"""
+
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.database import Base, SessionLocal, Case, Company, EstadoCaso, TipoIncapacidad
+from app import replicas
+from app.main import app
+from conftest import HEADERS
+
+
+def sembrar(fabrica, serial):
+    db = fabrica()
+    try:
+        empresa = Company(nombre="EMPRESA")
+        db.add(empresa)
+        db.flush()
+        db.add(Case(serial=serial, cedula="1", company_id=empresa.id, tipo=TipoIncapacidad.ENFERMEDAD_GENERAL,
+                     estado=EstadoCaso.NUEVO))
+        db.commit()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def replica(bd, tmp_path, monkeypatch):
+    """Una réplica configurada (ventana de lectura propia de 0,5 s, sin monitor)"""
+    monkeypatch.setattr(replicas, "REPLICA_URLS", [f"sqlite:///{tmp_path / 'replica.db'}"])
+    monkeypatch.setattr(replicas, "LECTURA_PROPIA_SEG", 0.5)
+    monkeypatch.setattr(replicas, "_monitor", lambda lista: None)
+    monkeypatch.setattr(replicas, "_replicas", None)
+    monkeypatch.setattr(replicas, "_escrituras_por_cliente", {})
+
+    sembrar(SessionLocal, "PRIMARIO")
+    replica = replicas.obtener_replicas()[0]
+    Base.metadata.create_all(bind=replica.engine)
+    # La réplica "de mentira" no replica: una escritura en el primario no le llega
+    sembrar(lambda: Session(bind=replica.engine), "REPLICA")
+    yield replica
+    replica.engine.dispose()
+
+
+def origen(cliente, **headers) -> str:
+    """Serial que devuelve la bandeja: dice de qué BD salió la lectura"""
+    r = cliente.get("/validador/casos", headers={**HEADERS, **headers})
+    assert r.status_code == 200
+    return r.json()['items'][0]['serial']
+
+
+def test_enrutamiento_de_lecturas(replica):
+    cliente = TestClient(app)
+    assert origen(cliente) == "PRIMARIO"
+
+    replica.medir()
+    assert replica.disponible and origen(cliente) == "REPLICA"
+    assert cliente.get("/validador/stats", headers=HEADERS).status_code == 200
+
+    replica.retraso = replicas.RETRASO_MAX_SEG + 5
+    assert origen(cliente) == "PRIMARIO"
+
+    # Caída: fuera hasta que el monitor la vuelve a medir
+    replica.error = "conexión rechazada"
+    assert origen(cliente) == "PRIMARIO"
+    replica.medir()
+    assert origen(cliente) == "REPLICA"
+
+    estado = cliente.get("/status").json()['replicas']
+    assert estado['configuradas'] == 1 and estado['replicas'][0]['lecturas'] > 0
+
+
+def test_lee_tus_escrituras(replica):
+    replica.medir()
+    cliente = TestClient(app)
+    r = cliente.post("/validador/casos/PRIMARIO/nota", json={'contenido': 'hola'}, headers=HEADERS)
+    assert r.status_code == 200 and r.headers.get('x-bd-escritura') and 'bd_escritura' in cliente.cookies
+    assert origen(cliente) == "PRIMARIO"
+
+    # Otro navegador: sin la cookie pero misma IP → primario; otra IP → réplica
+    otro = TestClient(app)
+    assert origen(otro) == "PRIMARIO"
+    assert origen(otro, **{'X-Forwarded-For': '10.0.0.9'}) == "REPLICA"
+    # Header explícito (clientes que no guardan cookies)
+    assert origen(otro, **{'X-Forwarded-For': '10.0.0.10', 'X-BD-Escritura': str(time.time())}) == "PRIMARIO"
+
+    # Pasada la ventana, la réplica alcanzó la escritura
+    time.sleep(1.2)
+    assert origen(cliente) == "REPLICA"
+
+
+def test_replica_rechaza_escrituras(replica):
+    db = replica.Session()
+    try:
+        db.add(Company(nombre="NO"))
+        with pytest.raises(RuntimeError):
+            db.commit()
+    finally:
+        db.rollback()
+        db.close()
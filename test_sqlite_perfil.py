@@ -0,0 +1,136 @@
+"""
+Pruebas - Perfil de SQLite (un servidor, sin DATABASE_URL)
+Ejecutar: python -m pytest -q test_sqlite_perfil.py
+
+Los pragmas de cada conexión, que el pool de lectores sea de solo lectura,
+que la sesión lea en los lectores y escriba (y lea lo que escribió) en la
+única conexión de escritura, que escritores concurrentes hagan fila sin
+"database is locked" y el mantenimiento (checkpoint del WAL y ANALYZE).
+"""
+
+import threading
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event, select, func, text, update
+
+from app import database
+from app.database import (
+    engine, engine_lectura, SessionLocal, Company, Employee,
+    checkpoint_sqlite, analizar_sqlite, obtener_estadisticas_sqlite
+)
+
+
+def pragmas(motor):
+    with motor.connect() as conn:
+        return {p: conn.exec_driver_sql(f"PRAGMA {p}").scalar()
+                for p in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "query_only")}
+
+
+def test_pragmas_en_escritor_y_lectores(bd):
+    escritor, lector = pragmas(engine), pragmas(engine_lectura)
+    for p in (escritor, lector):
+        assert p['journal_mode'] == "wal" and p['synchronous'] == 1
+        assert p['busy_timeout'] == database.SQLITE_BUSY_MS and p['cache_size'] == -database.SQLITE_CACHE_MB * 1024
+    assert engine.pool.size() == 1 and not escritor['query_only'] and lector['query_only'] == 1
+
+
+def test_lectores_rechazan_escrituras(bd):
+    with pytest.raises(Exception, match="readonly"):
+        with engine_lectura.begin() as conn:
+            conn.execute(text("INSERT INTO companies (nombre, activa) VALUES ('X', 1)"))
+
+
+def test_sesion_lee_en_lectores_y_escribe_en_el_escritor(bd):
+    db = SessionLocal()
+    try:
+        assert db.get_bind(clause=select(Company)) is engine_lectura
+        db.add(Company(nombre="ALFA"))
+        db.flush()
+        # Tras escribir lee lo suyo en el escritor, hasta el commit
+        assert db.get_bind(clause=select(Company)) is engine
+        assert db.scalar(select(func.count()).select_from(Company)) == 1
+        db.commit()
+        assert db.get_bind(clause=select(Company)) is engine_lectura
+        assert db.get_bind(clause=update(Employee).values(activo=True)) is engine
+    finally:
+        db.close()
+
+
+def test_lecturas_dentro_del_flush_van_al_escritor(bd):
+    db = SessionLocal()
+    binds = []
+    # Lo que el flush lee (defaults, relaciones) ve las filas que está escribiendo
+    event.listen(db, "before_flush", lambda *a: binds.append(db.get_bind(clause=select(Company))))
+    try:
+        db.add(Company(nombre="ALFA"))
+        db.commit()
+        assert binds == [engine] and 'en_flush' not in db.info
+        assert db.get_bind(clause=select(Company)) is engine_lectura
+    finally:
+        db.close()
+
+
+def test_sql_textual_va_al_escritor(bd):
+    db = SessionLocal()
+    try:
+        db.add(Company(nombre="ALFA"))
+        db.commit()
+        # text() puede escribir: no sale por los lectores de solo lectura
+        assert db.get_bind(clause=text("SELECT 1")) is engine
+        db.execute(text("UPDATE companies SET nombre = 'BETA'"))
+        db.commit()
+        assert db.get_bind(clause=None) is engine
+        db.commit()
+        assert db.scalar(select(Company.nombre)) == "BETA"
+    finally:
+        db.close()
+
+
+def test_escritores_concurrentes_sin_bloqueos(bd):
+    db = SessionLocal()
+    empresa = Company(nombre="ALFA")
+    db.add(empresa)
+    db.commit()
+    empresa_id = empresa.id
+    db.close()
+    errores = []
+
+    def radicar(hilo):
+        for i in range(50):
+            sesion = SessionLocal()
+            try:
+                sesion.add(Employee(cedula=f"{hilo}-{i}", nombre=f"Empleado {hilo}-{i}", company_id=empresa_id))
+                sesion.commit()
+            except Exception as e:
+                errores.append(str(e))
+            finally:
+                sesion.close()
+
+    hilos = [threading.Thread(target=radicar, args=(h,)) for h in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    with engine_lectura.connect() as conn:
+        total = conn.scalar(select(func.count()).select_from(Employee))
+    assert not errores and total == 400
+
+
+def test_mantenimiento(bd):
+    db = SessionLocal()
+    db.add(Company(nombre="ALFA"))
+    db.commit()
+    db.close()
+
+    wal = Path(engine.url.database + "-wal")
+    checkpoint = checkpoint_sqlite()
+    assert checkpoint['completo'] and wal.stat().st_size == 0
+
+    analizar_sqlite()
+    with engine_lectura.connect() as conn:
+        assert conn.scalar(text("SELECT count(*) FROM sqlite_stat1")) > 0
+
+    estado = obtener_estadisticas_sqlite()
+    assert estado['lectores'] == database.SQLITE_LECTORES
+    assert estado['checkpoint'] is not None and estado['analyze'] is not None